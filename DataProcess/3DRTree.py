@@ -1,11 +1,15 @@
 import os
 import glob
 import sys
+import argparse
 import time
 from datetime import datetime
 from rtree import index
 from tqdm import tqdm  # 用于显示进度条（需要安装 tqdm）
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.item_ids import encode_item_id
+
 script_dir = os.path.dirname(os.path.abspath(__file__))
 # 输入数据目录 - 包含所有出租车轨迹文件的文件夹
 input_dir = os.path.join(script_dir, '..', 'Data', 'taxi_log_2008_by_id')
@@ -58,7 +62,14 @@ def parse_line(line):
         return None
 
 def main():
-    global index_file_basename  
+    global index_file_basename, input_dir
+
+    parser = argparse.ArgumentParser(description='构建时空 R 树索引')
+    parser.add_argument('--data-dir', default=input_dir, help='轨迹数据目录')
+    parser.add_argument('--index', default=index_file_basename, help='输出索引文件基名（不含 .idx/.dat 扩展名）')
+    args = parser.parse_args()
+    input_dir = args.data_dir
+    index_file_basename = args.index
     
     print("开始构建时空 R 树索引...")
     print(f"输入目录: {input_dir}")
@@ -100,7 +111,6 @@ def main():
 
     print(f"找到 {len(txt_files)} 个 .txt 文件准备处理。")
 
-    item_id_counter = 0  # 用于给每个轨迹点分配唯一ID
     total_points_processed = 0  # 统计成功处理的轨迹点
     skipped_lines = 0  # 统计跳过的行数
 
@@ -110,6 +120,7 @@ def main():
         for filepath in file_iterator:
             try:
                 with open(filepath, 'r', encoding='utf-8') as infile:
+                    seq = 0  # 点在该车轨迹中的序号
                     for line in infile:
                         parsed_data = parse_line(line)
                         if parsed_data:
@@ -125,11 +136,11 @@ def main():
                             # 注意：对于点数据，最小值和最大值相同
                             bbox = (lon, lat, timestamp_num, lon, lat, timestamp_num)
 
-                            # 插入数据到索引中，item_id_counter作为唯一ID
-                            # obj参数存储taxi_id，便于根据索引查找原始数据
-                            idx.insert(item_id_counter, bbox, obj=taxi_id)
+                            # 条目ID中编码出租车ID、时间戳与序号（见 utils/item_ids.py），
+                            # 不再用 obj 参数为每个点 pickle 出租车ID
+                            idx.insert(encode_item_id(taxi_id, timestamp_num, seq), bbox)
 
-                            item_id_counter += 1
+                            seq += 1
                             total_points_processed += 1
                         else:
                             skipped_lines += 1  # 统计无法解析的行数
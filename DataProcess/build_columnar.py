@@ -0,0 +1,168 @@
+"""
+构建列式时空点存储（api/columnar.py 的查询后端）
+
+把全部轨迹点存为若干 NumPy 列文件，按 (时间桶, Z 序网格编码) 排序：
+    keys.npy      int64    时间桶号 << 32 | Z 序编码（见 utils/zorder.py）
+    lon.npy / lat.npy / time.npy   float64
+    taxi.npy      int32    出租车ID
+    bucket_ids.npy / bucket_offsets.npy   各时间桶在列中的起止行（块范围索引）
+以及 meta.json:
+    {"version", "bucket_seconds", "origin", "extent", "grid_bits", "points", "bounds"}
+
+extent 为网格覆盖的经纬度范围（取 0.1%~99.9% 分位数，避免少数漂移点把网格拉得过粗），
+范围外的点归入边缘格子。服务端用 np.load(mmap_mode='r') 打开，多个工作进程共享页缓存。
+先写到临时目录，完成后整体替换旧目录。
+
+用法:
+    python DataProcess/build_columnar.py --bucket-minutes 60
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.zorder import GRID_BITS, grid_cells, morton_encode
+from build_rtree_shards import read_track, shard_origin
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUT_DIR = os.path.join(script_dir, '..', 'Data', 'taxi_log_2008_by_id')
+DEFAULT_OUTPUT_DIR = os.path.join(script_dir, '..', 'Data', 'taxi_columns')
+STORE_VERSION = 1
+EXTENT_PERCENTILES = (0.1, 99.9)
+COLUMNS = ('keys', 'lon', 'lat', 'time', 'taxi')
+
+
+def grid_extent(lons, lats):
+    lon_lo, lon_hi = np.percentile(lons, EXTENT_PERCENTILES)
+    lat_lo, lat_hi = np.percentile(lats, EXTENT_PERCENTILES)
+    return [float(lon_lo), float(lat_lo), float(lon_hi), float(lat_hi)]
+
+
+def write_store(output_dir, taxi_ids, timestamps, lons, lats, bucket_seconds=3600, origin=None, extent=None,
+                ingest_batches=()):
+    """排序并写出列存储，返回 meta；origin、extent 为 None 时按数据计算，ingest_batches 为已并入的增量批次"""
+    if len(timestamps) == 0:
+        raise ValueError('没有有效的轨迹点')
+    if origin is None:
+        origin = shard_origin(timestamps.min())
+    if extent is None:
+        extent = grid_extent(lons, lats)
+
+    buckets = np.floor((timestamps - origin) / bucket_seconds).astype(np.int64)
+    keys = (buckets << 32) | morton_encode(*grid_cells(lons, lats, extent))
+    order = np.argsort(keys, kind='stable')
+    columns = {
+        'keys': keys[order],
+        'lon': lons[order].astype(np.float64),
+        'lat': lats[order].astype(np.float64),
+        'time': timestamps[order].astype(np.float64),
+        'taxi': taxi_ids[order].astype(np.int32),
+    }
+    bucket_ids, bucket_starts = np.unique(buckets[order], return_index=True)
+
+    building_dir = output_dir.rstrip('/\\') + '.building'
+    shutil.rmtree(building_dir, ignore_errors=True)
+    os.makedirs(building_dir)
+    for name, column in columns.items():
+        np.save(os.path.join(building_dir, f'{name}.npy'), column)
+    np.save(os.path.join(building_dir, 'bucket_ids.npy'), bucket_ids)
+    np.save(os.path.join(building_dir, 'bucket_offsets.npy'), np.append(bucket_starts, len(keys)).astype(np.int64))
+
+    meta = {
+        'version': STORE_VERSION,
+        'bucket_seconds': bucket_seconds,
+        'origin': origin,
+        'extent': extent,
+        'grid_bits': GRID_BITS,
+        'points': int(len(keys)),
+        'bounds': [float(lons.min()), float(lats.min()), float(timestamps.min()),
+                   float(lons.max()), float(lats.max()), float(timestamps.max())],
+    }
+    if ingest_batches:
+        meta['ingest_batches'] = list(ingest_batches)
+    with open(os.path.join(building_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    # 整体替换旧目录；服务进程按 meta.json 的修改时间重新打开
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+    os.replace(building_dir, output_dir)
+    return meta
+
+
+def read_store(store_dir):
+    """读取已有的列存储，返回 (meta, 出租车ID, 时间戳, 经度, 纬度)"""
+    with open(os.path.join(store_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    columns = [np.load(os.path.join(store_dir, f'{name}.npy')) for name in ('taxi', 'time', 'lon', 'lat')]
+    return (meta, *columns)
+
+
+def merge_into_store(store_dir, taxi_ids, timestamps, lons, lats, batch=None):
+    """把新点并入已有的列存储（沿用原有的时间桶与网格范围），返回新的 meta
+
+    batch 为增量导入的批次号，记录在 meta 中；该批次已并入时直接返回，重试导入不会重复并入。
+    """
+    meta, old_taxis, old_times, old_lons, old_lats = read_store(store_dir)
+    batches = meta.get('ingest_batches', [])
+    if batch is not None and batch in batches:
+        return meta
+    return write_store(store_dir,
+                       np.concatenate([old_taxis.astype(np.int64), taxi_ids]),
+                       np.concatenate([old_times, timestamps]),
+                       np.concatenate([old_lons, lons]),
+                       np.concatenate([old_lats, lats]),
+                       meta['bucket_seconds'], meta['origin'], meta['extent'],
+                       batches + ([batch] if batch is not None else []))
+
+
+def build_store(input_dir, output_dir, bucket_seconds=3600, workers=None):
+    files = sorted(os.path.join(input_dir, fname) for fname in os.listdir(input_dir) if fname.endswith('.txt'))
+    if not files:
+        raise ValueError(f'在输入目录 "{input_dir}" 中没有找到 .txt 文件')
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        tracks = list(tqdm(executor.map(read_track, files, chunksize=16), total=len(files),
+                           desc="读取轨迹", unit="文件"))
+    taxi_ids, timestamps, lons, lats = (np.concatenate(column) for column in zip(*tracks))
+    del tracks
+    return write_store(output_dir, taxi_ids, timestamps, lons, lats, bucket_seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='构建列式时空点存储')
+    parser.add_argument('--data-dir', default=DEFAULT_INPUT_DIR, help='轨迹数据目录')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_DIR, help='列存储输出目录')
+    parser.add_argument('--bucket-minutes', type=float, default=60, help='时间桶时长（分钟）')
+    parser.add_argument('--workers', type=int, default=None, help='读取轨迹的进程数，默认等于 CPU 核数')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        print(f"错误：输入目录 \"{args.data_dir}\" 不存在。", file=sys.stderr)
+        sys.exit(1)
+    if args.bucket_minutes <= 0:
+        print("错误：--bucket-minutes 必须大于0。", file=sys.stderr)
+        sys.exit(1)
+
+    print("开始构建列式点存储...")
+    print(f"输入目录: {args.data_dir}")
+    print(f"输出目录: {args.output}")
+    start_build_time = time.time()
+    try:
+        meta = build_store(args.data_dir, args.output, int(args.bucket_minutes * 60), args.workers)
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        sys.exit(1)
+
+    print("\n列存储构建完成！")
+    print(f"总共处理了 {meta['points']} 个有效数据点。")
+    print(f"构建耗时: {time.time() - start_build_time:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+构建按时间分片的时空 R 树索引
+
+与 3DRTree.py 构建的单个索引内容相同（点的边界框为 (经度, 纬度, 时间戳)，条目ID编码出租车ID与时间，
+见 utils/item_ids.py），
+但按固定时长（默认24小时，从数据最早一天的本地零点起算）切分为多个分片，
+输出到 <输出目录>/shard_<YYYYmmddHH>.idx/.dat，并写入 manifest.json:
+    {
+        "version": 1,
+        "shard_seconds": 分片时长（秒）,
+        "origin": 分片起点的时间戳,
+        "points": 总点数,
+        "bounds": 全部点的边界,
+        "shards": [{"name", "start", "end", "points", "bounds"}, ...]   # 按时间排序
+    }
+分片按 [start, end) 划分。各分片在独立进程中用批量装载（STR）构建，比逐点插入快得多。
+先写到临时目录，构建完成后整体替换旧的分片目录。
+
+用法:
+    python DataProcess/build_rtree_shards.py --shard-hours 24
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.item_ids import encode_item_ids, track_sequence
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUT_DIR = os.path.join(script_dir, '..', 'Data', 'taxi_log_2008_by_id')
+DEFAULT_OUTPUT_DIR = os.path.join(script_dir, '..', 'Data', 'taxi_rtree_shards')
+MANIFEST_VERSION = 1
+
+
+def local_timestamps(time_strs):
+    """批量将 'YYYY-MM-DD HH:MM:SS' 按本地时区转为时间戳，与 datetime.strptime(...).timestamp() 一致"""
+    naive = np.array(time_strs, dtype='datetime64[s]').astype(np.int64)
+    hours = naive // 3600
+    unique_hours, inverse = np.unique(hours, return_inverse=True)
+    # 按小时计算本地时区偏移，夏令时切换也能正确处理
+    offsets = np.array([(datetime(1970, 1, 1) + timedelta(hours=int(h))).timestamp() - int(h) * 3600
+                        for h in unique_hours])
+    return naive + offsets[inverse]
+
+
+def parse_records(lines, with_lines=False):
+    """解析轨迹行，返回 (出租车ID, 时间字符串, 时间戳, 经度, 纬度) 五个列表；格式不正确的行跳过
+
+    with_lines 为真时额外返回保留下来的原始行（去掉行尾换行），用于原样写回轨迹文件。
+    """
+    taxi_ids, time_strs, lons, lats, kept = [], [], [], [], []
+    for line in lines:
+        parts = [p.strip() for p in line.split(',')]
+        if len(parts) != 4:
+            continue
+        try:
+            taxi_id = int(parts[0])
+            lon = float(parts[2])
+            lat = float(parts[3])
+        except ValueError:
+            continue
+        taxi_ids.append(taxi_id)
+        time_strs.append(parts[1])
+        lons.append(lon)
+        lats.append(lat)
+        kept.append(line.rstrip('\r\n'))
+    try:
+        timestamps = local_timestamps([s.replace(' ', 'T') for s in time_strs]).tolist()
+    except ValueError:
+        # 有无法解析的时间时逐行转换，丢弃这些行
+        keep, timestamps = [], []
+        for i, time_str in enumerate(time_strs):
+            try:
+                timestamps.append(datetime.strptime(time_str, '%Y-%m-%d %H:%M:%S').timestamp())
+                keep.append(i)
+            except ValueError:
+                pass
+        taxi_ids, time_strs, lons, lats, kept = ([column[i] for i in keep]
+                                                 for column in (taxi_ids, time_strs, lons, lats, kept))
+    if with_lines:
+        return taxi_ids, time_strs, timestamps, lons, lats, kept
+    return taxi_ids, time_strs, timestamps, lons, lats
+
+
+def read_track(filepath):
+    """读取一个轨迹文件，返回 (出租车ID, 时间戳, 经度, 纬度) 四个数组"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        taxi_ids, _, timestamps, lons, lats = parse_records(f)
+    return (np.array(taxi_ids, dtype=np.int64), np.array(timestamps, dtype=np.float64),
+            np.array(lons, dtype=np.float64), np.array(lats, dtype=np.float64))
+
+
+def build_shard(path, item_ids, timestamps, lons, lats):
+    """用批量装载构建一个分片索引，返回点的边界"""
+    from rtree import index
+    p = index.Property()
+    p.dimension = 3  # 三维索引：经度、纬度、时间
+    # 出租车ID已编码在条目ID中，不再附带 pickle 对象
+    items = ((item_id, (lon, lat, t, lon, lat, t), None)
+             for item_id, t, lon, lat in zip(item_ids.tolist(), timestamps.tolist(), lons.tolist(), lats.tolist()))
+    idx = index.Index(path, items, properties=p)
+    idx.close()
+    return [float(lons.min()), float(lats.min()), float(timestamps.min()),
+            float(lons.max()), float(lats.max()), float(timestamps.max())]
+
+
+def shard_origin(min_timestamp):
+    """分片起点：最早一个点所在日期的本地零点"""
+    day = datetime.fromtimestamp(min_timestamp).replace(hour=0, minute=0, second=0, microsecond=0)
+    return day.timestamp()
+
+
+def shard_name(start):
+    return 'shard_' + datetime.fromtimestamp(start).strftime('%Y%m%d%H')
+
+
+def write_manifest(output_dir, manifest):
+    tmp_path = os.path.join(output_dir, 'manifest.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(output_dir, 'manifest.json'))
+
+
+def build_shards(input_dir, output_dir, shard_hours=24, workers=None):
+    """读取全部轨迹并构建分片索引，返回分片清单"""
+    files = sorted(os.path.join(input_dir, fname) for fname in os.listdir(input_dir) if fname.endswith('.txt'))
+    if not files:
+        raise ValueError(f'在输入目录 "{input_dir}" 中没有找到 .txt 文件')
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        tracks = list(tqdm(executor.map(read_track, files, chunksize=16), total=len(files),
+                           desc="读取轨迹", unit="文件"))
+        taxi_ids, timestamps, lons, lats = (np.concatenate(column) for column in zip(*tracks))
+        del tracks
+        if len(timestamps) == 0:
+            raise ValueError('没有有效的轨迹点')
+        # 文件内的点按时间排列，序号在按分片重排之前计算
+        item_ids = encode_item_ids(taxi_ids, timestamps, track_sequence(taxi_ids))
+
+        shard_seconds = int(shard_hours * 3600)
+        origin = shard_origin(timestamps.min())
+        keys = np.floor((timestamps - origin) / shard_seconds).astype(np.int64)
+        order = np.argsort(keys, kind='stable')
+        item_ids, timestamps, lons, lats, keys = (a[order] for a in (item_ids, timestamps, lons, lats, keys))
+        unique_keys, starts = np.unique(keys, return_index=True)
+        ends = np.append(starts[1:], len(keys))
+
+        building_dir = output_dir.rstrip('/\\') + '.building'
+        shutil.rmtree(building_dir, ignore_errors=True)
+        os.makedirs(building_dir)
+
+        shards = []
+        futures = []
+        for key, lo, hi in zip(unique_keys.tolist(), starts.tolist(), ends.tolist()):
+            start = origin + key * shard_seconds
+            name = shard_name(start)
+            shards.append({'name': name, 'start': start, 'end': start + shard_seconds, 'points': hi - lo})
+            futures.append(executor.submit(build_shard, os.path.join(building_dir, name),
+                                           item_ids[lo:hi], timestamps[lo:hi], lons[lo:hi], lats[lo:hi]))
+        for shard, future in tqdm(zip(shards, futures), total=len(shards), desc="构建分片", unit="分片"):
+            shard['bounds'] = future.result()
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'shard_seconds': shard_seconds,
+        'origin': origin,
+        'points': int(len(timestamps)),
+        'bounds': [float(lons.min()), float(lats.min()), float(timestamps.min()),
+                   float(lons.max()), float(lats.max()), float(timestamps.max())],
+        'shards': shards,
+    }
+    write_manifest(building_dir, manifest)
+
+    # 整体替换旧的分片目录；服务进程按清单修改时间重新打开分片
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+    os.replace(building_dir, output_dir)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='构建按时间分片的时空 R 树索引')
+    parser.add_argument('--data-dir', default=DEFAULT_INPUT_DIR, help='轨迹数据目录')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_DIR, help='分片索引输出目录')
+    parser.add_argument('--shard-hours', type=float, default=24, help='每个分片覆盖的时长（小时）')
+    parser.add_argument('--workers', type=int, default=None, help='读取与构建的进程数，默认等于 CPU 核数')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        print(f"错误：输入目录 \"{args.data_dir}\" 不存在。", file=sys.stderr)
+        sys.exit(1)
+    if args.shard_hours <= 0:
+        print("错误：--shard-hours 必须大于0。", file=sys.stderr)
+        sys.exit(1)
+
+    print("开始构建分片 R 树索引...")
+    print(f"输入目录: {args.data_dir}")
+    print(f"输出目录: {args.output}")
+    start_build_time = time.time()
+    try:
+        manifest = build_shards(args.data_dir, args.output, args.shard_hours, args.workers)
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        sys.exit(1)
+
+    print("\n分片索引构建完成！")
+    print(f"总共处理了 {manifest['points']} 个有效数据点，生成 {len(manifest['shards'])} 个分片。")
+    print(f"构建索引耗时: {time.time() - start_build_time:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
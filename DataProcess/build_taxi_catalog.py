@@ -0,0 +1,128 @@
+"""
+构建出租车目录（api/catalog.py 使用）
+
+原先要知道一辆车有没有轨迹、有多少点、覆盖哪段时间和哪片区域，只能打开并解析它的轨迹文件，
+F1、F9 每个请求都先探测文件是否存在。这里为每辆车预先记录一行元数据：
+点数、首末时间、经纬度范围与轨迹文件的字节数，F1 的列表接口按这些字段筛选与分页，
+F1、F9 据此直接拒绝没有轨迹或时间窗内没有点的查询。
+
+输出到 Data/taxi_catalog/（按出租车ID排序）:
+    taxi.npy                  int64    出租车ID
+    points.npy                int64    有效轨迹点数
+    first_time/last_time.npy  float64  首末点的时间戳（没有有效点时为 NaN，下同）
+    min_lon/min_lat/max_lon/max_lat.npy  float64  点的经纬度范围
+    bytes.npy                 int64    轨迹文件的字节数
+以及 meta.json。增量导入（ingest.py）追加轨迹后更新涉及出租车的行。
+
+用法:
+    python DataProcess/build_taxi_catalog.py
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from build_rtree_shards import read_track
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUT_DIR = os.path.join(script_dir, '..', 'Data', 'taxi_log_2008_by_id')
+DEFAULT_OUTPUT_DIR = os.path.join(script_dir, '..', 'Data', 'taxi_catalog')
+CATALOG_VERSION = 1
+COLUMNS = ('taxi', 'points', 'first_time', 'last_time', 'min_lon', 'min_lat', 'max_lon', 'max_lat', 'bytes')
+
+
+def file_entry(path):
+    """一个轨迹文件 -> 目录中的一行（按 COLUMNS 的顺序）"""
+    taxi_id = int(os.path.basename(path)[:-len('.txt')])
+    _, timestamps, lons, lats = read_track(path)
+    size = os.path.getsize(path)
+    if len(timestamps) == 0:
+        return (taxi_id, 0) + (np.nan,) * 6 + (size,)
+    return (taxi_id, len(timestamps), float(timestamps.min()), float(timestamps.max()),
+            float(lons.min()), float(lats.min()), float(lons.max()), float(lats.max()), size)
+
+
+def track_files(input_dir):
+    """目录中以出租车ID命名的轨迹文件"""
+    return sorted(os.path.join(input_dir, fname) for fname in os.listdir(input_dir)
+                  if fname.endswith('.txt') and fname[:-len('.txt')].isdigit())
+
+
+def write_catalog(output_dir, entries, meta):
+    entries = sorted(entries, key=lambda entry: entry[0])
+    columns = {name: np.array([entry[i] for entry in entries],
+                              dtype=np.int64 if name in ('taxi', 'points', 'bytes') else np.float64)
+               for i, name in enumerate(COLUMNS)}
+    building_dir = output_dir.rstrip('/\\') + '.building'
+    shutil.rmtree(building_dir, ignore_errors=True)
+    os.makedirs(building_dir)
+    for name, column in columns.items():
+        np.save(os.path.join(building_dir, f'{name}.npy'), column)
+    meta = dict(meta, version=CATALOG_VERSION, taxis=len(entries), points=int(columns['points'].sum()))
+    with open(os.path.join(building_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    # 整体替换旧目录；服务进程按 meta.json 的修改时间重新打开
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+    os.replace(building_dir, output_dir)
+    return meta
+
+
+def build_catalog(input_dir, output_dir, workers=None):
+    files = track_files(input_dir)
+    if not files:
+        raise ValueError(f'在输入目录 "{input_dir}" 中没有找到 .txt 文件')
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        entries = list(tqdm(executor.map(file_entry, files, chunksize=16), total=len(files),
+                            desc="统计轨迹", unit="文件"))
+    return write_catalog(output_dir, entries, {})
+
+
+def update_taxis(catalog_dir, track_dir, taxi_ids):
+    """轨迹文件追加新点后重新统计这些出租车（可以是新出现的出租车），返回新的 meta"""
+    with open(os.path.join(catalog_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    columns = [np.load(os.path.join(catalog_dir, f'{name}.npy')) for name in COLUMNS]
+    updated = {int(taxi_id) for taxi_id in taxi_ids}
+    entries = [entry for entry in zip(*(column.tolist() for column in columns)) if entry[0] not in updated]
+    for taxi_id in sorted(updated):
+        path = os.path.join(track_dir, f'{taxi_id}.txt')
+        if os.path.exists(path):
+            entries.append(file_entry(path))
+    return write_catalog(catalog_dir, entries, meta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='构建出租车目录')
+    parser.add_argument('--data-dir', default=DEFAULT_INPUT_DIR, help='轨迹数据目录')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_DIR, help='目录输出路径')
+    parser.add_argument('--workers', type=int, default=None, help='读取轨迹的进程数，默认等于 CPU 核数')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        print(f"错误：输入目录 \"{args.data_dir}\" 不存在。", file=sys.stderr)
+        sys.exit(1)
+
+    print("开始构建出租车目录...")
+    print(f"输入目录: {args.data_dir}")
+    print(f"输出目录: {args.output}")
+    start_build_time = time.time()
+    try:
+        meta = build_catalog(args.data_dir, args.output, args.workers)
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        sys.exit(1)
+
+    print("\n出租车目录构建完成！")
+    print(f"{meta['taxis']} 辆出租车，共 {meta['points']} 个轨迹点。")
+    print(f"构建耗时: {time.time() - start_build_time:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
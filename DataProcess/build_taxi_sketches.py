@@ -0,0 +1,213 @@
+"""
+构建按网格与时间桶划分的出租车去重草图（api/sketches.py 使用）
+
+F3 的独立出租车数无法由点数汇总得到，原先每次都要枚举时间窗内的每个点。这里为每个
+(时间桶, 网格) 记录经过的出租车：车辆不多的格子直接保存出租车ID列表（精确），超过
+exact_limit 辆的格子保存 HyperLogLog 草图（utils/hll.py），两种形式都可以跨网格、跨时间桶合并。
+
+网格为经纬度方向的等宽网格，边界为 cell_size 的整数倍（与数据范围无关，增量导入的新点不需要重新划分），
+网格号与格子键见 utils/sketch_grid.py。时间桶与 Unix 时间对齐，同样左闭右开。
+
+输出到 Data/taxi_sketches/（按 keys 排序）:
+    keys.npy        int64    格子键（时间桶号、经度方向网格号、纬度方向网格号）
+    points.npy      int64    格子内的点数
+    id_offsets.npy  int64    各格子的出租车ID在 taxi_ids.npy 中的起止位置（草图格子为空区间）
+    taxi_ids.npy    int32    精确格子的出租车ID（格内升序）
+    hll_rows.npy    int32    草图格子在 registers.npy 中的行号，精确格子为 -1
+    registers.npy   uint8    (草图格子数, 2^precision) 的 HyperLogLog 寄存器
+以及 meta.json。
+
+用法:
+    python DataProcess/build_taxi_sketches.py --cell-size 0.01 --bucket-minutes 60
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.hll import DEFAULT_PRECISION, add_ids
+from utils.sketch_grid import cell_index, encode_keys
+from build_rtree_shards import read_track
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUT_DIR = os.path.join(script_dir, '..', 'Data', 'taxi_log_2008_by_id')
+DEFAULT_OUTPUT_DIR = os.path.join(script_dir, '..', 'Data', 'taxi_sketches')
+SKETCH_VERSION = 1
+DEFAULT_CELL_SIZE = 0.01  # 度，约1公里
+COLUMNS = ('keys', 'points', 'id_offsets', 'taxi_ids', 'hll_rows', 'registers')
+
+
+def point_keys(timestamps, lons, lats, cell_size, bucket_seconds):
+    buckets = np.floor(np.asarray(timestamps, dtype=np.float64) / bucket_seconds)
+    return encode_keys(buckets, cell_index(lons, cell_size), cell_index(lats, cell_size))
+
+
+def taxi_pairs(taxi_ids, timestamps, lons, lats, cell_size, bucket_seconds):
+    """点 -> 去重后的 (格子键, 出租车ID) 与每对的点数"""
+    keys = point_keys(timestamps, lons, lats, cell_size, bucket_seconds)
+    pairs, counts = np.unique(np.stack([keys, np.asarray(taxi_ids, dtype=np.int64)], axis=1),
+                              axis=0, return_counts=True)
+    return pairs[:, 0], pairs[:, 1], counts
+
+
+def file_pairs(path, cell_size, bucket_seconds):
+    taxi_ids, timestamps, lons, lats = read_track(path)
+    return taxi_pairs(taxi_ids, timestamps, lons, lats, cell_size, bucket_seconds)
+
+
+def build_entries(keys, taxis, counts, precision, exact_limit, sketches=None):
+    """(格子键, 出租车ID, 点数) -> 各列；sketches 为已有的 {格子键: (寄存器, 点数)}，其中的格子保持草图形式"""
+    order = np.lexsort((taxis, keys))
+    keys, taxis, counts = keys[order], taxis[order], counts[order]
+    # 同一格子同一辆车可能来自多个输入（增量导入），先合并
+    first = np.r_[True, (keys[1:] != keys[:-1]) | (taxis[1:] != taxis[:-1])]
+    group = np.cumsum(first) - 1
+    counts = np.bincount(group, weights=counts).astype(np.int64)
+    keys, taxis = keys[first], taxis[first]
+
+    sketches = sketches or {}
+    entry_keys, starts = np.unique(keys, return_index=True)
+    ends = np.append(starts[1:], len(keys))
+    points = np.add.reduceat(counts, starts) if len(keys) else np.zeros(0, dtype=np.int64)
+    extra = np.array(sorted(set(sketches) - set(entry_keys.tolist())), dtype=np.int64)
+    all_keys = np.union1d(entry_keys, extra)
+    position = np.searchsorted(all_keys, entry_keys)
+    all_points = np.zeros(len(all_keys), dtype=np.int64)
+    all_points[position] = points
+    distinct = np.zeros(len(all_keys), dtype=np.int64)
+    distinct[position] = ends - starts
+    as_sketch = distinct > exact_limit
+    for key, (_, sketch_points) in sketches.items():
+        i = int(np.searchsorted(all_keys, key))
+        as_sketch[i] = True
+        all_points[i] += sketch_points
+
+    hll_rows = np.full(len(all_keys), -1, dtype=np.int32)
+    hll_rows[as_sketch] = np.arange(int(as_sketch.sum()), dtype=np.int32)
+    registers = np.zeros((int(as_sketch.sum()), 1 << precision), dtype=np.uint8)
+    pair_start = np.zeros(len(all_keys), dtype=np.int64)
+    pair_end = np.zeros(len(all_keys), dtype=np.int64)
+    pair_start[position], pair_end[position] = starts, ends
+    for i in np.flatnonzero(as_sketch).tolist():
+        row = registers[hll_rows[i]]
+        if int(all_keys[i]) in sketches:
+            np.maximum(row, sketches[int(all_keys[i])][0], out=row)
+        add_ids(row, taxis[pair_start[i]:pair_end[i]], precision)
+
+    exact_pairs = np.repeat(~as_sketch, pair_end - pair_start)
+    taxi_ids = taxis[exact_pairs].astype(np.int32)
+    lengths = np.where(as_sketch, 0, pair_end - pair_start)
+    id_offsets = np.r_[0, np.cumsum(lengths)].astype(np.int64)
+    return {'keys': all_keys, 'points': all_points, 'id_offsets': id_offsets, 'taxi_ids': taxi_ids,
+            'hll_rows': hll_rows, 'registers': registers}
+
+
+def write_sketches(output_dir, columns, meta):
+    building_dir = output_dir.rstrip('/\\') + '.building'
+    shutil.rmtree(building_dir, ignore_errors=True)
+    os.makedirs(building_dir)
+    for name in COLUMNS:
+        np.save(os.path.join(building_dir, f'{name}.npy'), columns[name])
+    meta = dict(meta, version=SKETCH_VERSION, entries=int(len(columns['keys'])),
+                hll_entries=int(len(columns['registers'])), points=int(columns['points'].sum()),
+                max_taxi=int(max(meta.get('max_taxi', 0), columns['taxi_ids'].max(initial=0))))
+    with open(os.path.join(building_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    # 整体替换旧目录；服务进程按 meta.json 的修改时间重新打开
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+    os.replace(building_dir, output_dir)
+    return meta
+
+
+def build_sketches(input_dir, output_dir, cell_size=DEFAULT_CELL_SIZE, bucket_seconds=3600,
+                   precision=DEFAULT_PRECISION, workers=None):
+    files = sorted(os.path.join(input_dir, fname) for fname in os.listdir(input_dir) if fname.endswith('.txt'))
+    if not files:
+        raise ValueError(f'在输入目录 "{input_dir}" 中没有找到 .txt 文件')
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(tqdm(executor.map(file_pairs, files, [cell_size] * len(files), [bucket_seconds] * len(files),
+                                         chunksize=16), total=len(files), desc="统计网格车辆", unit="文件"))
+    keys, taxis, counts = (np.concatenate(column) for column in zip(*results))
+    # 精确列表不超过草图大小的四分之一（按 int32 计）时保存为列表
+    exact_limit = (1 << precision) // 4
+    columns = build_entries(keys, taxis, counts, precision, exact_limit)
+    meta = {'cell_size': cell_size, 'bucket_seconds': bucket_seconds, 'precision': precision,
+            'exact_limit': exact_limit, 'max_taxi': int(taxis.max(initial=0))}
+    return write_sketches(output_dir, columns, meta)
+
+
+def merge_points(sketch_dir, taxi_ids, timestamps, lons, lats, batch=None):
+    """把新点并入已有的草图（沿用原有的网格与时间桶），返回新的 meta
+
+    batch 为增量导入的批次号，记录在 meta 中；该批次已并入时直接返回，重试导入不会重复计数。
+    """
+    with open(os.path.join(sketch_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if batch is not None:
+        if batch in meta.get('ingest_batches', []):
+            return meta
+        meta['ingest_batches'] = meta.get('ingest_batches', []) + [batch]
+    old = {name: np.load(os.path.join(sketch_dir, f'{name}.npy')) for name in COLUMNS}
+    exact = old['hll_rows'] < 0
+    lengths = np.diff(old['id_offsets'])
+    # 精确格子展开为 (格子键, 出租车ID)，格子的点数记在第一对上
+    old_keys = np.repeat(old['keys'], lengths)
+    old_counts = np.zeros(len(old_keys), dtype=np.int64)
+    old_counts[old['id_offsets'][:-1][exact & (lengths > 0)]] = old['points'][exact & (lengths > 0)]
+    sketches = {int(key): (old['registers'][row], int(points))
+                for key, row, points in zip(old['keys'][~exact].tolist(), old['hll_rows'][~exact].tolist(),
+                                            old['points'][~exact].tolist())}
+    new_keys, new_taxis, new_counts = taxi_pairs(taxi_ids, timestamps, lons, lats,
+                                                 meta['cell_size'], meta['bucket_seconds'])
+    columns = build_entries(np.concatenate([old_keys, new_keys]),
+                            np.concatenate([old['taxi_ids'].astype(np.int64), new_taxis]),
+                            np.concatenate([old_counts, new_counts]),
+                            meta['precision'], meta['exact_limit'], sketches)
+    meta['max_taxi'] = max(meta['max_taxi'], int(np.max(taxi_ids, initial=0)))
+    return write_sketches(sketch_dir, columns, meta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='构建按网格与时间桶划分的出租车去重草图')
+    parser.add_argument('--data-dir', default=DEFAULT_INPUT_DIR, help='轨迹数据目录')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_DIR, help='草图输出目录')
+    parser.add_argument('--cell-size', type=float, default=DEFAULT_CELL_SIZE, help='网格边长（度）')
+    parser.add_argument('--bucket-minutes', type=float, default=60, help='时间桶时长（分钟）')
+    parser.add_argument('--precision', type=int, default=DEFAULT_PRECISION,
+                        help='HyperLogLog 精度（寄存器数为 2^precision，相对误差约 1.04/sqrt(2^precision)）')
+    parser.add_argument('--workers', type=int, default=None, help='读取轨迹的进程数，默认等于 CPU 核数')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        print(f"错误：输入目录 \"{args.data_dir}\" 不存在。", file=sys.stderr)
+        sys.exit(1)
+    if args.cell_size <= 0 or args.bucket_minutes <= 0 or not 4 <= args.precision <= 16:
+        print("错误：--cell-size、--bucket-minutes 必须大于0，--precision 须在 4~16 之间。", file=sys.stderr)
+        sys.exit(1)
+
+    print("开始构建出租车去重草图...")
+    print(f"输入目录: {args.data_dir}")
+    print(f"输出目录: {args.output}")
+    start_build_time = time.time()
+    try:
+        meta = build_sketches(args.data_dir, args.output, args.cell_size, int(args.bucket_minutes * 60),
+                              args.precision, args.workers)
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        sys.exit(1)
+
+    print("\n去重草图构建完成！")
+    print(f"{meta['points']} 个轨迹点汇总为 {meta['entries']} 个 (时间桶, 网格)，"
+          f"其中 {meta['hll_entries']} 个使用 HyperLogLog 草图。")
+    print(f"构建耗时: {time.time() - start_build_time:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+预先计算各轨迹点的 Douglas-Peucker 重要度（F1 轨迹简化使用）
+
+F1 原先返回一辆车的全部 GPS 点，一周的轨迹常有数万个点，缩小到全城视图时绝大多数点落在同一个像素内。
+这里为每个轨迹文件计算每个点的重要度（米，见 utils/simplify.py），F1 按容差或地图缩放级别
+保留重要度大于容差的点，任意简化程度都只是一次阈值过滤，不需要重新计算。
+
+输出到 Data/track_ranks/<出租车ID>.npy（float32，与 F1 读出的点一一对应）。
+轨迹文件比重要度文件新（如增量导入追加了新点）时，F1 会重新计算并覆盖该文件。
+
+用法:
+    python DataProcess/build_track_ranks.py
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.simplify import significance
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUT_DIR = os.path.join(script_dir, '..', 'Data', 'taxi_log_2008_by_id')
+DEFAULT_OUTPUT_DIR = os.path.join(script_dir, '..', 'Data', 'track_ranks')
+
+
+def track_coordinates(path):
+    """按 F1 的规则读取轨迹文件中的经纬度（格式不正确的行跳过）"""
+    lons, lats = [], []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                _, _, lon, lat = line.strip().split(',')
+                lon, lat = float(lon), float(lat)
+            except ValueError:
+                continue
+            lons.append(lon)
+            lats.append(lat)
+    return np.array(lons, dtype=np.float64), np.array(lats, dtype=np.float64)
+
+
+def write_ranks(output_dir, taxi_id, ranks):
+    # 先写临时文件再替换，F1 不会读到写了一半的文件
+    path = os.path.join(output_dir, f'{taxi_id}.npy')
+    tmp_path = f'{path}.{os.getpid()}.tmp.npy'
+    np.save(tmp_path, np.asarray(ranks, dtype=np.float32))
+    os.replace(tmp_path, path)
+    return path
+
+
+def build_file(path, output_dir):
+    """计算并写入一个轨迹文件的重要度，返回点数"""
+    lons, lats = track_coordinates(path)
+    write_ranks(output_dir, os.path.basename(path)[:-len('.txt')], significance(lons, lats))
+    return len(lons)
+
+
+def update_taxis(output_dir, track_dir, taxi_ids):
+    """轨迹文件追加新点后重新计算这些出租车的重要度，返回点数"""
+    points = 0
+    for taxi_id in taxi_ids:
+        path = os.path.join(track_dir, f'{taxi_id}.txt')
+        if os.path.exists(path):
+            points += build_file(path, output_dir)
+    return points
+
+
+def main():
+    parser = argparse.ArgumentParser(description='预先计算各轨迹点的 Douglas-Peucker 重要度')
+    parser.add_argument('--data-dir', default=DEFAULT_INPUT_DIR, help='轨迹数据目录')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_DIR, help='重要度输出目录')
+    parser.add_argument('--workers', type=int, default=None, help='进程数，默认等于 CPU 核数')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        print(f"错误：输入目录 \"{args.data_dir}\" 不存在。", file=sys.stderr)
+        sys.exit(1)
+    files = sorted(os.path.join(args.data_dir, fname) for fname in os.listdir(args.data_dir)
+                   if fname.endswith('.txt'))
+    if not files:
+        print(f"错误：在输入目录 \"{args.data_dir}\" 中没有找到 .txt 文件。", file=sys.stderr)
+        sys.exit(1)
+    os.makedirs(args.output, exist_ok=True)
+
+    print("开始计算轨迹点重要度...")
+    print(f"输入目录: {args.data_dir}")
+    print(f"输出目录: {args.output}")
+    start_build_time = time.time()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        points = sum(tqdm(executor.map(build_file, files, [args.output] * len(files), chunksize=16),
+                          total=len(files), desc="计算重要度", unit="文件"))
+
+    print("\n轨迹点重要度计算完成！")
+    print(f"{len(files)} 条轨迹，共 {points} 个点。")
+    print(f"构建耗时: {time.time() - start_build_time:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+把每辆车的轨迹切分为行程，写入行程表（F5、F9 的行程模式使用）
+
+原始轨迹中没有“行程”的概念：逐点分析时，一对跨越夜间收车的点也会被当作一次通行。
+这里按两种断点把轨迹切开：
+- 时间间隔：相邻两点相隔超过 max_gap 秒（收车、信号中断）；
+- 停车：一段连续的静止步（相邻两点距离小于 stop_meters 米）累计超过 stop_seconds 秒，
+  行程在停车的第一个点结束，下一段行程从停车的最后一个点出发。
+短暂的静止（等红灯、堵车）不切分行程。累计距离不足 min_meters 米的片段（原地漂移）不计为行程。
+
+输出 SQLite 数据库 Data/taxi_trips.sqlite:
+    trips              每个行程的出租车ID、起终点坐标与时间、距离（米）、时长（秒）、点数
+    trip_origins       起点 (经度, 纬度, 出发时间) 的 R*Tree
+    trip_destinations  终点 (经度, 纬度, 到达时间) 的 R*Tree
+    trip_meta          切分参数，增量导入时按相同参数重新切分
+
+用法:
+    python DataProcess/build_trips.py --max-gap-minutes 30 --stop-minutes 10
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.geometry import haversine_distance
+from build_rtree_shards import read_track
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUT_DIR = os.path.join(script_dir, '..', 'Data', 'taxi_log_2008_by_id')
+DEFAULT_DB = os.path.join(script_dir, '..', 'Data', 'taxi_trips.sqlite')
+DEFAULT_PARAMS = {
+    'max_gap': 30 * 60,
+    'stop_seconds': 10 * 60,
+    'stop_meters': 100.0,
+    'min_meters': 500.0,
+}
+TRIP_COLUMNS = ('taxi_id', 'start_time', 'end_time', 'origin_lon', 'origin_lat',
+                'dest_lon', 'dest_lat', 'distance', 'duration', 'points')
+
+
+def _runs(mask):
+    """布尔数组中连续为 True 的区间，返回 (起点, 终点) 两个数组，区间左闭右开"""
+    edges = np.diff(np.r_[0, mask.astype(np.int8), 0])
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def segment_track(timestamps, lons, lats, max_gap, stop_seconds, stop_meters, min_meters):
+    """一辆车的轨迹（按时间排序）-> 各行程的 (起点下标, 终点下标, 距离) 三个数组，终点下标包含在行程内"""
+    empty = np.zeros(0, dtype=np.int64)
+    if len(timestamps) < 2:
+        return empty, empty, np.zeros(0)
+    # 第 i 步为第 i 个点到第 i+1 个点
+    step_seconds = np.diff(timestamps)
+    step_meters = haversine_distance(lons[:-1], lats[:-1], lons[1:], lats[1:])
+    gap = step_seconds > max_gap
+    still = (step_meters < stop_meters) & ~gap
+
+    # 累计时长超过 stop_seconds 的静止段为停车，停车中的各步不属于任何行程
+    still_starts, still_ends = _runs(still)
+    long_stop = timestamps[still_ends] - timestamps[still_starts] >= stop_seconds
+    marks = np.zeros(len(step_seconds) + 1, dtype=np.int64)
+    np.add.at(marks, still_starts[long_stop], 1)
+    np.add.at(marks, still_ends[long_stop], -1)
+    stopped = np.cumsum(marks)[:-1] > 0
+
+    # 其余连续的步构成行程：第 a~b-1 步对应第 a~b 个点
+    trip_starts, trip_ends = _runs(~(gap | stopped))
+    cumulative = np.r_[0.0, np.cumsum(step_meters)]
+    distances = cumulative[trip_ends] - cumulative[trip_starts]
+    keep = distances >= min_meters
+    return trip_starts[keep], trip_ends[keep], distances[keep]
+
+
+def file_trips(path, params=DEFAULT_PARAMS):
+    """读取一个轨迹文件，返回行程列表，每个行程为与 TRIP_COLUMNS 对应的元组"""
+    taxi_ids, timestamps, lons, lats = read_track(path)
+    if len(taxi_ids) == 0:
+        return []
+    order = np.argsort(timestamps, kind='stable')
+    timestamps, lons, lats = timestamps[order], lons[order], lats[order]
+    starts, ends, distances = segment_track(timestamps, lons, lats, params['max_gap'], params['stop_seconds'],
+                                            params['stop_meters'], params['min_meters'])
+    taxi_id = int(taxi_ids[0])
+    return [(taxi_id, float(timestamps[s]), float(timestamps[e]), float(lons[s]), float(lats[s]),
+             float(lons[e]), float(lats[e]), float(distance), float(timestamps[e] - timestamps[s]), int(e - s + 1))
+            for s, e, distance in zip(starts.tolist(), ends.tolist(), distances.tolist())]
+
+
+def insert_trips(conn, trips):
+    """写入行程及起终点的 R*Tree 条目（R*Tree 以单精度存储，查询时再按 trips 表中的精确值过滤）"""
+    c = conn.cursor()
+    for trip in trips:
+        c.execute(f'INSERT INTO trips ({", ".join(TRIP_COLUMNS)}) VALUES ({", ".join("?" * len(TRIP_COLUMNS))})',
+                  trip)
+        trip_id = c.lastrowid
+        _, start_time, end_time, origin_lon, origin_lat, dest_lon, dest_lat = trip[:7]
+        c.execute('INSERT INTO trip_origins VALUES (?, ?, ?, ?, ?, ?, ?)',
+                  (trip_id, origin_lon, origin_lon, origin_lat, origin_lat, start_time, start_time))
+        c.execute('INSERT INTO trip_destinations VALUES (?, ?, ?, ?, ?, ?, ?)',
+                  (trip_id, dest_lon, dest_lon, dest_lat, dest_lat, end_time, end_time))
+
+
+def write_trips(db_path, trips, params):
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE trips (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            taxi_id INTEGER,
+            start_time REAL,
+            end_time REAL,
+            origin_lon REAL,
+            origin_lat REAL,
+            dest_lon REAL,
+            dest_lat REAL,
+            distance REAL,
+            duration REAL,
+            points INTEGER
+        )
+    ''')
+    for name in ('trip_origins', 'trip_destinations'):
+        c.execute(f'CREATE VIRTUAL TABLE {name} USING rtree(id, min_lon, max_lon, min_lat, max_lat, min_time, max_time)')
+    insert_trips(conn, trips)
+    c.execute('CREATE INDEX idx_trips_taxi ON trips (taxi_id, start_time)')
+    c.execute('CREATE TABLE trip_meta (key TEXT PRIMARY KEY, value TEXT)')
+    c.executemany('INSERT INTO trip_meta (key, value) VALUES (?, ?)',
+                  [(key, str(value)) for key, value in params.items()])
+    conn.commit()
+    conn.close()
+
+
+def build_trips(input_dir, db_path, params=DEFAULT_PARAMS, workers=None):
+    files = sorted(os.path.join(input_dir, fname) for fname in os.listdir(input_dir) if fname.endswith('.txt'))
+    if not files:
+        raise ValueError(f'在输入目录 "{input_dir}" 中没有找到 .txt 文件')
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(tqdm(executor.map(file_trips, files, [params] * len(files), chunksize=16),
+                            total=len(files), desc="切分行程", unit="文件"))
+    trips = [trip for taxi_trips in results for trip in taxi_trips]
+    write_trips(db_path, trips, params)
+    return trips
+
+
+def read_trip_params(conn):
+    meta = dict(conn.execute('SELECT key, value FROM trip_meta').fetchall())
+    return {key: type(default)(float(meta[key])) if key in meta else default
+            for key, default in DEFAULT_PARAMS.items()}
+
+
+def update_taxis(db_path, track_dir, taxi_ids):
+    """轨迹文件追加新点后，按原参数重新切分这些出租车的行程并替换原有记录，返回重新写入的行程数"""
+    conn = sqlite3.connect(db_path)
+    try:
+        params = read_trip_params(conn)
+        trips = []
+        for taxi_id in taxi_ids:
+            path = os.path.join(track_dir, f'{taxi_id}.txt')
+            if os.path.exists(path):
+                trips.extend(file_trips(path, params))
+        with conn:
+            for taxi_id in taxi_ids:
+                for name in ('trip_origins', 'trip_destinations'):
+                    conn.execute(f'DELETE FROM {name} WHERE id IN (SELECT id FROM trips WHERE taxi_id = ?)',
+                                 (int(taxi_id),))
+                conn.execute('DELETE FROM trips WHERE taxi_id = ?', (int(taxi_id),))
+            insert_trips(conn, trips)
+        return len(trips)
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='把出租车轨迹切分为行程')
+    parser.add_argument('--data-dir', default=DEFAULT_INPUT_DIR, help='轨迹数据目录')
+    parser.add_argument('--db', default=DEFAULT_DB, help='输出 SQLite 路径')
+    parser.add_argument('--max-gap-minutes', type=float, default=DEFAULT_PARAMS['max_gap'] / 60,
+                        help='相邻两点间隔超过该时长（分钟）时切分行程')
+    parser.add_argument('--stop-minutes', type=float, default=DEFAULT_PARAMS['stop_seconds'] / 60,
+                        help='静止超过该时长（分钟）视为停车并切分行程')
+    parser.add_argument('--stop-meters', type=float, default=DEFAULT_PARAMS['stop_meters'],
+                        help='相邻两点距离小于该值（米）视为静止')
+    parser.add_argument('--min-meters', type=float, default=DEFAULT_PARAMS['min_meters'],
+                        help='行程的最短距离（米）')
+    parser.add_argument('--workers', type=int, default=None, help='读取轨迹的进程数，默认等于 CPU 核数')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        print(f"错误：输入目录 \"{args.data_dir}\" 不存在。", file=sys.stderr)
+        sys.exit(1)
+    if args.max_gap_minutes <= 0 or args.stop_minutes <= 0:
+        print("错误：--max-gap-minutes 与 --stop-minutes 必须大于0。", file=sys.stderr)
+        sys.exit(1)
+
+    params = {
+        'max_gap': int(args.max_gap_minutes * 60),
+        'stop_seconds': int(args.stop_minutes * 60),
+        'stop_meters': args.stop_meters,
+        'min_meters': args.min_meters,
+    }
+    print("开始切分行程...")
+    print(f"输入目录: {args.data_dir}")
+    print(f"输出数据库: {args.db}")
+    start_build_time = time.time()
+    try:
+        trips = build_trips(args.data_dir, args.db, params, args.workers)
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        sys.exit(1)
+
+    print("\n行程表构建完成！")
+    if trips:
+        durations = np.array([trip[8] for trip in trips])
+        distances = np.array([trip[7] for trip in trips])
+        print(f"共 {len(trips)} 个行程，时长中位数 {np.median(durations) / 60:.1f} 分钟，"
+              f"距离中位数 {np.median(distances) / 1000:.2f} 公里。")
+    else:
+        print("没有切分出行程。")
+    print(f"构建耗时: {time.time() - start_build_time:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+构建网格访问区间索引（api/visits.py 使用）
+
+把每辆车的轨迹压缩为“访问”：连续落在同一网格中的一段点记为 (网格, 出租车ID, 进入时间, 离开时间)，
+进入/离开时间为这段中第一个和最后一个点的时间。出租车在区域内停留一小时只留下一条访问，
+F5、F6、F9 的区域间移动分析按访问计算，而不是逐个 GPS 点。
+网格与路径挖掘相同（trajectory_preprocess.GRID_SIZE，约200米，网格编号见 encode_cells）。
+单条访问最长 MAX_VISIT_SECONDS，更长的停留切成多条，查询时可按进入时间二分定位。
+
+输出到 Data/taxi_visits/：cell.npy、taxi.npy、enter.npy、exit.npy（按 网格、进入时间 排序）与 meta.json。
+
+用法:
+    python DataProcess/build_visit_index.py
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from trajectory_preprocess import GRID_SIZE, encode_cells
+from build_rtree_shards import read_track
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUT_DIR = os.path.join(script_dir, '..', 'Data', 'taxi_log_2008_by_id')
+DEFAULT_OUTPUT_DIR = os.path.join(script_dir, '..', 'Data', 'taxi_visits')
+INDEX_VERSION = 1
+MAX_VISIT_SECONDS = 6 * 3600
+COLUMNS = ('cell', 'taxi', 'enter', 'exit')
+
+
+def track_visits(timestamps, lons, lats, grid_size=GRID_SIZE, max_seconds=MAX_VISIT_SECONDS):
+    """一辆车的轨迹（按时间排序）-> (网格, 进入时间, 离开时间, 点数) 四个数组"""
+    if len(timestamps) == 0:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.int64))
+    cells = encode_cells(lons, lats, grid_size)
+    run_starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+    run_ids = np.cumsum(np.r_[True, cells[1:] != cells[:-1]]) - 1
+    # 超过 max_seconds 的停留按进入后经过的时长切段，每段都不超过 max_seconds
+    pieces = np.floor((timestamps - timestamps[run_starts][run_ids]) / max_seconds).astype(np.int64)
+    new_visit = np.r_[True, (run_ids[1:] != run_ids[:-1]) | (pieces[1:] != pieces[:-1])]
+    starts = np.flatnonzero(new_visit)
+    ends = np.append(starts[1:], len(cells)) - 1
+    return cells[starts], timestamps[starts], timestamps[ends], ends - starts + 1
+
+
+def file_visits(path, grid_size=GRID_SIZE, max_seconds=MAX_VISIT_SECONDS):
+    """读取一个轨迹文件，返回 (网格, 出租车ID, 进入时间, 离开时间, 点数)"""
+    taxi_ids, timestamps, lons, lats = read_track(path)
+    if len(taxi_ids) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0), np.zeros(0), 0
+    order = np.argsort(timestamps, kind='stable')
+    cells, enters, exits, _ = track_visits(timestamps[order], lons[order], lats[order], grid_size, max_seconds)
+    return cells, np.full(len(cells), taxi_ids[0], dtype=np.int64), enters, exits, len(taxi_ids)
+
+
+def write_index(output_dir, cells, taxis, enters, exits, meta):
+    """按 网格、进入时间 排序并写出索引（同时进入的按出租车ID排序，结果与输入顺序无关）"""
+    order = np.lexsort((exits, taxis, enters, cells))
+    columns = {'cell': cells[order], 'taxi': taxis[order].astype(np.int32),
+               'enter': enters[order].astype(np.float64), 'exit': exits[order].astype(np.float64)}
+    building_dir = output_dir.rstrip('/\\') + '.building'
+    shutil.rmtree(building_dir, ignore_errors=True)
+    os.makedirs(building_dir)
+    for name, column in columns.items():
+        np.save(os.path.join(building_dir, f'{name}.npy'), column)
+    meta = dict(meta, version=INDEX_VERSION, visits=int(len(cells)))
+    with open(os.path.join(building_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    # 整体替换旧目录；服务进程按 meta.json 的修改时间重新打开
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+    os.replace(building_dir, output_dir)
+    return meta
+
+
+def build_index(input_dir, output_dir, grid_size=GRID_SIZE, max_seconds=MAX_VISIT_SECONDS, workers=None):
+    files = sorted(os.path.join(input_dir, fname) for fname in os.listdir(input_dir) if fname.endswith('.txt'))
+    if not files:
+        raise ValueError(f'在输入目录 "{input_dir}" 中没有找到 .txt 文件')
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(tqdm(executor.map(file_visits, files, [grid_size] * len(files), [max_seconds] * len(files),
+                                         chunksize=16), total=len(files), desc="压缩轨迹", unit="文件"))
+    cells, taxis, enters, exits, points = zip(*results)
+    meta = {'grid_size': grid_size, 'max_visit_seconds': max_seconds, 'points': int(sum(points))}
+    return write_index(output_dir, np.concatenate(cells), np.concatenate(taxis),
+                       np.concatenate(enters), np.concatenate(exits), meta)
+
+
+def update_taxis(index_dir, track_dir, taxi_ids, new_points, batch=None):
+    """轨迹文件追加了 new_points 个点后，重新计算这些出租车的访问并替换索引中原有的记录，返回新的 meta
+
+    batch 为增量导入的批次号；重试已完成的批次时只重新计算访问，不重复累加点数。
+    """
+    with open(os.path.join(index_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if batch is not None and batch in meta.get('ingest_batches', []):
+        new_points = 0
+    elif batch is not None:
+        meta['ingest_batches'] = meta.get('ingest_batches', []) + [batch]
+    cells, taxis, enters, exits = (np.load(os.path.join(index_dir, f'{name}.npy')) for name in COLUMNS)
+    keep = ~np.isin(taxis, np.array(sorted(taxi_ids), dtype=np.int64))
+    parts = [(cells[keep], taxis[keep].astype(np.int64), enters[keep], exits[keep])]
+    for taxi_id in taxi_ids:
+        path = os.path.join(track_dir, f'{taxi_id}.txt')
+        if os.path.exists(path):
+            parts.append(file_visits(path, meta['grid_size'], meta['max_visit_seconds'])[:4])
+    cells, taxis, enters, exits = (np.concatenate(column) for column in zip(*parts))
+    meta['points'] += new_points
+    return write_index(index_dir, cells, taxis, enters, exits, meta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='构建网格访问区间索引')
+    parser.add_argument('--data-dir', default=DEFAULT_INPUT_DIR, help='轨迹数据目录')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_DIR, help='索引输出目录')
+    parser.add_argument('--max-visit-hours', type=float, default=MAX_VISIT_SECONDS / 3600,
+                        help='单条访问的最长时长（小时），更长的停留切成多条')
+    parser.add_argument('--workers', type=int, default=None, help='读取轨迹的进程数，默认等于 CPU 核数')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        print(f"错误：输入目录 \"{args.data_dir}\" 不存在。", file=sys.stderr)
+        sys.exit(1)
+    if args.max_visit_hours <= 0:
+        print("错误：--max-visit-hours 必须大于0。", file=sys.stderr)
+        sys.exit(1)
+
+    print("开始构建访问区间索引...")
+    print(f"输入目录: {args.data_dir}")
+    print(f"输出目录: {args.output}")
+    start_build_time = time.time()
+    try:
+        meta = build_index(args.data_dir, args.output, GRID_SIZE, int(args.max_visit_hours * 3600), args.workers)
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        sys.exit(1)
+
+    print("\n访问区间索引构建完成！")
+    print(f"{meta['points']} 个轨迹点压缩为 {meta['visits']} 条访问（{meta['points'] / max(meta['visits'], 1):.1f} 点/条）。")
+    print(f"构建耗时: {time.time() - start_build_time:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,76 +1,109 @@
 import os
+import sys
 import pickle
 import sqlite3
-import numpy as np
+import argparse
 import glob
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from tqdm import tqdm  # 用于显示进度条
 
-def haversine_distance(lon1, lat1, lon2, lat2):
-    lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = np.sin(dlat/2.0)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2.0)**2
-    c = 2 * np.arcsin(np.sqrt(a))
-    r = 6371000
-    return c * r
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.geometry import batch_path_lengths
 
-def calculate_path_length(points):
-    total_length = 0
-    for i in range(len(points) - 1):
-        lon1, lat1 = points[i]
-        lon2, lat2 = points[i + 1]
-        total_length += haversine_distance(lon1, lat1, lon2, lat2)
-    return total_length
+
+def load_block_rows(pkl_file):
+    """工作进程：读取一个 pkl 分块，返回待插入的 (frequency, length, points) 行"""
+    with open(pkl_file, 'rb') as f:
+        block = pickle.load(f)
+    paths = list(block.keys())
+    lengths = batch_path_lengths(paths)
+    return [(len(block[path_key]), float(length), ';'.join([f"{p[0]},{p[1]}" for p in path_key]))
+            for path_key, length in zip(paths, lengths)]
+
+
+def bounded_results(executor, fn, items, max_in_flight):
+    """按完成顺序逐个返回 (item, future)，同时最多有 max_in_flight 个任务未取走结果"""
+    in_flight = {}
+    for item in items:
+        in_flight[executor.submit(fn, item)] = item
+        if len(in_flight) >= max_in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield in_flight.pop(future), future
+    for future in as_completed(list(in_flight)):
+        yield in_flight.pop(future), future
 
 # 基础路径设置
 BASE_DIR = os.path.dirname(__file__)
 BLOCK_DIR = os.path.join(BASE_DIR, '../Data/path_invert_blocks')
 DB_PATH = os.path.join(BASE_DIR, '../Data/all_paths_from_pkl.sqlite')
+COMMIT_ROWS = 500000  # 每个事务最多写入的行数
+IN_FLIGHT_PER_WORKER = 2  # 每个进程最多排队的分块数，解析好但未插入的行只保留这么多
+
+def init_db(db_path):
+    # 删除已有数据库
+    if os.path.exists(db_path):
+        os.remove(db_path)
 
-# 删除已有数据库
-if os.path.exists(DB_PATH):
-    os.remove(DB_PATH)
+    # 初始化数据库；构建期间关闭日志与同步，失败时直接重建即可
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('''
+        CREATE TABLE paths (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            frequency INTEGER,
+            length REAL,
+            points TEXT
+        )
+    ''')
+    conn.commit()
+    return conn
 
-# 初始化数据库
-conn = sqlite3.connect(DB_PATH)
-c = conn.cursor()
-c.execute('''
-    CREATE TABLE paths (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        frequency INTEGER,
-        length REAL,
-        points TEXT
-    )
-''')
-conn.commit()
+def main():
+    parser = argparse.ArgumentParser(description='将 pkl 分块转换为 SQLite 路径库')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='解析 pkl 的进程数')
+    parser.add_argument('--block-dir', default=BLOCK_DIR, help='pkl 分块根目录')
+    parser.add_argument('--db', default=DB_PATH, help='输出 SQLite 路径')
+    args = parser.parse_args()
 
-# 遍历每一个子文件夹 path_invert_blocks_5 到 path_invert_blocks_17
-for window_size in range(5, 18):
-    sub_dir = os.path.join(BLOCK_DIR, f'path_invert_blocks_{window_size}')
-    if not os.path.exists(sub_dir):
-        print(f"❌ 子目录不存在：{sub_dir}")
-        continue
+    conn = init_db(args.db)
+    c = conn.cursor()
+    pending = 0
+    max_in_flight = IN_FLIGHT_PER_WORKER * max(args.workers or os.cpu_count() or 1, 1)
 
-    pkl_files = glob.glob(os.path.join(sub_dir, '*.pkl'))
-    print(f"\n📂 正在处理子目录: path_invert_blocks_{window_size}，共 {len(pkl_files)} 个文件")
+    # 多进程解析分块，主进程作为唯一写入者；每个分块的行插入后即释放
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        # 遍历每一个子文件夹 path_invert_blocks_5 到 path_invert_blocks_17
+        for window_size in range(5, 18):
+            sub_dir = os.path.join(args.block_dir, f'path_invert_blocks_{window_size}')
+            if not os.path.exists(sub_dir):
+                print(f"❌ 子目录不存在：{sub_dir}")
+                continue
 
-    # ✅ 使用 tqdm 显示当前子目录的处理进度
-    for pkl_file in tqdm(pkl_files, desc=f"正在处理 path_invert_blocks_{window_size}", unit="文件"):
-        try:
-            with open(pkl_file, 'rb') as f:
-                block = pickle.load(f)
+            pkl_files = glob.glob(os.path.join(sub_dir, '*.pkl'))
+            print(f"\n📂 正在处理子目录: path_invert_blocks_{window_size}，共 {len(pkl_files)} 个文件")
 
-            for path_key, taxi_ids in block.items():
-                points = list(path_key)
-                path_length = calculate_path_length(points)
-                points_str = ';'.join([f"{p[0]},{p[1]}" for p in points])
-                c.execute('INSERT INTO paths (frequency, length, points) VALUES (?, ?, ?)',
-                          (len(taxi_ids), path_length, points_str))
+            results = bounded_results(executor, load_block_rows, pkl_files, max_in_flight)
+            # ✅ 使用 tqdm 显示当前子目录的处理进度
+            for pkl_file, future in tqdm(results, total=len(pkl_files), desc=f"正在处理 path_invert_blocks_{window_size}", unit="文件"):
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    print(f"❌ 错误文件: {pkl_file}，错误信息: {e}")
+                    continue
+                c.executemany('INSERT INTO paths (frequency, length, points) VALUES (?, ?, ?)', rows)
+                pending += len(rows)
+                if pending >= COMMIT_ROWS:
+                    conn.commit()
+                    pending = 0
 
-            conn.commit()
-        except Exception as e:
-            print(f"❌ 错误文件: {pkl_file}，错误信息: {e}")
+    conn.commit()
+    # 恢复默认日志模式，供 API 只读访问
+    conn.execute('PRAGMA journal_mode=DELETE')
+    # 关闭数据库连接
+    conn.close()
+    print(f"\n✅ 所有路径数据已写入 SQLite：{args.db}")
 
-# 关闭数据库连接
-conn.close()
-print(f"\n✅ 所有路径数据已写入 SQLite：{DB_PATH}")
+if __name__ == '__main__':
+    main()
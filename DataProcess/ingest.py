@@ -0,0 +1,527 @@
+"""
+增量导入新的 GPS 轨迹
+
+新增一天的数据时不再重建全部索引与路径库，只处理新数据：
+1. 按分片清单的分片时长把新点切开，每个时间段构建一个增量分片
+   shard_<YYYYmmddHH>_b<批次号>，与同一时间段的原有分片并存，查询时一并扫描；
+2. 对新数据涉及的出租车，比较“原有轨迹”与“原有轨迹 + 新数据”中的全部窗口，
+   得到每辆车新经过的路径，在路径库中原地累加频次（频次为经过该路径的出租车数）。
+   路径库中没有的路径用 Misra-Gries 草图计数，达到最小支持度的作为新候选；
+   top-k 模式的库按原挖掘参数重新做 k-skyband 筛选；
+3. 把新记录并入 taxi_log_2008_by_id 下各车的轨迹文件（新数据早于已有记录时按时间重排该文件）；
+4. 已构建列式点存储（build_columnar.py）时把新点并入并重新排序，已构建去重草图（build_taxi_sketches.py）时并入新点；
+   已构建访问区间索引（build_visit_index.py）时按追加后的轨迹文件重新计算涉及出租车的访问；
+   已构建行程表（build_trips.py）时同样按完整轨迹重新切分涉及出租车的行程；
+   已计算轨迹点重要度（build_track_ranks.py）时重新计算涉及出租车的重要度；
+   已构建出租车目录（build_taxi_catalog.py）时重新统计涉及出租车（包括新出现的出租车）的元数据；
+5. 最后写入新的分片清单（服务进程按清单修改时间自动加载新分片），清空 F7/F8 的查询缓存。
+
+已导入文件的 SHA-1 记录在 Data/ingest_log.json 中，重复导入同一文件会被跳过。
+每个批次在修改任何数据之前先作为未完成批次写入该文件，每完成一步记录一次；中途失败后用同样的文件
+重新运行即从未完成的步骤继续，已完成的步骤不会重做。增量分片与新的轨迹文件先写到 Data/ingest_staging/，
+全部写好后再逐个替换进数据目录，因此重试不会重复追加轨迹；只能累加的存储（路径库、列存储、去重草图）
+在各自的数据中记下已并入的批次号。
+新路径的频次只统计了本批涉及的出租车，是真实频次的下界；增量分片多了以后可以
+重新运行 build_rtree_shards.py 与 topk_path_miner.py 做一次全量重建（合并分片、精确频次）。
+
+需要先用 build_rtree_shards.py 构建分片索引。
+
+用法:
+    python DataProcess/ingest.py --input new_logs/2008-02-09
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import numpy as np
+from datetime import datetime
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.geometry import path_length
+from utils.item_ids import encode_item_ids, track_sequence
+from trajectory_preprocess import GRID_SIZE, encode_cells, decode_cells
+from topk_path_miner import (MIN_WINDOW, MAX_WINDOW, MisraGries, parse_track_lines, track_segments,
+                             k_skyband)
+from build_rtree_shards import parse_records, build_shard, shard_name, write_manifest
+from build_columnar import merge_into_store
+from build_taxi_sketches import merge_points as merge_into_sketches
+from build_visit_index import update_taxis as update_visits
+from build_trips import update_taxis as update_trips
+from build_track_ranks import update_taxis as update_ranks
+from build_taxi_catalog import update_taxis as update_catalog
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, '..', 'Data')
+LEDGER_FILE = 'ingest_log.json'
+STAGING_DIR = 'ingest_staging'
+QUERY_CACHE_DIRS = ('f7_query_cache', 'f8_query_cache')
+SKETCH_CAPACITY = 200000  # 新候选路径草图的计数器数量
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_ledger(data_dir):
+    try:
+        with open(os.path.join(data_dir, LEDGER_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'batches': []}
+
+
+def save_ledger(data_dir, ledger):
+    path = os.path.join(data_dir, LEDGER_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(ledger, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def read_batch(files):
+    """读取新数据，返回按出租车分组的记录 {出租车ID: [(时间字符串, 时间戳, 经度, 纬度, 原始行), ...]}"""
+    records = defaultdict(list)
+    for path in tqdm(files, desc="读取新数据", unit="文件"):
+        with open(path, 'r', encoding='utf-8') as f:
+            for taxi_id, time_str, timestamp, lon, lat, line in zip(*parse_records(f, with_lines=True)):
+                records[taxi_id].append((time_str, timestamp, lon, lat, line))
+    for taxi_records in records.values():
+        taxi_records.sort(key=lambda r: r[1])
+    return records
+
+
+def batch_arrays(records):
+    """把本批记录展开为 (出租车ID, 时间戳, 经度, 纬度) 四个数组"""
+    taxi_ids, timestamps, lons, lats = [], [], [], []
+    for taxi_id, taxi_records in records.items():
+        for _, timestamp, lon, lat, _ in taxi_records:
+            taxi_ids.append(taxi_id)
+            timestamps.append(timestamp)
+            lons.append(lon)
+            lats.append(lat)
+    taxi_ids = np.array(taxi_ids, dtype=np.int64)
+    timestamps = np.array(timestamps, dtype=np.float64)
+    lons = np.array(lons, dtype=np.float64)
+    lats = np.array(lats, dtype=np.float64)
+    return taxi_ids, timestamps, lons, lats
+
+
+def move_staged(staging_dir, target_dir):
+    """把暂存目录中的文件逐个替换进目标目录；中途失败后重新调用会继续移动剩下的文件"""
+    if not os.path.isdir(staging_dir):
+        return 0
+    os.makedirs(target_dir, exist_ok=True)
+    fnames = os.listdir(staging_dir)
+    for fname in fnames:
+        os.replace(os.path.join(staging_dir, fname), os.path.join(target_dir, fname))
+    os.rmdir(staging_dir)
+    return len(fnames)
+
+
+def build_delta_shards(records, staging_dir, manifest, batch_no, workers=None):
+    """按分片时长切分新点，在暂存目录中构建增量分片，返回新分片的清单条目"""
+    taxi_ids, timestamps, lons, lats = batch_arrays(records)
+    item_ids = encode_item_ids(taxi_ids, timestamps, track_sequence(taxi_ids))
+
+    shard_seconds = manifest['shard_seconds']
+    origin = manifest['origin']
+    keys = np.floor((timestamps - origin) / shard_seconds).astype(np.int64)
+    order = np.argsort(keys, kind='stable')
+    item_ids, timestamps, lons, lats, keys = (a[order] for a in (item_ids, timestamps, lons, lats, keys))
+    unique_keys, starts = np.unique(keys, return_index=True)
+    ends = np.append(starts[1:], len(keys))
+
+    # 上次中途失败留下的半成品分片会被 rtree 追加写入，先清空
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+    shards = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for key, lo, hi in zip(unique_keys.tolist(), starts.tolist(), ends.tolist()):
+            start = origin + key * shard_seconds
+            name = f'{shard_name(start)}_b{batch_no}'
+            shards.append({'name': name, 'start': start, 'end': start + shard_seconds, 'points': hi - lo})
+            futures.append(executor.submit(build_shard, os.path.join(staging_dir, name),
+                                           item_ids[lo:hi], timestamps[lo:hi], lons[lo:hi], lats[lo:hi]))
+        for shard, future in zip(shards, futures):
+            shard['bounds'] = future.result()
+    return shards
+
+
+def merge_manifest(manifest, new_shards):
+    # 清单中已有的分片（重试时）不再重复计入
+    names = {shard['name'] for shard in manifest['shards']}
+    new_shards = [shard for shard in new_shards if shard['name'] not in names]
+    manifest['shards'] = sorted(manifest['shards'] + new_shards, key=lambda s: (s['start'], s['name']))
+    manifest['points'] += sum(shard['points'] for shard in new_shards)
+    bounds = manifest['bounds']
+    for shard in new_shards:
+        b = shard['bounds']
+        bounds = [min(bounds[i], b[i]) for i in range(3)] + [max(bounds[i], b[i]) for i in range(3, 6)]
+    manifest['bounds'] = bounds
+    return manifest
+
+
+def read_track_file(path, newline=None):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8', newline=newline) as f:
+        return f.readlines()
+
+
+def format_record(record):
+    # 原样写回源文件中的行，保留坐标的原始精度与格式
+    return record[-1] + '\n'
+
+
+def _windows(segments, window_size):
+    """全部行程段中长度为 window_size 的窗口（void 数组，每个元素为窗口的字节表示）"""
+    parts = []
+    for cells in segments:
+        if len(cells) >= window_size:
+            windows = np.lib.stride_tricks.sliding_window_view(cells, window_size)
+            parts.append(np.ascontiguousarray(windows).view(np.dtype((np.void, 8 * window_size))).ravel())
+    return np.concatenate(parts) if parts else None
+
+
+def new_path_keys(old_lines, new_lines, preprocess, grid_size):
+    """一辆车加入新数据后新经过的路径（相对原有轨迹），返回窗口字节键列表"""
+    old_segments = track_segments(*parse_track_lines(old_lines)[1:], preprocess, grid_size) if old_lines else []
+    new_segments = track_segments(*parse_track_lines(old_lines + new_lines)[1:], preprocess, grid_size)
+    keys = []
+    for window_size in range(MIN_WINDOW, MAX_WINDOW + 1):
+        new_windows = _windows(new_segments, window_size)
+        if new_windows is None:
+            break
+        old_windows = _windows(old_segments, window_size)
+        novel = np.unique(new_windows) if old_windows is None else np.setdiff1d(new_windows, old_windows)
+        keys.extend(window.tobytes() for window in novel)
+    return keys
+
+
+def _taxi_path_keys(task):
+    # 进程池任务：读取原有轨迹并计算新经过的路径
+    taxi_id, taxi_records, track_dir, preprocess, grid_size = task
+    old_lines = read_track_file(os.path.join(track_dir, f'{taxi_id}.txt'))
+    new_lines = [format_record(r) for r in taxi_records]
+    return new_path_keys(old_lines, new_lines, preprocess, grid_size)
+
+
+def read_mining_meta(conn):
+    try:
+        return dict(conn.execute('SELECT key, value FROM mining_meta').fetchall())
+    except sqlite3.OperationalError:
+        return None  # 全量流程（convert_all_pkl_to_sqlite.py）生成的库没有挖掘参数
+
+
+def applied_batches(conn):
+    try:
+        return {row[0] for row in conn.execute('SELECT batch FROM ingest_batches')}
+    except sqlite3.OperationalError:
+        return set()
+
+
+def count_path_keys(records, track_dir, preprocess, grid_size, existing, capacity, workers=None):
+    """统计本批各车新经过的路径，返回 (已有路径的增量, 库外路径的草图, 库外路径的精确计数)
+
+    capacity 为 None 时不用草图，库外路径精确计数。
+    """
+    increments = defaultdict(int)
+    sketch = MisraGries(capacity) if capacity is not None else None
+    novel_counts = defaultdict(int)
+    # 轨迹预处理是主要开销，各车在进程池中并行计算
+    tasks = ((taxi_id, taxi_records, track_dir, preprocess, grid_size) for taxi_id, taxi_records in records.items())
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for keys in tqdm(executor.map(_taxi_path_keys, tasks, chunksize=16), total=len(records),
+                         desc="更新路径频次", unit="车"):
+            for key in keys:
+                if key in existing:
+                    increments[key] += 1
+                elif sketch is not None:
+                    sketch.update(key)
+                else:
+                    novel_counts[key] += 1
+    return increments, sketch, novel_counts
+
+
+def update_paths_db(db_path, track_dir, records, workers=None, batch_no=None):
+    """按新数据累加路径频次，返回 (更新的路径数, 新增的路径数, 删除的路径数)
+
+    batch_no 与频次更新在同一事务中写入 ingest_batches 表；该批次已写入时不再累加，返回 None。
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        if batch_no is not None and batch_no in applied_batches(conn):
+            return None
+        meta = read_mining_meta(conn)
+        grid_size = float(meta.get('grid_size', GRID_SIZE)) if meta else GRID_SIZE
+        preprocess = meta.get('preprocess', 'True') == 'True' if meta else True
+
+        existing = {}  # 窗口字节键 -> [id, 频次, 长度, points 文本]
+        for row_id, frequency, length, points in conn.execute('SELECT id, frequency, length, points FROM paths'):
+            coords = np.array([p.split(',') for p in points.split(';')], dtype=np.float64)
+            key = encode_cells(coords[:, 0], coords[:, 1], grid_size).tobytes()
+            existing[key] = [row_id, frequency, length, points]
+
+        # top-k 模式的库只保留候选路径，库外路径用草图计数；全量库则精确计数
+        capacity = SKETCH_CAPACITY if meta else None
+        increments, sketch, novel_counts = count_path_keys(records, track_dir, preprocess, grid_size, existing,
+                                                           capacity, workers)
+        if sketch is not None:
+            min_support = int(meta.get('min_support', 2))
+            # 草图误差达到最小支持度时频繁路径可能已被移出，容量加倍后重新统计
+            while not sketch.covers(min_support):
+                print(f"路径草图误差 {sketch.error} 已达到最小支持度，容量 {capacity} 加倍后重新统计")
+                capacity *= 2
+                increments, sketch, novel_counts = count_path_keys(records, track_dir, preprocess, grid_size,
+                                                                   existing, capacity, workers)
+            # 草图计数是真实频次的下界，只收入下界已达到最小支持度的路径
+            novel_counts = {key: count for key, count in sketch.counters.items() if count >= min_support}
+
+        for key, count in increments.items():
+            existing[key][1] += count
+        novel = []
+        for key, frequency in novel_counts.items():
+            points = decode_cells(np.frombuffer(key, dtype=np.int64))
+            novel.append({'frequency': frequency, 'length': path_length(points), 'points': points, 'key': key})
+
+        kept_keys = None
+        if meta and 'top_k' in meta:
+            candidates = [{'frequency': row[1], 'length': row[2], 'key': key} for key, row in existing.items()] + novel
+            kept_keys = {p['key'] for p in k_skyband(candidates, int(meta['top_k']))}
+
+        removed = [row[0] for key, row in existing.items() if kept_keys is not None and key not in kept_keys]
+        inserted = [p for p in novel if kept_keys is None or p['key'] in kept_keys]
+        with conn:
+            conn.executemany('UPDATE paths SET frequency = ? WHERE id = ?',
+                             [(existing[key][1], existing[key][0]) for key in increments])
+            conn.executemany('DELETE FROM paths WHERE id = ?', [(row_id,) for row_id in removed])
+            conn.executemany('INSERT INTO paths (frequency, length, points) VALUES (?, ?, ?)',
+                             [(p['frequency'], p['length'], ';'.join(f"{lon},{lat}" for lon, lat in p['points']))
+                              for p in inserted])
+            if meta is not None:
+                conn.execute('INSERT OR REPLACE INTO mining_meta (key, value) VALUES (?, ?)',
+                             ('incremental_updates', str(int(meta.get('incremental_updates', 0)) + 1)))
+            if batch_no is not None:
+                conn.execute('CREATE TABLE IF NOT EXISTS ingest_batches (batch INTEGER PRIMARY KEY)')
+                conn.execute('INSERT INTO ingest_batches (batch) VALUES (?)', (batch_no,))
+        return len(increments), len(inserted), len(removed)
+    finally:
+        conn.close()
+
+
+def _line_time(line):
+    parts = line.split(',')
+    return parts[1].strip() if len(parts) >= 4 else ''
+
+
+def stage_tracks(track_dir, staging_dir, records):
+    """在暂存目录中写出各车并入新记录后的完整轨迹文件；新记录早于文件中最后一条时按时间重排
+
+    原有轨迹文件不做修改，由 move_staged 整体替换，中途失败后重新暂存不会重复追加。
+    """
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+    for taxi_id, taxi_records in records.items():
+        new_lines = [format_record(r) for r in taxi_records]
+        # 按原样读写（不转换换行符），与直接追加到原文件的结果相同
+        old_lines = read_track_file(os.path.join(track_dir, f'{taxi_id}.txt'), newline='')
+        if old_lines and not old_lines[-1].endswith('\n'):
+            old_lines[-1] += '\n'
+        last_time = max((_line_time(line) for line in old_lines[-1:]), default='')
+        if taxi_records[0][0] >= last_time:
+            lines = old_lines + new_lines
+        else:
+            # 时间字符串为 YYYY-MM-DD HH:MM:SS，按字符串排序即按时间排序；sorted 是稳定的
+            lines = sorted(old_lines + new_lines, key=_line_time)
+        with open(os.path.join(staging_dir, f'{taxi_id}.txt'), 'w', encoding='utf-8', newline='') as f:
+            f.writelines(lines)
+
+
+def clear_query_caches(data_dir):
+    for name in QUERY_CACHE_DIRS:
+        shutil.rmtree(os.path.join(data_dir, name), ignore_errors=True)
+
+
+def select_files(input_paths, ledger):
+    """挑出本次要导入的文件 {绝对路径: SHA-1}
+
+    有未完成的批次时只继续该批次：输入中必须包含它的全部文件（按 SHA-1 比对），其余新文件留到下次导入。
+    """
+    done = {sha1 for batch in ledger['batches'] for sha1 in batch['files'].values()}
+    hashes = {}
+    for path in input_paths:
+        sha1 = file_sha1(path)
+        if sha1 in done:
+            print(f"跳过已导入的文件: {path}")
+        elif sha1 not in hashes.values():
+            hashes[os.path.abspath(path)] = sha1
+    pending = ledger.get('pending')
+    if pending is None:
+        return hashes
+    by_sha1 = {sha1: path for path, sha1 in hashes.items()}
+    missing = [path for path, sha1 in pending['files'].items() if sha1 not in by_sha1]
+    if missing:
+        raise ValueError(f'第 {pending["batch"]} 批导入尚未完成，请用该批的文件重新运行以完成导入'
+                         f'（缺少: {", ".join(missing)}）')
+    others = [path for path, sha1 in hashes.items() if sha1 not in pending['files'].values()]
+    if others:
+        print(f"先完成未完成的第 {pending['batch']} 批导入，以下文件请之后再导入: {', '.join(others)}")
+    return {by_sha1[sha1]: sha1 for sha1 in pending['files'].values()}
+
+
+def ingest(input_paths, data_dir, update_paths=True, workers=None):
+    """导入新数据，返回本批次的记录；没有新文件时返回 None"""
+    shard_dir = os.path.join(data_dir, 'taxi_rtree_shards')
+    track_dir = os.path.join(data_dir, 'taxi_log_2008_by_id')
+    db_path = os.path.join(data_dir, 'all_paths_from_pkl.sqlite')
+    manifest_path = os.path.join(shard_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        raise ValueError(f'分片清单 "{manifest_path}" 不存在，请先运行 build_rtree_shards.py 构建分片索引')
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    ledger = load_ledger(data_dir)
+    files = select_files(input_paths, ledger)
+    if not files:
+        return None
+
+    records = read_batch(sorted(files))
+    points = sum(len(r) for r in records.values())
+    if points == 0:
+        raise ValueError('新文件中没有有效的轨迹点')
+    batch = ledger.get('pending')
+    if batch is None:
+        batch = {'batch': len(ledger['batches']) + 1, 'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                 'files': files, 'taxis': len(records), 'points': points, 'seconds': {}, 'steps': []}
+        # 修改任何数据之前先记下未完成的批次，中途失败后重试时据此跳过已完成的步骤
+        ledger['pending'] = batch
+        save_ledger(data_dir, ledger)
+    else:
+        print(f"继续未完成的第 {batch['batch']} 批导入，已完成的步骤: {', '.join(batch['steps']) or '无'}")
+    batch_no = batch['batch']
+    staging_dir = os.path.join(data_dir, STAGING_DIR, f'b{batch_no}')
+
+    def step(name, run):
+        if name in batch['steps']:
+            return
+        start = time.time()
+        run()
+        batch['seconds'][name] = round(time.time() - start, 3)
+        batch['steps'].append(name)
+        save_ledger(data_dir, ledger)
+
+    def shards_step():
+        new_shards = build_delta_shards(records, os.path.join(staging_dir, 'shards'), manifest, batch_no, workers)
+        batch['shards'] = [shard['name'] for shard in new_shards]
+        batch['new_shards'] = new_shards
+
+    step('shards', shards_step)
+
+    # 路径频次要和原有轨迹比较，须在替换轨迹文件之前更新
+    if update_paths and os.path.exists(db_path):
+        def paths_step():
+            result = update_paths_db(db_path, track_dir, records, workers, batch_no)
+            if result is not None:
+                updated, inserted, removed = result
+                batch['paths'] = {'updated': updated, 'inserted': inserted, 'removed': removed}
+
+        step('paths', paths_step)
+
+    # 完整的新轨迹文件全部暂存好之后再逐个替换，替换中途失败时重试只需继续替换
+    step('tracks_staged', lambda: stage_tracks(track_dir, os.path.join(staging_dir, 'tracks'), records))
+    step('tracks', lambda: move_staged(os.path.join(staging_dir, 'tracks'), track_dir))
+
+    # 列式点存储（如果已构建）同样并入新点
+    column_dir = os.path.join(data_dir, 'taxi_columns')
+    if os.path.exists(os.path.join(column_dir, 'meta.json')):
+        step('columns', lambda: merge_into_store(column_dir, *batch_arrays(records), batch=batch_no))
+
+    # 去重草图（如果已构建）的格子可直接合并，不需要原有轨迹
+    sketch_dir = os.path.join(data_dir, 'taxi_sketches')
+    if os.path.exists(os.path.join(sketch_dir, 'meta.json')):
+        step('sketches', lambda: merge_into_sketches(sketch_dir, *batch_arrays(records), batch=batch_no))
+
+    # 访问区间索引须按完整轨迹计算（新点可能接续原有的访问），在替换轨迹文件之后更新
+    visit_dir = os.path.join(data_dir, 'taxi_visits')
+    if os.path.exists(os.path.join(visit_dir, 'meta.json')):
+        step('visits', lambda: update_visits(visit_dir, track_dir, sorted(records), points, batch_no))
+
+    trips_db = os.path.join(data_dir, 'taxi_trips.sqlite')
+    if os.path.exists(trips_db):
+        def trips_step():
+            batch['trips'] = update_trips(trips_db, track_dir, sorted(records))
+
+        step('trips', trips_step)
+
+    # 轨迹点重要度按整条轨迹计算（F1 读到过期文件时也会自行重算）
+    rank_dir = os.path.join(data_dir, 'track_ranks')
+    if os.path.isdir(rank_dir):
+        step('track_ranks', lambda: update_ranks(rank_dir, track_dir, sorted(records)))
+
+    catalog_dir = os.path.join(data_dir, 'taxi_catalog')
+    if os.path.exists(os.path.join(catalog_dir, 'meta.json')):
+        step('catalog', lambda: update_catalog(catalog_dir, track_dir, sorted(records)))
+
+    # 增量分片最后才移入分片目录并写入清单，服务进程按清单修改时间加载新分片
+    def manifest_step():
+        move_staged(os.path.join(staging_dir, 'shards'), shard_dir)
+        write_manifest(shard_dir, merge_manifest(manifest, batch['new_shards']))
+
+    step('manifest', manifest_step)
+    clear_query_caches(data_dir)
+    shutil.rmtree(os.path.join(data_dir, STAGING_DIR), ignore_errors=True)
+    del batch['steps'], batch['new_shards']
+    ledger['batches'].append(ledger.pop('pending'))
+    save_ledger(data_dir, ledger)
+    return batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description='增量导入新的出租车轨迹数据')
+    parser.add_argument('--input', required=True, nargs='+', help='新数据文件或目录（目录下的全部 .txt）')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='数据目录（包含分片索引、路径库与轨迹文件）')
+    parser.add_argument('--skip-paths', action='store_true', help='不更新频繁路径库')
+    parser.add_argument('--workers', type=int, default=None, help='构建增量分片与更新路径库的进程数，默认等于 CPU 核数')
+    args = parser.parse_args()
+
+    input_paths = []
+    for path in args.input:
+        if os.path.isdir(path):
+            input_paths.extend(os.path.join(path, fname) for fname in sorted(os.listdir(path)) if fname.endswith('.txt'))
+        elif os.path.isfile(path):
+            input_paths.append(path)
+        else:
+            print(f"错误：输入 \"{path}\" 不存在。", file=sys.stderr)
+            sys.exit(1)
+
+    start_time = time.time()
+    try:
+        batch = ingest(input_paths, args.data_dir, not args.skip_paths, args.workers)
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        sys.exit(1)
+    if batch is None:
+        print("没有需要导入的新文件。")
+        return
+
+    print(f"\n第 {batch['batch']} 批导入完成：{batch['taxis']} 辆车、{batch['points']} 个轨迹点，"
+          f"新增 {len(batch['shards'])} 个增量分片")
+    if 'paths' in batch:
+        paths = batch['paths']
+        print(f"路径库：更新 {paths['updated']} 条，新增 {paths['inserted']} 条，移出 {paths['removed']} 条")
+    print(f"总耗时: {time.time() - start_time:.2f} 秒")
+
+
+if __name__ == '__main__':
+    main()
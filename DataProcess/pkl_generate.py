@@ -3,11 +3,15 @@ import pickle
 import numpy as np
 import sys
 from collections import defaultdict
+from trajectory_preprocess import parse_timestamps, decode_cells, preprocess_trajectory
 
 #WINDOW_SIZE = 10
 GRID_SIZE = 0.002  # 约200米
 DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'Data', 'taxi_log_2008_by_id')
 OUT_PATH = os.path.join(os.path.dirname(__file__), '..', 'Data', 'precomputed_path_index.pkl')
+# 窗口化前是否做轨迹预处理（切分行程、去除停留点、合并连续重复网格），
+# 否则停靠车辆会产生大量同一网格重复的窗口
+PREPROCESS = True
 
 #
 def grid_point(point, grid_size=GRID_SIZE):
@@ -34,10 +38,22 @@ def parse_line(line):# 解析每一行数据
         taxi_id = str(parts[0])
         lon = float(parts[2])
         lat = float(parts[3])
-        return taxi_id, lon, lat
+        return taxi_id, parts[1], lon, lat
     except Exception:
         return None
 
+def build_segments(time_strs, traj):
+    """返回已网格化的行程段列表，每段为网格中心点元组列表"""
+    if not PREPROCESS:
+        return [grid_path(traj)]
+    try:
+        timestamps = parse_timestamps(time_strs)
+    except ValueError:
+        return [grid_path(traj)]
+    lons = [p[0] for p in traj]
+    lats = [p[1] for p in traj]
+    return [decode_cells(cells, GRID_SIZE) for cells in preprocess_trajectory(timestamps, lons, lats, GRID_SIZE)]
+
 def calculate_path_length(points):
     total_length = 0
     for i in range(len(points)-1):
@@ -59,35 +75,38 @@ def main():
         with open(file_path, 'r', encoding='utf-8') as f:
             lines = f.readlines()
         traj = []
+        time_strs = []
         taxi_id = None
         for line in lines:
             parsed = parse_line(line)
             if parsed is None:
                 continue
-            taxi_id, lon, lat = parsed
+            taxi_id, time_str, lon, lat = parsed
             traj.append((lon, lat))
+            time_strs.append(time_str)
+        segments = build_segments(time_strs, traj)
 
         seen_dict = defaultdict(set)  # 每个 window_size 独立记录已见路径
 
         for window_size in range(5,17):  #  （你可根据需要修改为 range(5, 17)）
-            if len(traj) < window_size:
-                continue
-
             # 为当前 window_size 创建独立缓存
             path_to_taxis = defaultdict(set)
 
-            for i in range(len(traj) - window_size + 1):
-                sub_path = traj[i:i+window_size]
-                grid_sub_path = grid_path(sub_path)
-                path_key = path_to_tuple(grid_sub_path)
+            # 窗口不跨越行程段
+            for segment in segments:
+                for i in range(len(segment) - window_size + 1):
+                    path_key = path_to_tuple(segment[i:i+window_size])
+
+                    if not path_key:  # 避免空路径导致 IndexError
+                        continue
 
-                if not path_key:  # 避免空路径导致 IndexError
-                    continue
+                    if path_key in seen_dict[window_size]:
+                        continue
+                    seen_dict[window_size].add(path_key)
+                    path_to_taxis[path_key].add(taxi_id)
 
-                if path_key in seen_dict[window_size]:
-                    continue
-                seen_dict[window_size].add(path_key)
-                path_to_taxis[path_key].add(taxi_id)
+            if not path_to_taxis:
+                continue
 
             # 构建当前 window_size 的分块目录
             block_dir = os.path.join(path_base_dir, f'window_{window_size}')
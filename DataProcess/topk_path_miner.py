@@ -0,0 +1,330 @@
+"""
+Top-k 频繁路径挖掘（F7 预处理的精简模式）
+
+原流程 (pkl_generate.py + convert_all_pkl_to_sqlite.py) 会把长度 5~16 的所有
+滑动窗口全部写盘再入库，而 F7 接口只会取频次最高的前 k 条。本脚本直接挖掘
+top-k 候选并生成同样结构的 paths 表：
+
+1. 每辆车的轨迹只解析一次，经 trajectory_preprocess 清洗（切分行程、去除停留点、
+   合并重复网格）后以 int64 网格编号数组常驻内存；
+2. 按窗口长度逐层挖掘，每层用 Misra-Gries 草图统计“经过该路径的出租车数”，
+   内存只与草图容量有关；
+3. Apriori 剪枝：长度 L 的路径频次不可能超过其长度 L-1 的前缀（以及后缀），
+   因此只有前缀、后缀都是上一层频繁路径的窗口才参与下一层计数；
+4. 对草图留下的候选做一次精确复核，最后只保留在任意 min_distance 下都可能
+   进入 top-k 的路径（频次-长度的 k-skyband）。
+
+用法:
+    python topk_path_miner.py --k 100 --capacity 200000
+"""
+import os
+import sys
+import time
+import bisect
+import sqlite3
+import argparse
+import numpy as np
+from collections import defaultdict
+from tqdm import tqdm  # 用于显示进度条
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.geometry import path_length
+from trajectory_preprocess import (GRID_SIZE, parse_timestamps, encode_cells, decode_cells,
+                                   preprocess_trajectory)
+
+MIN_WINDOW = 5     # 最短路径点数
+MAX_WINDOW = 16    # 最长路径点数
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, '..', 'Data', 'taxi_log_2008_by_id')
+DB_PATH = os.path.join(BASE_DIR, '..', 'Data', 'all_paths_from_pkl.sqlite')
+
+
+class MisraGries:
+    """Misra-Gries 频繁项草图
+
+    最多保留 capacity 个计数器。计数器溢出时整体减去第 capacity+1 大的计数值
+    （批量版本，均摊 O(1)），因此每个计数都是真实频次的下界，
+    真实频次不超过 count + error；被移出草图的键真实频次不超过 error。
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counters = {}
+        self.error = 0  # 累计扣减量，即最大低估值
+
+    def update(self, key):
+        counters = self.counters
+        if key in counters:
+            counters[key] += 1
+            return
+        counters[key] = 1
+        if len(counters) > 2 * self.capacity:
+            self._shrink()
+
+    def _shrink(self):
+        counts = np.fromiter(self.counters.values(), dtype=np.int64, count=len(self.counters))
+        # 第 capacity+1 大的计数作为本次整体扣减量
+        cut = int(np.partition(counts, -(self.capacity + 1))[-(self.capacity + 1)])
+        self.error += cut
+        self.counters = {k: v - cut for k, v in self.counters.items() if v > cut}
+
+    def covers(self, min_support):
+        """误差小于 min_support 时，真实频次不低于 min_support 的键都还在草图中"""
+        return self.error < min_support
+
+    def candidates(self, min_support):
+        """返回真实频次可能不低于 min_support 的所有键"""
+        if not self.covers(min_support):
+            raise ValueError(f'草图误差 {self.error} 已达到最小支持度 {min_support}，'
+                             f'频繁键可能已被移出，请增大草图容量（当前 {self.capacity}）')
+        threshold = min_support - self.error
+        return {k for k, v in self.counters.items() if v >= threshold}
+
+
+def parse_track_lines(lines):
+    """解析轨迹行，返回 (出租车ID, 时间字符串列表, 经度列表, 纬度列表)；没有有效行时ID为 None"""
+    time_strs = []
+    lons = []
+    lats = []
+    taxi_id = None
+    for line in lines:
+        parts = line.strip().split(',')
+        if len(parts) < 4:
+            continue
+        try:
+            lon = float(parts[2])
+            lat = float(parts[3])
+        except ValueError:
+            continue
+        taxi_id = parts[0]
+        time_strs.append(parts[1])
+        lons.append(lon)
+        lats.append(lat)
+    return taxi_id, time_strs, lons, lats
+
+
+def track_segments(time_strs, lons, lats, preprocess=True, grid_size=GRID_SIZE):
+    """网格化一辆车的轨迹，返回 int64 网格编号数组列表（每个元素为一段行程）
+
+    preprocess 为 True 时按 trajectory_preprocess 切分行程、去除停留点并合并重复网格；
+    否则与 pkl_generate.py 的旧行为一致，整条轨迹作为一段。
+    """
+    if len(lons) < MIN_WINDOW:
+        return []
+    if preprocess:
+        try:
+            timestamps = parse_timestamps(time_strs)
+        except ValueError:
+            return []
+        return preprocess_trajectory(timestamps, lons, lats, grid_size, min_segment=MIN_WINDOW)
+    return [encode_cells(lons, lats, grid_size)]
+
+
+def load_trajectories(data_dir, preprocess=True, grid_size=GRID_SIZE):
+    """读取全部轨迹并网格化，返回 {taxi_id: [int64 网格编号数组, ...]}"""
+    trajectories = {}
+    files = [fname for fname in os.listdir(data_dir) if fname.endswith('.txt')]
+    for fname in tqdm(files, desc="读取轨迹", unit="文件"):
+        with open(os.path.join(data_dir, fname), 'r', encoding='utf-8') as f:
+            taxi_id, time_strs, lons, lats = parse_track_lines(f)
+        if taxi_id is None:
+            continue
+        segments = track_segments(time_strs, lons, lats, preprocess, grid_size)
+        if segments:
+            trajectories[taxi_id] = segments
+    return trajectories
+
+
+def window_keys(cells, starts, window_size):
+    """取出以 starts 为起点、长度为 window_size 的窗口，返回去重后的 bytes 键列表"""
+    if len(starts) == 0:
+        return []
+    windows = np.lib.stride_tricks.sliding_window_view(cells, window_size)[starts]
+    windows = np.ascontiguousarray(windows).view(np.dtype((np.void, 8 * window_size))).ravel()
+    return [w.tobytes() for w in np.unique(windows)]
+
+
+def alive_starts(cells, window_size, frequent):
+    """返回长度为 window_size 且属于 frequent 集合的窗口起点掩码"""
+    n = len(cells) - window_size + 1
+    windows = np.lib.stride_tricks.sliding_window_view(cells, window_size)
+    windows = np.ascontiguousarray(windows).view(np.dtype((np.void, 8 * window_size))).ravel()
+    return np.fromiter((w.tobytes() in frequent for w in windows), dtype=bool, count=n)
+
+
+def count_level(trajectories, masks, window_size, capacity):
+    """用容量为 capacity 的草图统计一层窗口，返回 (草图, 计数的窗口数)"""
+    sketch = MisraGries(capacity)
+    windows_counted = 0
+    for taxi_id, segment_masks in masks.items():
+        # 同一辆车经过同一路径只计一次（跨行程段去重），频次即出租车数
+        keys = set()
+        for cells, mask in zip(trajectories[taxi_id], segment_masks):
+            if mask is None:
+                continue
+            starts = np.flatnonzero(mask)
+            windows_counted += len(starts)
+            keys.update(window_keys(cells, starts, window_size))
+        for key in keys:
+            sketch.update(key)
+    return sketch, windows_counted
+
+
+def mine_candidates(trajectories, capacity, min_support):
+    """逐层挖掘候选路径，返回 ({window_size: 候选键集合}, 最终的草图容量)
+
+    某层草图误差达到 min_support 时，被移出的键可能是频繁路径，Apriori 剪枝会连带丢掉它们的所有延长，
+    此时把容量加倍后重新统计该层，保证不漏掉频繁路径。
+    """
+    candidates = {}
+    # 每段行程当前层可参与计数的窗口起点掩码，第一层为全部窗口
+    masks = {taxi_id: [np.ones(len(cells) - MIN_WINDOW + 1, dtype=bool) if len(cells) >= MIN_WINDOW else None
+                       for cells in segments]
+             for taxi_id, segments in trajectories.items()}
+
+    for window_size in range(MIN_WINDOW, MAX_WINDOW + 1):
+        sketch, windows_counted = count_level(trajectories, masks, window_size, capacity)
+        while not sketch.covers(min_support):
+            print(f"窗口长度 {window_size}: 草图误差 {sketch.error} 已达到最小支持度，容量 {capacity} 加倍后重新统计")
+            capacity *= 2
+            sketch, windows_counted = count_level(trajectories, masks, window_size, capacity)
+
+        frequent = sketch.candidates(min_support)
+        candidates[window_size] = frequent
+        print(f"窗口长度 {window_size}: 计数窗口 {windows_counted}，候选路径 {len(frequent)}，草图误差上界 {sketch.error}")
+
+        if not frequent or window_size == MAX_WINDOW:
+            break
+
+        # Apriori 剪枝：下一层窗口的前缀(起点 i)与后缀(起点 i+1)都必须是本层频繁路径
+        next_masks = {}
+        for taxi_id, segment_masks in masks.items():
+            next_segment_masks = []
+            for cells, mask in zip(trajectories[taxi_id], segment_masks):
+                if mask is None or len(cells) < window_size + 1:
+                    next_segment_masks.append(None)
+                    continue
+                alive = alive_starts(cells, window_size, frequent)
+                next_mask = alive[:-1] & alive[1:]
+                next_segment_masks.append(next_mask if next_mask.any() else None)
+            if any(m is not None for m in next_segment_masks):
+                next_masks[taxi_id] = next_segment_masks
+        masks = next_masks
+
+    return candidates, capacity
+
+
+def exact_frequencies(trajectories, candidates):
+    """对草图候选做一次精确复核，返回 {(window_size, key): 出租车数}"""
+    frequencies = defaultdict(int)
+    for segments in tqdm(trajectories.values(), desc="精确复核", unit="车"):
+        for window_size, keys in candidates.items():
+            if not keys:
+                continue
+            taxi_keys = set()
+            for cells in segments:
+                if len(cells) < window_size:
+                    continue
+                alive = alive_starts(cells, window_size, keys)
+                taxi_keys.update(window_keys(cells, np.flatnonzero(alive), window_size))
+            for key in taxi_keys:
+                frequencies[(window_size, key)] += 1
+    return frequencies
+
+
+def k_skyband(paths, k):
+    """保留严格支配者（频次更高且长度不短）少于 k 条的路径
+
+    F7 查询为 WHERE length >= d ORDER BY frequency DESC LIMIT k，
+    不在 k-skyband 中的路径对任何 d 都不会被返回。
+    """
+    paths = sorted(paths, key=lambda p: p['frequency'], reverse=True)
+    kept = []
+    higher_lengths = []  # 已处理的更高频次路径长度（升序）
+    i = 0
+    while i < len(paths):
+        j = i
+        while j < len(paths) and paths[j]['frequency'] == paths[i]['frequency']:
+            j += 1
+        group = paths[i:j]
+        for p in group:
+            dominators = len(higher_lengths) - bisect.bisect_left(higher_lengths, p['length'])
+            if dominators < k:
+                kept.append(p)
+        for p in group:
+            bisect.insort(higher_lengths, p['length'])
+        i = j
+    return kept
+
+
+def write_paths(db_path, paths, params):
+    """写入与 convert_all_pkl_to_sqlite.py 相同结构的 paths 表"""
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE paths (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            frequency INTEGER,
+            length REAL,
+            points TEXT
+        )
+    ''')
+    c.executemany('INSERT INTO paths (frequency, length, points) VALUES (?, ?, ?)',
+                  [(p['frequency'], p['length'], ';'.join(f"{lon},{lat}" for lon, lat in p['points']))
+                   for p in paths])
+    c.execute('CREATE INDEX idx_paths_frequency ON paths (frequency DESC)')
+    # 记录挖掘参数，说明该库只保证 k 不超过 top_k 的查询结果正确
+    c.execute('CREATE TABLE mining_meta (key TEXT PRIMARY KEY, value TEXT)')
+    c.executemany('INSERT INTO mining_meta (key, value) VALUES (?, ?)',
+                  [(key, str(value)) for key, value in params.items()])
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Top-k 频繁路径挖掘')
+    parser.add_argument('--k', type=int, default=100, help='F7 查询允许的最大 k')
+    parser.add_argument('--capacity', type=int, default=200000, help='每层 Misra-Gries 草图的计数器数量')
+    parser.add_argument('--min-support', type=int, default=2, help='候选路径的最小出租车数')
+    parser.add_argument('--raw', action='store_true', help='跳过轨迹预处理，直接对原始采样窗口化')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='轨迹数据目录')
+    parser.add_argument('--db', default=DB_PATH, help='输出 SQLite 路径')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        print(f"错误：输入目录 \"{args.data_dir}\" 不存在。", file=sys.stderr)
+        sys.exit(1)
+
+    start_time = time.time()
+    trajectories = load_trajectories(args.data_dir, preprocess=not args.raw)
+    print(f"共载入 {len(trajectories)} 辆出租车的轨迹")
+
+    candidates, capacity = mine_candidates(trajectories, args.capacity, args.min_support)
+    frequencies = exact_frequencies(trajectories, candidates)
+
+    paths = []
+    for (window_size, key), frequency in frequencies.items():
+        if frequency < args.min_support:
+            continue
+        points = decode_cells(np.frombuffer(key, dtype=np.int64))
+        paths.append({'frequency': frequency, 'length': path_length(points), 'points': points})
+
+    kept = k_skyband(paths, args.k)
+    write_paths(args.db, kept, {
+        'top_k': args.k,
+        'capacity': capacity,  # 容量不足时 mine_candidates 会加倍，记录实际使用的值
+        'min_support': args.min_support,
+        'grid_size': GRID_SIZE,
+        'preprocess': not args.raw,
+    })
+
+    print(f"\n候选路径 {len(paths)} 条，k-skyband 保留 {len(kept)} 条")
+    print(f"✅ 路径数据已写入 SQLite：{args.db}")
+    print(f"总耗时: {time.time() - start_time:.2f} 秒")
+
+
+if __name__ == '__main__':
+    main()
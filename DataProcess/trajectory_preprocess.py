@@ -0,0 +1,107 @@
+"""
+轨迹预处理：为频繁路径挖掘清洗原始 GPS 轨迹
+
+原始采样直接网格化后，停靠的出租车会产生大量“同一网格重复出现”的窗口，
+使 F7 的 top-k 结果被停车点占据。窗口化之前依次做：
+1. 按时间排序，并在长时间断档处切分行程；
+2. 去除停留点（一段时间内始终在小半径内的点，只保留到达时的第一个点）；
+3. 网格化后合并连续重复的网格。
+"""
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.geometry import haversine_distance
+
+GRID_SIZE = 0.002        # 约200米，与 pkl_generate.py 保持一致
+MAX_GAP = 30 * 60        # 相邻采样间隔超过30分钟即切分行程（秒）
+STAY_RADIUS = 200        # 停留点判定半径（米）
+STAY_DURATION = 10 * 60  # 在半径内停留超过10分钟视为停留（秒）
+MIN_SEGMENT = 5          # 短于该点数的行程段直接丢弃
+
+
+def parse_timestamps(time_strs):
+    """批量将 'YYYY-MM-DD HH:MM:SS' 字符串转为整数秒（仅用于计算时间差）"""
+    return np.array(time_strs, dtype='datetime64[s]').astype(np.int64)
+
+
+def encode_cells(lons, lats, grid_size=GRID_SIZE):
+    """经纬度网格化，网格编号 = (grid_x << 32) | grid_y"""
+    grid_x = np.floor(np.asarray(lons) / grid_size).astype(np.int64)
+    grid_y = np.floor(np.asarray(lats) / grid_size).astype(np.int64)
+    return (grid_x << 32) | (grid_y & 0xFFFFFFFF)
+
+
+def decode_cells(cells, grid_size=GRID_SIZE):
+    """网格编号解码为网格中心点 (lon, lat) 列表，保留6位小数"""
+    cells = np.asarray(cells, dtype=np.int64)
+    grid_x = cells >> 32
+    grid_y = (cells & 0xFFFFFFFF).astype(np.int32).astype(np.int64)
+    center_lon = np.round((grid_x + 0.5) * grid_size, 6)
+    center_lat = np.round((grid_y + 0.5) * grid_size, 6)
+    return list(zip(center_lon.tolist(), center_lat.tolist()))
+
+
+def split_by_gap(timestamps, max_gap=MAX_GAP):
+    """在时间断档处切分，返回 (start, end) 下标区间列表"""
+    breaks = np.flatnonzero(np.diff(timestamps) > max_gap) + 1
+    bounds = np.concatenate(([0], breaks, [len(timestamps)]))
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def stay_point_mask(timestamps, lons, lats, radius=STAY_RADIUS, min_duration=STAY_DURATION):
+    """返回保留点掩码：停留段只保留到达时的第一个点"""
+    n = len(timestamps)
+    keep = np.ones(n, dtype=bool)
+    i = 0
+    while i < n - 1:
+        # 从 i 出发，按块向后查找第一个超出半径的点 j
+        j = n
+        chunk_start = i + 1
+        chunk = 32
+        while chunk_start < n:
+            chunk_end = min(chunk_start + chunk, n)
+            dists = haversine_distance(lons[i], lats[i], lons[chunk_start:chunk_end], lats[chunk_start:chunk_end])
+            outside = np.flatnonzero(dists > radius)
+            if len(outside):
+                j = chunk_start + int(outside[0])
+                break
+            chunk_start = chunk_end
+            chunk *= 2
+        if timestamps[j - 1] - timestamps[i] >= min_duration:
+            keep[i + 1:j] = False
+            i = j
+        else:
+            i += 1
+    return keep
+
+
+def collapse_duplicates(cells):
+    """合并连续重复的网格"""
+    if len(cells) == 0:
+        return cells
+    keep = np.empty(len(cells), dtype=bool)
+    keep[0] = True
+    np.not_equal(cells[1:], cells[:-1], out=keep[1:])
+    return cells[keep]
+
+
+def preprocess_trajectory(timestamps, lons, lats, grid_size=GRID_SIZE, min_segment=MIN_SEGMENT):
+    """完整预处理流程，返回网格编号数组列表（每个元素为一段行程）"""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    order = np.argsort(timestamps, kind='stable')
+    timestamps, lons, lats = timestamps[order], lons[order], lats[order]
+
+    segments = []
+    for start, end in split_by_gap(timestamps):
+        if end - start < min_segment:
+            continue
+        seg_ts, seg_lons, seg_lats = timestamps[start:end], lons[start:end], lats[start:end]
+        keep = stay_point_mask(seg_ts, seg_lons, seg_lats)
+        cells = collapse_duplicates(encode_cells(seg_lons[keep], seg_lats[keep], grid_size))
+        if len(cells) >= min_segment:
+            segments.append(cells)
+    return segments
@@ -1,28 +1,356 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 import os
+import re
 import glob
+import threading
+import numpy as np
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from api.resources import TAXI_LOG_DIR, TRACK_RANK_DIR
+from api.metrics import mark_phase, record_points
+from api.streaming import sse_event, sse_response
+from api.catalog import track_exists, window_empty, list_taxis, SORT_KEYS
+from utils.simplify import significance, zoom_tolerance
 
 # 创建蓝图而不是应用
 taxi_routes = Blueprint('taxi_routes', __name__)
 
 # 数据文件目录路径
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data', 'taxi_log_2008_by_id')
+DATA_DIR = TAXI_LOG_DIR
+MAX_BATCH_TAXIS = 1000  # 批量接口一次最多查询的出租车数
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+TRACK_POOLS = ('thread', 'process')
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def track_pool_kind():
+    """批量读取轨迹的并行方式（环境变量 TAXIFLOW_TRACK_POOL）：thread（默认）或 process
+
+    线程池重叠各文件的磁盘读取。进程池可以多核并行解析，但在每个服务进程中各自创建
+    （gunicorn 下共有 工作进程数 × 核数 个子进程），解析出的轨迹还要序列化传回，需要时再显式开启。
+    """
+    kind = os.environ.get('TAXIFLOW_TRACK_POOL', 'thread')
+    return kind if kind in TRACK_POOLS else 'thread'
+
+
+def track_workers():
+    """批量读取轨迹的进程/线程数（环境变量 TAXIFLOW_TRACK_WORKERS），默认等于 CPU 核数"""
+    workers = os.environ.get('TAXIFLOW_TRACK_WORKERS')
+    return int(workers) if workers else (os.cpu_count() or 1)
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                if track_pool_kind() == 'process':
+                    _executor = ProcessPoolExecutor(max_workers=track_workers())
+                else:
+                    _executor = ThreadPoolExecutor(max_workers=track_workers(), thread_name_prefix='track-read')
+                _executor_pid = pid
+    return _executor
+
+
+def normalize_time(time_str):
+    """把 'YYYY-MM-DD HH:mm:ss' 或 'YYYY-MM-DDTHH:mm' 统一为轨迹文件中的时间格式，便于按字符串比较"""
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M'):
+        try:
+            return datetime.strptime(time_str, fmt).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            continue
+    raise ValueError(f"无法解析时间字符串: {time_str}")
+
+
+def time_to_timestamp(time_str):
+    """normalize_time 的结果 -> 时间戳；None 保持不变"""
+    return datetime.strptime(time_str, '%Y-%m-%d %H:%M:%S').timestamp() if time_str is not None else None
+
+
+def empty_track(taxi_id):
+    return {'id': str(taxi_id), 'path': [], 'timestamp': []}
+
+
+@taxi_routes.route('', methods=['GET'])
+def list_taxi_tracks():
+    """分页列出有轨迹的出租车及其元数据（需要先构建出租车目录）
+
+    可选查询参数:
+        page、page_size      页码（从1开始）与每页条数，默认 1、100，每页最多 MAX_PAGE_SIZE 条
+        min_points           最少点数
+        start_time、end_time 只列出轨迹时间范围与该时间窗相交的出租车
+        min_lon、min_lat、max_lon、max_lat  只列出点的经纬度范围与该矩形相交的出租车（四项须同时给出）
+        sort                 id（默认）、points、start 或 end；加 order=desc 降序
+    """
+    args = request.args
+    try:
+        page = args.get('page', 1, type=int)
+        page_size = args.get('page_size', DEFAULT_PAGE_SIZE, type=int)
+        if page < 1 or not 1 <= page_size <= MAX_PAGE_SIZE:
+            raise ValueError(f'page 须大于0，page_size 须在 1~{MAX_PAGE_SIZE} 之间')
+        sort = args.get('sort', 'id')
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort 须为 {'、'.join(SORT_KEYS)} 之一")
+        start_time, end_time = (time_to_timestamp(normalize_time(args[name])) if name in args else None
+                                for name in ('start_time', 'end_time'))
+        bbox_names = ('min_lon', 'min_lat', 'max_lon', 'max_lat')
+        bbox = None
+        if any(name in args for name in bbox_names):
+            if not all(name in args for name in bbox_names):
+                raise ValueError('min_lon、min_lat、max_lon、max_lat 须同时给出')
+            bbox = tuple(float(args[name]) for name in bbox_names)
+    except ValueError as e:
+        return jsonify({'error': f'参数无效: {e}'}), 400
+
+    mark_phase('search')
+    result = list_taxis(args.get('min_points', type=int), start_time, end_time, bbox, sort,
+                        args.get('order') == 'desc', (page - 1) * page_size, page_size)
+    if result is None:
+        return jsonify({'error': '出租车目录不存在，请先运行 build_taxi_catalog.py 构建'}), 500
+    total, taxis = result
+    mark_phase('serialize')
+    return jsonify({
+        'taxis': taxis,
+        'total': total,
+        'page': page,
+        'page_size': page_size,
+        'pages': (total + page_size - 1) // page_size,
+    })
+
 
 # 获取单个出粗车轨迹数据
 @taxi_routes.route('/<taxi_id>', methods=['GET'])
 def get_taxi_track(taxi_id):
+    """返回出租车的轨迹
+
+    可选查询参数（都不给时返回全部点）:
+        start_time、end_time  只返回该时间窗内（含两端）的点
+        tolerance  简化容差（米），只保留 Douglas-Peucker 重要度大于该值的点
+        zoom       地图缩放级别，容差取该级别下一个像素对应的距离
+    """
     try:
         # 构建文件路径
         file_path = os.path.join(DATA_DIR, f'{taxi_id}.txt')
         
-        if not os.path.exists(file_path):
+        # 有出租车目录时查目录，不再探测文件
+        if not track_exists(taxi_id, DATA_DIR):
             return jsonify({'error': f'未找到出租车 {taxi_id} 的轨迹数据'}), 404
+
+        try:
+            start_time, end_time = (normalize_time(request.args[name]) if name in request.args else None
+                                    for name in ('start_time', 'end_time'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        tolerance = request.args.get('tolerance', type=float)
+        zoom = request.args.get('zoom', type=float)
+        if window_empty(taxi_id, time_to_timestamp(start_time), time_to_timestamp(end_time)):
+            return jsonify(empty_track(taxi_id))
             
-        return jsonify(read_taxi_track(file_path))
+        mark_phase('search')
+        track, points = load_track(file_path, start_time, end_time, tolerance, zoom)
+        record_points(points)
+        mark_phase('serialize')
+        return jsonify(track)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+def _batch_params(data):
+    """批量接口的请求参数 -> (出租车ID列表, 时间窗起点, 终点, 容差, 缩放级别)"""
+    taxi_ids = [str(taxi_id) for taxi_id in data.get('taxi_ids') or []]
+    if not taxi_ids:
+        raise ValueError('缺少必要参数: taxi_ids')
+    if len(taxi_ids) > MAX_BATCH_TAXIS:
+        raise ValueError(f'一次最多查询 {MAX_BATCH_TAXIS} 辆出租车')
+    start_time = normalize_time(data['start_time']) if data.get('start_time') else None
+    end_time = normalize_time(data['end_time']) if data.get('end_time') else None
+    tolerance = float(data['tolerance']) if data.get('tolerance') is not None else None
+    zoom = float(data['zoom']) if data.get('zoom') is not None else None
+    # 去掉重复的ID，保持请求中的顺序
+    return list(dict.fromkeys(taxi_ids)), start_time, end_time, tolerance, zoom
+
+
+def _read_one(taxi_id, start_time, end_time, tolerance, zoom):
+    """批量接口中读取一辆车（TAXIFLOW_TRACK_POOL=process 时在进程池中执行，须为模块级函数），返回 (出租车ID, 轨迹或 None, 读取的点数)"""
+    try:
+        return (taxi_id, *load_track(os.path.join(DATA_DIR, f'{taxi_id}.txt'), start_time, end_time, tolerance, zoom))
+    except FileNotFoundError:
+        # 目录建立后轨迹文件被删除
+        return taxi_id, None, 0
+
+
+def _read_batch(taxi_ids, start_time, end_time, tolerance, zoom):
+    """并行读取多辆车的轨迹，按完成顺序产生 (出租车ID, 轨迹或 None, 读取的点数)
+
+    没有轨迹或时间窗内没有点的出租车按出租车目录直接返回，不提交读取任务。
+    """
+    window = (time_to_timestamp(start_time), time_to_timestamp(end_time))
+    executor = _get_executor()
+    answered = []
+    futures = []
+    for taxi_id in taxi_ids:
+        # ID 只接受数字，防止路径穿越
+        if not re.fullmatch(r'\d+', taxi_id) or not track_exists(taxi_id, DATA_DIR):
+            answered.append((taxi_id, None, 0))
+        elif window_empty(taxi_id, *window):
+            answered.append((taxi_id, empty_track(taxi_id), 0))
+        else:
+            futures.append(executor.submit(_read_one, taxi_id, start_time, end_time, tolerance, zoom))
+    try:
+        yield from answered
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+@taxi_routes.route('/batch', methods=['POST'])
+def get_taxi_tracks():
+    """一次返回多辆出租车的轨迹，各轨迹文件默认在线程池中并行读取（TAXIFLOW_TRACK_POOL=process 改用进程池）
+
+    请求参数:
+        {
+            "taxi_ids": [str 或 int, ...],  # 最多 MAX_BATCH_TAXIS 个
+            "start_time": str,  # 可选，时间窗 (YYYY-MM-DD HH:mm:ss)
+            "end_time": str,    # 可选
+            "tolerance": float, # 可选，与单车接口的简化参数相同
+            "zoom": float       # 可选
+        }
+    返回 {"tracks": [...], "missing": [...], "points": 读取的点数}，tracks 按请求中的顺序排列，
+    每项与单车接口的返回格式相同；没有轨迹文件的ID列在 missing 中。
+    """
+    try:
+        taxi_ids, start_time, end_time, tolerance, zoom = _batch_params(request.get_json() or {})
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        mark_phase('search')
+        tracks = {}
+        points = 0
+        for taxi_id, track, track_points in _read_batch(taxi_ids, start_time, end_time, tolerance, zoom):
+            tracks[taxi_id] = track
+            points += track_points
+        record_points(points)
+        mark_phase('serialize')
+        return jsonify({
+            'tracks': [tracks[taxi_id] for taxi_id in taxi_ids if tracks[taxi_id] is not None],
+            'missing': [taxi_id for taxi_id in taxi_ids if tracks[taxi_id] is None],
+            'points': points,
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@taxi_routes.route('/batch/stream', methods=['POST'])
+def stream_taxi_tracks():
+    """流式返回多辆出租车的轨迹（Server-Sent Events）
+
+    请求参数与 /batch 相同。先推送 meta 事件，之后每读完一辆车推送一次 partial 事件
+    （{"track", "completed", "taxis"}，按完成顺序），最后推送 done 事件。
+    各轨迹只在 partial 中推送一次，done 事件只包含 missing 与 points，不再重复全部轨迹。
+    """
+    try:
+        taxi_ids, start_time, end_time, tolerance, zoom = _batch_params(request.get_json() or {})
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        yield sse_event('meta', {'taxis': len(taxi_ids)})
+        try:
+            missing = []
+            points = 0
+            completed = 0
+            for taxi_id, track, track_points in _read_batch(taxi_ids, start_time, end_time, tolerance, zoom):
+                completed += 1
+                points += track_points
+                if track is None:
+                    missing.append(taxi_id)
+                    continue
+                yield sse_event('partial', {'track': track, 'completed': completed, 'taxis': len(taxi_ids)})
+            yield sse_event('done', {'status': 'success', 'missing': missing, 'points': points})
+        except Exception as e:
+            yield sse_event('error', {'status': 'error', 'message': str(e)})
+
+    return sse_response(generate())
+
+
+def load_track(file_path, start_time=None, end_time=None, tolerance=None, zoom=None):
+    """读取轨迹并按时间窗过滤、按容差简化，返回 (轨迹, 文件中的点数)"""
+    track = read_taxi_track(file_path)
+    points = len(track['path'])
+    indices = None
+    if start_time is not None or end_time is not None:
+        indices = [i for i, time_str in enumerate(track['timestamp'])
+                   if (start_time is None or time_str >= start_time) and (end_time is None or time_str <= end_time)]
+    if (tolerance is not None or zoom is not None) and track['path']:
+        mark_phase('aggregate')
+        track = simplify_track(track, file_path, tolerance, zoom, indices)
+    elif indices is not None:
+        track = {
+            'id': track['id'],
+            'path': [track['path'][i] for i in indices],
+            'timestamp': [track['timestamp'][i] for i in indices],
+        }
+    return track, points
+
+
+def load_ranks(file_path, coords):
+    """读取轨迹点的重要度（DataProcess/build_track_ranks.py 预先计算）
+
+    重要度文件不存在、比轨迹文件旧或点数不符时重新计算并写回，下次请求直接读取。
+    """
+    taxi_id = os.path.basename(file_path).replace('.txt', '')
+    rank_path = os.path.join(TRACK_RANK_DIR, f'{taxi_id}.npy')
+    try:
+        if os.path.getmtime(rank_path) >= os.path.getmtime(file_path):
+            ranks = np.load(rank_path)
+            if len(ranks) == len(coords):
+                return ranks
+    except (OSError, ValueError):
+        pass
+    ranks = significance(coords[:, 0], coords[:, 1]).astype(np.float32)
+    try:
+        os.makedirs(TRACK_RANK_DIR, exist_ok=True)
+        tmp_path = f'{rank_path}.{os.getpid()}.{threading.get_ident()}.tmp.npy'
+        np.save(tmp_path, ranks)
+        os.replace(tmp_path, rank_path)
+    except OSError:
+        pass
+    return ranks
+
+
+def simplify_track(track, file_path, tolerance=None, zoom=None, indices=None):
+    """按容差（米）或地图缩放级别简化轨迹，给出 tolerance 时忽略 zoom
+
+    indices 为时间窗内的点的下标（None 表示全部点）；重要度按整条轨迹计算，时间窗的首末点总是保留。
+    """
+    coords = np.asarray(track['path'], dtype=np.float64)
+    candidates = np.arange(len(coords)) if indices is None else np.asarray(indices, dtype=np.int64)
+    if tolerance is None:
+        tolerance = float(zoom_tolerance(zoom, coords[:, 1].mean()))
+    ranks = load_ranks(file_path, coords)
+    selected = ranks[candidates] > tolerance
+    selected[[0, -1] if len(candidates) else []] = True
+    keep = candidates[selected].tolist()
+    return {
+        'id': track['id'],
+        'path': [track['path'][i] for i in keep],
+        'timestamp': [track['timestamp'][i] for i in keep],
+        'simplified': {
+            'tolerance': round(tolerance, 3),
+            'points': len(keep),
+            'original_points': len(candidates),
+        },
+    }
+
 def read_taxi_track(file_path):
     """读取单个出租车轨迹文件
     Args:
@@ -31,6 +359,19 @@ def read_taxi_track(file_path):
         dict: 轨迹数据
     """
     taxi_id = os.path.basename(file_path).replace('.txt', '')
+    with open(file_path, 'r', encoding='utf-8') as f:
+        rows = [line.split(',') for line in f.read().splitlines()]
+    # 整个文件格式都正确时用列表推导一次转换，比逐行 try 快约一半；有格式不正确的行时逐行处理
+    if all(len(row) == 4 for row in rows):
+        try:
+            return {
+                'id': taxi_id,
+                'path': [[float(row[2]), float(row[3])] for row in rows],
+                'timestamp': [row[1] for row in rows],
+            }
+        except ValueError:
+            pass
+
     path = []
     timestamp = []
     
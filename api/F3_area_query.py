@@ -3,14 +3,15 @@ import os
 import sys
 import time
 from datetime import datetime
-from rtree import index
+from api.spatial import index_available, query_region_taxis
+from api.regions import Region, parse_region
+from api.metrics import mark_phase, record_points
+from api.bucket_cache import compose
+from api.sketches import query_sketch_taxis
 
 # 创建蓝图
 area_query = Blueprint('area_query', __name__)
 
-# 索引文件路径
-INDEX_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data', 'taxi_rtree')
-
 # 将字符串时间转换为时间戳
 def str_to_timestamp(time_str):
     try:
@@ -23,6 +24,24 @@ def str_to_timestamp(time_str):
         except ValueError:
             raise ValueError(f"无法解析时间字符串: {time_str}")
 
+
+def window_taxis(region, start_timestamp, end_timestamp):
+    """区域在时间窗内的独立出租车ID集合与总点数
+
+    按时间桶合成（api/bucket_cache.py）：每个桶缓存 (出租车ID数组, 点数)，
+    调整时间窗后只扫描未缓存的桶与两端不足一个桶的部分。返回 (出租车ID数组, 总点数, 缓存统计)。
+    """
+    import numpy as np
+
+    def scan(piece_start, piece_end):
+        taxi_ids, count = query_region_taxis(region, piece_start, piece_end)
+        return (np.fromiter(taxi_ids, dtype=np.int64, count=len(taxi_ids)), np.array([count])), count
+
+    parts, stats = compose(('taxis', region), start_timestamp, end_timestamp, scan)
+    taxi_ids = np.unique(np.concatenate([partial[0] for _, partial in parts]))
+    count = sum(int(partial[1][0]) for _, partial in parts)
+    return taxi_ids, count, stats
+
 @area_query.route('/rectangle', methods=['POST'])
 def query_rectangle():
     """
@@ -35,8 +54,12 @@ def query_rectangle():
         "max_lon": 经度最大值,
         "max_lat": 纬度最大值,
         "start_time": "开始时间（格式：YYYY-MM-DDTHH:MM或YYYY-MM-DD HH:MM:SS）",
-        "end_time": "结束时间（格式：YYYY-MM-DDTHH:MM或YYYY-MM-DD HH:MM:SS）"
+        "end_time": "结束时间（格式：YYYY-MM-DDTHH:MM或YYYY-MM-DD HH:MM:SS）",
+        "exact": 可选，为 true 时总是扫描索引
     }
+    构建了去重草图（DataProcess/build_taxi_sketches.py）且区域内含完整的网格与时间桶时，
+    由草图合并得到结果，用到 HyperLogLog 草图时 count 为估计值（approximate 为 true，
+    relative_error 为相对标准误差），total_points 总是精确的。
     """
     try:
         # 获取请求数据
@@ -71,54 +94,109 @@ def query_rectangle():
         if start_timestamp >= end_timestamp:
             return jsonify({'error': '时间范围无效，确保start_time < end_time'}), 400
         
-        # 创建查询矩形边界框
-        # 3D边界框格式: (min_lon, min_lat, min_time, max_lon, max_lat, max_time)
-        search_bbox = (min_lon, min_lat, start_timestamp, max_lon, max_lat, end_timestamp)
-        
         # 检查索引文件是否存在
-        if not (os.path.exists(INDEX_FILE + '.idx') and os.path.exists(INDEX_FILE + '.dat')):
+        if not index_available():
             return jsonify({'error': '索引文件不存在，请先构建索引'}), 500
         
-        # 打开索引
-        p = index.Property()
-        p.dimension = 3  # 三维索引：经度、纬度、时间
-        idx = index.Index(INDEX_FILE, properties=p)
-        
-        # 执行查询
+        exact = str(data.get('exact', False)).lower() in ('true', '1')
+        mark_phase('search')
         start_query_time = time.time()
+        sketch = None if exact else query_sketch_taxis(
+            (min_lon, min_lat, start_timestamp, max_lon, max_lat, end_timestamp))
+        if sketch is not None:
+            # 内部网格由草图合并，只扫描边缘部分
+            count, total_points, info = sketch
+            query_time = time.time() - start_query_time
+            record_points(info['scanned_points'])
+            mark_phase('serialize')
+            return jsonify({
+                'count': count,                # 独立出租车数量（approximate 为 true 时为估计值）
+                'total_points': total_points,  # 总轨迹点数
+                'query_time': query_time,
+                'approximate': info['approximate'],
+                'relative_error': info['relative_error'],
+                'sketch': info
+            })
         
-        taxi_ids = set()
-        count = 0
-
-        # 获取查询结果的迭代器
-        results = idx.intersection(search_bbox, objects=True)
-
-        # 单次遍历计算唯一ID和总点数
-        for item in results:
-            taxi_ids.add(item.object)
-            count += 1
+        # 执行查询：按时间桶合成，未缓存的时间段按时间范围选出分片并行扫描，单次遍历计算唯一ID和总点数
+        taxi_ids, count, cache_stats = window_taxis(Region((min_lon, min_lat, max_lon, max_lat)),
+                                                    start_timestamp, end_timestamp)
         
         # 查询结束时间
         end_query_time = time.time()
         query_time = end_query_time - start_query_time
         
-        # 关闭索引
-        idx.close()
-        
         # 返回结果
+        record_points(count)
+        mark_phase('serialize')
         return jsonify({
             'count': len(taxi_ids),  # 独立出租车数量
             'total_points': count,   # 总轨迹点数
-            'query_time': query_time
+            'query_time': query_time,
+            'approximate': False,
+            'relative_error': 0.0,
+            'bucket_cache': cache_stats
         })
         
     except Exception as e:
-        # 确保在发生异常时关闭索引
-        try:
-            if 'idx' in locals() and idx:
-                idx.close()
-        except:
-            pass
-        
         # 返回错误信息
         return jsonify({'error': f'查询过程中发生错误: {str(e)}'}), 500
+
+
+@area_query.route('/polygon', methods=['POST'])
+def query_polygon():
+    """
+    接受一个多边形区域和时间范围，返回该区域内的出租车数量
+
+    请求体JSON格式:
+    {
+        "region": GeoJSON 几何对象 {"type": "Polygon" 或 "MultiPolygon", "coordinates": [...]}，
+                  也可以是矩形 {min_lon, min_lat, max_lon, max_lat}，
+        "start_time": "开始时间（格式：YYYY-MM-DDTHH:MM或YYYY-MM-DD HH:MM:SS）",
+        "end_time": "结束时间（格式：YYYY-MM-DDTHH:MM或YYYY-MM-DD HH:MM:SS）"
+    }
+    一个多边形只按外包矩形查询一次索引，代替拼出该形状的多个矩形查询。
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': '请求体必须是JSON格式'}), 400
+
+        for param in ['region', 'start_time', 'end_time']:
+            if param not in data:
+                return jsonify({'error': f'缺少必要参数: {param}'}), 400
+
+        # 解析区域与时间范围
+        try:
+            region = parse_region(data['region'])
+            start_timestamp = str_to_timestamp(data['start_time'])
+            end_timestamp = str_to_timestamp(data['end_time'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        min_lon, min_lat, max_lon, max_lat = region.bbox
+        if min_lon >= max_lon or min_lat >= max_lat:
+            return jsonify({'error': '坐标范围无效，确保min < max'}), 400
+        if start_timestamp >= end_timestamp:
+            return jsonify({'error': '时间范围无效，确保start_time < end_time'}), 400
+
+        if not index_available():
+            return jsonify({'error': '索引文件不存在，请先构建索引'}), 500
+
+        # 按外包矩形扫描一次索引，多边形内部的网格只取条目ID，边界网格逐点判断
+        mark_phase('search')
+        start_query_time = time.time()
+        taxi_ids, count, cache_stats = window_taxis(region, start_timestamp, end_timestamp)
+        query_time = time.time() - start_query_time
+
+        record_points(count)
+        mark_phase('serialize')
+        return jsonify({
+            'count': len(taxi_ids),  # 独立出租车数量
+            'total_points': count,   # 总轨迹点数
+            'query_time': query_time,
+            'bucket_cache': cache_stats
+        })
+
+    except Exception as e:
+        return jsonify({'error': f'查询过程中发生错误: {str(e)}'}), 500
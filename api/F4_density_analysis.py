@@ -1,17 +1,17 @@
 from flask import Blueprint, request, jsonify
-import pandas as pd
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
-from rtree import index
+from api.resources import DATA_DIR
+from api.spatial import index_available, index_bounds, query_points, ScanProgress
+from api.jobs import report_progress
+from api.metrics import mark_phase, record_points, record_cache
+from api.streaming import sse_event, sse_response, time_chunks
+from api.bucket_cache import compose, bucket_seconds
+from api.density_tiles import MAX_ZOOM, get_tile, prerender
 
 density_bp = Blueprint('density', __name__)
 
-# 数据文件路径
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data')
-# R树索引文件路径
-INDEX_FILE = os.path.join(DATA_DIR, 'taxi_rtree')
-
 # 北京市边界范围
 BEIJING_BOUNDS = {
     'min_lon': 115.7,
@@ -20,10 +20,6 @@ BEIJING_BOUNDS = {
     'max_lat': 41.6
 }
 
-# 添加数据处理限制
-MAX_POINTS = 100000  # 最大处理点数
-BATCH_SIZE = 10000   # 批处理大小
-
 def str_to_timestamp(time_str):
     try:
         return datetime.strptime(time_str, '%Y-%m-%d %H:%M:%S').timestamp()
@@ -33,6 +29,46 @@ def str_to_timestamp(time_str):
         except ValueError:
             raise ValueError(f"无法解析时间字符串: {time_str}")
 
+
+def grid_shape(grid_size):
+    """网格大小（米）-> (网格边长（度）, 纬度方向网格数, 经度方向网格数)"""
+    # 将米转换为经纬度（粗略转换）
+    grid_size_degree = grid_size / 111000
+    lng_grids = int((BEIJING_BOUNDS['max_lon'] - BEIJING_BOUNDS['min_lon']) / grid_size_degree) + 1
+    lat_grids = int((BEIJING_BOUNDS['max_lat'] - BEIJING_BOUNDS['min_lat']) / grid_size_degree) + 1
+    return grid_size_degree, lat_grids, lng_grids
+
+
+def density_parts(grid_size, start_time, end_time, progress=None, width=None):
+    """按时间桶（api/bucket_cache.py）统计各时间段每个网格的点数
+
+    每个时间段的部分结果为 (非空网格的编号（行 * 列数 + 列）, 点数)，完整的桶会被缓存，
+    调整时间窗后只扫描未缓存的桶与两端不足一个桶的部分。返回 ([(段起点, 部分结果), ...], 缓存统计)。
+    """
+    min_lon = BEIJING_BOUNDS['min_lon']
+    max_lon = BEIJING_BOUNDS['max_lon']
+    min_lat = BEIJING_BOUNDS['min_lat']
+    max_lat = BEIJING_BOUNDS['max_lat']
+    grid_size_degree, lat_grids, lng_grids = grid_shape(grid_size)
+
+    def scan(piece_start, piece_end):
+        points = query_points((min_lon, min_lat, piece_start, max_lon, max_lat, piece_end), progress)
+        lng_idx = ((points[:, 0] - min_lon) / grid_size_degree).astype(int)
+        lat_idx = ((points[:, 1] - min_lat) / grid_size_degree).astype(int)
+        valid = (lng_idx >= 0) & (lng_idx < lng_grids) & (lat_idx >= 0) & (lat_idx < lat_grids)
+        cells, counts = np.unique(lat_idx[valid] * lng_grids + lng_idx[valid], return_counts=True)
+        return (cells, counts), len(points)
+
+    return compose(('density', grid_size), start_time, end_time, scan, width)
+
+
+def merge_counts(parts, lat_grids, lng_grids):
+    """把若干时间段的部分结果累加为网格计数矩阵"""
+    density_counts = np.zeros(lat_grids * lng_grids)
+    for _, (cells, counts) in parts:
+        density_counts[cells] += counts
+    return density_counts.reshape(lat_grids, lng_grids)
+
 @density_bp.route('/analyze', methods=['POST'])
 def analyze_density():
     """分析指定时间段内的车流密度
@@ -57,128 +93,66 @@ def analyze_density():
         print(f"处理后的参数: grid_size={grid_size}, start_time={start_time}, end_time={end_time}")
         
         # 检查索引文件是否存在
-        if not (os.path.exists(INDEX_FILE + '.idx') and os.path.exists(INDEX_FILE + '.dat')):
+        if not index_available():
             print("错误: 索引文件不存在")
             return jsonify({
                 'status': 'error',
                 'message': '索引文件不存在，请先构建索引'
             }), 500
         
-        # 打开R树索引
-        p = index.Property()
-        p.dimension = 3  # 三维索引：经度、纬度、时间
-        idx = index.Index(INDEX_FILE, properties=p)
+        # 查询北京市范围内指定时间段的所有点（各时间分片并行扫描），按时间桶合成各网格的点数；
+        # 各时间段扫描后立即汇总，不保存整个时间窗的原始点，因此不再截断点数
+        print("开始按时间桶统计网格点数...")
+        report_progress('查询轨迹点')
+        mark_phase('search')
+        grid_size_degree, lat_grids, lng_grids = grid_shape(grid_size)
+        parts, cache_stats = density_parts(grid_size, start_time, end_time, ScanProgress())
+        density_counts = merge_counts(parts, lat_grids, lng_grids)
+        total_points = int(density_counts.sum())
+        print(f"总共统计了 {total_points} 个点，缓存命中 {cache_stats['hits']}/{cache_stats['buckets']} 个时间桶")
+        record_points(cache_stats['scanned_points'])
+        mark_phase('aggregate')
         
-        try:
-            # 使用北京市边界范围
-            min_lon = BEIJING_BOUNDS['min_lon']
-            max_lon = BEIJING_BOUNDS['max_lon']
-            min_lat = BEIJING_BOUNDS['min_lat']
-            max_lat = BEIJING_BOUNDS['max_lat']
-            
-            # 查询北京市范围内指定时间段的所有点
-            search_bbox = (min_lon, min_lat, start_time, max_lon, max_lat, end_time)
-            points = []
-            point_count = 0
-            batch = []
-            
-            print("开始分批收集轨迹点...")
-            for item in idx.intersection(search_bbox, objects=True):
-                coords = item.bbox[:2]  # 获取经纬度
-                # 确保点在北京市范围内
-                if (min_lon <= coords[0] <= max_lon and 
-                    min_lat <= coords[1] <= max_lat):
-                    batch.append(coords)
-                    point_count += 1
-                    
-                    if len(batch) >= BATCH_SIZE:
-                        points.extend(batch)
-                        batch = []
-                        print(f"已处理 {point_count} 个点...")
-                        
-                    if point_count >= MAX_POINTS:
-                        print(f"达到最大点数限制 ({MAX_POINTS})")
-                        break
-            
-            points.extend(batch)  # 添加最后一批
-            print(f"总共收集了 {len(points)} 个点")
-            
-            if not points:
-                print("警告: 所选时间范围内没有数据")
-                return jsonify({
-                    'status': 'error',
-                    'message': '所选时间范围内没有数据'
-                }), 400
-            
-            # 将米转换为经纬度
-            grid_size_degree = grid_size / 111000  # 粗略转换
-            
-            # 计算网格数量
-            lng_grids = int((max_lon - min_lon) / grid_size_degree) + 1
-            lat_grids = int((max_lat - min_lat) / grid_size_degree) + 1
-            
-            print(f"创建网格: {lng_grids}x{lat_grids} (经度x纬度)")
-            
-            # 初始化密度矩阵
-            density_matrix = np.zeros((lat_grids, lng_grids))
-            
-            # 统计每个网格内的点数量
-            for lon, lat in points:
-                lng_idx = int((lon - min_lon) / grid_size_degree)
-                lat_idx = int((lat - min_lat) / grid_size_degree)
-                if 0 <= lng_idx < lng_grids and 0 <= lat_idx < lat_grids:
-                    density_matrix[lat_idx][lng_idx] += 1
-            
-            # 归一化密度值
-            max_density = density_matrix.max()
-            if max_density > 0:
-                density_matrix = (density_matrix / max_density * 100).astype(int)
-            
-            print(f"最大密度值: {max_density}")
-            
-            # 构建返回数据
-            grid_data = []
-            for i in range(lat_grids):
-                for j in range(lng_grids):
-                    if density_matrix[i][j] > 0:
-                        grid_data.append({
-                            'bounds': {
-                                'sw': [min_lon + j * grid_size_degree, 
-                                      min_lat + i * grid_size_degree],
-                                'ne': [min_lon + (j + 1) * grid_size_degree, 
-                                      min_lat + (i + 1) * grid_size_degree]
-                            },
-                            'density': int(density_matrix[i][j])
-                        })
-            
-            print(f"生成了 {len(grid_data)} 个非空网格")
-            
-            # 计算统计信息
-            stats = {
-                'total_points': len(points),
-                'total_grids': len(grid_data),
-                'max_density': int(density_matrix.max()),
-                'avg_density': float(density_matrix[density_matrix > 0].mean()),
-                'time_range': {
-                    'start': datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S'),
-                    'end': datetime.fromtimestamp(end_time).strftime('%Y-%m-%d %H:%M:%S')
-                }
-            }
-            
-            print("分析完成，返回结果")
+        if total_points == 0:
+            print("警告: 所选时间范围内没有数据")
             return jsonify({
-                'status': 'success',
-                'data': {
-                    'grid_data': grid_data,
-                    'stats': stats,
-                    'grid_size': grid_size,
-                    'bounds': BEIJING_BOUNDS
-                }
-            })
-            
-        finally:
-            # 确保关闭索引
-            idx.close()
+                'status': 'error',
+                'message': '所选时间范围内没有数据'
+            }), 400
+        
+        report_progress('网格统计', total_points)
+        print(f"创建网格: {lng_grids}x{lat_grids} (经度x纬度)")
+        print(f"最大密度值: {density_counts.max()}")
+        
+        # 归一化密度值并构建返回数据
+        grid_data, density_matrix = build_grid_data(density_counts, BEIJING_BOUNDS['min_lon'],
+                                                    BEIJING_BOUNDS['min_lat'], grid_size_degree)
+        print(f"生成了 {len(grid_data)} 个非空网格")
+        
+        # 计算统计信息
+        stats = {
+            'total_points': total_points,
+            'total_grids': len(grid_data),
+            'max_density': int(density_matrix.max()),
+            'avg_density': float(density_matrix[density_matrix > 0].mean()),
+            'time_range': {
+                'start': datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S'),
+                'end': datetime.fromtimestamp(end_time).strftime('%Y-%m-%d %H:%M:%S')
+            },
+            'bucket_cache': cache_stats
+        }
+        
+        print("分析完成，返回结果")
+        mark_phase('serialize')
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'grid_data': grid_data,
+                'stats': stats,
+                'grid_size': grid_size,
+                'bounds': BEIJING_BOUNDS
+            }
+        })
             
     except Exception as e:
         import traceback
@@ -209,111 +183,279 @@ def analyze_density_time_series():
         interval = int(data.get('interval', 60))  # 默认1小时
         
         # 检查索引文件是否存在
-        if not (os.path.exists(INDEX_FILE + '.idx') and os.path.exists(INDEX_FILE + '.dat')):
+        if not index_available():
             return jsonify({
                 'status': 'error',
                 'message': '索引文件不存在，请先构建索引'
             }), 500
         
-        # 打开R树索引
-        p = index.Property()
-        p.dimension = 3  # 三维索引：经度、纬度、时间
-        idx = index.Index(INDEX_FILE, properties=p)
+        # 查询北京市范围内的点（各时间分片并行扫描），按时间桶合成各网格的点数；
+        # 时间间隔是缓存时间桶的整数倍时直接由缓存的桶组成，否则以时间间隔为桶
+        interval_seconds = interval * 60
+        width = bucket_seconds() if interval_seconds % bucket_seconds() == 0 else interval_seconds
+        report_progress('查询轨迹点')
+        mark_phase('search')
+        parts, cache_stats = density_parts(grid_size, start_time, end_time, ScanProgress(), width)
+        grid_size_degree, lat_grids, lng_grids = grid_shape(grid_size)
         
-        try:
-            # 使用北京市边界范围
-            min_lon = BEIJING_BOUNDS['min_lon']
-            max_lon = BEIJING_BOUNDS['max_lon']
-            min_lat = BEIJING_BOUNDS['min_lat']
-            max_lat = BEIJING_BOUNDS['max_lat']
-            
-            # 收集所有点的时间戳和坐标
-            points_data = []
-            
-            # 查询北京市范围内的点
-            search_bbox = (min_lon, min_lat, start_time, max_lon, max_lat, end_time)
-            
-            for item in idx.intersection(search_bbox, objects=True):
-                coords = item.bbox[:2]  # 经纬度
-                timestamp = item.bbox[2]  # 时间戳
-                # 确保点在北京市范围内
-                if (min_lon <= coords[0] <= max_lon and 
-                    min_lat <= coords[1] <= max_lat):
-                    points_data.append((timestamp, coords[0], coords[1]))
-            
-            if not points_data:
-                return jsonify({
-                    'status': 'error',
-                    'message': '所选时间范围内没有数据'
-                }), 400
-            
-            # 将米转换为经纬度
-            grid_size_degree = grid_size / 111000
-            
-            # 计算网格数量
-            lng_grids = int((max_lon - min_lon) / grid_size_degree) + 1
-            lat_grids = int((max_lat - min_lat) / grid_size_degree) + 1
-            
-            # 按时间间隔分组
-            interval_seconds = interval * 60
-            time_buckets = {}
-            
-            # 将点分配到时间桶中
-            for timestamp, lon, lat in points_data:
-                bucket_time = int(timestamp / interval_seconds) * interval_seconds
-                if bucket_time not in time_buckets:
-                    time_buckets[bucket_time] = []
-                time_buckets[bucket_time].append((lon, lat))
-            
-            # 存储每个时间段的密度数据
-            time_series_data = []
+        # 各时间段按所在的时间间隔分组
+        time_buckets = {}
+        for piece_start, partial in parts:
+            if len(partial[0]):
+                bucket_time = int(piece_start / interval_seconds) * interval_seconds
+                time_buckets.setdefault(bucket_time, []).append((piece_start, partial))
+        
+        if not time_buckets:
+            return jsonify({
+                'status': 'error',
+                'message': '所选时间范围内没有数据'
+            }), 400
+        
+        report_progress('按时间段统计', cache_stats['scanned_points'])
+        record_points(cache_stats['scanned_points'])
+        mark_phase('aggregate')
+        
+        # 存储每个时间段的密度数据
+        time_series_data = []
+        
+        # 对每个时间桶计算密度
+        for bucket_time in sorted(time_buckets.keys()):
+            density_matrix = merge_counts(time_buckets[bucket_time], lat_grids, lng_grids)
+            bucket_points = int(density_matrix.sum())
             
-            # 对每个时间桶计算密度
-            for bucket_time in sorted(time_buckets.keys()):
-                points = time_buckets[bucket_time]
-                
-                # 初始化密度矩阵
-                density_matrix = np.zeros((lat_grids, lng_grids))
-                
-                # 统计每个网格内的点数量
-                for lon, lat in points:
-                    lng_idx = int((lon - min_lon) / grid_size_degree)
-                    lat_idx = int((lat - min_lat) / grid_size_degree)
-                    if 0 <= lng_idx < lng_grids and 0 <= lat_idx < lat_grids:
-                        density_matrix[lat_idx][lng_idx] += 1
-                
-                # 归一化密度值
-                if density_matrix.max() > 0:
-                    density_matrix = (density_matrix / density_matrix.max() * 100).astype(int)
-                
-                # 记录该时间段的统计信息
-                time_series_data.append({
-                    'time': datetime.fromtimestamp(bucket_time).strftime('%Y-%m-%d %H:%M:%S'),
-                    'max_density': int(density_matrix.max()),
-                    'avg_density': float(density_matrix[density_matrix > 0].mean()) if density_matrix.max() > 0 else 0,
-                    'total_points': len(points),
-                    'active_grids': int((density_matrix > 0).sum())
-                })
+            # 归一化密度值
+            if density_matrix.max() > 0:
+                density_matrix = (density_matrix / density_matrix.max() * 100).astype(int)
             
-            return jsonify({
-                'status': 'success',
-                'data': {
-                    'time_series': time_series_data,
-                    'grid_info': {
-                        'size': grid_size,
-                        'rows': lat_grids,
-                        'cols': lng_grids,
-                        'bounds': BEIJING_BOUNDS
-                    }
-                }
+            # 记录该时间段的统计信息
+            time_series_data.append({
+                'time': datetime.fromtimestamp(bucket_time).strftime('%Y-%m-%d %H:%M:%S'),
+                'max_density': int(density_matrix.max()),
+                'avg_density': float(density_matrix[density_matrix > 0].mean()) if density_matrix.max() > 0 else 0,
+                'total_points': bucket_points,
+                'active_grids': int((density_matrix > 0).sum())
             })
-            
-        finally:
-            # 确保关闭索引
-            idx.close()
+        
+        mark_phase('serialize')
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'time_series': time_series_data,
+                'grid_info': {
+                    'size': grid_size,
+                    'rows': lat_grids,
+                    'cols': lng_grids,
+                    'bounds': BEIJING_BOUNDS
+                },
+                'bucket_cache': cache_stats
+            }
+        })
             
     except Exception as e:
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
+
+
+def build_grid_data(density_counts, min_lon, min_lat, grid_size_degree):
+    """将网格计数矩阵归一化为0-100，并转换为前端使用的非空网格列表"""
+    max_density = density_counts.max() if density_counts.size else 0
+    if max_density > 0:
+        density_matrix = (density_counts / max_density * 100).astype(int)
+    else:
+        density_matrix = density_counts.astype(int)
+    grid_data = []
+    rows, cols = np.nonzero(density_matrix)
+    for i, j in zip(rows.tolist(), cols.tolist()):
+        grid_data.append({
+            'bounds': {
+                'sw': [min_lon + j * grid_size_degree,
+                       min_lat + i * grid_size_degree],
+                'ne': [min_lon + (j + 1) * grid_size_degree,
+                       min_lat + (i + 1) * grid_size_degree]
+            },
+            'density': int(density_matrix[i][j])
+        })
+    return grid_data, density_matrix
+
+@density_bp.route('/analyze/stream', methods=['POST'])
+def analyze_density_stream():
+    """流式分析车流密度（Server-Sent Events）
+
+    请求参数与 /analyze 相同，另可指定:
+        {
+            "chunk_minutes": int  # 每个推送时间段的最大长度(分钟)，默认60
+        }
+
+    按时间段逐段查询索引，每段结束推送一次累计密度网格（partial 事件），
+    最后推送 done 事件，数据格式与 /analyze 的 data 字段相同。
+    """
+    try:
+        data = request.get_json()
+        grid_size = float(data.get('grid_size', 500))
+        start_time = str_to_timestamp(data['start_time'])
+        end_time = str_to_timestamp(data['end_time'])
+        chunk_seconds = int(data.get('chunk_minutes', 60)) * 60
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    if start_time >= end_time or chunk_seconds <= 0:
+        return jsonify({'status': 'error', 'message': '时间范围或时间段长度无效'}), 400
+
+    if not index_available():
+        return jsonify({'status': 'error', 'message': '索引文件不存在，请先构建索引'}), 500
+
+    def generate():
+        min_lon = BEIJING_BOUNDS['min_lon']
+        max_lon = BEIJING_BOUNDS['max_lon']
+        min_lat = BEIJING_BOUNDS['min_lat']
+        max_lat = BEIJING_BOUNDS['max_lat']
+
+        # 将米转换为经纬度
+        grid_size_degree = grid_size / 111000
+        lng_grids = int((max_lon - min_lon) / grid_size_degree) + 1
+        lat_grids = int((max_lat - min_lat) / grid_size_degree) + 1
+        density_counts = np.zeros((lat_grids, lng_grids))
+        chunks = time_chunks(start_time, end_time, chunk_seconds)
+        time_range = {
+            'start': datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S'),
+            'end': datetime.fromtimestamp(end_time).strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+        yield sse_event('meta', {
+            'grid_size': grid_size,
+            'bounds': BEIJING_BOUNDS,
+            'chunks': len(chunks),
+            'time_range': time_range
+        })
+
+        try:
+            total_points = 0
+            for chunk_index, (chunk_start, chunk_end) in enumerate(chunks):
+                is_last = chunk_index == len(chunks) - 1
+                search_bbox = (min_lon, min_lat, chunk_start, max_lon, max_lat, chunk_end)
+                points = query_points(search_bbox)
+                if not is_last:
+                    # 时间段按左闭右开划分，避免边界上的点被统计两次
+                    points = points[points[:, 2] < chunk_end]
+
+                if len(points):
+                    lng_idx = ((points[:, 0] - min_lon) / grid_size_degree).astype(int)
+                    lat_idx = ((points[:, 1] - min_lat) / grid_size_degree).astype(int)
+                    valid = (lng_idx >= 0) & (lng_idx < lng_grids) & (lat_idx >= 0) & (lat_idx < lat_grids)
+                    np.add.at(density_counts, (lat_idx[valid], lng_idx[valid]), 1)
+                    total_points += int(valid.sum())
+
+                grid_data, density_matrix = build_grid_data(density_counts, min_lon, min_lat, grid_size_degree)
+                stats = {
+                    'total_points': total_points,
+                    'total_grids': len(grid_data),
+                    'max_density': int(density_matrix.max()),
+                    'avg_density': float(density_matrix[density_matrix > 0].mean()) if grid_data else 0,
+                    'time_range': time_range
+                }
+                frame = {
+                    'grid_data': grid_data,
+                    'stats': stats,
+                    'grid_size': grid_size,
+                    'bounds': BEIJING_BOUNDS
+                }
+                yield sse_event('partial', {
+                    'chunk': chunk_index + 1,
+                    'chunks': len(chunks),
+                    'processed_until': datetime.fromtimestamp(chunk_end).strftime('%Y-%m-%d %H:%M:%S'),
+                    'data': frame
+                })
+
+            if total_points == 0:
+                yield sse_event('error', {'status': 'error', 'message': '所选时间范围内没有数据'})
+            else:
+                yield sse_event('done', {'status': 'success', 'data': frame})
+        except Exception as e:
+            yield sse_event('error', {'status': 'error', 'message': str(e)})
+
+    return sse_response(generate())
+
+
+@density_bp.route('/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def density_tile(z, x, y):
+    """按地图瓦片返回车流密度（瓦片金字塔见 api/density_tiles.py）
+
+    查询参数:
+        start_time  开始时间 (YYYY-MM-DD HH:mm:ss)
+        end_time    结束时间 (YYYY-MM-DD HH:mm:ss)
+
+    z/x/y 为 Web 墨卡托瓦片编号，z 不超过 MAX_ZOOM（更大的缩放级别请放大显示 MAX_ZOOM 的瓦片）。
+    返回瓦片内非空格子的点数，max_density 为同一缩放级别所有格子的最大点数，用于各瓦片统一着色。
+    """
+    try:
+        start_time = str_to_timestamp(request.args['start_time'])
+        end_time = str_to_timestamp(request.args['end_time'])
+    except (KeyError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': f'时间参数无效: {e}'}), 400
+
+    if start_time >= end_time:
+        return jsonify({'status': 'error', 'message': '时间范围无效'}), 400
+    if not 0 <= z <= MAX_ZOOM or not 0 <= x < (1 << z) or not 0 <= y < (1 << z):
+        return jsonify({'status': 'error', 'message': f'瓦片编号无效，缩放级别须在 0~{MAX_ZOOM} 之间'}), 400
+
+    if not index_available():
+        return jsonify({'status': 'error', 'message': '索引文件不存在，请先构建索引'}), 500
+
+    try:
+        mark_phase('search')
+        tile, source, cache_stats = get_tile(BEIJING_BOUNDS, start_time, end_time, z, x, y, ScanProgress())
+        record_cache(source != 'scan')
+        if cache_stats is not None:
+            record_points(cache_stats['scanned_points'])
+        mark_phase('serialize')
+        return jsonify({'status': 'success', 'data': tile, 'source': source})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@density_bp.route('/tiles/prerender', methods=['POST'])
+def prerender_density_tiles():
+    """预先渲染常用时间窗的密度瓦片
+
+    请求参数:
+        {
+            "windows": [{"start_time": str, "end_time": str}, ...],  # 缺省时为数据覆盖的每一天（00:00:00~23:59:59）
+            "min_zoom": int,  # 默认0
+            "max_zoom": int   # 默认 MAX_ZOOM
+        }
+    耗时较长，可以通过 /api/jobs 以 density_tiles 类型异步提交。
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        min_zoom = int(data.get('min_zoom', 0))
+        max_zoom = int(data.get('max_zoom', MAX_ZOOM))
+        if not 0 <= min_zoom <= max_zoom <= MAX_ZOOM:
+            return jsonify({'status': 'error', 'message': f'缩放级别须在 0~{MAX_ZOOM} 之间'}), 400
+        if not index_available():
+            return jsonify({'status': 'error', 'message': '索引文件不存在，请先构建索引'}), 500
+
+        if 'windows' in data:
+            windows = [(str_to_timestamp(window['start_time']), str_to_timestamp(window['end_time']))
+                       for window in data['windows']]
+        else:
+            _, _, min_time, _, _, max_time = index_bounds()
+            day = datetime.fromtimestamp(min_time).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+            windows = []
+            while day <= max_time:
+                windows.append((day, day + 24 * 3600 - 1))
+                day = (datetime.fromtimestamp(day) + timedelta(days=1)).timestamp()
+
+        results = []
+        for start_time, end_time in windows:
+            report_progress(f"渲染 {datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S')} 起的时间窗")
+            result = prerender(BEIJING_BOUNDS, start_time, end_time, min_zoom, max_zoom, ScanProgress())
+            results.append({
+                'start': datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S'),
+                'end': datetime.fromtimestamp(end_time).strftime('%Y-%m-%d %H:%M:%S'),
+                **result
+            })
+        return jsonify({'status': 'success', 'data': {'windows': results}})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -3,15 +3,18 @@ import os
 import sys
 import time as time_module  # 使用别名避免与变量冲突
 from datetime import datetime, timedelta
-from rtree import index
+from api.spatial import index_available, query_region_objects, ScanProgress
+from api.regions import parse_region
+from api.visits import area_events, sorted_events
+from api.trips import trips_exist, parse_mode, query_od_trips
+from api.jobs import report_progress
+from api.streaming import sse_event, sse_response
+from api.metrics import mark_phase, record_points
 from collections import defaultdict
 
 # 创建蓝图
 area_relation = Blueprint('area_relation', __name__)
 
-# 索引文件路径
-INDEX_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data', 'taxi_rtree')
-
 # 将字符串时间转换为时间戳
 def str_to_timestamp(time_str):
     try:
@@ -28,6 +31,16 @@ def str_to_timestamp(time_str):
 def timestamp_to_str(timestamp):
     return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
 
+def count_trip_flows(time_slots, region_a, region_b, start_timestamp, end_timestamp, travel_time_seconds):
+    """按行程表统计各时间槽的 A→B、B→A 行程数，行程计入到达时所在的时间槽（与逐点分析相同）"""
+    for key, origin, destination in (('a_to_b', region_a, region_b), ('b_to_a', region_b, region_a)):
+        for _, _, _, arrive_time, _, _ in query_od_trips(origin, destination, start_timestamp, end_timestamp,
+                                                         travel_time_seconds):
+            for slot in time_slots:
+                if slot['start'] <= arrive_time < slot['end']:
+                    slot[key] += 1
+                    break
+
 @area_relation.route('/analyze', methods=['POST'])
 def analyze_area_relation():
     """
@@ -49,9 +62,12 @@ def analyze_area_relation():
         },
         "start_time": "开始时间（格式：YYYY-MM-DDTHH:MM或YYYY-MM-DD HH:MM:SS）",
         "end_time": "结束时间（格式：YYYY-MM-DDTHH:MM或YYYY-MM-DD HH:MM:SS）",
-        "interval": 时间间隔（分钟）
+        "interval": 时间间隔（分钟）,
+        "mode": "points（默认，逐点识别区域间移动）或 trips（统计行程表中起终点分别在两个区域的行程）"
     }
+    area_a、area_b 也可以是 GeoJSON Polygon / MultiPolygon（见 api/regions.py）。
     """
+    handler_start = time_module.time()
     try:
         # 获取请求数据
         data = request.get_json()
@@ -64,19 +80,12 @@ def analyze_area_relation():
             if param not in data:
                 return jsonify({'error': f'缺少必要参数: {param}'}), 400
 
-        # 解析区域A的坐标
-        area_a = data['area_a']
-        min_lon_a = float(area_a['min_lon'])
-        min_lat_a = float(area_a['min_lat'])
-        max_lon_a = float(area_a['max_lon'])
-        max_lat_a = float(area_a['max_lat'])
-
-        # 解析区域B的坐标
-        area_b = data['area_b']
-        min_lon_b = float(area_b['min_lon'])
-        min_lat_b = float(area_b['min_lat'])
-        max_lon_b = float(area_b['max_lon'])
-        max_lat_b = float(area_b['max_lat'])
+        # 解析区域A、B（矩形或多边形）
+        try:
+            region_a = parse_region(data['area_a'])
+            region_b = parse_region(data['area_b'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         # 解析时间范围
         try:
@@ -97,76 +106,64 @@ def analyze_area_relation():
         slot_interval_minutes = 60  # 固定为1小时
         slot_interval_seconds = slot_interval_minutes * 60
 
-        # 检查索引文件是否存在
-        if not (os.path.exists(INDEX_FILE + '.idx') and os.path.exists(INDEX_FILE + '.dat')):
-            return jsonify({'error': '索引文件不存在，请先构建索引'}), 500
-
-        # 打开索引
-        p = index.Property()
-        p.dimension = 3  # 三维索引：经度、纬度、时间
-        idx = index.Index(INDEX_FILE, properties=p)
-
+        # 解析分析模式
         try:
-            # 创建时间槽
-            time_slots = []
-            current_time = start_timestamp
-            while current_time < end_timestamp:
-                next_time = min(current_time + slot_interval_seconds, end_timestamp)
-                time_slots.append({
-                    'start': current_time,
-                    'end': next_time,
-                    'label': f"{timestamp_to_str(current_time)} - {timestamp_to_str(next_time)}",
-                    'a_to_b': 0,  # 从A到B的车辆数
-                    'b_to_a': 0   # 从B到A的车辆数
-                })
-                current_time = next_time
-
-            # 查询区域A和区域B内的所有轨迹点
-            # 创建查询边界框
-            bbox_a = (min_lon_a, min_lat_a, start_timestamp, max_lon_a, max_lat_a, end_timestamp)
-            bbox_b = (min_lon_b, min_lat_b, start_timestamp, max_lon_b, max_lat_b, end_timestamp)
-
-            # 收集区域A和区域B内的轨迹点
-            points_in_a = defaultdict(list)  # 按出租车ID分组的区域A内的点
-            points_in_b = defaultdict(list)  # 按出租车ID分组的区域B内的点
-
-            # 查询区域A内的点
-            for item in idx.intersection(bbox_a, objects=True):
-                taxi_id = item.object
-                timestamp = item.bbox[2]  # 时间戳
-
-                points_in_a[taxi_id].append(timestamp)
-
-
-            # 查询区域B内的点
-            for item in idx.intersection(bbox_b, objects=True):
-                taxi_id = item.object
-                timestamp = item.bbox[2]  # 时间戳
+            mode = parse_mode(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-                points_in_b[taxi_id].append(timestamp)
+        # 检查索引文件是否存在
+        if mode == 'trips':
+            if not trips_exist():
+                return jsonify({'error': '行程表不存在，请先运行 build_trips.py 构建行程表'}), 500
+        elif not index_available():
+            return jsonify({'error': '索引文件不存在，请先构建索引'}), 500
 
+        # 创建时间槽
+        time_slots = []
+        current_time = start_timestamp
+        while current_time < end_timestamp:
+            next_time = min(current_time + slot_interval_seconds, end_timestamp)
+            time_slots.append({
+                'start': current_time,
+                'end': next_time,
+                'label': f"{timestamp_to_str(current_time)} - {timestamp_to_str(next_time)}",
+                'a_to_b': 0,  # 从A到B的车辆数
+                'b_to_a': 0   # 从B到A的车辆数
+            })
+            current_time = next_time
+
+        if mode == 'trips':
+            # 按行程表统计：起点在一个区域、终点在另一个区域，且行程时长在允许范围内的行程
+            report_progress('查询行程')
+            mark_phase('search')
+            count_trip_flows(time_slots, region_a, region_b, start_timestamp, end_timestamp, travel_time_seconds)
+        else:
+            # 查询区域A和区域B内每辆车的事件：有访问区间索引时区域内连续的点合并为一个事件
+            # （首个点时间, 末个点时间），否则每个点为一个事件
+            areas = [('A', region_a), ('B', region_b)]
+            progress = ScanProgress()
+            report_progress('查询区域A、B')
+            mark_phase('search')
+            events, points_scanned = area_events(areas, start_timestamp, end_timestamp, progress=progress)
+            events_a, events_b = events['A'], events['B']
 
             # 分析每辆出租车的轨迹，识别从A到B和从B到A的移动
-            for taxi_id in set(points_in_a.keys()) | set(points_in_b.keys()):
-                points_a = sorted(points_in_a.get(taxi_id, []))
-                points_b = sorted(points_in_b.get(taxi_id, []))
-
-                if not points_a or not points_b:
+            report_progress('识别区域间移动', points_scanned)
+            record_points(points_scanned)
+            mark_phase('aggregate')
+            for taxi_id in set(events_a.keys()) | set(events_b.keys()):
+                if not events_a.get(taxi_id) or not events_b.get(taxi_id):
                     continue  # 如果出租车只出现在一个区域，则跳过
 
-                # 合并并排序所有点
-                all_events = []
-                for event_time in points_a:
-                    all_events.append((event_time, 'A'))
-                for event_time in points_b:
-                    all_events.append((event_time, 'B'))
-                all_events.sort()
+                # 合并并排序所有事件
+                all_events = sorted_events(events, taxi_id)
 
                 # 跟踪车辆状态
                 last_area = None
                 last_time = None
 
-                for event_time, area in all_events:
+                for event_time, area, leave_time in all_events:
                     # 如果状态从A变为B，且时间间隔在允许范围内
                     if last_area == 'A' and area == 'B' and event_time - last_time <= travel_time_seconds:
                         # 找到了一次从A到B的移动
@@ -182,42 +179,139 @@ def analyze_area_relation():
                                 break
 
                     last_area = area
-                    last_time = event_time
-
-            # 计算总流量
-            total_a_to_b = sum(slot['a_to_b'] for slot in time_slots)
-            total_b_to_a = sum(slot['b_to_a'] for slot in time_slots)
-
-            # 计算查询执行时间
-            query_execution_time = time_module.time() - start_timestamp
-
-            # 返回结果
-            return jsonify({
-                'time_slots': time_slots,
-                'total': {
-                    'a_to_b': total_a_to_b,
-                    'b_to_a': total_b_to_a
-                },
-                'query_time': query_execution_time
-            })
-
-        finally:
-            # 确保关闭索引
-            idx.close()
+                    last_time = leave_time  # 离开该区域（事件中最后一个点）的时间
+
+        # 计算总流量
+        total_a_to_b = sum(slot['a_to_b'] for slot in time_slots)
+        total_b_to_a = sum(slot['b_to_a'] for slot in time_slots)
+
+        # 计算查询执行时间（从收到请求开始计时）
+        query_execution_time = time_module.time() - handler_start
+        mark_phase('serialize')
+
+        # 返回结果
+        return jsonify({
+            'time_slots': time_slots,
+            'total': {
+                'a_to_b': total_a_to_b,
+                'b_to_a': total_b_to_a
+            },
+            'mode': mode,
+            'query_time': query_execution_time
+        })
 
     except Exception as e:
-        # 确保在发生异常时关闭索引
-        try:
-            if 'idx' in locals() and idx:
-                idx.close()
-        except:
-            pass
-
         # 返回错误信息
         return jsonify({'error': f'分析过程中发生错误: {str(e)}'}), 500
 
 
+@area_relation.route('/analyze/stream', methods=['POST'])
+def analyze_area_relation_stream():
+    """
+    流式分析两个区域之间的车流量变化（Server-Sent Events）
+
+    请求体与 /analyze 相同。按1小时时间槽逐槽查询索引，每个时间槽结束推送一次
+    partial 事件（该槽的流量与截至目前的总流量），最后推送与 /analyze 结果相同的 done 事件。
+    每辆车的上一次所在区域会跨时间槽保留，因此跨越槽边界的移动同样会被统计。
+    mode=trips 时逐槽查询行程表中到达时间落在该槽内的行程。
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': '请求体必须是JSON格式'}), 400
+        for param in ['area_a', 'area_b', 'start_time', 'end_time']:
+            if param not in data:
+                return jsonify({'error': f'缺少必要参数: {param}'}), 400
+        region_a = parse_region(data['area_a'])
+        region_b = parse_region(data['area_b'])
+        start_timestamp = str_to_timestamp(data['start_time'])
+        end_timestamp = str_to_timestamp(data['end_time'])
+        travel_time_seconds = int(data.get('interval', 30)) * 60
+        mode = parse_mode(data)
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    if start_timestamp >= end_timestamp:
+        return jsonify({'error': '时间范围无效，确保start_time < end_time'}), 400
+
+    if mode == 'trips':
+        if not trips_exist():
+            return jsonify({'error': '行程表不存在，请先运行 build_trips.py 构建行程表'}), 500
+    elif not index_available():
+        return jsonify({'error': '索引文件不存在，请先构建索引'}), 500
+
+    slot_interval_seconds = 60 * 60  # 时间槽固定为1小时
+
+    def generate():
+        handler_start = time_module.time()
+        time_slots = []
+        current_time = start_timestamp
+        while current_time < end_timestamp:
+            next_time = min(current_time + slot_interval_seconds, end_timestamp)
+            time_slots.append({
+                'start': current_time,
+                'end': next_time,
+                'label': f"{timestamp_to_str(current_time)} - {timestamp_to_str(next_time)}",
+                'a_to_b': 0,
+                'b_to_a': 0
+            })
+            current_time = next_time
 
+        yield sse_event('meta', {'time_slots': [slot['label'] for slot in time_slots]})
 
+        # 每辆车最近一次出现的区域和时间，跨时间槽保留
+        last_seen = {}
+        total = {'a_to_b': 0, 'b_to_a': 0}
+        try:
+            for slot_index, slot in enumerate(time_slots):
+                if mode == 'trips':
+                    # 行程须完整落在整个时间窗内（与 /analyze 相同），按到达时间计入该槽
+                    count_trip_flows([slot], region_a, region_b, start_timestamp, slot['end'], travel_time_seconds)
+                    for key in total:
+                        total[key] += slot[key]
+                    yield sse_event('partial', {
+                        'slot_index': slot_index,
+                        'slot': slot,
+                        'total': total
+                    })
+                    continue
+
+                is_last = slot_index == len(time_slots) - 1
+                events = defaultdict(list)
+                for area, region in (('A', region_a), ('B', region_b)):
+                    for taxi_id, timestamp in query_region_objects(region, slot['start'], slot['end']):
+                        # 时间槽按左闭右开划分，避免边界上的点被统计两次
+                        if timestamp >= slot['end'] and not is_last:
+                            continue
+                        events[taxi_id].append((timestamp, area))
+
+                for taxi_id, taxi_events in events.items():
+                    taxi_events.sort()
+                    last_area, last_time = last_seen.get(taxi_id, (None, None))
+                    for event_time, area in taxi_events:
+                        if last_area is not None and last_area != area and event_time - last_time <= travel_time_seconds:
+                            # 移动计入事件发生时所在的时间槽（与 /analyze 相同，终点时刻不计入任何槽）
+                            if event_time < slot['end']:
+                                key = 'a_to_b' if last_area == 'A' else 'b_to_a'
+                                slot[key] += 1
+                                total[key] += 1
+                        last_area = area
+                        last_time = event_time
+                    last_seen[taxi_id] = (last_area, last_time)
+
+                yield sse_event('partial', {
+                    'slot_index': slot_index,
+                    'slot': slot,
+                    'total': total
+                })
 
+            yield sse_event('done', {
+                'time_slots': time_slots,
+                'total': total,
+                'mode': mode,
+                'query_time': time_module.time() - handler_start
+            })
+        except Exception as e:
+            yield sse_event('error', {'error': f'分析过程中发生错误: {str(e)}'})
 
+    return sse_response(generate())
@@ -3,15 +3,18 @@ import os
 import sys
 import time as time_module  # 使用别名避免与变量冲突
 from datetime import datetime, timedelta
-from rtree import index
+from api.spatial import index_available, query_region_objects, ScanProgress
+from api.regions import Region, parse_region
+from api.visits import area_events, sorted_events
+from api.trips import parse_mode
+from api.jobs import report_progress
+from api.streaming import sse_event, sse_response
+from api.metrics import mark_phase, record_points
 from collections import defaultdict
 
 # 创建蓝图
 area_relation2 = Blueprint('area_relation2', __name__)
 
-# 索引文件路径
-INDEX_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data', 'taxi_rtree')
-
 # 北京市边界范围
 BEIJING_BOUNDS = {
     'min_lon': 116.0,
@@ -20,6 +23,27 @@ BEIJING_BOUNDS = {
     'max_lat': 40.2
 }
 
+def outer_region(inner):
+    """内部区域外包矩形的1.5倍大小的外部矩形，不超出北京市边界"""
+    min_lon, min_lat, max_lon, max_lat = inner.bbox
+    center_lon = (min_lon + max_lon) / 2
+    center_lat = (min_lat + max_lat) / 2
+    width = max_lon - min_lon
+    height = max_lat - min_lat
+    return Region((
+        max(center_lon - width * 0.75, BEIJING_BOUNDS['min_lon']),
+        max(center_lat - height * 0.75, BEIJING_BOUNDS['min_lat']),
+        min(center_lon + width * 0.75, BEIJING_BOUNDS['max_lon']),
+        min(center_lat + height * 0.75, BEIJING_BOUNDS['max_lat'])
+    ))
+
+def parse_points_mode(data):
+    """F6 统计的是进出内部区域边界的次数，行程表只有起终点，只支持逐点分析"""
+    mode = parse_mode(data)
+    if mode != 'points':
+        raise ValueError('区域边界流量只支持逐点分析（mode=points），不支持按行程表分析')
+    return mode
+
 # 将字符串时间转换为时间戳
 def str_to_timestamp(time_str):
     try:
@@ -51,9 +75,12 @@ def analyze_area_relation2():
         },
         "start_time": "开始时间（格式：YYYY-MM-DDTHH:MM或YYYY-MM-DD HH:MM:SS）",
         "end_time": "结束时间（格式：YYYY-MM-DDTHH:MM或YYYY-MM-DD HH:MM:SS）",
-        "interval": 时间间隔（分钟）
+        "interval": 时间间隔（分钟）,
+        "mode": "points（默认）；与 F5 不同，这里不支持 trips"
     }
+    inner_rect 也可以是 GeoJSON Polygon / MultiPolygon，外部矩形按其外包矩形计算。
     """
+    handler_start = time_module.time()
     try:
         # 获取请求数据
         data = request.get_json()
@@ -66,30 +93,12 @@ def analyze_area_relation2():
             if param not in data:
                 return jsonify({'error': f'缺少必要参数: {param}'}), 400
 
-        # 解析内部矩形的坐标
-        inner_rect = data['inner_rect']
-        min_lon = float(inner_rect['min_lon'])
-        min_lat = float(inner_rect['min_lat'])
-        max_lon = float(inner_rect['max_lon'])
-        max_lat = float(inner_rect['max_lat'])
-
-        # 计算内部矩形的中心点和尺寸
-        center_lon = (min_lon + max_lon) / 2
-        center_lat = (min_lat + max_lat) / 2
-        width = max_lon - min_lon
-        height = max_lat - min_lat
-
-        # 创建1.5倍大小的外部矩形
-        outer_min_lon = center_lon - width * 0.75
-        outer_min_lat = center_lat - height * 0.75
-        outer_max_lon = center_lon + width * 0.75
-        outer_max_lat = center_lat + height * 0.75
-
-        # 确保外部矩形不超出北京市边界
-        outer_min_lon = max(outer_min_lon, BEIJING_BOUNDS['min_lon'])
-        outer_min_lat = max(outer_min_lat, BEIJING_BOUNDS['min_lat'])
-        outer_max_lon = min(outer_max_lon, BEIJING_BOUNDS['max_lon'])
-        outer_max_lat = min(outer_max_lat, BEIJING_BOUNDS['max_lat'])
+        # 解析内部区域（矩形或多边形），创建1.5倍大小的外部矩形
+        try:
+            inner = parse_region(data['inner_rect'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        outer = outer_region(inner)
 
         # 解析时间范围
         try:
@@ -102,6 +111,11 @@ def analyze_area_relation2():
         if start_timestamp >= end_timestamp:
             return jsonify({'error': '时间范围无效，确保start_time < end_time'}), 400
 
+        try:
+            mode = parse_points_mode(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
         # 不再考虑时间间隔
 
         # 时间槽间隔固定为1小时或者使用单独的参数
@@ -109,117 +123,186 @@ def analyze_area_relation2():
         slot_interval_seconds = slot_interval_minutes * 60
 
         # 检查索引文件是否存在
-        if not (os.path.exists(INDEX_FILE + '.idx') and os.path.exists(INDEX_FILE + '.dat')):
+        if not index_available():
             return jsonify({'error': '索引文件不存在，请先构建索引'}), 500
 
-        # 打开索引
-        p = index.Property()
-        p.dimension = 3  # 三维索引：经度、纬度、时间
-        idx = index.Index(INDEX_FILE, properties=p)
+        # 创建时间槽
+        time_slots = []
+        current_time = start_timestamp
+        while current_time < end_timestamp:
+            next_time = min(current_time + slot_interval_seconds, end_timestamp)
+            time_slots.append({
+                'start': current_time,
+                'end': next_time,
+                'label': f"{timestamp_to_str(current_time)} - {timestamp_to_str(next_time)}",
+                'inner_to_outer': 0,  # 从内部矩形到外部区域的车辆数
+                'outer_to_inner': 0   # 从外部区域到内部矩形的车辆数
+            })
+            current_time = next_time
+
+        # 查询内部矩形和外部环形区域内每辆车的事件：外部矩形中只有不在内部矩形的点算作外部区域；
+        # 有访问区间索引时区域内连续的点合并为一个事件，否则每个点为一个事件
+        areas = [('inner', inner), ('outer', outer)]
+        progress = ScanProgress()
+        report_progress('查询内部与外部区域')
+        mark_phase('search')
+        events, points_scanned = area_events(areas, start_timestamp, end_timestamp, exclusive=True,
+                                             progress=progress)
+        events_inner, events_outer = events['inner'], events['outer']
+
+        # 分析每辆出租车的轨迹，识别从内部矩形到外部区域和从外部区域到内部矩形的移动
+        report_progress('识别区域间移动', points_scanned)
+        record_points(points_scanned)
+        mark_phase('aggregate')
+        for taxi_id in set(events_inner.keys()) | set(events_outer.keys()):
+            if not events_inner.get(taxi_id) or not events_outer.get(taxi_id):
+                continue  # 如果出租车只出现在一个区域，则跳过
+
+            # 合并并排序所有事件
+            all_events = sorted_events(events, taxi_id)
+
+            # 跟踪车辆状态
+            last_area = None
+
+            for event_time, area, _ in all_events:
+                # 如果状态从内部矩形变为外部区域
+                if last_area == 'inner' and area == 'outer':
+                    # 找到了一次从内部矩形到外部区域的移动
+                    for slot in time_slots:
+                        if slot['start'] <= event_time < slot['end']:
+                            slot['inner_to_outer'] += 1
+                            break
+                # 如果状态从外部区域变为内部矩形
+                if last_area == 'outer' and area == 'inner':
+                    # 找到了一次从外部区域到内部矩形的移动
+                    for slot in time_slots:
+                        if slot['start'] <= event_time < slot['end']:
+                            slot['outer_to_inner'] += 1
+                            break
+
+                last_area = area
+
+        # 计算总流量
+        total_inner_to_outer = sum(slot['inner_to_outer'] for slot in time_slots)
+        total_outer_to_inner = sum(slot['outer_to_inner'] for slot in time_slots)
+
+        # 计算查询执行时间（从收到请求开始计时）
+        query_execution_time = time_module.time() - handler_start
+        mark_phase('serialize')
+
+        # 返回结果
+        return jsonify({
+            'time_slots': time_slots,
+            'total': {
+                'inner_to_outer': total_inner_to_outer,
+                'outer_to_inner': total_outer_to_inner
+            },
+            'mode': mode,
+            'query_time': query_execution_time
+        })
 
-        try:
-            # 创建时间槽
-            time_slots = []
-            current_time = start_timestamp
-            while current_time < end_timestamp:
-                next_time = min(current_time + slot_interval_seconds, end_timestamp)
-                time_slots.append({
-                    'start': current_time,
-                    'end': next_time,
-                    'label': f"{timestamp_to_str(current_time)} - {timestamp_to_str(next_time)}",
-                    'inner_to_outer': 0,  # 从内部矩形到外部区域的车辆数
-                    'outer_to_inner': 0   # 从外部区域到内部矩形的车辆数
-                })
-                current_time = next_time
-
-            # 查询内部矩形和外部矩形内的所有轨迹点
-            # 创建查询边界框
-            bbox_inner = (min_lon, min_lat, start_timestamp, max_lon, max_lat, end_timestamp)
-            bbox_outer = (outer_min_lon, outer_min_lat, start_timestamp, outer_max_lon, outer_max_lat, end_timestamp)
-
-            # 收集内部矩形和外部矩形内的轨迹点
-            points_in_inner = defaultdict(list)  # 按出租车ID分组的内部矩形内的点
-            points_in_outer = defaultdict(list)  # 按出租车ID分组的外部矩形内的点
-
-            # 查询内部矩形内的点
-            for item in idx.intersection(bbox_inner, objects=True):
-                taxi_id = item.object
-                timestamp = item.bbox[2]  # 时间戳
-                points_in_inner[taxi_id].append(timestamp)
-
-            # 查询外部矩形内的点
-            for item in idx.intersection(bbox_outer, objects=True):
-                taxi_id = item.object
-                timestamp = item.bbox[2]  # 时间戳
-                # 只有不在内部矩形的点才添加到外部区域
-                if taxi_id not in points_in_inner or timestamp not in points_in_inner[taxi_id]:
-                    points_in_outer[taxi_id].append(timestamp)
-
-            # 分析每辆出租车的轨迹，识别从内部矩形到外部区域和从外部区域到内部矩形的移动
-            for taxi_id in set(points_in_inner.keys()) | set(points_in_outer.keys()):
-                points_inner = sorted(points_in_inner.get(taxi_id, []))
-                points_outer = sorted(points_in_outer.get(taxi_id, []))
-
-                if not points_inner or not points_outer:
-                    continue  # 如果出租车只出现在一个区域，则跳过
-
-                # 合并并排序所有点
-                all_events = []
-                for event_time in points_inner:
-                    all_events.append((event_time, 'inner'))
-                for event_time in points_outer:
-                    all_events.append((event_time, 'outer'))
-                all_events.sort()
-
-                # 跟踪车辆状态
-                last_area = None
-
-                for event_time, area in all_events:
-                    # 如果状态从内部矩形变为外部区域
-                    if last_area == 'inner' and area == 'outer':
-                        # 找到了一次从内部矩形到外部区域的移动
-                        for slot in time_slots:
-                            if slot['start'] <= event_time < slot['end']:
-                                slot['inner_to_outer'] += 1
-                                break
-                    # 如果状态从外部区域变为内部矩形
-                    if last_area == 'outer' and area == 'inner':
-                        # 找到了一次从外部区域到内部矩形的移动
-                        for slot in time_slots:
-                            if slot['start'] <= event_time < slot['end']:
-                                slot['outer_to_inner'] += 1
-                                break
-
-                    last_area = area
-
-            # 计算总流量
-            total_inner_to_outer = sum(slot['inner_to_outer'] for slot in time_slots)
-            total_outer_to_inner = sum(slot['outer_to_inner'] for slot in time_slots)
-
-            # 计算查询执行时间
-            query_execution_time = time_module.time() - start_timestamp
-
-            # 返回结果
-            return jsonify({
-                'time_slots': time_slots,
-                'total': {
-                    'inner_to_outer': total_inner_to_outer,
-                    'outer_to_inner': total_outer_to_inner
-                },
-                'query_time': query_execution_time
+    except Exception as e:
+        # 返回错误信息
+        return jsonify({'error': f'分析过程中发生错误: {str(e)}'}), 500
+
+
+@area_relation2.route('/analyze/stream', methods=['POST'])
+def analyze_area_relation2_stream():
+    """
+    流式分析指定矩形区域与其他区域之间的车流量变化（Server-Sent Events）
+
+    请求体与 /analyze 相同。按1小时时间槽逐槽查询索引，每个时间槽结束推送一次
+    partial 事件（该槽的流量与截至目前的总流量），最后推送与 /analyze 结果相同的 done 事件。
+    每辆车的上一次所在区域会跨时间槽保留，因此跨越槽边界的移动同样会被统计。
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': '请求体必须是JSON格式'}), 400
+        for param in ['inner_rect', 'start_time', 'end_time']:
+            if param not in data:
+                return jsonify({'error': f'缺少必要参数: {param}'}), 400
+        inner = parse_region(data['inner_rect'])
+        start_timestamp = str_to_timestamp(data['start_time'])
+        end_timestamp = str_to_timestamp(data['end_time'])
+        mode = parse_points_mode(data)
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    if start_timestamp >= end_timestamp:
+        return jsonify({'error': '时间范围无效，确保start_time < end_time'}), 400
+
+    if not index_available():
+        return jsonify({'error': '索引文件不存在，请先构建索引'}), 500
+
+    outer = outer_region(inner)
+
+    slot_interval_seconds = 60 * 60  # 时间槽固定为1小时
+
+    def generate():
+        handler_start = time_module.time()
+        time_slots = []
+        current_time = start_timestamp
+        while current_time < end_timestamp:
+            next_time = min(current_time + slot_interval_seconds, end_timestamp)
+            time_slots.append({
+                'start': current_time,
+                'end': next_time,
+                'label': f"{timestamp_to_str(current_time)} - {timestamp_to_str(next_time)}",
+                'inner_to_outer': 0,
+                'outer_to_inner': 0
             })
+            current_time = next_time
 
-        finally:
-            # 确保关闭索引
-            idx.close()
+        yield sse_event('meta', {
+            'time_slots': [slot['label'] for slot in time_slots],
+            'outer_rect': dict(zip(('min_lon', 'min_lat', 'max_lon', 'max_lat'), outer.bbox))
+        })
 
-    except Exception as e:
-        # 确保在发生异常时关闭索引
+        # 每辆车最近一次出现的区域，跨时间槽保留
+        last_seen = {}
+        total = {'inner_to_outer': 0, 'outer_to_inner': 0}
         try:
-            if 'idx' in locals() and idx:
-                idx.close()
-        except:
-            pass
+            for slot_index, slot in enumerate(time_slots):
+                is_last = slot_index == len(time_slots) - 1
+                inner_points = defaultdict(set)
+                events = defaultdict(list)
+                for area, region in (('inner', inner), ('outer', outer)):
+                    for taxi_id, timestamp in query_region_objects(region, slot['start'], slot['end']):
+                        # 时间槽按左闭右开划分，避免边界上的点被统计两次
+                        if timestamp >= slot['end'] and not is_last:
+                            continue
+                        if area == 'inner':
+                            inner_points[taxi_id].add(timestamp)
+                        elif timestamp in inner_points[taxi_id]:
+                            # 只有不在内部矩形的点才算作外部区域
+                            continue
+                        events[taxi_id].append((timestamp, area))
+
+                for taxi_id, taxi_events in events.items():
+                    taxi_events.sort()
+                    last_area = last_seen.get(taxi_id)
+                    for event_time, area in taxi_events:
+                        if last_area is not None and last_area != area and event_time < slot['end']:
+                            key = 'inner_to_outer' if last_area == 'inner' else 'outer_to_inner'
+                            slot[key] += 1
+                            total[key] += 1
+                        last_area = area
+                    last_seen[taxi_id] = last_area
+
+                yield sse_event('partial', {
+                    'slot_index': slot_index,
+                    'slot': slot,
+                    'total': total
+                })
 
-        # 返回错误信息
-        return jsonify({'error': f'分析过程中发生错误: {str(e)}'}), 500
+            yield sse_event('done', {
+                'time_slots': time_slots,
+                'total': total,
+                'mode': mode,
+                'query_time': time_module.time() - handler_start
+            })
+        except Exception as e:
+            yield sse_event('error', {'error': f'分析过程中发生错误: {str(e)}'})
+
+    return sse_response(generate())
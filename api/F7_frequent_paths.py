@@ -11,63 +11,15 @@ import json
 import pickle
 import glob
 import sqlite3
+from api.resources import paths_db, clamp_top_k, DATA_DIR, INDEX_FILE
+from api.metrics import mark_phase, record_points, record_cache
 
 # 创建蓝图
 frequent_paths = Blueprint('frequent_paths_bp', __name__)
 
-# 索引文件路径
-INDEX_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data', 'taxi_rtree')
-
 # 全局缓存倒排索引
 precomputed_path_to_taxis = None
-PRECOMPUTED_INDEX_PATH = os.path.join(os.path.dirname(__file__), '../Data/precomputed_path_index.pkl')
-
-def haversine_distance(lon1, lat1, lon2, lat2):
-    """
-    计算两个经纬度点之间的距离（单位：米）
-    使用Haversine公式计算地球表面两点之间的距离
-    """
-    # 将经纬度转换为弧度
-    lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
-    
-    # Haversine公式
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = np.sin(dlat/2.0)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2.0)**2
-    c = 2 * np.arcsin(np.sqrt(a))
-    
-    # 地球平均半径（米）
-    r = 6371000
-    
-    return c * r
-
-def calculate_path_length(points):
-    """计算路径长度（使用Haversine距离）"""
-    total_length = 0
-    for i in range(len(points)-1):
-        # 使用Haversine公式计算相邻两点间的实际地球表面距离
-        lon1, lat1 = points[i][0], points[i][1]
-        lon2, lat2 = points[i+1][0], points[i+1][1]
-        dist = haversine_distance(lon1, lat1, lon2, lat2)
-        total_length += dist
-    return total_length
-
-def batch_path_lengths(paths):
-    """批量计算多个子路径的总长度（每个子路径为N*2的数组）"""
-    # paths: List[List[[lon, lat], ...]]
-    results = []
-    for pts in paths:
-        pts = np.array(pts)
-        if pts.shape[0] < 2:
-            results.append(0)
-            continue
-        lon1 = pts[:-1, 0]
-        lat1 = pts[:-1, 1]
-        lon2 = pts[1:, 0]
-        lat2 = pts[1:, 1]
-        d = haversine_distance(lon1, lat1, lon2, lat2)
-        results.append(np.sum(d))
-    return results
+PRECOMPUTED_INDEX_PATH = os.path.join(DATA_DIR, 'precomputed_path_index.pkl')
 
 def path_to_string(points):
     """将路径点转换为字符串表示"""
@@ -104,10 +56,7 @@ def analyze_frequent_paths():
         "min_distance": 路径最小长度（米）
     }
     """
-    # 获取项目根目录
-    PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-    CACHE_DIR = os.path.join(PROJECT_ROOT, 'Data', 'f7_query_cache')
-    DB_PATH = os.path.join(PROJECT_ROOT, 'Data', 'all_paths_from_pkl.sqlite')
+    CACHE_DIR = os.path.join(DATA_DIR, 'f7_query_cache')
     os.makedirs(CACHE_DIR, exist_ok=True)
     try:
         data = request.get_json()
@@ -121,6 +70,8 @@ def analyze_frequent_paths():
             return jsonify({'error': 'k必须大于0'}), 400
         if min_distance <= 0:
             return jsonify({'error': 'min_distance必须大于0'}), 400
+        # top-k 模式的路径库只能正确回答不超过挖掘参数 top_k 的查询，超出时截断并在结果中提示
+        k, warning = clamp_top_k(k)
 
         
 
@@ -132,14 +83,19 @@ def analyze_frequent_paths():
         if os.path.exists(cache_path):
             with open(cache_path, 'r', encoding='utf-8') as f:
                 cache_data = json.load(f)
-            return jsonify(cache_data)
+            record_cache(True)
+            mark_phase('serialize')
+            return jsonify(dict(cache_data, warning=warning) if warning else cache_data)
+        record_cache(False)
 
         # SQL查询高效获取top-k（适配all_paths_from_pkl.sqlite）
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('''SELECT points, frequency, length FROM paths WHERE length >= ? ORDER BY frequency DESC LIMIT ?''', (min_distance, k))
-        rows = c.fetchall()
-        conn.close()
+        mark_phase('search')
+        with paths_db() as conn:
+            c = conn.cursor()
+            c.execute('''SELECT points, frequency, length FROM paths WHERE length >= ? ORDER BY frequency DESC LIMIT ?''', (min_distance, k))
+            rows = c.fetchall()
+        record_points(len(rows))
+        mark_phase('aggregate')
         result_paths = []
         for points_str, frequency, path_length in rows:
             # points_str: "lon1,lat1;lon2,lat2;..."
@@ -159,6 +115,7 @@ def analyze_frequent_paths():
                 json.dump(result, f, ensure_ascii=False)
         except Exception:
             pass
-        return jsonify(result)
+        mark_phase('serialize')
+        return jsonify(dict(result, warning=warning) if warning else result)
     except Exception as e:
         return jsonify({'error': f'分析过程中发生错误: {str(e)}'}), 500
@@ -4,15 +4,10 @@ import sqlite3
 import numpy as np
 import hashlib
 import json
-
-def point_in_rect(point, rect):
-    """
-    判断点是否在矩形区域内
-    point: [lon, lat]
-    rect: [min_lon, min_lat, max_lon, max_lat]
-    """
-    lon, lat = point
-    return rect[0] <= lon <= rect[2] and rect[1] <= lat <= rect[3]
+from api.resources import paths_db, paths_mining_meta, clamp_top_k, DATA_DIR
+from api.metrics import mark_phase, record_points, record_cache
+from api.jobs import report_progress, PROGRESS_INTERVAL
+from api.regions import parse_region
 
 # 创建蓝图
 frequent_paths_ab_bp = Blueprint('frequent_paths_ab_bp', __name__)
@@ -27,10 +22,9 @@ def analyze_frequent_paths_ab():
         "rect_a": [min_lon, min_lat, max_lon, max_lat],
         "rect_b": [min_lon, min_lat, max_lon, max_lat]
     }
+    rect_a、rect_b 也可以是 GeoJSON Polygon / MultiPolygon（见 api/regions.py）。
     """
-    PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-    CACHE_DIR = os.path.join(PROJECT_ROOT, 'Data', 'f8_query_cache')
-    DB_PATH = os.path.join(PROJECT_ROOT, 'Data', 'all_paths_from_pkl.sqlite')
+    CACHE_DIR = os.path.join(DATA_DIR, 'f8_query_cache')
     os.makedirs(CACHE_DIR, exist_ok=True)
     try:
         data = request.get_json()
@@ -45,8 +39,15 @@ def analyze_frequent_paths_ab():
         
         if k <= 0:
             return jsonify({'error': 'k必须大于0'}), 400
-        if len(rect_a) != 4 or len(rect_b) != 4:
-            return jsonify({'error': 'rect_a和rect_b必须为4元素数组'}), 400
+        try:
+            region_a = parse_region(rect_a)
+            region_b = parse_region(rect_b)
+        except ValueError as e:
+            return jsonify({'error': f'rect_a或rect_b无效: {e}'}), 400
+        # top-k 模式的路径库只保留全局频繁的路径，区域间的结果可能不完整，k 超出挖掘参数时截断
+        k, warning = clamp_top_k(k)
+        if 'top_k' in paths_mining_meta():
+            warning = ' '.join(filter(None, [warning, '路径库为 top-k 精简模式，只含全局频繁的路径，A→B 的结果可能不完整']))
 
         # 查询参数生成唯一key
         cache_key = json.dumps({'k': k, 'min_distance': min_distance, 'rect_a': rect_a, 'rect_b': rect_b}, sort_keys=True)
@@ -55,25 +56,40 @@ def analyze_frequent_paths_ab():
         if os.path.exists(cache_path):
             with open(cache_path, 'r', encoding='utf-8') as f:
                 cache_data = json.load(f)
-            return jsonify(cache_data)
+            record_cache(True)
+            mark_phase('serialize')
+            return jsonify(dict(cache_data, warning=warning) if warning else cache_data)
+        record_cache(False)
 
         # 查询数据库，筛选起点在A、终点在B的路径
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('''SELECT points, frequency, length FROM paths WHERE length >= ?''', (min_distance,))
-        rows = c.fetchall()
-        conn.close()
+        report_progress('读取路径库')
+        mark_phase('search')
+        with paths_db() as conn:
+            c = conn.cursor()
+            c.execute('''SELECT points, frequency, length FROM paths WHERE length >= ?''', (min_distance,))
+            rows = c.fetchall()
+        record_points(len(rows))
+        mark_phase('aggregate')
+        report_progress('筛选路径')
+        # 先只解析各路径的起点与终点，整体判断是否在区域内，只有命中的路径才解析全部点
+        endpoints = np.empty((len(rows), 4))
+        for scanned, (points_str, _, _) in enumerate(rows, 1):
+            if scanned % PROGRESS_INTERVAL == 0:
+                report_progress(points=scanned)
+            first = points_str.split(';', 1)[0]
+            last = points_str.rsplit(';', 1)[-1]
+            endpoints[scanned - 1] = [*first.split(','), *last.split(',')]
+        matched = (region_a.contains(endpoints[:, 0], endpoints[:, 1])
+                   & region_b.contains(endpoints[:, 2], endpoints[:, 3]))
         result_paths = []
-        for points_str, frequency, path_length in rows:
+        for i in np.flatnonzero(matched).tolist():
+            points_str, frequency, path_length = rows[i]
             points = [[float(x), float(y)] for x, y in (p.split(',') for p in points_str.split(';'))]
-            if not points:
-                continue
-            if point_in_rect(points[0], rect_a) and point_in_rect(points[-1], rect_b):
-                result_paths.append({
-                    'frequency': frequency,
-                    'length': path_length,
-                    'points': points
-                })
+            result_paths.append({
+                'frequency': frequency,
+                'length': path_length,
+                'points': points
+            })
         result_paths = sorted(result_paths, key=lambda x: x['frequency'], reverse=True)[:k]
         result = {
             'paths': result_paths,
@@ -84,6 +100,7 @@ def analyze_frequent_paths_ab():
                 json.dump(result, f, ensure_ascii=False)
         except Exception:
             pass
-        return jsonify(result)
+        mark_phase('serialize')
+        return jsonify(dict(result, warning=warning) if warning else result)
     except Exception as e:
         return jsonify({'error': f'分析过程中发生错误: {str(e)}'}), 500
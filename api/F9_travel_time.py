@@ -3,17 +3,20 @@ import os
 import sys
 import time as time_module
 from datetime import datetime, timedelta
-from rtree import index
-from collections import defaultdict
+from api.resources import TAXI_LOG_DIR
+from api.spatial import index_available, ScanProgress
+from api.regions import parse_region
+from api.visits import area_events, sorted_events
+from api.trips import trips_exist, parse_mode, query_od_trips
+from api.jobs import report_progress
+from api.metrics import mark_phase, record_points
+from api.catalog import track_exists, window_empty
 
 # 创建蓝图
 travel_time = Blueprint('travel_time', __name__)
 
-# 索引文件路径
-INDEX_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data', 'taxi_rtree')
-
 # 数据文件目录路径
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data', 'taxi_log_2008_by_id')
+DATA_DIR = TAXI_LOG_DIR
 
 # 将字符串时间转换为时间戳
 def str_to_timestamp(time_str):
@@ -36,12 +39,17 @@ def read_taxi_track(taxi_id, start_time, end_time):
     try:
         # 构建文件路径
         file_path = os.path.join(DATA_DIR, f'{taxi_id}.txt')
+        file_id = taxi_id
 
-        if not os.path.exists(file_path):
+        # 有出租车目录时查目录，不再探测文件
+        if not track_exists(file_id, DATA_DIR):
             # 尝试使用不同的文件名格式
-            file_path = os.path.join(DATA_DIR, f'{int(taxi_id)}.txt')
-            if not os.path.exists(file_path):
+            file_id = int(taxi_id)
+            file_path = os.path.join(DATA_DIR, f'{file_id}.txt')
+            if not track_exists(file_id, DATA_DIR):
                 return None
+        if window_empty(file_id, start_time, end_time):
+            return {'id': taxi_id, 'path': []}
 
         # 读取文件内容
         track_data = {
@@ -90,6 +98,10 @@ def read_taxi_track(taxi_id, start_time, end_time):
 def analyze_travel_time():
     """
     分析从区域A到区域B的最短通行时间
+
+    mode 为 points（默认）时逐点比较车辆在两个区域的出现时间；
+    为 trips 时取行程表中起点在A、终点在B的最短行程。
+    area_a、area_b 为矩形 {min_lon, min_lat, max_lon, max_lat} 或 GeoJSON Polygon / MultiPolygon。
     """
     try:
         # 获取请求数据
@@ -103,18 +115,12 @@ def analyze_travel_time():
             if param not in data:
                 return jsonify({'error': f'缺少必要参数: {param}'}), 400
 
-        # 解析区域A和B的坐标
-        area_a = data['area_a']
-        min_lon_a = float(area_a['min_lon'])
-        min_lat_a = float(area_a['min_lat'])
-        max_lon_a = float(area_a['max_lon'])
-        max_lat_a = float(area_a['max_lat'])
-
-        area_b = data['area_b']
-        min_lon_b = float(area_b['min_lon'])
-        min_lat_b = float(area_b['min_lat'])
-        max_lon_b = float(area_b['max_lon'])
-        max_lat_b = float(area_b['max_lat'])
+        # 解析区域A和B（矩形或多边形）
+        try:
+            region_a = parse_region(data['area_a'])
+            region_b = parse_region(data['area_b'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         # 解析时间范围
         try:
@@ -126,38 +132,43 @@ def analyze_travel_time():
         if start_timestamp >= end_timestamp:
             return jsonify({'error': '时间范围无效，确保start_time < end_time'}), 400
 
+        # 解析分析模式
+        try:
+            mode = parse_mode(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
         # 检查索引文件是否存在
-        if not (os.path.exists(INDEX_FILE + '.idx') and os.path.exists(INDEX_FILE + '.dat')):
+        if mode == 'trips':
+            if not trips_exist():
+                return jsonify({'error': '行程表不存在，请先运行 build_trips.py 构建行程表'}), 500
+        elif not index_available():
             return jsonify({'error': '索引文件不存在，请先构建索引'}), 500
 
-        # 打开索引
-        p = index.Property()
-        p.dimension = 3  # 三维索引：经度、纬度、时间
-        idx = index.Index(INDEX_FILE, properties=p)
-
-        try:
-            # 创建查询边界框
-            bbox_a = (min_lon_a, min_lat_a, start_timestamp, max_lon_a, max_lat_a, end_timestamp)
-            bbox_b = (min_lon_b, min_lat_b, start_timestamp, max_lon_b, max_lat_b, end_timestamp)
-
-            # 收集区域A和区域B内的轨迹点
-            points_in_a = defaultdict(list)
-            points_in_b = defaultdict(list)
-
-            # 查询区域A内的点
-            for item in idx.intersection(bbox_a, objects=True):
-                taxi_id = item.object
-                timestamp = item.bbox[2]
-                points_in_a[taxi_id].append(timestamp)
-
-            # 查询区域B内的点
-            for item in idx.intersection(bbox_b, objects=True):
-                taxi_id = item.object
-                timestamp = item.bbox[2]
-                points_in_b[taxi_id].append(timestamp)
+        if mode == 'trips':
+            # 行程表中起点在A、终点在B的行程，取时长最短的一个（出发与到达属于同一行程）
+            report_progress('查询行程')
+            mark_phase('search')
+            trips = query_od_trips(region_a, region_b, start_timestamp, end_timestamp)
+            min_travel_taxi = None
+            if trips:
+                trip_id, min_travel_taxi, min_travel_start, min_travel_end, trip_distance, min_travel_time = \
+                    min(trips, key=lambda trip: (trip[5], trip[2]))
+        else:
+            # 查询区域A和区域B内每辆车的事件：有访问区间索引时区域内连续的点合并为一个事件
+            # （首个点时间, 末个点时间），否则每个点为一个事件
+            areas = [('A', region_a), ('B', region_b)]
+            progress = ScanProgress()
+            report_progress('查询区域A、B')
+            mark_phase('search')
+            events, points_scanned = area_events(areas, start_timestamp, end_timestamp, progress=progress)
+            events_a, events_b = events['A'], events['B']
 
             # 找出同时出现在区域A和区域B的出租车
-            common_taxis = set(points_in_a.keys()) & set(points_in_b.keys())
+            report_progress('计算通行时间', points_scanned)
+            record_points(points_scanned)
+            mark_phase('aggregate')
+            common_taxis = set(events_a.keys()) & set(events_b.keys())
 
             if not common_taxis:
                 return jsonify({'error': '没有找到同时出现在两个区域的出租车'}), 404
@@ -169,26 +180,14 @@ def analyze_travel_time():
             min_travel_end = None
 
             for taxi_id in common_taxis:
-                # 获取该出租车在A和B区域的时间点
-                points_a = sorted(points_in_a.get(taxi_id, []))
-                points_b = sorted(points_in_b.get(taxi_id, []))
-
-                if not points_a or not points_b:
-                    continue  # 如果出租车只出现在一个区域，则跳过
-
-                # 合并并排序所有点
-                all_events = []
-                for event_time in points_a:
-                    all_events.append((event_time, 'A'))
-                for event_time in points_b:
-                    all_events.append((event_time, 'B'))
-                all_events.sort()
+                # 合并并排序该出租车在A和B区域的事件
+                all_events = sorted_events(events, taxi_id)
 
                 # 跟踪车辆状态
                 last_area = None
                 last_time = None
 
-                for event_time, area in all_events:
+                for event_time, area, leave_time in all_events:
                     # 如果状态从A变为B，记录一次从A到B的移动
                     if last_area == 'A' and area == 'B':
                         travel_time = event_time - last_time
@@ -201,34 +200,31 @@ def analyze_travel_time():
                             min_travel_end = event_time   # B区域的时间点
 
                     last_area = area
-                    last_time = event_time
-
-            if min_travel_taxi is None:
-                return jsonify({'error': '没有找到从区域A到区域B的有效路径'}), 404
-
-            # 获取最短通行时间的出租车完整轨迹
-            track_data = read_taxi_track(min_travel_taxi, min_travel_start, min_travel_end)
-
-            if not track_data:
-                return jsonify({'error': f'无法读取出租车 {min_travel_taxi} 的轨迹数据'}), 500
-
-            # 返回结果
-            return jsonify({
-                'taxi_id': min_travel_taxi,
-                'travel_time': min_travel_time / 60,  # 转换为分钟
-                'travel_time_seconds': min_travel_time,
-                'start_time': timestamp_to_str(min_travel_start),
-                'end_time': timestamp_to_str(min_travel_end),
-                'track': track_data
-            })
-
-        finally:
-            idx.close()
+                    last_time = leave_time  # 离开该区域（事件中最后一个点）的时间
+
+        if min_travel_taxi is None:
+            return jsonify({'error': '没有找到从区域A到区域B的有效路径'}), 404
+
+        # 获取最短通行时间的出租车完整轨迹
+        track_data = read_taxi_track(min_travel_taxi, min_travel_start, min_travel_end)
+
+        if not track_data:
+            return jsonify({'error': f'无法读取出租车 {min_travel_taxi} 的轨迹数据'}), 500
+
+        # 返回结果
+        mark_phase('serialize')
+        result = {
+            'taxi_id': min_travel_taxi,
+            'travel_time': min_travel_time / 60,  # 转换为分钟
+            'travel_time_seconds': min_travel_time,
+            'start_time': timestamp_to_str(min_travel_start),
+            'end_time': timestamp_to_str(min_travel_end),
+            'track': track_data,
+            'mode': mode
+        }
+        if mode == 'trips':
+            result['trip'] = {'id': trip_id, 'distance': trip_distance}
+        return jsonify(result)
 
     except Exception as e:
-        try:
-            if 'idx' in locals() and idx:
-                idx.close()
-        except:
-            pass
         return jsonify({'error': f'分析过程中发生错误: {str(e)}'}), 500
@@ -0,0 +1,160 @@
+"""
+按时间桶缓存的部分聚合结果（F3、F4）
+
+分析时常在相近的时间窗之间反复微调（如 08:00~10:00 之后改为 08:00~11:00），每次都要重新扫描整个时间窗。
+这里把时间窗按固定时长的时间桶（默认一小时，与 Unix 时间对齐）切开：完整落在时间窗内的桶，
+其部分聚合结果按 (查询参数, 桶时长, 桶起点) 缓存；时间窗两端不足一个桶的部分每次直接扫描。
+新的时间窗由已缓存的桶加上未缓存的桶与两端的部分合成，相邻的时间窗只需扫描变化的部分。
+
+各时间段左闭右开（查询框的时间上界取前一个浮点数），最后一段包含时间窗终点，
+合起来与直接查询 [start, end] 的点完全相同。部分聚合结果由调用方的 scan 计算，须可合并（集合并、计数相加）。
+
+缓存在进程内按最近使用淘汰，总大小不超过 TAXIFLOW_BUCKET_CACHE_MB；当前后端的数据版本
+（api/spatial.py 的 data_version）改变后整体清空。每次合成的命中桶数与省去扫描的点数通过
+api/metrics.py 的 record_buckets 上报，进程内的累计值见 /api/health 的 bucket_cache 字段。
+
+环境变量:
+    TAXIFLOW_BUCKET_MINUTES   时间桶时长（分钟），默认 60
+    TAXIFLOW_BUCKET_CACHE_MB  缓存大小上限（MB），默认 256，0 表示不缓存（仍按时间桶合成）
+"""
+import os
+import math
+import threading
+from collections import OrderedDict
+from api.spatial import data_version
+from api.metrics import record_buckets
+
+DEFAULT_BUCKET_MINUTES = 60
+DEFAULT_CACHE_MB = 256
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # (查询参数, 桶时长, 桶起点) -> (部分结果, 点数, 字节数)，按最近使用排序
+_bytes = 0
+_version = None
+_totals = {'hits': 0, 'misses': 0, 'saved_points': 0, 'scanned_points': 0}
+
+
+def bucket_seconds():
+    minutes = os.environ.get('TAXIFLOW_BUCKET_MINUTES')
+    return max(1, int(float(minutes) * 60)) if minutes else DEFAULT_BUCKET_MINUTES * 60
+
+
+def cache_limit():
+    megabytes = os.environ.get('TAXIFLOW_BUCKET_CACHE_MB')
+    return int(float(megabytes) * 1024 * 1024) if megabytes else DEFAULT_CACHE_MB * 1024 * 1024
+
+
+def window_pieces(start, end, width):
+    """把时间窗 [start, end] 在桶边界处切开，返回 [(段起点, 段终点, 是否为完整的桶)]
+
+    除最后一段外均为左闭右开；终点恰在桶边界上时最后一段为 [end, end]，只含终点时刻的点。
+    """
+    bounds = [start]
+    edge = math.floor(start / width) * width + width
+    while edge <= end:
+        bounds.append(edge)
+        edge += width
+    pieces = []
+    for i, piece_start in enumerate(bounds):
+        if i + 1 < len(bounds):
+            piece_end = bounds[i + 1]
+            pieces.append((piece_start, piece_end, piece_start % width == 0 and piece_end - piece_start == width))
+        else:
+            pieces.append((piece_start, end, False))
+    return pieces
+
+
+def _nbytes(partial):
+    return sum(array.nbytes for array in partial)
+
+
+def _lookup(key, version):
+    global _bytes, _version
+    with _lock:
+        if version != _version:
+            _entries.clear()
+            _bytes = 0
+            _version = version
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+        return entry
+
+
+def _store(key, version, partial, points):
+    global _bytes
+    size = _nbytes(partial)
+    limit = cache_limit()
+    if size > limit:
+        return
+    with _lock:
+        if version != _version or key in _entries:
+            return
+        _entries[key] = (partial, points, size)
+        _bytes += size
+        while _bytes > limit:
+            _, (_, _, evicted) = _entries.popitem(last=False)
+            _bytes -= evicted
+
+
+def clear_cache():
+    """清空缓存（基准测试在每次计时前调用）"""
+    global _bytes
+    with _lock:
+        _entries.clear()
+        _bytes = 0
+
+
+def compose(params, start, end, scan, width=None):
+    """按时间桶合成时间窗 [start, end] 上的部分聚合结果
+
+    params 为可哈希的查询参数（区域、网格大小等，不含时间）；scan(段起点, 段终点) 扫描闭区间上的点，
+    返回 (部分结果, 扫描的点数)，部分结果为 NumPy 数组组成的元组。
+    返回 ([(段起点, 部分结果), ...], 统计)，统计为 {'buckets', 'hits', 'scanned_points', 'saved_points'}。
+    """
+    import numpy as np
+    width = width or bucket_seconds()
+    version = data_version()
+    parts = []
+    stats = {'buckets': 0, 'hits': 0, 'scanned_points': 0, 'saved_points': 0}
+    pieces = window_pieces(start, end, width)
+    for i, (piece_start, piece_end, full) in enumerate(pieces):
+        key = (params, width, piece_start)
+        if full:
+            stats['buckets'] += 1
+            entry = _lookup(key, version)
+            if entry is not None:
+                stats['hits'] += 1
+                stats['saved_points'] += entry[1]
+                parts.append((piece_start, entry[0]))
+                continue
+        # 最后一段包含时间窗终点，其余各段不含段终点
+        scan_end = piece_end if i == len(pieces) - 1 else float(np.nextafter(piece_end, -np.inf))
+        partial, points = scan(piece_start, scan_end)
+        stats['scanned_points'] += points
+        if full:
+            _store(key, version, partial, points)
+        parts.append((piece_start, partial))
+
+    misses = stats['buckets'] - stats['hits']
+    with _lock:
+        _totals['hits'] += stats['hits']
+        _totals['misses'] += misses
+        _totals['saved_points'] += stats['saved_points']
+        _totals['scanned_points'] += stats['scanned_points']
+    record_buckets(stats['hits'], misses, stats['saved_points'])
+    return parts, stats
+
+
+def bucket_cache_status():
+    """进程内的缓存大小与累计命中情况"""
+    with _lock:
+        lookups = _totals['hits'] + _totals['misses']
+        return {
+            'bucket_minutes': bucket_seconds() / 60,
+            'entries': len(_entries),
+            'bytes': _bytes,
+            'limit_bytes': cache_limit(),
+            **_totals,
+            'hit_rate': round(_totals['hits'] / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,155 @@
+"""
+出租车目录的查询
+
+DataProcess/build_taxi_catalog.py 为每辆车记录点数、首末时间、经纬度范围与轨迹文件大小。
+F1 的列表接口按这些字段筛选、分页；F1、F9 读取轨迹前先查目录，没有轨迹或时间窗与轨迹不相交时
+直接返回，不再探测文件、解析轨迹。没有目录时各接口仍按原方式探测文件。
+
+目录同样用 mmap 打开，meta.json 修改后（重建或增量导入）自动重新打开。
+"""
+import os
+import json
+import threading
+from api.resources import DATA_DIR
+
+CATALOG_DIR = os.path.join(DATA_DIR, 'taxi_catalog')
+META_FILE = os.path.join(CATALOG_DIR, 'meta.json')
+COLUMNS = ('taxi', 'points', 'first_time', 'last_time', 'min_lon', 'min_lat', 'max_lon', 'max_lat', 'bytes')
+SORT_KEYS = {'id': 'taxi', 'points': 'points', 'start': 'first_time', 'end': 'last_time'}
+
+_lock = threading.Lock()
+_catalog = None
+_catalog_mtime = None
+
+
+def catalog_exists():
+    return os.path.exists(META_FILE)
+
+
+def catalog_files():
+    if not os.path.isdir(CATALOG_DIR):
+        return []
+    return [os.path.join(CATALOG_DIR, fname) for fname in sorted(os.listdir(CATALOG_DIR)) if fname.endswith('.npy')]
+
+
+def load_catalog():
+    """打开出租车目录，返回 {'meta', 列名: 数组}；不存在时返回 None"""
+    global _catalog, _catalog_mtime
+    try:
+        mtime = os.path.getmtime(META_FILE)
+    except OSError:
+        return None
+    if mtime != _catalog_mtime:
+        with _lock:
+            if mtime != _catalog_mtime:
+                import numpy as np  # 健康检查等轻量路径也会导入本模块，NumPy 在用到时才导入
+                with open(META_FILE, 'r', encoding='utf-8') as f:
+                    catalog = {'meta': json.load(f)}
+                for name in COLUMNS:
+                    catalog[name] = np.load(os.path.join(CATALOG_DIR, f'{name}.npy'), mmap_mode='r')
+                _catalog = catalog
+                _catalog_mtime = mtime
+    return _catalog
+
+
+def _row(catalog, taxi_id):
+    """出租车在目录中的行号；没有目录或 ID 不是规范的数字（如带前导零，与文件名不符）时返回 None，不在目录中时返回 -1"""
+    taxi_id = str(taxi_id)
+    if catalog is None or not taxi_id.isdigit() or str(int(taxi_id)) != taxi_id:
+        return None
+    import numpy as np
+    taxis = catalog['taxi']
+    i = int(np.searchsorted(taxis, int(taxi_id)))
+    return i if i < len(taxis) and int(taxis[i]) == int(taxi_id) else -1
+
+
+def _entry(catalog, i):
+    from datetime import datetime
+    points = int(catalog['points'][i])
+
+    def time_str(timestamp):
+        return datetime.fromtimestamp(float(timestamp)).strftime('%Y-%m-%d %H:%M:%S') if points else None
+
+    return {
+        'id': str(int(catalog['taxi'][i])),
+        'points': points,
+        'start': time_str(catalog['first_time'][i]),
+        'end': time_str(catalog['last_time'][i]),
+        'first_time': float(catalog['first_time'][i]) if points else None,
+        'last_time': float(catalog['last_time'][i]) if points else None,
+        'bounds': {name: float(catalog[name][i]) for name in ('min_lon', 'min_lat', 'max_lon', 'max_lat')}
+        if points else None,
+        'bytes': int(catalog['bytes'][i]),
+    }
+
+
+def track_exists(taxi_id, track_dir):
+    """出租车是否有轨迹文件；有目录时查目录，否则探测文件"""
+    i = _row(load_catalog(), taxi_id)
+    if i is None:
+        return os.path.exists(os.path.join(track_dir, f'{taxi_id}.txt'))
+    return i >= 0
+
+
+def taxi_entry(taxi_id):
+    """出租车在目录中的元数据；没有目录或不在目录中时返回 None"""
+    catalog = load_catalog()
+    i = _row(catalog, taxi_id)
+    return _entry(catalog, i) if i is not None and i >= 0 else None
+
+
+def window_empty(taxi_id, start_time, end_time):
+    """目录表明该车在时间窗 [start_time, end_time]（时间戳，可为 None 表示不限）内没有点时返回 True"""
+    entry = taxi_entry(taxi_id)
+    if entry is None:
+        return False
+    if entry['points'] == 0:
+        return True
+    return ((start_time is not None and entry['last_time'] < start_time)
+            or (end_time is not None and entry['first_time'] > end_time))
+
+
+def list_taxis(min_points=None, start_time=None, end_time=None, bbox=None, sort='id', descending=False,
+               offset=0, limit=100):
+    """按条件筛选出租车，返回 (符合条件的总数, 当前页的元数据列表)；没有目录时返回 None
+
+    start_time、end_time 为时间戳，保留轨迹时间范围与之相交的出租车；
+    bbox 为 (min_lon, min_lat, max_lon, max_lat)，保留点的经纬度范围与之相交的出租车。
+    """
+    catalog = load_catalog()
+    if catalog is None:
+        return None
+    import numpy as np
+    points = np.asarray(catalog['points'])
+    mask = points > 0 if (start_time is not None or end_time is not None or bbox is not None) \
+        else np.ones(len(points), dtype=bool)
+    if min_points is not None:
+        mask &= points >= min_points
+    if start_time is not None:
+        mask &= np.asarray(catalog['last_time']) >= start_time
+    if end_time is not None:
+        mask &= np.asarray(catalog['first_time']) <= end_time
+    if bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        mask &= ((np.asarray(catalog['max_lon']) >= min_lon) & (np.asarray(catalog['min_lon']) <= max_lon)
+                 & (np.asarray(catalog['max_lat']) >= min_lat) & (np.asarray(catalog['min_lat']) <= max_lat))
+    rows = np.flatnonzero(mask)
+    keys = np.asarray(catalog[SORT_KEYS[sort]])[rows]
+    # 按出租车ID打破并列，分页结果稳定
+    order = np.lexsort((np.asarray(catalog['taxi'])[rows], -keys if descending else keys))
+    page = rows[order][offset:offset + limit]
+    return len(rows), [_entry(catalog, int(i)) for i in page]
+
+
+def catalog_status():
+    try:
+        with open(META_FILE, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return {'exists': False}
+    return {
+        'exists': True,
+        'taxis': meta['taxis'],
+        'points': meta['points'],
+        'loaded': _catalog is not None,
+    }
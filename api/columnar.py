@@ -0,0 +1,213 @@
+"""
+列式时空点存储的查询后端
+
+R 树查询通过 Python 迭代器逐个返回命中的点，吞吐量受限于解释器。
+DataProcess/build_columnar.py 把全部点存为按 (时间桶, Z 序网格编码) 排序的 NumPy 列，
+查询时按时间范围确定时间桶，把查询矩形分解为少量 Z 序编码区间，在排序键上二分查找
+得到候选行的区间，再对候选行向量化精确过滤。
+
+提供与 api/shards.py 相同的 query_* 接口，由 api/spatial.py 按配置选择后端。
+列文件用 mmap 打开，meta.json 修改后（重建或增量导入）自动重新打开。
+"""
+import os
+import json
+import threading
+from api.resources import DATA_DIR
+
+COLUMN_DIR = os.path.join(DATA_DIR, 'taxi_columns')
+META_FILE = os.path.join(COLUMN_DIR, 'meta.json')
+REGION_BOXES = 16  # 多边形区域的查询框不超过该数量时逐个查询，否则查询外包矩形后逐点判断
+
+_lock = threading.Lock()
+_store = None
+_store_mtime = None
+
+
+def store_exists():
+    return os.path.exists(META_FILE)
+
+
+def store_files():
+    if not os.path.isdir(COLUMN_DIR):
+        return []
+    return [os.path.join(COLUMN_DIR, fname) for fname in sorted(os.listdir(COLUMN_DIR)) if fname.endswith('.npy')]
+
+
+def load_store():
+    """打开列存储，返回 {'meta', 列名: 数组}；文件修改后自动重新打开，不存在时返回 None"""
+    global _store, _store_mtime
+    try:
+        mtime = os.path.getmtime(META_FILE)
+    except OSError:
+        return None
+    if mtime != _store_mtime:
+        with _lock:
+            if mtime != _store_mtime:
+                import numpy as np  # 健康检查等轻量路径也会导入本模块，NumPy 在用到时才导入
+                with open(META_FILE, 'r', encoding='utf-8') as f:
+                    store = {'meta': json.load(f)}
+                for name in ('keys', 'lon', 'lat', 'time', 'taxi', 'bucket_ids', 'bucket_offsets'):
+                    store[name] = np.load(os.path.join(COLUMN_DIR, f'{name}.npy'), mmap_mode='r')
+                _store = store
+                _store_mtime = mtime
+    return _store
+
+
+def _candidate_rows(store, bbox):
+    """查询框命中的时间桶内、Z 序区间覆盖的候选行号"""
+    import numpy as np
+    from utils.zorder import grid_cells, zorder_ranges
+    meta = store['meta']
+    min_lon, min_lat, min_time, max_lon, max_lat, max_time = bbox
+    if min_lon > max_lon or min_lat > max_lat or min_time > max_time:
+        return np.empty(0, dtype=np.int64)
+
+    first = np.floor((min_time - meta['origin']) / meta['bucket_seconds'])
+    last = np.floor((max_time - meta['origin']) / meta['bucket_seconds'])
+    bucket_ids = store['bucket_ids']
+    lo = int(np.searchsorted(bucket_ids, first, side='left'))
+    hi = int(np.searchsorted(bucket_ids, last, side='right'))
+    if lo >= hi:
+        return np.empty(0, dtype=np.int64)
+
+    cx, cy = grid_cells([min_lon, max_lon], [min_lat, max_lat], meta['extent'])
+    z_lo, z_hi = zorder_ranges(cx[0], cy[0], cx[1], cy[1])
+    buckets = np.asarray(bucket_ids[lo:hi], dtype=np.int64)[:, None] << 32
+    # 时间桶的起止行作为二分查找的范围（块范围索引），避免在整个键列上查找
+    offsets = store['bucket_offsets']
+    keys = store['keys']
+    row_lo, row_hi = int(offsets[lo]), int(offsets[hi])
+    window = keys[row_lo:row_hi]
+    starts = np.searchsorted(window, (buckets | z_lo).ravel(), side='left') + row_lo
+    ends = np.searchsorted(window, (buckets | z_hi).ravel(), side='right') + row_lo
+    lengths = ends - starts
+    keep = lengths > 0
+    starts, lengths = starts[keep], lengths[keep]
+    if len(starts) == 0:
+        return np.empty(0, dtype=np.int64)
+    # 把各区间展开为行号
+    total = int(lengths.sum())
+    return np.arange(total, dtype=np.int64) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+
+
+def _filter(store, bbox):
+    """查询框内的行号，以及这些行的经度、纬度、时间列"""
+    rows = _candidate_rows(store, bbox)
+    lons, lats, times = store['lon'][rows], store['lat'][rows], store['time'][rows]
+    min_lon, min_lat, min_time, max_lon, max_lat, max_time = bbox
+    # 与 R 树相同，边界上的点算在查询框内
+    mask = ((lons >= min_lon) & (lons <= max_lon) & (lats >= min_lat) & (lats <= max_lat)
+            & (times >= min_time) & (times <= max_time))
+    return rows[mask], {'lon': lons[mask], 'lat': lats[mask], 'time': times[mask]}
+
+
+def _select(bbox, columns):
+    """返回查询框内各点的指定列"""
+    import numpy as np
+    store = load_store()
+    rows, selected = _filter(store, bbox)
+    return [np.asarray(selected[name] if name in selected else store[name][rows]) for name in columns]
+
+
+def query_objects(bbox, progress=None):
+    """查询框内的全部 (出租车ID, 时间戳)"""
+    taxis, times = _select(bbox, ('taxi', 'time'))
+    result = list(zip(taxis.tolist(), times.tolist()))
+    if progress is not None:
+        progress(result)
+    return result
+
+
+def query_points(bbox, progress=None):
+    """查询框内的全部点，(n, 3) 数组，每行为 (经度, 纬度, 时间戳)"""
+    import numpy as np
+    points = np.column_stack(_select(bbox, ('lon', 'lat', 'time')))
+    if progress is not None:
+        progress(points)
+    return points
+
+
+def query_records(bboxes, progress=None):
+    """若干查询框并集内的全部点，(n, 4) 数组，每行为 (出租车ID, 经度, 纬度, 时间戳)；每个点只返回一次"""
+    import numpy as np
+    store = load_store()
+    rows = np.unique(np.concatenate([_filter(store, bbox)[0] for bbox in bboxes] or [np.empty(0, dtype=np.int64)]))
+    records = np.column_stack([store[name][rows] for name in ('taxi', 'lon', 'lat', 'time')]).astype(np.float64)
+    if progress is not None:
+        progress(records)
+    return records
+
+
+def _select_region(region, start_time, end_time, columns):
+    """多边形区域（api/regions.py 的 Region）在时间窗内各点的指定列
+
+    查询框不多时（L 形、回字形等）逐个查询内部与边界查询框，只对边界查询框中的点做点在多边形内判断；
+    否则每个查询框的二分查找开销超过逐点判断，改为查询外包矩形后整体判断。
+    """
+    import numpy as np
+    store = load_store()
+    inner, edge = region.split_cells()
+    if len(inner) + len(edge) > REGION_BOXES:
+        rows, selected = _filter(store, region.box(start_time, end_time))
+        rows = rows[region.contains(selected['lon'], selected['lat'])]
+    else:
+        parts = [_filter(store, (*rect[:2], start_time, *rect[2:], end_time))[0] for rect in inner]
+        for rect in edge:
+            edge_rows, selected = _filter(store, (*rect[:2], start_time, *rect[2:], end_time))
+            parts.append(edge_rows[region.contains(selected['lon'], selected['lat'])])
+        rows = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+    return [store[name][rows] for name in columns]
+
+
+def query_region_objects(region, start_time, end_time, progress=None):
+    """多边形区域在时间窗内的全部 (出租车ID, 时间戳)"""
+    taxis, times = _select_region(region, start_time, end_time, ('taxi', 'time'))
+    result = list(zip(taxis.tolist(), times.tolist()))
+    if progress is not None:
+        progress(result)
+    return result
+
+
+def query_region_taxis(region, start_time, end_time):
+    """多边形区域在时间窗内的独立出租车ID集合与总点数"""
+    import numpy as np
+    taxis, = _select_region(region, start_time, end_time, ('taxi',))
+    return set(np.unique(taxis).tolist()), len(taxis)
+
+
+def query_taxis(bbox):
+    """查询框内的独立出租车ID集合与总点数"""
+    import numpy as np
+    taxis, = _select(bbox, ('taxi',))
+    return set(np.unique(taxis).tolist()), len(taxis)
+
+
+def query_count(bbox):
+    return len(_select(bbox, ('time',))[0])
+
+
+def index_bounds():
+    return tuple(load_store()['meta']['bounds'])
+
+
+def data_version():
+    """数据版本：meta.json 的修改时间，重建或增量导入后改变"""
+    try:
+        return os.path.getmtime(META_FILE)
+    except OSError:
+        return None
+
+
+def columnar_status():
+    """列存储概况；只读取 meta.json，不打开列文件"""
+    try:
+        with open(META_FILE, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return {'exists': False}
+    return {
+        'exists': True,
+        'points': meta['points'],
+        'bucket_minutes': meta['bucket_seconds'] / 60,
+        'loaded': _store is not None,
+    }
@@ -0,0 +1,343 @@
+"""
+F4 密度热力图的瓦片金字塔
+
+原先 /analyze 不管地图缩放级别，总是返回整个北京范围的固定网格：缩小时数据量很大，放大后网格又太粗。
+这里按 Web 墨卡托的 XYZ 瓦片（与地图底图相同的编号方式）返回密度：每个瓦片分成 TILE_CELLS × TILE_CELLS
+个格子，格子大小随缩放级别变化，在屏幕上始终是同样大小。
+
+时间窗内的点先在最细一级（MAX_ZOOM）的墨卡托格子上计数，各时间桶的结果由 api/bucket_cache.py 缓存与合成；
+较粗的级别由下一级每 2×2 个格子相加得到，构成金字塔。最近用到的时间窗的金字塔保存在进程内，
+各级在第一次请求时计算。
+
+渲染好的瓦片写入 Data/density_tiles/<时间窗与数据版本的哈希>/<z>/<x>_<y>.json，各工作进程共享、重启后仍有效。
+只有经常使用的时间窗才写入磁盘：通过 /api/density/tiles/prerender 预先渲染的时间窗，或在进程内被请求了
+AUTO_RENDER_REQUESTS 个瓦片的时间窗（后者由后台线程把各级的非空瓦片全部写入磁盘）。渲染时在 levels.json
+中记下已完整渲染的级别，此后平移地图时非空瓦片直接读文件，空瓦片由 levels.json 判断，都不需要再查询索引；
+偶尔查询的时间窗只使用进程内的金字塔。
+
+磁盘缓存的总大小不超过 TAXIFLOW_TILE_CACHE_MB（默认512），超出时按最近使用时间淘汰整个时间窗的目录，
+超过 TILE_MAX_AGE 未使用的目录也会删除。数据重建或增量导入后数据版本改变，旧目录不再使用，随之被淘汰。
+"""
+import os
+import json
+import math
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from api.resources import DATA_DIR
+from api.spatial import data_version, query_points
+from api.bucket_cache import compose
+
+TILE_DIR = os.path.join(DATA_DIR, 'density_tiles')
+TILE_BITS = 6
+TILE_CELLS = 1 << TILE_BITS  # 每个瓦片每边的格子数
+MAX_ZOOM = 14                # 金字塔最细的一级，格子边长约 20~30 米
+MAX_PYRAMIDS = 8             # 进程内保留的时间窗金字塔数
+COORD_BITS = 32              # 格子编号: 纵向号 << COORD_BITS | 横向号
+AUTO_RENDER_REQUESTS = 32    # 时间窗在进程内被请求这么多个瓦片后，才在后台整体渲染到磁盘
+TILE_CACHE_BYTES = int(float(os.environ.get('TAXIFLOW_TILE_CACHE_MB', 512)) * 1024 * 1024)
+TILE_MAX_AGE = 7 * 24 * 60 * 60  # 超过该时间（秒）未使用的时间窗目录予以删除
+RENDER_GRACE = 5 * 60            # 最近该时间（秒）内修改过的目录可能正由其他进程渲染，不淘汰
+
+_lock = threading.Lock()
+_build_locks = {}          # 时间窗目录名 -> 构建该时间窗金字塔的锁，不同时间窗可以并行构建
+_pyramids = OrderedDict()  # 时间窗目录名 -> TilePyramid，按最近使用排序
+_requests = OrderedDict()  # 时间窗目录名 -> 进程内请求的瓦片数，按最近使用排序
+_render_executor = None
+_render_queued = set()
+
+
+def mercator_pixels(lons, lats, zoom):
+    """经纬度 -> 第 zoom 级墨卡托格子的横向、纵向编号（纵向自北向南）"""
+    import numpy as np
+    scale = float(1 << (zoom + TILE_BITS))
+    lats = np.radians(np.clip(lats, -85.05112878, 85.05112878))
+    x = (np.asarray(lons, dtype=np.float64) + 180.0) / 360.0 * scale
+    y = (1.0 - np.log(np.tan(lats) + 1.0 / np.cos(lats)) / math.pi) / 2.0 * scale
+    return np.floor(x).astype(np.int64), np.floor(y).astype(np.int64)
+
+
+def tile_lon(x, zoom):
+    return x / (1 << zoom) * 360.0 - 180.0
+
+
+def tile_lat(y, zoom):
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / (1 << zoom)))))
+
+
+def tile_bounds(z, x, y):
+    """瓦片的经纬度范围 {'sw', 'ne'}"""
+    return {'sw': [tile_lon(x, z), tile_lat(y + 1, z)], 'ne': [tile_lon(x + 1, z), tile_lat(y, z)]}
+
+
+def _tile_data(z, x, y, rows, cols, counts, max_density):
+    """瓦片的返回数据；cells 为非空格子的 [行, 列, 点数]，第 0 行在最北边"""
+    return {
+        'z': z,
+        'x': x,
+        'y': y,
+        'bounds': tile_bounds(z, x, y),
+        'size': TILE_CELLS,
+        # 格子的纬度边界自北向南（墨卡托投影下不等距），经度方向等距
+        'lat_edges': [tile_lat(y + i / TILE_CELLS, z) for i in range(TILE_CELLS + 1)],
+        'cells': [[row, col, count] for row, col, count in zip(rows, cols, counts)],
+        'total_points': int(sum(counts)),
+        'max_density': int(max_density),
+    }
+
+
+class TilePyramid:
+    """一个时间窗的密度金字塔；levels[z] 为按瓦片排序的 (瓦片编号, 行, 列, 点数)"""
+
+    def __init__(self, cells, counts):
+        self.base = (cells, counts)
+        self.total_points = int(counts.sum())
+        self.levels = {}
+        self._lock = threading.Lock()
+
+    def level(self, z):
+        import numpy as np
+        with self._lock:
+            if z in self.levels:
+                return self.levels[z]
+            cells, counts = self.base
+            shift = MAX_ZOOM - z
+            px = (cells & ((1 << COORD_BITS) - 1)) >> shift
+            py = (cells >> COORD_BITS) >> shift
+            level_cells, inverse = np.unique((py << COORD_BITS) | px, return_inverse=True)
+            level_counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(level_cells)).astype(np.int64)
+            px = level_cells & ((1 << COORD_BITS) - 1)
+            py = level_cells >> COORD_BITS
+            tiles = ((py >> TILE_BITS) << COORD_BITS) | (px >> TILE_BITS)
+            order = np.argsort(tiles, kind='stable')
+            level = (tiles[order], (py[order] & (TILE_CELLS - 1)), (px[order] & (TILE_CELLS - 1)),
+                     level_counts[order], int(level_counts.max(initial=0)))
+            self.levels[z] = level
+            return level
+
+    def tile(self, z, x, y):
+        import numpy as np
+        tiles, rows, cols, counts, max_density = self.level(z)
+        key = (y << COORD_BITS) | x
+        lo, hi = np.searchsorted(tiles, key, side='left'), np.searchsorted(tiles, key, side='right')
+        return _tile_data(z, x, y, rows[lo:hi].tolist(), cols[lo:hi].tolist(), counts[lo:hi].tolist(), max_density)
+
+    def tiles(self, z):
+        """第 z 级的非空瓦片 [(x, y), ...]"""
+        import numpy as np
+        keys = np.unique(self.level(z)[0])
+        return list(zip((keys & ((1 << COORD_BITS) - 1)).tolist(), (keys >> COORD_BITS).tolist()))
+
+
+def window_key(start_time, end_time):
+    """时间窗与数据版本 -> 磁盘缓存目录名"""
+    key = json.dumps({'start': start_time, 'end': end_time, 'version': list(data_version()),
+                      'cells': TILE_CELLS, 'max_zoom': MAX_ZOOM}, sort_keys=True)
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def _tile_path(window, z, x, y):
+    return os.path.join(TILE_DIR, window, str(z), f'{x}_{y}.json')
+
+
+def _write_json(path, data):
+    # 先写临时文件再替换，其他进程不会读到写了一半的瓦片
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def rendered_levels(window):
+    """已完整渲染到磁盘的级别 {z: max_density}"""
+    levels = _read_json(os.path.join(TILE_DIR, window, 'levels.json')) or {}
+    return {int(z): max_density for z, max_density in levels.items()}
+
+
+def build_pyramid(bounds, start_time, end_time, progress=None):
+    """扫描（或由时间桶缓存合成）时间窗内的点，返回 (TilePyramid, 缓存统计)"""
+    import numpy as np
+    min_lon, max_lon = bounds['min_lon'], bounds['max_lon']
+    min_lat, max_lat = bounds['min_lat'], bounds['max_lat']
+
+    def scan(piece_start, piece_end):
+        points = query_points((min_lon, min_lat, piece_start, max_lon, max_lat, piece_end), progress)
+        px, py = mercator_pixels(points[:, 0], points[:, 1], MAX_ZOOM)
+        cells, counts = np.unique((py << COORD_BITS) | px, return_counts=True)
+        return (cells, counts), len(points)
+
+    parts, stats = compose(('tiles', MAX_ZOOM, tuple(sorted(bounds.items()))), start_time, end_time, scan)
+    cells = np.concatenate([partial[0] for _, partial in parts]) if parts else np.zeros(0, dtype=np.int64)
+    counts = np.concatenate([partial[1] for _, partial in parts]) if parts else np.zeros(0, dtype=np.int64)
+    cells, inverse = np.unique(cells, return_inverse=True)
+    counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(cells)).astype(np.int64)
+    return TilePyramid(cells, counts), stats
+
+
+def get_pyramid(window, bounds, start_time, end_time, progress=None):
+    """取进程内的金字塔，没有时构建；返回 (TilePyramid, 缓存统计或 None)"""
+    with _lock:
+        pyramid = _pyramids.get(window)
+        if pyramid is not None:
+            _pyramids.move_to_end(window)
+            return pyramid, None
+        build_lock = _build_locks.setdefault(window, threading.Lock())
+    # 同一时间窗的并发请求只构建一次
+    with build_lock:
+        with _lock:
+            pyramid = _pyramids.get(window)
+        if pyramid is not None:
+            return pyramid, None
+        try:
+            pyramid, stats = build_pyramid(bounds, start_time, end_time, progress)
+            with _lock:
+                _pyramids[window] = pyramid
+                while len(_pyramids) > MAX_PYRAMIDS:
+                    _pyramids.popitem(last=False)
+        finally:
+            with _lock:
+                _build_locks.pop(window, None)
+    return pyramid, stats
+
+
+def clear_pyramids():
+    """清空进程内的金字塔（基准测试在每次计时前调用）"""
+    with _lock:
+        _pyramids.clear()
+        _requests.clear()
+
+
+def _note_request(window):
+    """记一次对该时间窗的瓦片请求，返回是否已达到自动渲染的次数"""
+    with _lock:
+        count = _requests.pop(window, 0) + 1
+        _requests[window] = count
+        while len(_requests) > 64 * MAX_PYRAMIDS:
+            _requests.popitem(last=False)
+    return count >= AUTO_RENDER_REQUESTS
+
+
+def _touch(window):
+    # 目录的修改时间即最近使用时间，淘汰时按它排序
+    try:
+        os.utime(os.path.join(TILE_DIR, window))
+    except OSError:
+        pass
+
+
+def prune_tiles(max_bytes=None, max_age=TILE_MAX_AGE):
+    """淘汰磁盘缓存：删除超过 max_age 未使用的时间窗目录，总大小超过 max_bytes 时再按最近使用时间删除，
+    返回删除的目录数"""
+    if max_bytes is None:
+        max_bytes = TILE_CACHE_BYTES
+    if not os.path.isdir(TILE_DIR):
+        return 0
+    now = time.time()
+    windows = []
+    for name in os.listdir(TILE_DIR):
+        path = os.path.join(TILE_DIR, name)
+        try:
+            mtime = os.path.getmtime(path)
+            size = sum(os.path.getsize(os.path.join(root, fname))
+                       for root, _, fnames in os.walk(path) for fname in fnames)
+        except OSError:
+            continue
+        windows.append((mtime, name, size))
+    total = sum(size for _, _, size in windows)
+    removed = 0
+    for mtime, name, size in sorted(windows):
+        if total <= max_bytes and now - mtime <= max_age:
+            continue
+        with _lock:
+            busy = name in _render_queued
+        if busy or now - mtime < RENDER_GRACE:
+            continue
+        shutil.rmtree(os.path.join(TILE_DIR, name), ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def render_window(window, pyramid, min_zoom=0, max_zoom=MAX_ZOOM):
+    """把时间窗各级的非空瓦片写入磁盘，返回写入的瓦片数"""
+    written = 0
+    levels = rendered_levels(window)
+    for z in range(min_zoom, max_zoom + 1):
+        if z in levels:
+            continue
+        for x, y in pyramid.tiles(z):
+            _write_json(_tile_path(window, z, x, y), pyramid.tile(z, x, y))
+            written += 1
+        levels[z] = pyramid.level(z)[4]
+        # 每完成一级更新一次，中途失败时已完成的级别仍可使用
+        _write_json(os.path.join(TILE_DIR, window, 'levels.json'), {str(z): m for z, m in sorted(levels.items())})
+    return written
+
+
+def _render_in_background(window, pyramid):
+    global _render_executor
+    with _lock:
+        if window in _render_queued:
+            return
+        _render_queued.add(window)
+        if _render_executor is None:
+            _render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tile-render')
+
+    def run():
+        try:
+            written = render_window(window, pyramid)
+            print(f"瓦片后台渲染完成: {window}，写入 {written} 个瓦片")
+            prune_tiles()
+        except Exception as e:
+            print(f"瓦片后台渲染失败: {window}: {e}")
+        finally:
+            with _lock:
+                _render_queued.discard(window)
+
+    _render_executor.submit(run)
+
+
+def get_tile(bounds, start_time, end_time, z, x, y, progress=None):
+    """返回 (瓦片数据, 来源, 时间桶缓存统计)
+
+    来源为 disk（磁盘缓存）、memory（进程内金字塔）或 scan（新构建金字塔，此时才有缓存统计，否则为 None）。
+    """
+    window = window_key(start_time, end_time)
+    data = _read_json(_tile_path(window, z, x, y))
+    if data is not None:
+        _touch(window)
+        return data, 'disk', None
+    levels = rendered_levels(window)
+    if z in levels:
+        # 该级已完整渲染，没有文件说明瓦片为空
+        _touch(window)
+        return _tile_data(z, x, y, [], [], [], levels[z]), 'disk', None
+    pyramid, stats = get_pyramid(window, bounds, start_time, end_time, progress)
+    data = pyramid.tile(z, x, y)
+    if _note_request(window):
+        # 经常使用的时间窗写入磁盘，供其他工作进程与重启后使用
+        _write_json(_tile_path(window, z, x, y), data)
+        _render_in_background(window, pyramid)
+    return data, 'memory' if stats is None else 'scan', stats
+
+
+def prerender(bounds, start_time, end_time, min_zoom=0, max_zoom=MAX_ZOOM, progress=None):
+    """预先渲染一个时间窗，返回 {'window', 'tiles', 'total_points'}"""
+    window = window_key(start_time, end_time)
+    pyramid, _ = get_pyramid(window, bounds, start_time, end_time, progress)
+    result = {'window': window, 'tiles': render_window(window, pyramid, min_zoom, max_zoom),
+              'total_points': pyramid.total_points}
+    prune_tiles()
+    return result
@@ -0,0 +1,304 @@
+"""
+长耗时分析的异步任务
+
+F4 时间序列、多日时间窗的 F5/F6、未命中缓存的 F8 等分析可能在同步请求中运行数十秒。
+POST 提交后立即返回任务 ID，分析在后台线程池中执行，前端轮询进度并获取结果。
+
+任务状态、结果与取消标记都保存在 Data/jobs 目录下的文件中：多进程服务器中
+提交与轮询可能落在不同的工作进程上，文件是各进程都能看到的共享状态。
+任务状态中记录执行它的进程号，该进程退出（被重启或崩溃）后，未结束的任务在读取或清理时标记为失败。
+"""
+from flask import Blueprint, request, jsonify, current_app
+import os
+import sys
+import re
+import json
+import time
+import uuid
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from api.resources import DATA_DIR
+
+jobs_bp = Blueprint('jobs', __name__)
+
+JOB_DIR = os.path.join(DATA_DIR, 'jobs')
+
+MAX_WORKERS = 2              # 每个进程同时执行的任务数
+MAX_RETAINED_JOBS = 50       # 最多保留的已结束任务数
+JOB_RETENTION = 30 * 60      # 已结束任务的保留时间（秒），也是未结束任务的最长存活时间
+PROGRESS_INTERVAL = 10000    # 分析循环中每处理多少个点上报一次进度
+PROGRESS_WRITE_INTERVAL = 0.5  # 进度写盘的最小间隔（秒）
+
+# 任务类型 -> (模块, 视图函数, 原接口路径)
+JOB_TYPES = {
+    'density': ('api.F4_density_analysis', 'analyze_density', '/api/density/analyze'),
+    'density_time_series': ('api.F4_density_analysis', 'analyze_density_time_series', '/api/density/analyze/time-series'),
+    'density_tiles': ('api.F4_density_analysis', 'prerender_density_tiles', '/api/density/tiles/prerender'),
+    'area_relation': ('api.F5_area_relation', 'analyze_area_relation', '/api/area_relation/analyze'),
+    'area_relation2': ('api.F6_area_relation2', 'analyze_area_relation2', '/api/area_relation2/analyze'),
+    'frequent_paths_ab': ('api.F8_frequent_paths_ab', 'analyze_frequent_paths_ab', '/api/frequent_paths_ab/analyze_ab'),
+    'travel_time': ('api.F9_travel_time', 'analyze_travel_time', '/api/travel_time/analyze'),
+}
+
+FINISHED_STATES = ('succeeded', 'failed', 'cancelled')
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_current = threading.local()
+
+
+class JobCancelled(BaseException):
+    """任务被取消
+
+    继承 BaseException，使其穿过各接口中的 except Exception，
+    同时接口里的 finally（归还索引句柄等）仍会执行。
+    """
+
+
+def report_progress(phase=None, points=None):
+    """在分析代码中上报进度；不在任务中运行时直接返回"""
+    job = getattr(_current, 'job', None)
+    if job is not None:
+        job.progress(phase, points)
+
+
+def _job_path(job_id, suffix='json'):
+    # job_id 来自 URL，只接受 uuid4().hex 格式，防止路径穿越
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return os.path.join(JOB_DIR, 'invalid')
+    return os.path.join(JOB_DIR, f'{job_id}.{suffix}')
+
+
+def _write_json(path, data):
+    # 先写临时文件再替换，轮询方不会读到写了一半的文件
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _owner_alive(pid):
+    """执行任务的进程是否仍在运行"""
+    if pid == os.getpid():
+        return True
+    if pid is None or sys.platform == 'win32':
+        # Windows 上的 os.kill 会结束进程；那里的生产服务器（waitress）是单进程，其他进程号都来自已退出的服务器
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _expire_orphan(state, now=None):
+    """执行进程已退出或超过 JOB_RETENTION 仍未结束的任务标记为失败，返回（可能更新后的）状态"""
+    if state is None or state.get('status') in FINISHED_STATES:
+        return state
+    now = now or time.time()
+    if not _owner_alive(state.get('pid')):
+        error = '执行任务的工作进程已退出'
+    elif now - state['created_at'] > JOB_RETENTION:
+        error = f'任务超过 {JOB_RETENTION} 秒仍未结束'
+        # 进程仍在运行时通知它停止，避免之后再覆盖失败状态
+        with open(_job_path(state['id'], 'cancel'), 'w'):
+            pass
+    else:
+        return state
+    state.update(status='failed', error=error, phase='结束', finished_at=now)
+    _write_json(_job_path(state['id']), state)
+    return state
+
+
+def _read_state(job_id):
+    return _expire_orphan(_read_json(_job_path(job_id)))
+
+
+class _RunningJob:
+    def __init__(self, state):
+        self.state = state
+        self._last_write = 0.0
+
+    def save(self):
+        _write_json(_job_path(self.state['id']), self.state)
+        self._last_write = time.time()
+
+    def progress(self, phase, points):
+        if phase is not None:
+            self.state['phase'] = phase
+        if points is not None:
+            self.state['points_scanned'] = points
+        now = time.time()
+        if phase is not None or now - self._last_write >= PROGRESS_WRITE_INTERVAL:
+            if os.path.exists(_job_path(self.state['id'], 'cancel')):
+                raise JobCancelled()
+            self.save()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='analysis-job')
+                _executor_pid = pid
+    return _executor
+
+
+def _run_job(app, state, params):
+    job = _RunningJob(state)
+    if os.path.exists(_job_path(state['id'], 'cancel')):
+        on_disk = _read_json(_job_path(state['id'])) or {}
+        if on_disk.get('status') != 'failed':
+            state.update(status='cancelled', finished_at=time.time())
+            job.save()
+        return
+
+    module_name, view_name, path = JOB_TYPES[state['type']]
+    state.update(status='running', phase='启动', started_at=time.time())
+    job.save()
+
+    _current.job = job
+    try:
+        view = getattr(importlib.import_module(module_name), view_name)
+        with app.test_request_context(path, method='POST', json=params):
+            response = app.make_response(view())
+        _write_json(_job_path(state['id'], 'result.json'), response.get_json())
+        state.update(status='succeeded' if response.status_code < 400 else 'failed',
+                     status_code=response.status_code)
+    except JobCancelled:
+        # 超时的任务已被其他进程标记为失败，保留失败状态与原因
+        on_disk = _read_json(_job_path(state['id'])) or {}
+        if on_disk.get('status') == 'failed':
+            state.update(status='failed', error=on_disk.get('error'))
+        else:
+            state['status'] = 'cancelled'
+    except Exception as e:
+        state.update(status='failed', error=str(e))
+    finally:
+        _current.job = None
+        state.update(phase='结束', finished_at=time.time())
+        job.save()
+
+
+def _prune_jobs():
+    """清理过期任务，并只保留最近的 MAX_RETAINED_JOBS 个已结束任务；执行进程已退出的任务先标记为失败"""
+    now = time.time()
+    finished = []
+    for fname in os.listdir(JOB_DIR):
+        if not fname.endswith('.json') or fname.endswith('.result.json'):
+            continue
+        state = _expire_orphan(_read_json(os.path.join(JOB_DIR, fname)), now)
+        if state and state.get('status') in FINISHED_STATES:
+            finished.append((state.get('finished_at') or 0, state['id']))
+    finished.sort(reverse=True)
+    for rank, (finished_at, job_id) in enumerate(finished):
+        if rank >= MAX_RETAINED_JOBS or now - finished_at > JOB_RETENTION:
+            for suffix in ('json', 'result.json', 'cancel'):
+                try:
+                    os.remove(_job_path(job_id, suffix))
+                except OSError:
+                    pass
+
+
+@jobs_bp.route('', methods=['POST'])
+def submit_job():
+    """
+    提交异步分析任务
+
+    请求体JSON格式:
+    {
+        "type": "density | density_time_series | area_relation | area_relation2 | frequent_paths_ab | travel_time",
+        "params": 与对应同步接口相同的请求体
+    }
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': '请求体必须是JSON格式'}), 400
+    job_type = data.get('type')
+    if job_type not in JOB_TYPES:
+        return jsonify({'error': f'不支持的任务类型: {job_type}'}), 400
+    params = data.get('params') or {}
+
+    os.makedirs(JOB_DIR, exist_ok=True)
+    _prune_jobs()
+
+    state = {
+        'id': uuid.uuid4().hex,
+        'type': job_type,
+        'status': 'queued',
+        'phase': '排队中',
+        'points_scanned': 0,
+        'created_at': time.time(),
+        'pid': os.getpid(),
+        'started_at': None,
+        'finished_at': None,
+    }
+    _write_json(_job_path(state['id']), state)
+    _get_executor().submit(_run_job, current_app._get_current_object(), state, params)
+    return jsonify({'job_id': state['id'], 'status': state['status']}), 202
+
+
+@jobs_bp.route('', methods=['GET'])
+def list_jobs():
+    """列出保留中的任务"""
+    if not os.path.isdir(JOB_DIR):
+        return jsonify({'jobs': []})
+    jobs = []
+    for fname in os.listdir(JOB_DIR):
+        if fname.endswith('.json') and not fname.endswith('.result.json'):
+            state = _expire_orphan(_read_json(os.path.join(JOB_DIR, fname)))
+            if state:
+                jobs.append(state)
+    jobs.sort(key=lambda s: s['created_at'], reverse=True)
+    return jsonify({'jobs': jobs})
+
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询任务状态与进度"""
+    state = _read_state(job_id)
+    if state is None:
+        return jsonify({'error': f'任务不存在: {job_id}'}), 404
+    return jsonify(state)
+
+
+@jobs_bp.route('/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """获取任务结果，任务未结束时返回202"""
+    state = _read_state(job_id)
+    if state is None:
+        return jsonify({'error': f'任务不存在: {job_id}'}), 404
+    if state['status'] not in FINISHED_STATES:
+        return jsonify(state), 202
+    if state['status'] == 'cancelled':
+        return jsonify({'error': '任务已取消'}), 410
+    result = _read_json(_job_path(job_id, 'result.json'))
+    if result is None:
+        return jsonify({'error': state.get('error', '任务结果不存在')}), 500
+    return jsonify(result), state.get('status_code', 200)
+
+
+@jobs_bp.route('/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """取消任务：排队中的任务不再执行，运行中的任务在下次上报进度时停止"""
+    state = _read_state(job_id)
+    if state is None:
+        return jsonify({'error': f'任务不存在: {job_id}'}), 404
+    if state['status'] not in FINISHED_STATES:
+        with open(_job_path(job_id, 'cancel'), 'w'):
+            pass
+    return jsonify({'job_id': job_id, 'status': 'cancelling' if state['status'] not in FINISHED_STATES else state['status']})
@@ -0,0 +1,105 @@
+"""
+蓝图的延迟加载
+
+各功能模块导入时会连带导入 NumPy、rtree 等较重的依赖。启动时只解析模块源码中的
+@<蓝图>.route 装饰器，为每个路由注册一个轻量的占位视图；第一次请求到达时才导入模块，
+之后直接调用真正的视图函数。端点名与直接注册蓝图时相同（<蓝图名>.<函数名>）。
+"""
+import ast
+import sys
+import time
+import importlib
+import importlib.util
+import threading
+
+_lock = threading.Lock()
+# 模块名 -> 导入耗时（秒），尚未导入的模块为 None
+_modules = {}
+
+
+def _literal(node):
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return None
+
+
+def scan_routes(module_name):
+    """不导入模块，从源码中解析路由，返回 [(蓝图名, 规则, 请求方法, 函数名)]"""
+    path = importlib.util.find_spec(module_name).origin
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    blueprints = {}  # 变量名 -> 蓝图名
+    for node in tree.body:
+        if (isinstance(node, ast.Assign) and isinstance(node.value, ast.Call)
+                and getattr(node.value.func, 'id', None) == 'Blueprint'):
+            for target in node.targets:
+                blueprints[target.id] = _literal(node.value.args[0])
+
+    routes = []
+    for node in tree.body:
+        if not isinstance(node, ast.FunctionDef):
+            continue
+        for decorator in node.decorator_list:
+            if not (isinstance(decorator, ast.Call) and isinstance(decorator.func, ast.Attribute)
+                    and decorator.func.attr == 'route'
+                    and getattr(decorator.func.value, 'id', None) in blueprints):
+                continue
+            rule = _literal(decorator.args[0])
+            methods = ['GET']
+            for keyword in decorator.keywords:
+                if keyword.arg == 'methods':
+                    methods = _literal(keyword.value)
+            routes.append((blueprints[decorator.func.value.id], rule, methods, node.name))
+    return routes
+
+
+def load_module(module_name):
+    """导入模块并记录耗时；可在后台线程中调用以提前加载"""
+    if _modules.get(module_name) is None:
+        with _lock:
+            if _modules.get(module_name) is None:
+                start = time.perf_counter()
+                importlib.import_module(module_name)
+                _modules[module_name] = time.perf_counter() - start
+    return importlib.import_module(module_name)
+
+
+class LazyView:
+    """占位视图：第一次调用时导入模块，取出真正的视图函数"""
+
+    def __init__(self, module_name, func_name):
+        self.module_name = module_name
+        self.func_name = func_name
+        self.__name__ = func_name
+        self._view = None
+
+    def __call__(self, *args, **kwargs):
+        if self._view is None:
+            self._view = getattr(load_module(self.module_name), self.func_name)
+        return self._view(*args, **kwargs)
+
+
+def register_lazy_blueprint(app, module_name, url_prefix):
+    """按模块源码中的路由注册占位视图，不导入模块"""
+    _modules.setdefault(module_name, None)
+    for blueprint_name, rule, methods, func_name in scan_routes(module_name):
+        app.add_url_rule(url_prefix + rule, endpoint=f'{blueprint_name}.{func_name}',
+                         view_func=LazyView(module_name, func_name), methods=methods)
+
+
+def preload_modules():
+    """导入全部延迟加载的模块；多进程服务器在 fork 之前调用，工作进程共享已导入的代码"""
+    for module_name in list(_modules):
+        load_module(module_name)
+
+
+def module_status():
+    """各延迟加载模块的状态：已导入的给出导入耗时（毫秒）"""
+    # 异步任务等处也可能直接导入模块，是否已加载以 sys.modules 为准
+    return {
+        name: {'loaded': name in sys.modules,
+               'import_ms': round(seconds * 1000, 1) if seconds is not None else None}
+        for name, seconds in _modules.items()
+    }
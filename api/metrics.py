@@ -0,0 +1,340 @@
+"""
+请求计时与运行指标
+
+每个请求按阶段计时：parse（解析参数）、search（索引/数据库查询）、aggregate（统计汇总）、
+serialize（生成响应）。接口代码在阶段切换处调用 mark_phase，扫描的点数与缓存命中
+通过 record_points / record_cache 上报，F3、F4 的时间桶缓存（api/bucket_cache.py）命中的桶数与
+省去扫描的点数通过 record_buckets 上报；未调用 mark_phase 的耗时都计入 parse。
+
+请求结束时把各阶段耗时写入 Server-Timing 响应头，并累计到按接口划分的直方图中，
+GET /api/metrics 以 Prometheus 文本格式输出。多进程服务器中各进程定期把自己的
+累计值写到 Data/metrics/<pid>_<启动时间>.json，进程退出时再写一次最终值；/api/metrics 汇总
+同一主进程下各工作进程的快照（仍在运行的，或已正常退出并写过最终值的）。服务器启动时清空该目录，
+之前运行留下的快照不会计入。
+
+异步任务和流式接口的生成器不经过请求钩子，其中的 mark_phase 等调用直接忽略。
+"""
+from flask import Blueprint, Response, g, request, has_app_context
+import os
+import sys
+import json
+import time
+import atexit
+import shutil
+import threading
+from api.resources import DATA_DIR
+
+metrics_bp = Blueprint('metrics', __name__)
+
+METRICS_DIR = os.path.join(DATA_DIR, 'metrics')
+
+PHASES = ('parse', 'search', 'aggregate', 'serialize')
+# 直方图桶上界（秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SNAPSHOT_INTERVAL = 1.0          # 进程快照写盘的最小间隔（秒）
+STALE_SNAPSHOT = 24 * 60 * 60    # 超过该时间未更新的快照视为已退出的进程，予以删除
+
+_lock = threading.Lock()
+_last_snapshot = 0.0
+_pid = None
+_snapshot_file = None
+_snapshot_timer = None
+# 进程内累计值，键均为字符串以便直接写入 JSON
+_state = None
+
+
+def _empty_state():
+    return {
+        'requests': {},     # "接口|状态码" -> 次数
+        'histograms': {},   # "接口|阶段" -> [各桶计数..., +Inf计数, 总耗时]
+        'points': {},       # 接口 -> 扫描点数
+        'cache': {},        # "接口|hit/miss" -> 次数
+        'buckets': {},      # "接口|hit/miss" -> 时间桶数
+        'saved': {},        # 接口 -> 时间桶缓存省去扫描的点数
+    }
+
+
+def _local_state():
+    global _state, _pid, _snapshot_file
+    # fork 出的子进程从零开始累计，避免与父进程的快照重复计数
+    if _pid != os.getpid():
+        _state = _empty_state()
+        _pid = os.getpid()
+        # 文件名带上进程启动时间，pid 被复用时不会覆盖已退出进程的快照
+        _snapshot_file = f'{_pid}_{int(time.time() * 1000)}.json'
+    return _state
+
+
+class _RequestTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phase = 'parse'
+        self.phase_start = self.start
+        self.timings = {}
+        self.points = 0
+        self.cache = None
+        self.buckets = None  # [命中桶数, 未命中桶数, 省去扫描的点数]
+
+    def switch(self, phase):
+        now = time.perf_counter()
+        self.timings[self.phase] = self.timings.get(self.phase, 0.0) + now - self.phase_start
+        self.phase = phase
+        self.phase_start = now
+
+    def finish(self):
+        self.switch(None)
+        return time.perf_counter() - self.start
+
+
+def _timer():
+    return g.get('_request_timer') if has_app_context() else None
+
+
+def mark_phase(name):
+    """结束当前阶段，开始新阶段"""
+    timer = _timer()
+    if timer is not None:
+        timer.switch(name)
+
+
+def record_points(count):
+    """上报本次请求扫描的轨迹点（或路径）数"""
+    timer = _timer()
+    if timer is not None:
+        timer.points += count
+
+
+def record_cache(hit):
+    """上报本次请求的查询缓存是否命中"""
+    timer = _timer()
+    if timer is not None:
+        timer.cache = 'hit' if hit else 'miss'
+
+
+def record_buckets(hits, misses, saved_points):
+    """上报本次请求的时间桶缓存命中桶数、未命中桶数与省去扫描的点数"""
+    timer = _timer()
+    if timer is not None:
+        buckets = timer.buckets or [0, 0, 0]
+        timer.buckets = [buckets[0] + hits, buckets[1] + misses, buckets[2] + saved_points]
+
+
+def _observe(state, key, seconds):
+    hist = state['histograms'].setdefault(key, [0] * (len(BUCKETS) + 1) + [0.0])
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            hist[i] += 1
+    hist[len(BUCKETS)] += 1
+    hist[-1] += seconds
+
+
+def _before_request():
+    g._request_timer = _RequestTimer()
+
+
+def _after_request(response):
+    timer = g.pop('_request_timer', None)
+    if timer is None or request.endpoint in (None, 'metrics.get_metrics'):
+        return response
+    total = timer.finish()
+    endpoint = request.endpoint
+
+    entries = [f'{phase};dur={timer.timings[phase] * 1000:.1f}' for phase in PHASES if phase in timer.timings]
+    entries.append(f'total;dur={total * 1000:.1f}')
+    if timer.points:
+        entries.append(f'points;desc="{timer.points}"')
+    if timer.cache:
+        entries.append(f'cache;desc="{timer.cache}"')
+    if timer.buckets:
+        entries.append(f'buckets;desc="{timer.buckets[0]}/{timer.buckets[0] + timer.buckets[1]}"')
+    response.headers['Server-Timing'] = ', '.join(entries)
+    # 前端页面与接口不同源，需要允许跨域读取计时信息
+    response.headers['Timing-Allow-Origin'] = '*'
+
+    with _lock:
+        state = _local_state()
+        key = f'{endpoint}|{response.status_code}'
+        state['requests'][key] = state['requests'].get(key, 0) + 1
+        for phase, seconds in timer.timings.items():
+            _observe(state, f'{endpoint}|{phase}', seconds)
+        _observe(state, f'{endpoint}|total', total)
+        if timer.points:
+            state['points'][endpoint] = state['points'].get(endpoint, 0) + timer.points
+        if timer.cache:
+            key = f'{endpoint}|{timer.cache}'
+            state['cache'][key] = state['cache'].get(key, 0) + 1
+        if timer.buckets:
+            for result, count in zip(('hit', 'miss'), timer.buckets):
+                key = f'{endpoint}|{result}'
+                state['buckets'][key] = state['buckets'].get(key, 0) + count
+            state['saved'][endpoint] = state['saved'].get(endpoint, 0) + timer.buckets[2]
+        _maybe_snapshot(state)
+    return response
+
+
+def _write_snapshot(state, exited=False):
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, _snapshot_file)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(state, ppid=os.getppid(), exited=exited), f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def _delayed_snapshot():
+    global _last_snapshot, _snapshot_timer
+    with _lock:
+        _snapshot_timer = None
+        _last_snapshot = time.time()
+        _write_snapshot(_local_state())
+
+
+def _maybe_snapshot(state):
+    global _last_snapshot, _snapshot_timer
+    now = time.time()
+    if now - _last_snapshot < SNAPSHOT_INTERVAL:
+        # 间隔内的请求在间隔结束时补写一次，请求停下后快照也是最新的
+        if _snapshot_timer is None:
+            _snapshot_timer = threading.Timer(SNAPSHOT_INTERVAL - (now - _last_snapshot), _delayed_snapshot)
+            _snapshot_timer.daemon = True
+            _snapshot_timer.start()
+        return
+    _last_snapshot = now
+    _write_snapshot(state)
+
+
+def flush_snapshot():
+    """进程退出时写入最终快照（写盘有间隔限制，最后一秒内的请求否则会丢失）"""
+    with _lock:
+        if _pid == os.getpid() and any(_state['requests'].values()):
+            _write_snapshot(_state, exited=True)
+
+
+atexit.register(flush_snapshot)
+
+
+def reset_metrics():
+    """清空各进程的快照，服务器启动时调用一次"""
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+
+
+def _alive(pid):
+    if sys.platform == 'win32':
+        # Windows 上的 os.kill 会结束进程；那里的生产服务器（waitress）是单进程，不会有其他工作进程
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merged_state():
+    """汇总同一主进程下各工作进程的快照，当前进程使用内存中的最新值"""
+    with _lock:
+        own = json.loads(json.dumps(_local_state()))
+    merged = own
+    ppid = os.getppid()
+    if os.path.isdir(METRICS_DIR):
+        now = time.time()
+        for fname in os.listdir(METRICS_DIR):
+            if not fname.endswith('.json') or fname == _snapshot_file:
+                continue
+            path = os.path.join(METRICS_DIR, fname)
+            try:
+                pid = int(fname.split('_')[0])
+                if now - os.path.getmtime(path) > STALE_SNAPSHOT:
+                    os.remove(path)
+                    continue
+                with open(path, 'r', encoding='utf-8') as f:
+                    other = json.load(f)
+            except (OSError, ValueError):
+                continue
+            # 其他主进程（之前的运行）的快照，或异常退出、没有写最终值的工作进程的快照不计入
+            if other.get('ppid') != ppid or not (other.get('exited') or _alive(pid)):
+                if not _alive(pid):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                continue
+            for section in ('requests', 'points', 'cache', 'buckets', 'saved'):
+                for key, value in other.get(section, {}).items():
+                    merged[section][key] = merged[section].get(key, 0) + value
+            for key, hist in other.get('histograms', {}).items():
+                if key in merged['histograms']:
+                    merged['histograms'][key] = [a + b for a, b in zip(merged['histograms'][key], hist)]
+                else:
+                    merged['histograms'][key] = hist
+    return merged
+
+
+def _prometheus_text(state):
+    lines = [
+        '# HELP taxiflow_requests_total 请求总数',
+        '# TYPE taxiflow_requests_total counter',
+    ]
+    for key, value in sorted(state['requests'].items()):
+        endpoint, status = key.split('|')
+        lines.append(f'taxiflow_requests_total{{endpoint="{endpoint}",status="{status}"}} {value}')
+
+    lines += [
+        '# HELP taxiflow_request_phase_seconds 请求各阶段耗时',
+        '# TYPE taxiflow_request_phase_seconds histogram',
+    ]
+    for key, hist in sorted(state['histograms'].items()):
+        endpoint, phase = key.split('|')
+        labels = f'endpoint="{endpoint}",phase="{phase}"'
+        for bound, count in zip(BUCKETS, hist):
+            lines.append(f'taxiflow_request_phase_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'taxiflow_request_phase_seconds_bucket{{{labels},le="+Inf"}} {hist[len(BUCKETS)]}')
+        lines.append(f'taxiflow_request_phase_seconds_sum{{{labels}}} {hist[-1]:.6f}')
+        lines.append(f'taxiflow_request_phase_seconds_count{{{labels}}} {hist[len(BUCKETS)]}')
+
+    lines += [
+        '# HELP taxiflow_points_scanned_total 扫描的轨迹点（或路径）数',
+        '# TYPE taxiflow_points_scanned_total counter',
+    ]
+    for endpoint, value in sorted(state['points'].items()):
+        lines.append(f'taxiflow_points_scanned_total{{endpoint="{endpoint}"}} {value}')
+
+    lines += [
+        '# HELP taxiflow_query_cache_total 查询缓存命中情况',
+        '# TYPE taxiflow_query_cache_total counter',
+    ]
+    for key, value in sorted(state['cache'].items()):
+        endpoint, result = key.split('|')
+        lines.append(f'taxiflow_query_cache_total{{endpoint="{endpoint}",result="{result}"}} {value}')
+
+    lines += [
+        '# HELP taxiflow_bucket_cache_total 时间桶缓存命中的桶数',
+        '# TYPE taxiflow_bucket_cache_total counter',
+    ]
+    for key, value in sorted(state['buckets'].items()):
+        endpoint, result = key.split('|')
+        lines.append(f'taxiflow_bucket_cache_total{{endpoint="{endpoint}",result="{result}"}} {value}')
+
+    lines += [
+        '# HELP taxiflow_points_saved_total 时间桶缓存省去扫描的轨迹点数',
+        '# TYPE taxiflow_points_saved_total counter',
+    ]
+    for endpoint, value in sorted(state['saved'].items()):
+        lines.append(f'taxiflow_points_saved_total{{endpoint="{endpoint}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+@metrics_bp.route('', methods=['GET'])
+def get_metrics():
+    """以 Prometheus 文本格式输出累计指标"""
+    return Response(_prometheus_text(_merged_state()), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    """注册请求计时钩子"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
@@ -0,0 +1,136 @@
+"""
+按请求开启的性能剖析
+
+只有设置环境变量 TAXIFLOW_PROFILING=1 启动服务时才会生效：init_profiling 为所有视图函数
+套上剖析包装，并注册 /api/profiles 接口；未开启时不做任何包装，请求路径上没有额外开销。
+
+开启后，请求带上查询参数 profile 或请求头 X-Profile 即对该请求剖析：
+    profile=1          剖析结果保存到 Data/profiles，响应头 X-Profile-Id 给出文件名
+    profile=summary    不返回原响应，直接返回按累计耗时排序的剖析摘要
+    profile=cprofile   强制使用 cProfile（默认优先使用采样剖析器 pyinstrument，未安装时退回 cProfile）
+
+流式接口只剖析到返回生成器为止，异步任务不经过视图包装，不会被剖析。
+"""
+from flask import Blueprint, request, jsonify, send_from_directory, current_app
+import os
+import io
+import time
+import pstats
+import cProfile
+import functools
+from api.resources import DATA_DIR
+
+profiles_bp = Blueprint('profiles', __name__)
+
+PROFILE_DIR = os.path.join(DATA_DIR, 'profiles')
+MAX_PROFILES = 50      # 最多保留的剖析文件数
+SUMMARY_LINES = 40     # 摘要中列出的函数数
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:
+    SamplingProfiler = None
+
+
+def profiling_enabled():
+    return os.environ.get('TAXIFLOW_PROFILING') == '1'
+
+
+def _requested_mode():
+    return request.args.get('profile') or request.headers.get('X-Profile')
+
+
+def _run_cprofile(view, args, kwargs):
+    profiler = cProfile.Profile()
+    result = profiler.runcall(view, *args, **kwargs)
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(SUMMARY_LINES)
+    return result, stream.getvalue(), profiler.dump_stats, 'prof'
+
+
+def _run_sampling(view, args, kwargs):
+    profiler = SamplingProfiler()
+    profiler.start()
+    try:
+        result = view(*args, **kwargs)
+    finally:
+        profiler.stop()
+
+    def dump(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(profiler.output_html())
+    return result, profiler.output_text(unicode=True), dump, 'html'
+
+
+def _prune_profiles():
+    files = sorted((os.path.getmtime(os.path.join(PROFILE_DIR, fname)), fname)
+                   for fname in os.listdir(PROFILE_DIR))
+    for _, fname in files[:-MAX_PROFILES]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, fname))
+        except OSError:
+            pass
+
+
+def _profiled(endpoint, view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        mode = _requested_mode()
+        if not mode or mode == '0':
+            return view(*args, **kwargs)
+
+        start = time.perf_counter()
+        if mode == 'cprofile' or SamplingProfiler is None:
+            result, summary, dump, ext = _run_cprofile(view, args, kwargs)
+        else:
+            result, summary, dump, ext = _run_sampling(view, args, kwargs)
+        elapsed = time.perf_counter() - start
+
+        if mode == 'summary':
+            response = jsonify({'endpoint': endpoint, 'elapsed': elapsed, 'profile': summary})
+            response.headers['X-Profile-Status'] = str(_status_code(result))
+            return response
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{endpoint.replace('.', '_')}.{ext}"
+        dump(os.path.join(PROFILE_DIR, profile_id))
+        _prune_profiles()
+        print(f"已保存 {endpoint} 的剖析结果: {profile_id}（{elapsed:.3f} 秒）")
+
+        response = current_app.make_response(result)
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+    return wrapper
+
+
+def _status_code(result):
+    if isinstance(result, tuple) and len(result) > 1 and isinstance(result[1], int):
+        return result[1]
+    return getattr(result, 'status_code', 200)
+
+
+@profiles_bp.route('', methods=['GET'])
+def list_profiles():
+    """列出已保存的剖析文件"""
+    if not os.path.isdir(PROFILE_DIR):
+        return jsonify({'profiles': []})
+    profiles = [{'id': fname, 'size': os.path.getsize(os.path.join(PROFILE_DIR, fname))}
+                for fname in sorted(os.listdir(PROFILE_DIR), reverse=True)]
+    return jsonify({'profiles': profiles})
+
+
+@profiles_bp.route('/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """下载剖析文件：.prof 可用 snakeviz/pstats 打开，.html 可直接在浏览器中查看"""
+    return send_from_directory(PROFILE_DIR, profile_id, as_attachment=profile_id.endswith('.prof'))
+
+
+def init_profiling(app):
+    """在全部蓝图注册之后调用；未开启剖析时直接返回"""
+    if not profiling_enabled():
+        return
+    for endpoint, view in list(app.view_functions.items()):
+        if endpoint != 'static':
+            app.view_functions[endpoint] = _profiled(endpoint, view)
+    app.register_blueprint(profiles_bp, url_prefix='/api/profiles')
+    print(f"已开启按请求剖析（{'pyinstrument' if SamplingProfiler else 'cProfile'}），剖析文件目录: {PROFILE_DIR}")
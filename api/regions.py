@@ -0,0 +1,243 @@
+"""
+查询区域：矩形与多边形
+
+F3、F5、F6、F8、F9 的区域参数既可以是原来的矩形，也可以是 GeoJSON 的 Polygon / MultiPolygon 几何对象:
+    {"type": "Polygon", "coordinates": [[[lon, lat], ...], ...]}
+每个多边形的第一个环为外边界，其余环为洞；环可以不闭合。点是否在多边形内按奇偶规则判断，
+MultiPolygon 为各多边形的并集。多边形边界上的点不保证计入。
+
+多边形查询只按外包矩形选择一次分片，再把外包矩形划分为网格：完全落在多边形内的网格只取条目ID，
+只有被边穿过的网格才取出坐标做向量化的点在多边形内判断（R 树逐条取出坐标比只取ID慢一个数量级以上）。
+网格线包含各顶点的坐标，由水平、竖直的边围成的多边形（L 形、回字形）没有边界网格，与拼出它的几个矩形开销相当。
+边数组与网格划分按坐标缓存，重复查询同一区域时不再重新计算。
+"""
+from functools import lru_cache
+
+SPLIT_LEVELS = (8, 16, 32, 64, 128)  # 多边形外包矩形每边划分的网格数，可选的各级划分
+SPLIT_CELLS = SPLIT_LEVELS[-1]
+SPLIT_BUDGET = 1 << 20      # 划分网格时 网格数 × 边数 的上限（每批计算量与网格数上限）
+CONTAINS_CHUNK = 1 << 20    # 点在多边形内判断时，每批 点数 × 边数 的上限
+OUTSIDE, INNER, EDGE = 0, 1, 2
+RECT_KEYS = ('min_lon', 'min_lat', 'max_lon', 'max_lat')
+
+
+def row_boxes(mask):
+    """把网格掩码（行为 y、列为 x）分解为若干网格矩形 (x0, y0, x1, y1)，相邻行的相同区间合并"""
+    runs = []
+    for y, row in enumerate(mask):
+        x = 0
+        width = len(row)
+        while x < width:
+            if row[x]:
+                start = x
+                while x < width and row[x]:
+                    x += 1
+                runs.append((start, x - 1, y))
+            else:
+                x += 1
+    runs.sort()
+    boxes = []
+    for x0, x1, y in runs:
+        if boxes and boxes[-1][0] == x0 and boxes[-1][2] == x1 and boxes[-1][3] == y - 1:
+            boxes[-1][3] = y
+        else:
+            boxes.append([x0, y, x1, y])
+    return boxes
+
+
+@lru_cache(maxsize=256)
+def _polygon_edges(polygon):
+    """一个多边形（各环的坐标元组）的边数组 (x1, y1, x2, y2, 斜率)，所有环的边首尾拼接"""
+    import numpy as np
+    starts, ends = [], []
+    for ring in polygon:
+        coords = np.asarray(ring, dtype=np.float64)
+        starts.append(coords)
+        ends.append(np.roll(coords, -1, axis=0))
+    starts, ends = np.concatenate(starts), np.concatenate(ends)
+    x1, y1, x2, y2 = starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1]
+    dy = y2 - y1
+    # 水平边不会与水平射线相交，斜率取0避免除零
+    slope = np.divide(x2 - x1, dy, out=np.zeros_like(dy), where=dy != 0)
+    return x1, y1, x2, y2, slope
+
+
+def _polygons_contain(polygons, lons, lats):
+    """逐点按奇偶规则判断是否在任一多边形内"""
+    import numpy as np
+    inside = np.zeros(len(lons), dtype=bool)
+    for polygon in polygons:
+        x1, y1, _, y2, slope = _polygon_edges(polygon)
+        step = max(1, CONTAINS_CHUNK // len(x1))
+        for start in range(0, len(lons), step):
+            x = lons[start:start + step, None]
+            y = lats[start:start + step, None]
+            # 向右的水平射线与各边的交点数为奇数时点在多边形内
+            crossing = ((y1 > y) != (y2 > y)) & (x < x1 + (y - y1) * slope)
+            inside[start:start + step] |= np.count_nonzero(crossing, axis=1) % 2 == 1
+    return inside
+
+
+def _grid_lines(low, high, cells, vertices):
+    """外包矩形一个方向上的网格线：均匀划分，顶点不多时再加上各顶点的坐标，使沿网格线的边不穿过网格"""
+    import numpy as np
+    lines = np.linspace(low, high, cells + 1)
+    vertices = np.unique(vertices)
+    if len(vertices) <= cells:
+        lines = np.unique(np.concatenate([lines, vertices]))
+    return lines
+
+
+@lru_cache(maxsize=256)
+def _grid(bbox, polygons, max_cells=SPLIT_CELLS):
+    """把外包矩形每边划分为至多 max_cells 个网格并分类，返回 (经度网格线, 纬度网格线, 分类矩阵)
+
+    分类矩阵的行为纬度、列为经度：OUTSIDE 网格整体在区域外，INNER 整体在区域内，EDGE 内部有多边形的边穿过。
+    """
+    import numpy as np
+    edges = [_polygon_edges(polygon) for polygon in polygons]
+    x1, y1, x2, y2 = (np.concatenate([edge[i] for edge in edges]) for i in range(4))
+    # 网格数 × 边数 不超过 SPLIT_BUDGET，边多时网格相应变粗；各级网格数都是2的幂，粗网格线都在细网格线上
+    cells = max([level for level in SPLIT_LEVELS if level <= max_cells and level * level * len(x1) <= SPLIT_BUDGET],
+                default=SPLIT_LEVELS[0])
+    xs = _grid_lines(bbox[0], bbox[2], cells, x1)
+    ys = _grid_lines(bbox[1], bbox[3], cells, y1)
+    cx0, cy0 = (a.ravel() for a in np.meshgrid(xs[:-1], ys[:-1]))
+    cx1, cy1 = (a.ravel() for a in np.meshgrid(xs[1:], ys[1:]))
+
+    crossed = np.zeros(len(cx0), dtype=bool)
+    step = max(1, SPLIT_BUDGET // len(x1))
+    for start in range(0, len(cx0), step):
+        bx0, by0, bx1, by1 = (a[start:start + step, None] for a in (cx0, cy0, cx1, cy1))
+        # 边穿过网格内部 <=> 外包矩形与网格内部相交，且网格的四个角严格分布在边所在直线的两侧
+        overlap = ((np.minimum(x1, x2) < bx1) & (np.maximum(x1, x2) > bx0)
+                   & (np.minimum(y1, y2) < by1) & (np.maximum(y1, y2) > by0))
+        sides = [(x2 - x1) * (cy - y1) - (y2 - y1) * (cx - x1)
+                 for cx, cy in ((bx0, by0), (bx0, by1), (bx1, by0), (bx1, by1))]
+        positive = (sides[0] > 0) | (sides[1] > 0) | (sides[2] > 0) | (sides[3] > 0)
+        negative = (sides[0] < 0) | (sides[1] < 0) | (sides[2] < 0) | (sides[3] < 0)
+        crossed[start:start + step] = (overlap & positive & negative).any(axis=1)
+
+    # 没有边穿过的网格整体在区域内或区域外，按网格中心判断
+    centers = _polygons_contain(polygons, (cx0 + cx1) / 2, (cy0 + cy1) / 2)
+    classes = np.where(crossed, EDGE, np.where(centers, INNER, OUTSIDE)).astype(np.int8)
+    return xs, ys, classes.reshape(len(ys) - 1, len(xs) - 1)
+
+
+@lru_cache(maxsize=1024)
+def _split_cells(bbox, polygons, max_cells):
+    import numpy as np
+    xs, ys, classes = _grid(bbox, polygons, max_cells)
+    # 网格左闭右开（最后一行、一列闭合），与 contains 的网格归属一致：查询框的上界（外包矩形的上界除外）
+    # 向下收一个浮点数间隔，相邻的查询框互不重叠，每个点只被取出一次
+    highs_x = np.append(np.nextafter(xs[1:-1], -np.inf), xs[-1])
+    highs_y = np.append(np.nextafter(ys[1:-1], -np.inf), ys[-1])
+
+    def to_rects(mask):
+        return [(float(xs[x0]), float(ys[y0]), float(highs_x[x1]), float(highs_y[y1]))
+                for x0, y0, x1, y1 in row_boxes(mask)]
+    return to_rects(classes == INNER), to_rects(classes == EDGE)
+
+
+class Region:
+    """查询区域；polygons 为 None 时是矩形 bbox，否则为多边形元组（每个多边形是若干环的坐标元组）"""
+
+    def __init__(self, bbox, polygons=None):
+        self.bbox = tuple(bbox)
+        self.polygons = polygons
+
+    @property
+    def is_rect(self):
+        return self.polygons is None
+
+    def box(self, start_time, end_time):
+        """外包矩形与时间范围组成的三维查询框"""
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        return (min_lon, min_lat, start_time, max_lon, max_lat, end_time)
+
+    def contains(self, lons, lats):
+        """向量化判断各点是否在区域内，返回布尔数组；只有落在边界网格中的点才逐点判断
+
+        点按左闭右开归属网格，内部网格中的点（包括恰好在多边形边上的点）都在区域内。
+        """
+        import numpy as np
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        inside = (lons >= min_lon) & (lons <= max_lon) & (lats >= min_lat) & (lats <= max_lat)
+        if self.is_rect or not inside.any():
+            return inside
+        candidates = np.flatnonzero(inside)
+        xs, ys, classes = _grid(self.bbox, self.polygons)
+        gx = np.clip(np.searchsorted(xs, lons[candidates], side='right') - 1, 0, len(xs) - 2)
+        gy = np.clip(np.searchsorted(ys, lats[candidates], side='right') - 1, 0, len(ys) - 2)
+        cell_classes = classes[gy, gx]
+        hit = cell_classes == INNER
+        edge = np.flatnonzero(cell_classes == EDGE)
+        hit[edge] = _polygons_contain(self.polygons, lons[candidates[edge]], lats[candidates[edge]])
+        inside[candidates] = hit
+        return inside
+
+    def split_cells(self, max_cells=SPLIT_CELLS):
+        """把外包矩形分解为 (内部矩形列表, 边界矩形列表)，矩形为 (min_lon, min_lat, max_lon, max_lat)
+
+        内部矩形中的点都在区域内，只需取条目ID；边界矩形中有多边形的边穿过，其中的点需要逐点判断；
+        其余部分整体在区域外。网格越细，边界矩形的面积越小，但矩形个数越多。矩形区域整体是一个内部矩形。
+        """
+        if self.is_rect:
+            return [self.bbox], []
+        return _split_cells(self.bbox, self.polygons, max_cells)
+
+    def __eq__(self, other):
+        return isinstance(other, Region) and (self.bbox, self.polygons) == (other.bbox, other.polygons)
+
+    def __hash__(self):
+        return hash((self.bbox, self.polygons))
+
+
+def _parse_ring(ring):
+    points = [(float(lon), float(lat)) for lon, lat, *_ in ring]
+    if len(points) > 1 and points[0] == points[-1]:
+        points = points[:-1]
+    if len(set(points)) < 3:
+        raise ValueError('多边形的每个环至少需要3个不同的顶点')
+    return tuple(points)
+
+
+def parse_region(spec):
+    """解析请求中的区域参数：{min_lon, min_lat, max_lon, max_lat}、[min_lon, min_lat, max_lon, max_lat]
+    或 GeoJSON Polygon / MultiPolygon；参数无效时抛出 ValueError"""
+    if isinstance(spec, (list, tuple)):
+        if len(spec) != 4:
+            raise ValueError('矩形区域必须为4元素数组 [min_lon, min_lat, max_lon, max_lat]')
+        try:
+            bbox = tuple(float(value) for value in spec)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f'矩形区域的坐标无效: {e}')
+        return Region(bbox)
+    if not isinstance(spec, dict):
+        raise ValueError('区域参数必须是矩形或 GeoJSON 多边形')
+    if 'type' not in spec:
+        try:
+            bbox = tuple(float(spec[key]) for key in RECT_KEYS)
+        except KeyError as e:
+            raise ValueError(f'矩形区域缺少参数: {e}')
+        except (TypeError, ValueError) as e:
+            raise ValueError(f'矩形区域的坐标无效: {e}')
+        return Region(bbox)
+
+    try:
+        if spec['type'] == 'Polygon':
+            polygons = [spec['coordinates']]
+        elif spec['type'] == 'MultiPolygon':
+            polygons = spec['coordinates']
+        else:
+            raise ValueError(f"不支持的几何类型: {spec['type']}，只支持 Polygon 与 MultiPolygon")
+        polygons = tuple(tuple(_parse_ring(ring) for ring in polygon) for polygon in polygons)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f'GeoJSON 多边形格式无效: {e}')
+    if not polygons or not all(polygons):
+        raise ValueError('多边形不能为空')
+    lons = [lon for polygon in polygons for lon, _ in polygon[0]]
+    lats = [lat for polygon in polygons for _, lat in polygon[0]]
+    return Region((min(lons), min(lats), max(lons), max(lats)), polygons)
@@ -0,0 +1,200 @@
+"""
+共享数据资源：R树索引与路径库连接的进程内复用，以及启动前预加载
+
+各接口原先每个请求都重新打开一次 R 树索引。这里为每个进程维护一个只读句柄池，
+请求结束后归还复用；句柄池按进程号隔离，多进程服务器 fork 后子进程会自动
+重新打开自己的文件句柄（文件句柄的读写偏移在进程间共享，不能跨 fork 复用）。
+
+preload() 在 fork 之前把索引文件、路径库和轨迹文件读入系统页缓存，
+所有工作进程共享同一份缓存页。
+
+数据目录默认为项目下的 Data，可用环境变量 TAXIFLOW_DATA_DIR 指向其他目录（如基准测试生成的数据）。
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.environ.get('TAXIFLOW_DATA_DIR') or os.path.join(PROJECT_ROOT, 'Data')
+# R树索引文件路径
+INDEX_FILE = os.path.join(DATA_DIR, 'taxi_rtree')
+# 按时间分片的R树索引目录（见 api/shards.py）
+SHARD_DIR = os.path.join(DATA_DIR, 'taxi_rtree_shards')
+# 频繁路径数据库路径
+PATHS_DB = os.path.join(DATA_DIR, 'all_paths_from_pkl.sqlite')
+# 行程表路径（见 DataProcess/build_trips.py）
+TRIPS_DB = os.path.join(DATA_DIR, 'taxi_trips.sqlite')
+# 轨迹数据目录
+TAXI_LOG_DIR = os.path.join(DATA_DIR, 'taxi_log_2008_by_id')
+# 轨迹点重要度目录（见 DataProcess/build_track_ranks.py）
+TRACK_RANK_DIR = os.path.join(DATA_DIR, 'track_ranks')
+
+READ_CHUNK = 8 * 1024 * 1024  # 预加载时每次读取的字节数
+
+
+class HandlePool:
+    """按进程隔离的句柄池"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._pid = None
+        self._idle = None
+        self.opened = 0  # 当前进程中已打开的句柄数
+
+    def _queue(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    # fork 后丢弃父进程的句柄，不调用 close 以免影响父进程
+                    self._idle = queue.LifoQueue()
+                    self.opened = 0
+                    self._pid = pid
+        return self._idle
+
+    def acquire(self):
+        try:
+            return self._queue().get_nowait()
+        except queue.Empty:
+            handle = self._factory()
+            self.opened += 1
+            return handle
+
+    def release(self, handle):
+        if handle is not None and self._pid == os.getpid():
+            self._idle.put(handle)
+
+
+def rtree_exists():
+    return os.path.exists(INDEX_FILE + '.idx') and os.path.exists(INDEX_FILE + '.dat')
+
+
+def _open_rtree():
+    # rtree 在第一次打开索引时才导入，缩短服务启动时间
+    from rtree import index
+    p = index.Property()
+    p.dimension = 3  # 三维索引：经度、纬度、时间
+    return index.Index(INDEX_FILE, properties=p)
+
+
+def _open_paths_db():
+    # 只读打开，允许在归还后被其他线程复用
+    return sqlite3.connect(f'file:{PATHS_DB}?mode=ro', uri=True, check_same_thread=False)
+
+
+def _open_trips_db():
+    return sqlite3.connect(f'file:{TRIPS_DB}?mode=ro', uri=True, check_same_thread=False)
+
+
+_rtree_pool = HandlePool(_open_rtree)
+_paths_db_pool = HandlePool(_open_paths_db)
+_trips_db_pool = HandlePool(_open_trips_db)
+
+
+def acquire_rtree():
+    """取出一个只读 R 树索引句柄，用完后必须调用 release_rtree 归还"""
+    return _rtree_pool.acquire()
+
+
+def release_rtree(idx):
+    _rtree_pool.release(idx)
+
+
+@contextmanager
+def paths_db():
+    """取出一个只读路径库连接"""
+    conn = _paths_db_pool.acquire()
+    try:
+        yield conn
+    finally:
+        _paths_db_pool.release(conn)
+
+
+@contextmanager
+def trips_db():
+    """取出一个只读行程表连接"""
+    conn = _trips_db_pool.acquire()
+    try:
+        yield conn
+    finally:
+        _trips_db_pool.release(conn)
+
+
+_paths_meta = {}
+_paths_meta_mtime = None
+
+
+def paths_mining_meta():
+    """路径库的挖掘参数（topk_path_miner.py 写入的 mining_meta 表）；全量流程生成的库没有该表，返回 {}。
+    路径库修改（重建或增量导入）后重新读取"""
+    global _paths_meta, _paths_meta_mtime
+    try:
+        mtime = os.path.getmtime(PATHS_DB)
+    except OSError:
+        return {}
+    if mtime != _paths_meta_mtime:
+        with paths_db() as conn:
+            try:
+                meta = dict(conn.execute('SELECT key, value FROM mining_meta').fetchall())
+            except sqlite3.OperationalError:
+                meta = {}
+        _paths_meta, _paths_meta_mtime = meta, mtime
+    return _paths_meta
+
+
+def clamp_top_k(k):
+    """top-k 模式的路径库只保证 k 不超过挖掘时 top_k 的结果正确；k 超出时返回 (top_k, 提示)，否则 (k, None)"""
+    top_k = paths_mining_meta().get('top_k')
+    if top_k is not None and k > int(top_k):
+        return int(top_k), (f'路径库按 k={top_k} 挖掘（topk_path_miner.py），只能返回前 {top_k} 条路径；'
+                            f'需要更多时请用更大的 --k 重新挖掘')
+    return k, None
+
+
+def resource_status():
+    """索引文件是否存在、当前进程是否已打开"""
+    return {
+        'rtree': {'exists': rtree_exists(), 'loaded': _rtree_pool.opened > 0},
+        'paths_db': {'exists': os.path.exists(PATHS_DB), 'loaded': _paths_db_pool.opened > 0},
+        'trips_db': {'exists': os.path.exists(TRIPS_DB), 'loaded': _trips_db_pool.opened > 0},
+    }
+
+
+def read_file(path):
+    """顺序读取整个文件，使其进入系统页缓存，返回读取的字节数"""
+    total = 0
+    try:
+        with open(path, 'rb', buffering=0) as f:
+            while True:
+                chunk = f.read(READ_CHUNK)
+                if not chunk:
+                    break
+                total += len(chunk)
+    except OSError:
+        return 0
+    return total
+
+
+def index_files():
+    """单个R树索引、各分片索引、路径库与行程表中已存在的文件"""
+    paths = [INDEX_FILE + '.idx', INDEX_FILE + '.dat', PATHS_DB, TRIPS_DB]
+    if os.path.isdir(SHARD_DIR):
+        paths.extend(os.path.join(SHARD_DIR, fname) for fname in sorted(os.listdir(SHARD_DIR))
+                     if fname.endswith(('.idx', '.dat')))
+    return [path for path in paths if os.path.exists(path)]
+
+
+def preload(include_tracks=False):
+    """在 fork 工作进程之前预加载数据文件，返回 {文件: 字节数}"""
+    loaded = {}
+    for path in index_files():
+        loaded[path] = read_file(path)
+    if include_tracks and os.path.isdir(TAXI_LOG_DIR):
+        for fname in os.listdir(TAXI_LOG_DIR):
+            if fname.endswith('.txt'):
+                path = os.path.join(TAXI_LOG_DIR, fname)
+                loaded[path] = read_file(path)
+    return loaded
@@ -0,0 +1,62 @@
+"""
+生产模式服务器
+
+Flask 自带的开发服务器只有一个进程，F4/F7 等重查询会相互阻塞。
+生产模式优先使用 gunicorn（多进程，preload 后 fork，工作进程共享预加载的页），
+Windows 上没有 gunicorn 时使用 waitress（多线程），两者都不可用时退回多线程开发服务器。
+"""
+import sys
+from api.resources import preload
+from api.lazy import preload_modules
+from api.metrics import flush_snapshot
+
+# 单个请求允许的最长处理时间（秒），F4/F5 大时间窗查询可能需要数十秒
+WORKER_TIMEOUT = 300
+
+
+def serve(app, port=5000, workers=4, host='127.0.0.1', preload_tracks=False):
+    loaded = preload(include_tracks=preload_tracks)
+    print(f"预加载完成: {len(loaded)} 个文件，共 {sum(loaded.values()) / 1024 / 1024:.1f} MB")
+    # 生产模式在 fork 之前导入全部功能模块，避免每个工作进程在首个请求时各自导入
+    preload_modules()
+
+    if sys.platform != 'win32':
+        try:
+            from gunicorn.app.base import BaseApplication
+        except ImportError:
+            BaseApplication = None
+        if BaseApplication is not None:
+            print(f"使用 gunicorn 启动，工作进程数 {workers}")
+            _run_gunicorn(BaseApplication, app, {
+                'bind': f'{host}:{port}',
+                'workers': workers,
+                'preload_app': True,
+                'timeout': WORKER_TIMEOUT,
+                # 工作进程退出时写入运行指标的最终快照
+                'worker_exit': lambda server, worker: flush_snapshot(),
+            })
+            return
+
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        waitress_serve = None
+    if waitress_serve is not None:
+        print(f"使用 waitress 启动，线程数 {workers}")
+        waitress_serve(app, host=host, port=port, threads=workers)
+        return
+
+    print("未安装 gunicorn 或 waitress，使用多线程开发服务器")
+    app.run(host=host, port=port, threaded=True)
+
+
+def _run_gunicorn(base_class, application, options):
+    class GunicornApp(base_class):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return application
+
+    GunicornApp().run()
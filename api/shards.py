@@ -0,0 +1,443 @@
+"""
+按时间分片的 R 树索引
+
+单个 taxi_rtree 覆盖全部时间，一小时的查询也要在整棵树上下降，扫描也只能用一个核。
+DataProcess/build_rtree_shards.py 按固定时长（默认一天）把轨迹点切成若干分片索引，
+并在 taxi_rtree_shards/manifest.json 中记录每个分片的时间区间与点的实际边界。
+
+查询时先按清单剔除与查询框不相交的分片，剩余分片交给线程池（或进程池）并行扫描，
+各分片的部分结果按分片的时间顺序返回，由调用方合并。每个点只属于一个分片
+（分片按 [start, end) 划分），合并时无需去重。没有分片清单时退回单个 taxi_rtree。
+
+扫描函数的签名为 scan(idx, bbox)，返回该分片上的部分结果；使用进程池时扫描函数
+须为模块级函数（可被 pickle），部分结果也会在进程间传递，应尽量在扫描中完成汇总。
+
+新构建的索引把出租车ID与时间编码在条目ID中（utils/item_ids.py），只需 (出租车ID, 时间戳)
+的扫描用 objects=False 取ID解码，不再逐点反序列化；旧索引（obj 为出租车ID）仍按原方式读取，
+每个索引句柄第一次扫描时判断一次格式。
+
+环境变量:
+    TAXIFLOW_SHARD_POOL     thread（默认）或 process
+    TAXIFLOW_SHARD_WORKERS  并行扫描的线程/进程数，默认等于 CPU 核数
+"""
+import os
+import json
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from api.resources import SHARD_DIR, INDEX_FILE, HandlePool, rtree_exists, acquire_rtree, release_rtree
+from api.jobs import report_progress
+from api.regions import SPLIT_LEVELS
+
+MANIFEST_FILE = os.path.join(SHARD_DIR, 'manifest.json')
+SHARD_POOLS = ('thread', 'process')
+# 多边形区域扫描的开销估算，均相对只取一个条目ID的开销
+REGION_BOX_COST = 125.0    # 每个查询框一次 R 树下降
+REGION_RECORD_COST = 65.0  # 逐条取出条目（含坐标）
+
+_lock = threading.Lock()
+_manifest = None
+_manifest_mtime = None
+_handle_pools = {}  # 分片名 -> HandlePool，清单变化时整体重建
+_executor = None
+_executor_pid = None
+
+
+def pool_kind():
+    kind = os.environ.get('TAXIFLOW_SHARD_POOL', 'thread')
+    return kind if kind in SHARD_POOLS else 'thread'
+
+
+def pool_workers():
+    workers = os.environ.get('TAXIFLOW_SHARD_WORKERS')
+    return int(workers) if workers else (os.cpu_count() or 1)
+
+
+def load_manifest():
+    """读取分片清单，文件修改后自动重新加载；没有清单时返回 None"""
+    global _manifest, _manifest_mtime, _handle_pools
+    try:
+        mtime = os.path.getmtime(MANIFEST_FILE)
+    except OSError:
+        return None
+    if mtime != _manifest_mtime:
+        with _lock:
+            if mtime != _manifest_mtime:
+                with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+                    _manifest = json.load(f)
+                # 分片文件可能已被重建，旧句柄不再复用
+                _handle_pools = {}
+                _manifest_mtime = mtime
+    return _manifest
+
+
+def shards_exist():
+    return load_manifest() is not None
+
+
+def index_available():
+    """分片索引或单个 R 树索引是否存在"""
+    return shards_exist() or rtree_exists()
+
+
+def _open_shard(path):
+    from rtree import index
+    p = index.Property()
+    p.dimension = 3  # 三维索引：经度、纬度、时间
+    return index.Index(path, properties=p)
+
+
+def _shard_pool(name):
+    pool = _handle_pools.get(name)
+    if pool is None:
+        with _lock:
+            pool = _handle_pools.get(name)
+            if pool is None:
+                pool = HandlePool(partial(_open_shard, os.path.join(SHARD_DIR, name)))
+                _handle_pools[name] = pool
+    return pool
+
+
+def _intersects(bounds, bbox):
+    # bounds 与 bbox 均为 (min_lon, min_lat, min_time, max_lon, max_lat, max_time)
+    return all(bounds[i] <= bbox[i + 3] and bbox[i] <= bounds[i + 3] for i in range(3))
+
+
+def select_shards(bbox):
+    """与查询框相交的分片，按时间顺序排列"""
+    manifest = load_manifest()
+    if manifest is None:
+        return []
+    return [shard for shard in manifest['shards'] if shard['points'] and _intersects(shard['bounds'], bbox)]
+
+
+def _scan_shard(name, bbox, scan):
+    """在当前进程中打开（或复用）分片句柄并执行扫描；进程池的工作进程中也调用此函数"""
+    load_manifest()
+    pool = _shard_pool(name)
+    idx = pool.acquire()
+    try:
+        return scan(idx, bbox)
+    finally:
+        pool.release(idx)
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _lock:
+            if _executor is None or _executor_pid != pid:
+                if pool_kind() == 'process':
+                    _executor = ProcessPoolExecutor(max_workers=pool_workers())
+                else:
+                    _executor = ThreadPoolExecutor(max_workers=pool_workers(), thread_name_prefix='shard-scan')
+                _executor_pid = pid
+    return _executor
+
+
+def map_shards(bbox, scan, progress=None):
+    """在与 bbox 相交的各分片上并行执行 scan(idx, bbox)，返回按时间顺序排列的部分结果列表
+
+    progress(partial) 在调用线程中、每个分片完成时调用，可用于上报进度。
+    没有分片清单时在单个 R 树上执行一次扫描。
+    """
+    if not shards_exist():
+        idx = acquire_rtree()
+        try:
+            result = scan(idx, bbox)
+        finally:
+            release_rtree(idx)
+        if progress is not None:
+            progress(result)
+        return [result]
+
+    shards = select_shards(bbox)
+    if len(shards) == 1 and pool_kind() == 'thread':
+        # 只命中一个分片时直接在当前线程扫描，省去调度开销
+        result = _scan_shard(shards[0]['name'], bbox, scan)
+        if progress is not None:
+            progress(result)
+        return [result]
+
+    executor = _get_executor()
+    futures = {executor.submit(_scan_shard, shard['name'], bbox, scan): position
+               for position, shard in enumerate(shards)}
+    results = [None] * len(shards)
+    try:
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if progress is not None:
+                progress(results[futures[future]])
+    except BaseException:
+        # 出错或任务被取消时不再等待尚未开始的分片
+        for future in futures:
+            future.cancel()
+        raise
+    return results
+
+
+class ScanProgress:
+    """map_shards 的 progress 回调：累计各分片返回的点数并上报任务进度"""
+
+    def __init__(self, points=0):
+        self.points = points
+
+    def __call__(self, part):
+        self.points += len(part)
+        report_progress(points=self.points)
+
+
+def packed_ids(idx):
+    """索引的条目ID是否编码了出租车ID与时间；旧索引的条目带有 pickle 的出租车ID"""
+    packed = getattr(idx, 'packed_ids', None)
+    if packed is None:
+        first = next(iter(idx.nearest(idx.bounds, 1, objects=True)), None)
+        packed = first is None or first.object is None
+        idx.packed_ids = packed
+    return packed
+
+
+def _scan_ids(idx, bbox):
+    import numpy as np  # 健康检查等轻量路径也会导入本模块，NumPy 在用到时才导入
+    return np.fromiter(idx.intersection(bbox), dtype=np.int64)
+
+
+def scan_objects(idx, bbox):
+    """扫描函数：返回 [(出租车ID, 时间戳), ...]"""
+    if not packed_ids(idx):
+        return [(item.object, item.bbox[2]) for item in idx.intersection(bbox, objects=True)]
+    from utils.item_ids import decode_taxi_ids, decode_timestamps
+    item_ids = _scan_ids(idx, bbox)
+    return list(zip(decode_taxi_ids(item_ids).tolist(), decode_timestamps(item_ids).tolist()))
+
+
+def scan_points(idx, bbox):
+    """扫描函数：返回 (n, 3) 数组，每行为 (经度, 纬度, 时间戳)"""
+    import numpy as np
+    coords = [item.bbox[:3] for item in idx.intersection(bbox, objects=True)]
+    return np.array(coords, dtype=np.float64).reshape(-1, 3)
+
+
+def scan_records(idx, bbox, bboxes=None):
+    """扫描函数：返回 (n, 4) 数组，每行为 (出租车ID, 经度, 纬度, 时间戳)
+
+    给定 bboxes 时返回这些查询框并集内的点（bbox 为它们的外包框，只用于选择分片），相交部分的点只返回一次。
+    """
+    import numpy as np
+    items = {}
+    for box in bboxes or (bbox,):
+        for item in idx.intersection(box, objects=True):
+            items[item.id] = item
+    if packed_ids(idx):
+        from utils.item_ids import decode_taxi_ids
+        records = np.array([(item_id, *item.bbox[:3]) for item_id, item in items.items()],
+                           dtype=np.float64).reshape(-1, 4)
+        records[:, 0] = decode_taxi_ids(np.fromiter(items.keys(), dtype=np.int64, count=len(items)))
+        return records
+    return np.array([(item.object, *item.bbox[:3]) for item in items.values()], dtype=np.float64).reshape(-1, 4)
+
+
+def _region_boxes(bbox, rects):
+    return tuple((rect[0], rect[1], bbox[2], rect[2], rect[3], bbox[5]) for rect in rects)
+
+
+def _region_plan(idx, region, bbox):
+    """按估算开销选择多边形区域的扫描方式
+
+    返回 None 表示取出外包矩形内全部点的坐标逐点判断；否则返回 (内部查询框, 边界查询框)，
+    网格越细，需要取坐标的边界网格面积越小，但每个查询框都有一次 R 树下降的开销。
+    由水平、竖直的边围成的多边形在某一级网格上没有边界网格，直接按该级网格扫描，不需要统计点数。
+    """
+    min_lon, min_lat, max_lon, max_lat = region.bbox
+    area = (max_lon - min_lon) * (max_lat - min_lat)
+    if area <= 0:
+        return None
+    for cells in SPLIT_LEVELS:
+        inner, edge = region.split_cells(cells)
+        if not edge:
+            return _region_boxes(bbox, inner), ()
+
+    points = idx.count(bbox)
+    best, best_cost = None, points * REGION_RECORD_COST
+    for cells in SPLIT_LEVELS:
+        inner, edge = region.split_cells(cells)
+        edge_fraction = sum((rect[2] - rect[0]) * (rect[3] - rect[1]) for rect in edge) / area
+        cost = (len(inner) + len(edge)) * REGION_BOX_COST + points * (1 + edge_fraction * REGION_RECORD_COST)
+        if cost < best_cost:
+            best, best_cost = (inner, edge), cost
+        elif best is not None:
+            break  # 再细分只会增加查询框的开销
+    if best is None:
+        return None
+    return _region_boxes(bbox, best[0]), _region_boxes(bbox, best[1])
+
+
+def _region_objects(idx, region, bbox):
+    """取出查询框内全部条目的坐标，返回区域内条目的 (条目ID, 出租车对象, 时间戳) 三个列表"""
+    import numpy as np
+    items = list(idx.intersection(bbox, objects=True))
+    coords = np.array([item.bbox[:2] for item in items], dtype=np.float64).reshape(-1, 2)
+    inside = region.contains(coords[:, 0], coords[:, 1]).tolist()
+    items = [item for item, keep in zip(items, inside) if keep]
+    return [item.id for item in items], [item.object for item in items], [item.bbox[2] for item in items]
+
+
+def _region_item_ids(idx, region, bbox):
+    """新格式索引中多边形区域内的条目ID
+
+    按 _region_plan 决定逐点判断或按网格扫描：内部查询框只取ID，边界查询框取出坐标判断。
+    各查询框互不重叠（见 Region.split_cells），不需要去重。
+    """
+    import numpy as np
+    plan = _region_plan(idx, region, bbox)
+    if plan is None:
+        return np.array(_region_objects(idx, region, bbox)[0], dtype=np.int64)
+    inner, edge = plan
+    item_ids = [_scan_ids(idx, box) for box in inner]
+    item_ids.extend(np.array(_region_objects(idx, region, box)[0], dtype=np.int64) for box in edge)
+    return np.concatenate(item_ids) if item_ids else np.empty(0, dtype=np.int64)
+
+
+def scan_region_objects(idx, bbox, region=None):
+    """扫描函数：返回多边形区域（bbox 为其外包矩形与时间窗）内的 [(出租车ID, 时间戳), ...]"""
+    if not packed_ids(idx):
+        # 旧索引逐条取出对象，直接按坐标判断
+        _, taxi_ids, timestamps = _region_objects(idx, region, bbox)
+        return list(zip(taxi_ids, timestamps))
+    from utils.item_ids import decode_taxi_ids, decode_timestamps
+    item_ids = _region_item_ids(idx, region, bbox)
+    return list(zip(decode_taxi_ids(item_ids).tolist(), decode_timestamps(item_ids).tolist()))
+
+
+def scan_region_taxis(idx, bbox, region=None):
+    """扫描函数：返回多边形区域内的 (出租车ID集合, 点数)"""
+    if not packed_ids(idx):
+        _, taxi_ids, _ = _region_objects(idx, region, bbox)
+        return set(taxi_ids), len(taxi_ids)
+    import numpy as np
+    from utils.item_ids import decode_taxi_ids
+    item_ids = _region_item_ids(idx, region, bbox)
+    return set(np.unique(decode_taxi_ids(item_ids)).tolist()), len(item_ids)
+
+
+def scan_taxis(idx, bbox):
+    """扫描函数：返回 (出租车ID集合, 点数)"""
+    if packed_ids(idx):
+        import numpy as np
+        from utils.item_ids import decode_taxi_ids
+        item_ids = _scan_ids(idx, bbox)
+        return set(np.unique(decode_taxi_ids(item_ids)).tolist()), len(item_ids)
+    taxi_ids = set()
+    count = 0
+    for taxi_id in idx.intersection(bbox, objects='raw'):
+        taxi_ids.add(taxi_id)
+        count += 1
+    return taxi_ids, count
+
+
+def count_points(idx, bbox):
+    """扫描函数：只统计点数，不取出对象"""
+    return idx.count(bbox)
+
+
+def query_objects(bbox, progress=None):
+    """查询框内的全部 (出租车ID, 时间戳)"""
+    results = []
+    for part in map_shards(bbox, scan_objects, progress):
+        results.extend(part)
+    return results
+
+
+def query_points(bbox, progress=None):
+    """查询框内的全部点，(n, 3) 数组，每行为 (经度, 纬度, 时间戳)"""
+    import numpy as np
+    parts = map_shards(bbox, scan_points, progress)
+    return np.concatenate(parts) if parts else np.empty((0, 3))
+
+
+def query_records(bboxes, progress=None):
+    """若干查询框并集内的全部点，(n, 4) 数组，每行为 (出租车ID, 经度, 纬度, 时间戳)
+
+    各查询框在一次分片扫描中完成，每个点只返回一次。
+    """
+    import numpy as np
+    bboxes = tuple(tuple(box) for box in bboxes)
+    if not bboxes:
+        return np.empty((0, 4))
+    bounds = tuple(min(box[i] for box in bboxes) for i in range(3)) + \
+        tuple(max(box[i] for box in bboxes) for i in range(3, 6))
+    parts = map_shards(bounds, partial(scan_records, bboxes=bboxes), progress)
+    return np.concatenate(parts) if parts else np.empty((0, 4))
+
+
+def query_region_objects(region, start_time, end_time, progress=None):
+    """多边形区域（api/regions.py 的 Region）在时间窗内的全部 (出租车ID, 时间戳)"""
+    results = []
+    scan = partial(scan_region_objects, region=region)
+    for part in map_shards(region.box(start_time, end_time), scan, progress):
+        results.extend(part)
+    return results
+
+
+def query_region_taxis(region, start_time, end_time):
+    """多边形区域在时间窗内的独立出租车ID集合与总点数"""
+    taxi_ids = set()
+    count = 0
+    scan = partial(scan_region_taxis, region=region)
+    for part_ids, part_count in map_shards(region.box(start_time, end_time), scan):
+        taxi_ids |= part_ids
+        count += part_count
+    return taxi_ids, count
+
+
+def query_taxis(bbox):
+    """查询框内的独立出租车ID集合与总点数"""
+    taxi_ids = set()
+    count = 0
+    for part_ids, part_count in map_shards(bbox, scan_taxis):
+        taxi_ids |= part_ids
+        count += part_count
+    return taxi_ids, count
+
+
+def query_count(bbox):
+    return sum(map_shards(bbox, count_points))
+
+
+def index_bounds():
+    """全部数据的边界 (min_lon, min_lat, min_time, max_lon, max_lat, max_time)"""
+    manifest = load_manifest()
+    if manifest is None:
+        idx = acquire_rtree()
+        try:
+            return tuple(idx.bounds)
+        finally:
+            release_rtree(idx)
+    return tuple(manifest['bounds'])
+
+
+def data_version():
+    """数据版本：分片清单（没有清单时为 taxi_rtree）的修改时间，重建或增量导入后改变"""
+    for path in (MANIFEST_FILE, INDEX_FILE + '.dat'):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            continue
+    return None
+
+
+def shard_status():
+    """分片清单概况与当前进程中已打开的分片数"""
+    manifest = load_manifest()
+    if manifest is None:
+        return {'exists': False}
+    return {
+        'exists': True,
+        'shards': len(manifest['shards']),
+        'shard_hours': manifest['shard_seconds'] / 3600,
+        'points': manifest['points'],
+        'loaded': sum(1 for pool in _handle_pools.values() if pool.opened > 0),
+        'pool': pool_kind(),
+        'workers': pool_workers(),
+    }
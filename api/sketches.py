@@ -0,0 +1,195 @@
+"""
+出租车去重草图的查询（F3）
+
+DataProcess/build_taxi_sketches.py 为每个 (时间桶, 网格) 保存经过的出租车：车辆不多的格子为出租车ID列表，
+其余为 HyperLogLog 草图（utils/hll.py）。矩形查询框分成互不相交的两部分：
+- 内部：完全落在矩形内的网格 × 完全落在时间窗内的时间桶，直接合并这些格子的出租车与点数；
+- 边缘：时间窗两端不足一个时间桶的部分，以及中间时间段内矩形去掉内部网格后的（至多）四条网格带，
+  用当前后端的 query_taxis 精确扫描。
+两部分合起来正好是查询框，总点数是精确的；内部格子全是ID列表时独立出租车数也是精确的，
+用到草图时为估计值，相对标准误差约 1.04/sqrt(2^precision)。出租车ID的并集用按ID下标的布尔数组计算。
+边缘部分要另外扫描若干查询框，小区域、短时间窗时不一定更快：与查询框相交的格子中，
+内部格子的点数不到 MIN_INNER_SHARE 时直接扫描索引。
+
+草图同样用 mmap 打开，meta.json 修改后（重建或增量导入）自动重新打开。
+"""
+import os
+import json
+import threading
+from api.resources import DATA_DIR
+from api.spatial import query_taxis
+
+SKETCH_DIR = os.path.join(DATA_DIR, 'taxi_sketches')
+META_FILE = os.path.join(SKETCH_DIR, 'meta.json')
+COLUMNS = ('keys', 'points', 'id_offsets', 'taxi_ids', 'hll_rows', 'registers')
+MIN_INNER_SHARE = 0.5
+
+_lock = threading.Lock()
+_sketches = None
+_sketches_mtime = None
+
+
+def sketches_exist():
+    return os.path.exists(META_FILE)
+
+
+def sketch_files():
+    if not os.path.isdir(SKETCH_DIR):
+        return []
+    return [os.path.join(SKETCH_DIR, fname) for fname in sorted(os.listdir(SKETCH_DIR)) if fname.endswith('.npy')]
+
+
+def load_sketches():
+    """打开去重草图，返回 {'meta', 列名: 数组}；不存在时返回 None"""
+    global _sketches, _sketches_mtime
+    try:
+        mtime = os.path.getmtime(META_FILE)
+    except OSError:
+        return None
+    if mtime != _sketches_mtime:
+        with _lock:
+            if mtime != _sketches_mtime:
+                import numpy as np  # 健康检查等轻量路径也会导入本模块，NumPy 在用到时才导入
+                with open(META_FILE, 'r', encoding='utf-8') as f:
+                    sketches = {'meta': json.load(f)}
+                for name in COLUMNS:
+                    sketches[name] = np.load(os.path.join(SKETCH_DIR, f'{name}.npy'), mmap_mode='r')
+                _sketches = sketches
+                _sketches_mtime = mtime
+    return _sketches
+
+
+def _inner_cells(low, high, cell_size):
+    """完全落在 [low, high] 内的网格号范围 (第一个, 最后一个)，可能为空"""
+    from utils.sketch_grid import cell_index
+    first = int(cell_index(low, cell_size))
+    if first * cell_size < low:
+        first += 1
+    return first, int(cell_index(high, cell_size)) - 1
+
+
+def _cell_entries(sketches, buckets, cols, rows):
+    """时间桶范围 × 经度方向网格范围 × 纬度方向网格范围（均含两端）内的格子下标"""
+    import numpy as np
+    from utils.sketch_grid import encode_keys
+    # 每个 (时间桶, 经度方向网格) 的各纬度方向网格在键上连续
+    bucket_grid, col_grid = np.meshgrid(np.arange(buckets[0], buckets[1] + 1), np.arange(cols[0], cols[1] + 1),
+                                        indexing='ij')
+    keys = sketches['keys']
+    starts = np.searchsorted(keys, encode_keys(bucket_grid.ravel(), col_grid.ravel(), rows[0]), side='left')
+    ends = np.searchsorted(keys, encode_keys(bucket_grid.ravel(), col_grid.ravel(), rows[1]), side='right')
+    return _ranges(starts, ends)
+
+
+def _ranges(starts, ends):
+    """若干 [start, end) 区间内的全部下标"""
+    import numpy as np
+    lengths = ends - starts
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(int(lengths.sum()))
+
+
+def _edge_boxes(bbox, inner):
+    """查询框去掉内部块后剩下的部分，分成互不相交的查询框（上界取前一个浮点数表示开区间）"""
+    import numpy as np
+    min_lon, min_lat, start, max_lon, max_lat, end = bbox
+    x_lo, y_lo, t_lo, x_hi, y_hi, t_hi = inner
+
+    def below(value):
+        return float(np.nextafter(value, -np.inf))
+
+    boxes = []
+    if start < t_lo:
+        boxes.append((min_lon, min_lat, start, max_lon, max_lat, below(t_lo)))
+    boxes.append((min_lon, min_lat, t_hi, max_lon, max_lat, end))
+    middle = (t_lo, below(t_hi))
+    if min_lon < x_lo:
+        boxes.append((min_lon, min_lat, middle[0], below(x_lo), max_lat, middle[1]))
+    boxes.append((x_hi, min_lat, middle[0], max_lon, max_lat, middle[1]))
+    if min_lat < y_lo:
+        boxes.append((x_lo, min_lat, middle[0], below(x_hi), below(y_lo), middle[1]))
+    boxes.append((x_lo, y_hi, middle[0], below(x_hi), max_lat, middle[1]))
+    return boxes
+
+
+def query_sketch_taxis(bbox):
+    """用草图回答矩形查询框内的独立出租车数与总点数
+
+    返回 (独立出租车数, 总点数, 说明)；没有草图、查询框内不含完整的 (时间桶, 网格)
+    或内部格子的点数占比不到 MIN_INNER_SHARE 时返回 None。
+    说明为 {'approximate', 'relative_error', 'cells', 'sketch_cells', 'sketch_points', 'scanned_points'}。
+    """
+    sketches = load_sketches()
+    if sketches is None:
+        return None
+    import math
+    import numpy as np
+    from utils.hll import add_ids, estimate, relative_error
+    from utils.sketch_grid import cell_index
+    meta = sketches['meta']
+    cell_size, width = meta['cell_size'], meta['bucket_seconds']
+    min_lon, min_lat, start, max_lon, max_lat, end = bbox
+    col_lo, col_hi = _inner_cells(min_lon, max_lon, cell_size)
+    row_lo, row_hi = _inner_cells(min_lat, max_lat, cell_size)
+    # 时间桶 [b * width, (b + 1) * width) 完全落在时间窗内
+    bucket_lo, bucket_hi = math.ceil(start / width), math.floor(end / width) - 1
+    if col_lo > col_hi or row_lo > row_hi or bucket_lo > bucket_hi:
+        return None
+
+    entries = _cell_entries(sketches, (bucket_lo, bucket_hi), (col_lo, col_hi), (row_lo, row_hi))
+    sketch_points = int(sketches['points'][entries].sum())
+    touched = _cell_entries(sketches, (math.floor(start / width), math.floor(end / width)),
+                            (int(cell_index(min_lon, cell_size)), int(cell_index(max_lon, cell_size))),
+                            (int(cell_index(min_lat, cell_size)), int(cell_index(max_lat, cell_size))))
+    if sketch_points < MIN_INNER_SHARE * int(sketches['points'][touched].sum()):
+        return None
+    hll_rows = sketches['hll_rows'][entries]
+    exact_entries = entries[hll_rows < 0]
+    id_offsets = sketches['id_offsets']
+    taxi_ids = sketches['taxi_ids'][_ranges(id_offsets[exact_entries], id_offsets[exact_entries + 1])]
+
+    # 边缘部分精确扫描
+    inner = (col_lo * cell_size, row_lo * cell_size, bucket_lo * width,
+             (col_hi + 1) * cell_size, (row_hi + 1) * cell_size, (bucket_hi + 1) * width)
+    scanned_ids = set()
+    scanned_points = 0
+    for box in _edge_boxes(bbox, inner):
+        part_ids, part_count = query_taxis(box)
+        scanned_ids |= part_ids
+        scanned_points += part_count
+    scanned_ids = np.fromiter(scanned_ids, dtype=np.int64, count=len(scanned_ids))
+
+    seen = np.zeros(max(meta['max_taxi'], int(scanned_ids.max(initial=0))) + 1, dtype=bool)
+    seen[taxi_ids] = True
+    seen[scanned_ids] = True
+    count = int(np.count_nonzero(seen))
+    sketch_rows = np.sort(hll_rows[hll_rows >= 0])
+    if len(sketch_rows):
+        registers = np.asarray(sketches['registers'][sketch_rows]).max(axis=0)
+        add_ids(registers, np.flatnonzero(seen), meta['precision'])
+        count = max(count, int(round(estimate(registers))))
+    info = {
+        'approximate': bool(len(sketch_rows)),
+        'relative_error': round(relative_error(meta['precision']), 4) if len(sketch_rows) else 0.0,
+        'cells': int(len(entries)),
+        'sketch_cells': int(len(sketch_rows)),
+        'sketch_points': sketch_points,
+        'scanned_points': scanned_points,
+    }
+    return count, sketch_points + scanned_points, info
+
+
+def sketch_status():
+    try:
+        with open(META_FILE, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return {'exists': False}
+    return {
+        'exists': True,
+        'entries': meta['entries'],
+        'hll_entries': meta['hll_entries'],
+        'points': meta['points'],
+        'cell_size': meta['cell_size'],
+        'bucket_minutes': meta['bucket_seconds'] / 60,
+        'loaded': _sketches is not None,
+    }
@@ -0,0 +1,85 @@
+"""
+时空点查询的后端选择
+
+F3~F6、F9 与预热通过这里的 query_* 查询轨迹点，后端由环境变量 TAXIFLOW_INDEX_BACKEND 选择:
+    rtree     R 树索引（默认）：有分片清单时查询分片，否则查询单个 taxi_rtree，见 api/shards.py
+    columnar  列式点存储，见 api/columnar.py；列存储不存在时退回 rtree
+
+多边形区域（api/regions.py）用 query_region_*，矩形区域直接转为对应的查询框。
+
+环境变量在每次查询时读取，同一进程中可以切换后端（基准测试据此对比两种后端）。
+"""
+import os
+from api import shards, columnar
+from api.shards import ScanProgress  # 供各接口统一从本模块导入
+
+BACKENDS = ('rtree', 'columnar')
+
+
+def configured_backend():
+    backend = os.environ.get('TAXIFLOW_INDEX_BACKEND', 'rtree')
+    return backend if backend in BACKENDS else 'rtree'
+
+
+def active_backend():
+    """实际使用的后端名"""
+    if configured_backend() == 'columnar' and columnar.store_exists():
+        return 'columnar'
+    return 'rtree'
+
+
+def _backend():
+    return columnar if active_backend() == 'columnar' else shards
+
+
+def index_available():
+    """当前后端的数据是否存在"""
+    return active_backend() == 'columnar' or shards.index_available()
+
+
+def query_objects(bbox, progress=None):
+    return _backend().query_objects(bbox, progress)
+
+
+def query_points(bbox, progress=None):
+    return _backend().query_points(bbox, progress)
+
+
+def query_records(bboxes, progress=None):
+    return _backend().query_records(bboxes, progress)
+
+
+def query_region_objects(region, start_time, end_time, progress=None):
+    """区域（api/regions.py 的 Region）在时间窗内的全部 (出租车ID, 时间戳)；矩形区域即 query_objects"""
+    if region.is_rect:
+        return query_objects(region.box(start_time, end_time), progress)
+    return _backend().query_region_objects(region, start_time, end_time, progress)
+
+
+def query_region_taxis(region, start_time, end_time):
+    """区域在时间窗内的独立出租车ID集合与总点数"""
+    if region.is_rect:
+        return query_taxis(region.box(start_time, end_time))
+    return _backend().query_region_taxis(region, start_time, end_time)
+
+
+def query_taxis(bbox):
+    return _backend().query_taxis(bbox)
+
+
+def query_count(bbox):
+    return _backend().query_count(bbox)
+
+
+def index_bounds():
+    return _backend().index_bounds()
+
+
+def data_version():
+    """当前后端及其数据版本，数据重建或增量导入后改变（供 api/bucket_cache.py 判断缓存是否失效）"""
+    return active_backend(), _backend().data_version()
+
+
+def backend_status():
+    return {'configured': configured_backend(), 'active': active_backend(), 'columnar': columnar.columnar_status()}
+
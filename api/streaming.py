@@ -0,0 +1,40 @@
+"""
+Server-Sent Events 流式响应工具
+
+流式接口按时间段逐步计算并推送部分结果，事件类型约定:
+    meta     查询开始时立即发送，包含时间段划分等元信息
+    partial  每处理完一个时间段发送一次，包含截至目前的累计结果
+    done     全部完成，数据与对应同步接口的返回结果一致
+    error    处理过程中出错
+"""
+from flask import Response
+import json
+
+FIRST_CHUNK_SECONDS = 5 * 60  # 第一个时间段只取5分钟，保证首帧尽快返回
+
+
+def sse_event(event, data):
+    """格式化一条 SSE 事件"""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def sse_response(events):
+    """将事件生成器包装为 text/event-stream 响应"""
+    return Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # 禁止反向代理缓冲
+    })
+
+
+def time_chunks(start_timestamp, end_timestamp, max_chunk_seconds, first_chunk_seconds=FIRST_CHUNK_SECONDS):
+    """将时间范围切分为逐步变长的时间段: 首段 first_chunk_seconds，之后每段翻倍直到 max_chunk_seconds"""
+    chunks = []
+    chunk = min(first_chunk_seconds, max_chunk_seconds)
+    current = start_timestamp
+    while current < end_timestamp:
+        next_time = min(current + chunk, end_timestamp)
+        chunks.append((current, next_time))
+        current = next_time
+        chunk = min(chunk * 2, max_chunk_seconds)
+    return chunks
@@ -0,0 +1,70 @@
+"""
+行程表的查询
+
+DataProcess/build_trips.py 把轨迹按时间间隔与停车切分为行程，起点与终点各有一个 R*Tree。
+F5、F9 的行程模式（mode=trips）只统计“起点在区域A、终点在区域B”的行程，
+同一行程内的两个点才会构成一次 A→B 的通行，不会再把跨越收车时段的一对点当作一次通行；
+查询是 SQLite 中的 R*Tree 范围查询，不扫描 R 树中的轨迹点。
+
+R*Tree 以单精度存储坐标与时间（向外取整），只用于筛选候选，再按 trips 表中的精确值过滤。
+多边形区域（api/regions.py）先按外包矩形查询，再判断起终点是否在多边形内。
+"""
+import os
+from api.resources import TRIPS_DB, trips_db
+
+MODES = ('points', 'trips')
+
+_OD_SQL = '''
+    SELECT t.id, t.taxi_id, t.start_time, t.end_time, t.distance, t.duration,
+           t.origin_lon, t.origin_lat, t.dest_lon, t.dest_lat
+    FROM {index} r JOIN trips t ON t.id = r.id
+    WHERE r.max_lon >= ? AND r.min_lon <= ? AND r.max_lat >= ? AND r.min_lat <= ?
+      AND r.max_time >= ? AND r.min_time <= ?
+      AND t.origin_lon BETWEEN ? AND ? AND t.origin_lat BETWEEN ? AND ?
+      AND t.dest_lon BETWEEN ? AND ? AND t.dest_lat BETWEEN ? AND ?
+      AND t.start_time >= ? AND t.end_time <= ? AND t.duration <= ?
+'''
+
+
+def trips_exist():
+    return os.path.exists(TRIPS_DB)
+
+
+def parse_mode(data):
+    """请求中的 mode 参数：points（默认，逐点分析）或 trips（按行程表分析）"""
+    mode = data.get('mode', 'points')
+    if mode not in MODES:
+        raise ValueError(f"mode 参数无效: {mode}，可选 {', '.join(MODES)}")
+    return mode
+
+
+def _area(rect):
+    return (rect[2] - rect[0]) * (rect[3] - rect[1])
+
+
+def query_od_trips(origin, destination, start_time, end_time, max_duration=float('inf')):
+    """起点在 origin、终点在 destination、且完全落在时间窗内的行程
+
+    origin、destination 为 Region（见 api/regions.py）。
+    返回 [(行程ID, 出租车ID, 出发时间, 到达时间, 距离（米）, 时长（秒）), ...]，按出发时间排序。
+    """
+    import numpy as np
+    # 从面积较小的一端的 R*Tree 开始查找，另一端按 trips 表中的坐标过滤
+    origin_rect, destination_rect = origin.bbox, destination.bbox
+    if _area(origin_rect) <= _area(destination_rect):
+        index, rect = 'trip_origins', origin_rect
+    else:
+        index, rect = 'trip_destinations', destination_rect
+    params = (rect[0], rect[2], rect[1], rect[3], start_time, end_time,
+              origin_rect[0], origin_rect[2], origin_rect[1], origin_rect[3],
+              destination_rect[0], destination_rect[2], destination_rect[1], destination_rect[3],
+              start_time, end_time, max_duration)
+    with trips_db() as conn:
+        rows = conn.execute(_OD_SQL.format(index=index), params).fetchall()
+    if rows and not (origin.is_rect and destination.is_rect):
+        coords = np.array([row[6:] for row in rows], dtype=np.float64)
+        inside = origin.contains(coords[:, 0], coords[:, 1]) & destination.contains(coords[:, 2], coords[:, 3])
+        rows = [row for row, keep in zip(rows, inside.tolist()) if keep]
+    rows = [row[:6] for row in rows]
+    rows.sort(key=lambda row: (row[2], row[0]))
+    return rows
@@ -0,0 +1,243 @@
+"""
+网格访问区间索引的查询
+
+DataProcess/build_visit_index.py 把每辆车的轨迹压缩为 (网格, 出租车ID, 进入时间, 离开时间) 访问，
+一段连续落在同一网格中的点只对应一条访问。F5、F6、F9 只关心车辆在区域之间的先后移动，
+区域内连续的多个点与一条“首个点时间~末个点时间”的事件等价，因此可以按访问计算。
+
+area_events 把查询区域分成两类网格：
+- 完全落在某个区域内部的网格：直接取访问，不再逐点查询；
+- 与区域边界相交的网格：查询这些网格内的轨迹点，按点的坐标判断属于哪个区域。
+两部分合起来与逐点查询得到的事件序列一致（区域内连续的点合并为一个事件）。
+时间窗边界上的访问可能有部分点在窗外，但这样的事件之前（或之后）不会再有窗内的事件，
+不影响区域间移动的识别。没有访问索引时退回逐点查询，每个点就是一个事件。
+
+边界网格的取点要读出坐标，R 树逐条取出条目比只取条目ID慢一个数量级以上，列存储则相差不大。
+每次查询按网格数估算两种做法的开销（边界网格按后端的 RECORD_COST 计，内部网格按平均每条访问的点数折算），
+按访问计算的估算开销不到逐点查询的 VISIT_GAIN 倍时才使用访问索引，否则同样退回逐点查询。
+
+访问索引同样用 mmap 打开，meta.json 修改后（重建或增量导入）自动重新打开。
+"""
+import os
+import json
+import math
+import threading
+from collections import defaultdict
+from api.resources import DATA_DIR
+from api.regions import row_boxes
+from api.spatial import active_backend, query_region_objects, query_records
+
+VISIT_DIR = os.path.join(DATA_DIR, 'taxi_visits')
+META_FILE = os.path.join(VISIT_DIR, 'meta.json')
+CELL_MARGIN = 1e-9  # 边界网格查询框向外扩展的比例（相对网格边长），避免浮点误差漏点
+RECORD_COST = {'rtree': 30.0, 'columnar': 1.5}  # 取带坐标的点相对只取 (出租车ID, 时间戳) 的单点开销
+VISIT_GAIN = 0.5
+
+_lock = threading.Lock()
+_index = None
+_index_mtime = None
+
+
+def visits_exist():
+    return os.path.exists(META_FILE)
+
+
+def visit_files():
+    if not os.path.isdir(VISIT_DIR):
+        return []
+    return [os.path.join(VISIT_DIR, fname) for fname in sorted(os.listdir(VISIT_DIR)) if fname.endswith('.npy')]
+
+
+def load_visits():
+    """打开访问索引，返回 {'meta', 列名: 数组}；不存在时返回 None"""
+    global _index, _index_mtime
+    try:
+        mtime = os.path.getmtime(META_FILE)
+    except OSError:
+        return None
+    if mtime != _index_mtime:
+        with _lock:
+            if mtime != _index_mtime:
+                import numpy as np  # 健康检查等轻量路径也会导入本模块，NumPy 在用到时才导入
+                with open(META_FILE, 'r', encoding='utf-8') as f:
+                    index = {'meta': json.load(f)}
+                for name in ('cell', 'taxi', 'enter', 'exit'):
+                    index[name] = np.load(os.path.join(VISIT_DIR, f'{name}.npy'), mmap_mode='r')
+                _index = index
+                _index_mtime = mtime
+    return _index
+
+
+def points_per_visit(meta):
+    return meta['points'] / max(meta['visits'], 1)
+
+
+def visit_status():
+    try:
+        with open(META_FILE, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return {'exists': False}
+    return {
+        'exists': True,
+        'visits': meta['visits'],
+        'points': meta['points'],
+        'points_per_visit': round(points_per_visit(meta), 2),
+        'loaded': _index is not None,
+    }
+
+
+def rects_overlap(a, b):
+    """两个 (min_lon, min_lat, max_lon, max_lat) 矩形是否相交（含边界）"""
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _cell_span(rect, grid_size):
+    # 与 trajectory_preprocess.encode_cells 相同的网格划分
+    return (math.floor(rect[0] / grid_size), math.floor(rect[1] / grid_size),
+            math.floor(rect[2] / grid_size), math.floor(rect[3] / grid_size))
+
+
+def _bisect(column, lo, hi, value, right=False):
+    """在 column 的各区间 [lo, hi) 上同时二分查找 value（区间内升序），返回插入位置"""
+    import numpy as np
+    lo, hi = lo.copy(), hi.copy()
+    while True:
+        active = lo < hi
+        if not active.any():
+            return lo
+        mid = (lo + hi) // 2
+        values = column[np.where(active, mid, 0)]
+        before = (values <= value) if right else (values < value)
+        lo = np.where(active & before, mid + 1, lo)
+        hi = np.where(active & ~before, mid, hi)
+
+
+def _cell_visits(index, cells, start_time, end_time):
+    """指定网格中与时间窗相交的访问，返回 (出租车ID, 进入时间, 离开时间) 三个数组"""
+    import numpy as np
+    cell_column, enter_column = index['cell'], index['enter']
+    max_seconds = index['meta']['max_visit_seconds']
+    starts = np.searchsorted(cell_column, cells, side='left')
+    ends = np.searchsorted(cell_column, cells, side='right')
+    # 同一网格内按进入时间排序；访问不超过 max_seconds，进入时间早于 start - max_seconds 的不会与时间窗相交
+    first = _bisect(enter_column, starts, ends, start_time - max_seconds)
+    last = _bisect(enter_column, starts, ends, end_time, right=True)
+    lengths = np.maximum(last - first, 0)
+    total = int(lengths.sum())
+    rows = np.arange(total, dtype=np.int64) + np.repeat(first - (np.cumsum(lengths) - lengths), lengths)
+    exits = np.asarray(index['exit'][rows])
+    keep = exits >= start_time
+    rows = rows[keep]
+    return np.asarray(index['taxi'][rows], dtype=np.int64), np.asarray(index['enter'][rows]), exits[keep]
+
+
+def _label_points(records, areas):
+    """按坐标给点分配第一个包含它的区域序号，不在任何区域内的为 -1"""
+    import numpy as np
+    labels = np.full(len(records), -1, dtype=np.int64)
+    for i, (_, region) in reversed(list(enumerate(areas))):
+        labels[region.contains(records[:, 1], records[:, 2])] = i
+    return labels
+
+
+def _cell_codes(gx, gy):
+    import numpy as np
+    return (np.asarray(gx, dtype=np.int64) << 32) | (np.asarray(gy, dtype=np.int64) & 0xFFFFFFFF)
+
+
+def _split_cells(areas, grid_size):
+    """按区域划分网格，返回各区域的内部网格编码、边界网格编码与覆盖边界网格的查询矩形（网格坐标）"""
+    import numpy as np
+    spans = [_cell_span(region.bbox, grid_size) for _, region in areas]
+    split = []
+    for i, (x0, y0, x1, y1) in enumerate(spans):
+        gx, gy = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+        # 每个网格只由第一个覆盖它的区域处理
+        owned = np.ones(gx.shape, dtype=bool)
+        for sx0, sy0, sx1, sy1 in spans[:i]:
+            owned &= ~((gx >= sx0) & (gx <= sx1) & (gy >= sy0) & (gy <= sy1))
+        # 严格位于区域网格范围内部的网格，其中的点一定落在该区域内
+        pure = owned & (gx > x0) & (gx < x1) & (gy > y0) & (gy < y1)
+        mixed = owned & ~pure
+        boxes = [(bx0 + x0, by0 + y0, bx1 + x0, by1 + y0) for bx0, by0, bx1, by1 in row_boxes(mixed)]
+        split.append((np.sort(_cell_codes(gx[pure], gy[pure])), _cell_codes(gx[mixed], gy[mixed]), boxes))
+    return split
+
+
+def _visit_events(index, areas, split, start_time, end_time, progress):
+    import numpy as np
+    grid_size = index['meta']['grid_size']
+    events = {label: defaultdict(list) for label, _ in areas}
+    scanned = 0
+    for (label, _), (pure_cells, _, _) in zip(areas, split):
+        taxis, enters, exits = _cell_visits(index, pure_cells, start_time, end_time)
+        for taxi_id, enter, leave in zip(taxis.tolist(), enters.tolist(), exits.tolist()):
+            events[label][taxi_id].append((enter, leave))
+        scanned += len(taxis)
+
+    # 各区域的边界网格在一次查询中取点
+    margin = grid_size * CELL_MARGIN
+    bboxes = [(cx0 * grid_size - margin, cy0 * grid_size - margin, start_time,
+               (cx1 + 1) * grid_size + margin, (cy1 + 1) * grid_size + margin, end_time)
+              for _, _, boxes in split for cx0, cy0, cx1, cy1 in boxes]
+    records = query_records(bboxes, progress)
+    scanned += len(records)
+    # 查询框扩展出的点属于相邻网格，不在边界网格中的点已由访问计入或不在任何区域内
+    codes = _cell_codes(np.floor(records[:, 1] / grid_size), np.floor(records[:, 2] / grid_size))
+    records = records[np.isin(codes, np.concatenate([mixed for _, mixed, _ in split]))]
+    labels = _label_points(records, areas)
+    for (taxi_id, _, _, timestamp), j in zip(records.tolist(), labels.tolist()):
+        if j >= 0:
+            events[areas[j][0]][int(taxi_id)].append((timestamp, timestamp))
+    return events, scanned
+
+
+def _point_events(areas, start_time, end_time, exclusive, progress):
+    events = {label: defaultdict(list) for label, _ in areas}
+    seen = defaultdict(set)
+    scanned = 0
+    for label, region in areas:
+        for taxi_id, timestamp in query_region_objects(region, start_time, end_time, progress):
+            scanned += 1
+            if exclusive:
+                # 已属于前面区域的点不再计入后面的区域
+                if timestamp in seen[taxi_id]:
+                    continue
+                if label != areas[-1][0]:
+                    seen[taxi_id].add(timestamp)
+            events[label][taxi_id].append((timestamp, timestamp))
+    return events, scanned
+
+
+def area_events(areas, start_time, end_time, exclusive=False, progress=None):
+    """各区域内每辆车的事件，返回 ({标签: {出租车ID: [(首个点时间, 末个点时间), ...]}}, 扫描的点数与访问数)
+
+    areas 为 [(标签, Region), ...]（见 api/regions.py）；事件未排序。
+    exclusive=False 时同时落在多个区域的点在每个区域各算一次（与逐点查询相同），
+    此时区域相交则不使用访问索引；exclusive=True 时点只属于第一个包含它的区域（F6 的内部与环形区域）。
+    访问索引按网格划分矩形区域，有多边形区域时逐点查询。
+    """
+    index = load_visits()
+    overlapping = any(rects_overlap(a[1].bbox, b[1].bbox) for i, a in enumerate(areas) for b in areas[i + 1:])
+    if index is None or (overlapping and not exclusive) or not all(region.is_rect for _, region in areas):
+        return _point_events(areas, start_time, end_time, exclusive, progress)
+    grid_size = index['meta']['grid_size']
+    split = _split_cells(areas, grid_size)
+    # 按网格数估算开销：逐点查询扫描各区域的全部面积，按访问计算只在边界网格取点
+    rects = [region.bbox for _, region in areas]
+    point_cost = sum((rect[2] - rect[0]) * (rect[3] - rect[1]) for rect in rects) / grid_size ** 2
+    visit_cost = sum(len(mixed) * RECORD_COST[active_backend()] + len(pure_cells) / points_per_visit(index['meta'])
+                     for pure_cells, mixed, _ in split)
+    if visit_cost >= point_cost * VISIT_GAIN:
+        return _point_events(areas, start_time, end_time, exclusive, progress)
+    return _visit_events(index, areas, split, start_time, end_time, progress)
+
+
+def sorted_events(events_by_label, taxi_id):
+    """一辆车在各区域的事件按时间合并，返回 [(首个点时间, 标签, 末个点时间), ...]"""
+    merged = []
+    for label, events in events_by_label.items():
+        merged.extend((first, label, last) for first, last in events.get(taxi_id, ()))
+    merged.sort()
+    return merged
@@ -0,0 +1,118 @@
+"""
+启动后的后台预热
+
+刚启动时 R 树的 .dat 页和路径库都不在页缓存中，第一次 F3/F4 查询明显偏慢。
+预热在后台线程中执行，健康检查不受影响，进度通过 /api/health 的 warmup 字段查看。
+
+环境变量 TAXIFLOW_WARMUP 控制预热程度:
+    off      不预热
+    files    对索引文件与路径库做 madvise(WILLNEED)（不支持时顺序读取一遍）
+    full     在 files 的基础上打开索引与路径库，并执行一组代表性查询（默认）
+
+多进程服务器中每个工作进程在处理第一个请求时启动自己的预热线程，
+页缓存由各进程共享，索引句柄则各自打开。
+"""
+import os
+import mmap
+import time
+import threading
+from api.resources import PATHS_DB, index_files, paths_db, read_file
+from api.columnar import store_files
+from api.visits import visit_files
+from api.sketches import sketch_files
+from api.catalog import catalog_files
+from api.spatial import index_available, index_bounds, query_count, query_objects
+
+WARMUP_MODES = ('off', 'files', 'full')
+QUERY_WINDOW = 60 * 60   # 代表性查询的时间窗（秒）
+QUERY_HALF_SIZE = 0.01   # 小范围查询矩形的半边长（度），约1公里
+
+_lock = threading.Lock()
+_status = {'mode': None, 'state': 'pending', 'seconds': None, 'files_bytes': 0, 'queries': 0, 'error': None}
+_started_pid = None
+
+
+def warmup_mode():
+    mode = os.environ.get('TAXIFLOW_WARMUP', 'full')
+    return mode if mode in WARMUP_MODES else 'full'
+
+
+def _advise_file(path):
+    """提示内核预读整个文件，返回文件字节数；不支持 madvise 的平台退回顺序读取"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0
+    if not hasattr(mmap, 'MADV_WILLNEED'):
+        return read_file(path)
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        mapped.madvise(mmap.MADV_WILLNEED)
+    return size
+
+
+def warm_files():
+    total = 0
+    for path in index_files() + store_files() + visit_files() + sketch_files() + catalog_files():
+        total += _advise_file(path)
+    return total
+
+
+def warm_queries():
+    """打开索引与路径库并执行代表性查询，返回执行的查询数"""
+    queries = 0
+    if index_available():
+        # 有分片时查询落在第一个分片上，同时建立分片扫描线程池
+        min_lon, min_lat, min_time, max_lon, max_lat, max_time = index_bounds()
+        center_lon = (min_lon + max_lon) / 2
+        center_lat = (min_lat + max_lat) / 2
+        end_time = min(min_time + QUERY_WINDOW, max_time)
+        # 全城一小时（F4 密度分析的典型查询）
+        query_count((min_lon, min_lat, min_time, max_lon, max_lat, end_time))
+        # 市中心小范围一小时（F3/F5 的典型查询），取出对象以加载数据页
+        query_objects((center_lon - QUERY_HALF_SIZE, center_lat - QUERY_HALF_SIZE, min_time,
+                       center_lon + QUERY_HALF_SIZE, center_lat + QUERY_HALF_SIZE, end_time))
+        queries += 2
+    if os.path.exists(PATHS_DB):
+        with paths_db() as conn:
+            # F7 的典型查询
+            conn.execute('SELECT points, frequency, length FROM paths ORDER BY frequency DESC LIMIT 10').fetchall()
+            queries += 1
+    return queries
+
+
+def _run(mode):
+    start = time.perf_counter()
+    _status.update(mode=mode, state='running')
+    try:
+        _status['files_bytes'] = warm_files()
+        if mode == 'full':
+            _status['queries'] = warm_queries()
+        _status['state'] = 'done'
+    except Exception as e:
+        _status.update(state='failed', error=str(e))
+    _status['seconds'] = round(time.perf_counter() - start, 3)
+    print(f"预热{'完成' if _status['state'] == 'done' else '失败'}: {_status}")
+
+
+def start_warmup():
+    """在当前进程中启动一次后台预热；重复调用直接返回"""
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+        mode = warmup_mode()
+        if mode == 'off':
+            _status.update(mode=mode, state='skipped')
+            return
+        threading.Thread(target=_run, args=(mode,), name='index-warmup', daemon=True).start()
+
+
+def warmup_status():
+    return dict(_status)
+
+
+def init_warmup(app):
+    """每个进程处理第一个请求时启动预热（fork 之前启动的线程不会进入工作进程）"""
+    app.before_request(start_warmup)
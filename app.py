@@ -1,38 +1,78 @@
+import time
+STARTUP_BEGIN = time.perf_counter()
+
 from flask import Flask, jsonify
 from flask_cors import CORS
 
 app = Flask(__name__)
 CORS(app)
 
-# 导入并注册各个API模块
-from api.F1_taxi_routes import taxi_routes
-from api.F3_area_query import area_query  # 导入区域查询API蓝图
-from api.F4_density_analysis import density_bp  # 导入密度分析API蓝图
-from api.F5_area_relation import area_relation  # 导入区域关联分析API蓝图
-from api.F6_area_relation2 import area_relation2  # 导入区域关联分析2 API蓝图
-from api.F7_frequent_paths import frequent_paths  # 导入频繁路径分析API蓝图
-from api.F8_frequent_paths_ab import frequent_paths_ab_bp  # 导入A到B频繁路径分析API蓝图
-from api.F9_travel_time import travel_time  # 导入最短通行时间分析API蓝图
-# 导入其他API模块...
-
-app.register_blueprint(taxi_routes, url_prefix='/api/taxi_routes')
-app.register_blueprint(area_query, url_prefix='/api/area_query')  # 注册区域查询API蓝图
-app.register_blueprint(density_bp, url_prefix='/api/density')  # 注册密度分析API蓝图
-app.register_blueprint(area_relation, url_prefix='/api/area_relation')  # 注册区域关联分析API蓝图
-app.register_blueprint(area_relation2, url_prefix='/api/area_relation2')  # 注册区域关联分析2 API蓝图
-app.register_blueprint(travel_time, url_prefix='/api/travel_time')  # 注册最短通行时间分析API蓝图
-app.register_blueprint(frequent_paths_ab_bp, url_prefix='/api/frequent_paths_ab')  # 注册A到B频繁路径分析API蓝图
-app.register_blueprint(frequent_paths, url_prefix='/api/frequent_paths')  # 注册频繁路径分析API蓝图
+from api.lazy import register_lazy_blueprint, module_status
+from api.resources import resource_status
+from api.shards import shard_status
+from api.spatial import backend_status
+from api.visits import visit_status
+from api.sketches import sketch_status
+from api.catalog import catalog_status
+from api.bucket_cache import bucket_cache_status
+from api.jobs import jobs_bp  # 导入异步分析任务API蓝图
+from api.metrics import metrics_bp, init_metrics, reset_metrics  # 导入运行指标API蓝图
+from api.profiling import init_profiling  # 按请求剖析（TAXIFLOW_PROFILING=1 时开启）
+from api.warmup import init_warmup, start_warmup, warmup_status  # 索引后台预热
+
+# 功能模块依赖 NumPy、rtree 等较重的库，只注册路由占位，第一次请求时再导入
+LAZY_BLUEPRINTS = [
+    ('api.F1_taxi_routes', '/api/taxi_routes'),  # 轨迹查询
+    ('api.F3_area_query', '/api/area_query'),  # 区域查询
+    ('api.F4_density_analysis', '/api/density'),  # 密度分析
+    ('api.F5_area_relation', '/api/area_relation'),  # 区域关联分析
+    ('api.F6_area_relation2', '/api/area_relation2'),  # 区域关联分析2
+    ('api.F9_travel_time', '/api/travel_time'),  # 最短通行时间分析
+    ('api.F8_frequent_paths_ab', '/api/frequent_paths_ab'),  # A到B频繁路径分析
+    ('api.F7_frequent_paths', '/api/frequent_paths'),  # 频繁路径分析
+]
+for module_name, url_prefix in LAZY_BLUEPRINTS:
+    register_lazy_blueprint(app, module_name, url_prefix)
+
+app.register_blueprint(jobs_bp, url_prefix='/api/jobs')  # 注册异步分析任务API蓝图
+app.register_blueprint(metrics_bp, url_prefix='/api/metrics')  # 注册运行指标API蓝图
+init_metrics(app)  # 为所有请求注册计时钩子
+init_warmup(app)  # 每个进程收到第一个请求时开始后台预热
 # 注册其他Blueprint...
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'ok'})
+    """服务状态；ready 给出索引文件与各功能模块是否已加载"""
+    return jsonify({
+        'status': 'ok',
+        'startup_ms': round(STARTUP_SECONDS * 1000, 1),
+        'ready': {
+            'indexes': {**resource_status(), 'shards': shard_status(), 'backend': backend_status(),
+                        'visits': visit_status(), 'sketches': sketch_status(), 'catalog': catalog_status()},
+            'modules': module_status(),
+            'warmup': warmup_status(),
+        },
+        'bucket_cache': bucket_cache_status(),  # F3、F4 时间桶缓存的命中情况
+    })
+
+# 须在所有路由注册之后调用
+init_profiling(app)
+
+STARTUP_SECONDS = time.perf_counter() - STARTUP_BEGIN
 
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser(description='TaxiFlow API服务')
     parser.add_argument('--port', type=int, default=5000, help='服务端口号')
+    parser.add_argument('--workers', type=int, default=1, help='工作进程数，大于1时使用生产服务器（gunicorn/waitress）')
+    parser.add_argument('--preload-tracks', action='store_true', help='生产模式下同时预加载全部轨迹文件')
     args = parser.parse_args()
 
-    app.run(port=args.port)
+    # 之前运行留下的各进程指标快照不计入本次运行
+    reset_metrics()
+    if args.workers > 1:
+        from api.serving import serve
+        serve(app, port=args.port, workers=args.workers, preload_tracks=args.preload_tracks)
+    else:
+        start_warmup()
+        app.run(port=args.port)
@@ -3,6 +3,8 @@
  * 负责根据指定的网格大小，分析不同区域的车流密度变化
  */
 
+import { streamAnalysis } from './sseClient.js';
+
 // 存储当前分析网格图层
 let currentGridLayer = null;
 
@@ -73,23 +75,16 @@ export function analyzeDensity(map, startTime, endTime, gridSize) {
     // 显示加载提示
     showMessage('正在分析车流密度，可能需要一些时间...', 'info');
     
-    // 调用后端API进行密度分析
-    fetch('http://localhost:5000/api/density/analyze', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-            grid_size: Number(gridSize),
-            start_time: startTime,
-            end_time: endTime
-        })
-    })
-    .then(response => {
-        if (!response.ok) {
-            return response.json().then(err => Promise.reject(err));
+    // 调用后端流式接口进行密度分析，先显示已处理时间段的部分结果
+    streamAnalysis('http://localhost:5000/api/density/analyze/stream', {
+        grid_size: Number(gridSize),
+        start_time: startTime,
+        end_time: endTime
+    }, (event, data) => {
+        if (event === 'partial' && data.data.grid_data.length > 0) {
+            displayDensityGrid(map, data.data, true);
+            showMessage(`正在分析车流密度... ${data.chunk}/${data.chunks}，已处理至 ${data.processed_until}`, 'info');
         }
-        return response.json();
     })
     .then(result => {
         if (result.status === 'success') {
@@ -127,9 +122,15 @@ export function analyzeDensity(map, startTime, endTime, gridSize) {
  * 显示密度网格
  * @param {Object} map - 高德地图实例
  * @param {Object} data - 密度分析结果数据
+ * @param {boolean} isPartial - 是否为流式返回的部分结果（不调整视野、不提示完成）
  */
-function displayDensityGrid(map, data) {
+function displayDensityGrid(map, data, isPartial = false) {
     console.log('开始创建密度网格...');
+    // 流式分析时每次替换上一帧的网格
+    if (currentGridLayer) {
+        map.remove(currentGridLayer);
+        currentGridLayer = null;
+    }
     const polygons = [];
     
     if (!data.grid_data || !Array.isArray(data.grid_data)) {
@@ -220,7 +221,7 @@ function displayDensityGrid(map, data) {
         console.log('网格图层已添加到地图');
         
         // 调整视野以适应所有网格，但不限制地图范围
-        if (polygons.length > 0) {
+        if (polygons.length > 0 && !isPartial) {
             map.setFitView(polygons, false, [20, 20, 20, 20]);
             console.log('地图视野已调整到显示所有网格');
         }
@@ -228,7 +229,9 @@ function displayDensityGrid(map, data) {
         console.error('添加网格图层失败:', error);
     }
     
-    showMessage(`密度分析完成，共显示 ${polygons.length} 个网格`);
+    if (!isPartial) {
+        showMessage(`密度分析完成，共显示 ${polygons.length} 个网格`);
+    }
 }
 
 /**
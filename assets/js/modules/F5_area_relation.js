@@ -3,6 +3,8 @@
  * 区域关联分析模块 - 提供双区域间车流量分析功能
  */
 
+import { runAnalysisJob } from './jobClient.js';
+
 // 存储当前的两个查询区域
 let areaA = null;
 let areaB = null;
@@ -171,27 +173,16 @@ export function executeAreaRelationAnalysis(map) {
         },
         start_time: startTimeInput,
         end_time: endTimeInput,
-        interval: parseInt(intervalInput)
+        interval: parseInt(intervalInput),
+        mode: document.getElementById('f5_mode').value
     };
 
     // 显示加载提示
     showMessage("正在分析区域间流量，请稍候...", "info");
 
-    // 调用后端API进行分析
-    fetch('http://localhost:5000/api/area_relation/analyze', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify(queryData)
-    })
-    .then(response => {
-        if (!response.ok) {
-            return response.json().then(errData => {
-                throw new Error(errData.error || `服务器错误: ${response.status}`);
-            });
-        }
-        return response.json();
+    // 以异步任务方式调用后端分析，轮询显示进度
+    runAnalysisJob('area_relation', queryData, job => {
+        showMessage(`正在分析区域间流量（${job.phase}，已扫描 ${job.points_scanned} 个点）`, "info");
     })
     .then(data => {
         // 分析成功，显示结果
@@ -2,6 +2,8 @@
  * 区域关联分析2模块 - 提供单区域与其他区域间车流量分析功能
  */
 
+import { runAnalysisJob } from './jobClient.js';
+
 // 存储当前的查询区域
 let targetRect = null;
 let drawTool = null;
@@ -156,21 +158,9 @@ export function executeAreaRelation2Analysis(map) {
     // 显示加载提示
     showMessage("正在分析区域流量，请稍候...", "info");
 
-    // 调用后端API进行分析
-    fetch('http://localhost:5000/api/area_relation2/analyze', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify(queryData)
-    })
-    .then(response => {
-        if (!response.ok) {
-            return response.json().then(errData => {
-                throw new Error(errData.error || `服务器错误: ${response.status}`);
-            });
-        }
-        return response.json();
+    // 以异步任务方式调用后端分析，轮询显示进度
+    runAnalysisJob('area_relation2', queryData, job => {
+        showMessage(`正在分析区域流量（${job.phase}，已扫描 ${job.points_scanned} 个点）`, "info");
     })
     .then(data => {
         // 分析成功，显示结果
@@ -215,7 +215,8 @@ export function analyzeTravelTime(map) {
             max_lat: northeastB.lat
         },
         start_time: startTimeInput,
-        end_time: endTimeInput
+        end_time: endTimeInput,
+        mode: document.getElementById('f9_mode').value
     };
 
     // 显示加载提示
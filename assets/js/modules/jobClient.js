@@ -0,0 +1,53 @@
+/**
+ * 异步分析任务客户端
+ * 提交耗时分析后轮询进度，避免单个fetch长时间挂起
+ */
+
+const JOB_API = 'http://localhost:5000/api/jobs';
+const POLL_INTERVAL = 500; // 轮询间隔(毫秒)
+
+/**
+ * 提交分析任务并等待结果
+ * @param {string} type - 任务类型，如 area_relation、density_time_series
+ * @param {Object} params - 与同步接口相同的请求参数
+ * @param {Function} onProgress - 进度回调，参数为任务状态 {phase, points_scanned, ...}
+ * @returns {Promise<Object>} 分析结果
+ */
+export async function runAnalysisJob(type, params, onProgress) {
+    const submitResponse = await fetch(JOB_API, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ type, params })
+    });
+    const submitData = await submitResponse.json();
+    if (!submitResponse.ok) {
+        throw new Error(submitData.error || `服务器错误: ${submitResponse.status}`);
+    }
+
+    const jobId = submitData.job_id;
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, POLL_INTERVAL));
+        const resultResponse = await fetch(`${JOB_API}/${jobId}/result`);
+        const resultData = await resultResponse.json();
+        if (resultResponse.status === 202) {
+            if (onProgress) {
+                onProgress(resultData);
+            }
+            continue;
+        }
+        if (!resultResponse.ok) {
+            throw new Error(resultData.error || resultData.message || `服务器错误: ${resultResponse.status}`);
+        }
+        return resultData;
+    }
+}
+
+/**
+ * 取消分析任务
+ * @param {string} jobId - 任务ID
+ */
+export function cancelAnalysisJob(jobId) {
+    return fetch(`${JOB_API}/${jobId}`, { method: 'DELETE' });
+}
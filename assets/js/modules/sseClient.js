@@ -0,0 +1,78 @@
+/**
+ * 流式分析客户端
+ * 通过 fetch 读取后端 /analyze/stream 接口返回的 Server-Sent Events，
+ * 每收到一个事件就回调一次，用于在分析完成前先显示部分结果
+ */
+
+/**
+ * 解析一段 SSE 文本块
+ * @param {string} block - 以空行分隔的单个事件文本
+ * @returns {{event: string, data: Object}|null}
+ */
+function parseEvent(block) {
+    let event = 'message';
+    const dataLines = [];
+    for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) {
+            event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trim());
+        }
+    }
+    if (dataLines.length === 0) {
+        return null;
+    }
+    return { event, data: JSON.parse(dataLines.join('\n')) };
+}
+
+/**
+ * 发起流式分析请求
+ * @param {string} url - 流式接口地址
+ * @param {Object} body - 与同步接口相同的请求参数
+ * @param {Function} onEvent - 事件回调，参数为 (event, data)，event 为 meta/partial/done/error
+ * @returns {Promise<Object>} done 事件的数据
+ */
+export async function streamAnalysis(url, body, onEvent) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(body)
+    });
+    if (!response.ok) {
+        const err = await response.json().catch(() => ({}));
+        throw new Error(err.error || err.message || `服务器错误: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        let separator;
+        while ((separator = buffer.indexOf('\n\n')) >= 0) {
+            const parsed = parseEvent(buffer.slice(0, separator));
+            buffer = buffer.slice(separator + 2);
+            if (!parsed) {
+                continue;
+            }
+            if (parsed.event === 'error') {
+                throw new Error(parsed.data.error || '分析失败');
+            }
+            if (onEvent) {
+                onEvent(parsed.event, parsed.data);
+            }
+            if (parsed.event === 'done') {
+                reader.cancel();
+                return parsed.data;
+            }
+        }
+    }
+    throw new Error('连接在分析完成前中断');
+}
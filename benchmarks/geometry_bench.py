@@ -0,0 +1,96 @@
+"""
+路径长度计算基准：逐点标量循环 vs 逐路径数组 vs 不等长批量(reduceat) vs 等距圆柱近似
+
+用法:
+    python benchmarks/geometry_bench.py --paths 20000 --output geometry.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.geometry import haversine_distance, batch_path_lengths
+
+
+def make_paths(n_paths, seed=0):
+    """生成北京范围内长度 5~16 点、步长约 200 米的随机路径"""
+    rng = np.random.default_rng(seed)
+    paths = []
+    for _ in range(n_paths):
+        n = int(rng.integers(5, 17))
+        start = [rng.uniform(116.0, 116.8), rng.uniform(39.6, 40.2)]
+        steps = rng.choice([-0.002, 0.0, 0.002], size=(n - 1, 2))
+        paths.append(np.vstack([start, start + np.cumsum(steps, axis=0)]).round(6).tolist())
+    return paths
+
+
+def legacy_scalar(paths):
+    """原 calculate_path_length：逐线段调用标量 haversine"""
+    results = []
+    for points in paths:
+        total = 0
+        for i in range(len(points) - 1):
+            total += haversine_distance(points[i][0], points[i][1], points[i + 1][0], points[i + 1][1])
+        results.append(total)
+    return np.array(results, dtype=np.float64)
+
+
+def legacy_per_path(paths):
+    """原 batch_path_lengths：每条路径单独建数组"""
+    results = []
+    for pts in paths:
+        pts = np.array(pts)
+        results.append(np.sum(haversine_distance(pts[:-1, 0], pts[:-1, 1], pts[1:, 0], pts[1:, 1])))
+    return np.array(results, dtype=np.float64)
+
+
+def timed(func, paths, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(paths)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='路径长度计算基准')
+    parser.add_argument('--paths', type=int, default=20000, help='路径数量')
+    parser.add_argument('--repeat', type=int, default=3, help='每种方法重复次数（取最快）')
+    parser.add_argument('--output', help='结果 JSON 输出路径')
+    args = parser.parse_args()
+
+    paths = make_paths(args.paths)
+    methods = {
+        'scalar_loop': legacy_scalar,
+        'per_path_array': legacy_per_path,
+        'ragged_haversine': lambda p: batch_path_lengths(p),
+        'ragged_equirectangular': lambda p: batch_path_lengths(p, approximate=True),
+    }
+
+    reference = None
+    results = {'paths': args.paths, 'methods': {}}
+    for name, func in methods.items():
+        seconds, lengths = timed(func, paths, args.repeat)
+        if reference is None:
+            reference = lengths
+        nonzero = reference > 0
+        max_rel_error = float(np.max(np.abs(lengths[nonzero] - reference[nonzero]) / reference[nonzero])) if nonzero.any() else 0.0
+        results['methods'][name] = {
+            'seconds': seconds,
+            'paths_per_second': args.paths / seconds if seconds > 0 else None,
+            'max_relative_error': max_rel_error,
+        }
+        print(f"{name:<24} {seconds * 1000:10.2f} ms   最大相对误差 {max_rel_error:.2e}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,364 @@
+"""
+端到端性能基准
+
+1. 用 synthetic_data 生成指定规模的合成轨迹（参数相同时复用已生成的数据）
+2. 调用 DataProcess 中的构建脚本生成 R 树索引与频繁路径库，记录构建耗时；
+   指定 --shard-hours 时同时构建按时间分片的索引，接口查询改走分片；列式点存储总是构建，
+   --backend 选择 F3~F6、F9 查询所用的后端（rtree 或 columnar）
+3. 启动后端进程，记录从启动到 /api/health 首次响应的冷启动时间
+4. 通过 Flask 测试客户端在进程内依次请求 F1、F3~F9 各接口，记录耗时与 Server-Timing 分解
+
+结果写为 JSON，可用 --compare 与其他提交上的结果对比。接口在进程内调用，不含 HTTP 传输开销；
+F7/F8 的查询缓存在每次请求前清空，测得的是未命中缓存的耗时。
+
+用法:
+    python benchmarks/run_benchmarks.py --taxis 1000 --output bench_1k.json
+    python benchmarks/run_benchmarks.py --taxis 1000 --skip-build --compare bench_1k.json
+    python benchmarks/run_benchmarks.py --taxis 1000 --days 7 --shard-hours 24 --compare bench_1k.json
+    python benchmarks/run_benchmarks.py --taxis 1000 --skip-build --backend columnar --compare bench_1k.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import socket
+import platform
+import argparse
+import subprocess
+import contextlib
+import statistics
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+WORK_ROOT = os.path.join(BENCH_DIR, '.work')
+
+sys.path.insert(0, BENCH_DIR)
+from synthetic_data import generate_dataset
+
+QUERY_HALF_SIZE = 0.004  # 热点查询矩形的半边长（度），约400米
+LARGE_HALF_SIZE = 0.05   # 大范围区域查询的半边长（度），约5公里
+TILE_ZOOM = 12           # 密度瓦片的缩放级别
+BATCH_TAXIS = 200        # 批量轨迹查询的出租车数
+STARTUP_TIMEOUT = 60     # 等待后端启动的最长时间（秒）
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_dataset(work_dir, taxis, days, seed, workers, regenerate):
+    """生成合成数据；已有相同参数的数据时直接复用，返回 (数据集描述, 生成耗时)"""
+    meta_path = os.path.join(work_dir, 'synthetic.json')
+    if not regenerate and os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            dataset = json.load(f)
+        if (dataset['taxis'], dataset['days'], dataset['seed']) == (taxis, days, seed):
+            return dataset, None
+    shutil.rmtree(work_dir, ignore_errors=True)
+    start = time.perf_counter()
+    dataset = generate_dataset(work_dir, taxis, days, seed, workers)
+    return dataset, time.perf_counter() - start
+
+
+def run_builder(name, args, work_dir):
+    """以子进程运行 DataProcess 构建脚本，返回耗时；输出写入 work_dir/<name>.log"""
+    log_path = os.path.join(work_dir, f'{name}.log')
+    start = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        # 3DRTree.py 在导入时会在当前目录下尝试创建临时目录，因此在工作目录中运行
+        result = subprocess.run([sys.executable] + args, cwd=work_dir, stdout=log, stderr=subprocess.STDOUT)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f'{name} 构建失败，详见 {log_path}')
+    return elapsed
+
+
+def build_data(work_dir, shard_hours=0):
+    log_dir = os.path.join(work_dir, 'taxi_log_2008_by_id')
+    index_base = os.path.join(work_dir, 'taxi_rtree')
+    shard_dir = os.path.join(work_dir, 'taxi_rtree_shards')
+    column_dir = os.path.join(work_dir, 'taxi_columns')
+    visit_dir = os.path.join(work_dir, 'taxi_visits')
+    trips_db = os.path.join(work_dir, 'taxi_trips.sqlite')
+    sketch_dir = os.path.join(work_dir, 'taxi_sketches')
+    rank_dir = os.path.join(work_dir, 'track_ranks')
+    catalog_dir = os.path.join(work_dir, 'taxi_catalog')
+    db_path = os.path.join(work_dir, 'all_paths_from_pkl.sqlite')
+    for path in (index_base + '.idx', index_base + '.dat', db_path):
+        if os.path.exists(path):
+            os.remove(path)
+    # 存在分片清单时接口优先查询分片，不分片的运行须删除上次构建的分片
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    process_dir = os.path.join(PROJECT_ROOT, 'DataProcess')
+    builders = {
+        'rtree': run_builder('rtree', [os.path.join(process_dir, '3DRTree.py'),
+                                       '--data-dir', log_dir, '--index', index_base], work_dir),
+        'paths_db': run_builder('paths_db', [os.path.join(process_dir, 'topk_path_miner.py'),
+                                             '--data-dir', log_dir, '--db', db_path], work_dir),
+        'columns': run_builder('columns', [os.path.join(process_dir, 'build_columnar.py'),
+                                           '--data-dir', log_dir, '--output', column_dir], work_dir),
+        'visits': run_builder('visits', [os.path.join(process_dir, 'build_visit_index.py'),
+                                         '--data-dir', log_dir, '--output', visit_dir], work_dir),
+        'trips': run_builder('trips', [os.path.join(process_dir, 'build_trips.py'),
+                                       '--data-dir', log_dir, '--db', trips_db], work_dir),
+        'sketches': run_builder('sketches', [os.path.join(process_dir, 'build_taxi_sketches.py'),
+                                             '--data-dir', log_dir, '--output', sketch_dir], work_dir),
+        'track_ranks': run_builder('track_ranks', [os.path.join(process_dir, 'build_track_ranks.py'),
+                                                   '--data-dir', log_dir, '--output', rank_dir], work_dir),
+        'catalog': run_builder('catalog', [os.path.join(process_dir, 'build_taxi_catalog.py'),
+                                           '--data-dir', log_dir, '--output', catalog_dir], work_dir),
+    }
+    if shard_hours:
+        builders['rtree_shards'] = run_builder('rtree_shards', [
+            os.path.join(process_dir, 'build_rtree_shards.py'), '--data-dir', log_dir,
+            '--output', shard_dir, '--shard-hours', str(shard_hours)], work_dir)
+    return builders
+
+
+def measure_startup(work_dir, backend):
+    """启动 app.py 子进程，返回从启动到 /api/health 首次响应的秒数及健康检查内容"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    env = dict(os.environ, TAXIFLOW_DATA_DIR=work_dir, TAXIFLOW_INDEX_BACKEND=backend)
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(PROJECT_ROOT, 'app.py'), '--port', str(port)],
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < STARTUP_TIMEOUT:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=1) as response:
+                    health = json.load(response)
+                return {'seconds': time.perf_counter() - start, 'startup_ms': health.get('startup_ms')}
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError('后端启动超时')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def rect_around(spot, half_size=QUERY_HALF_SIZE):
+    return {
+        'min_lon': spot[0] - half_size, 'min_lat': spot[1] - half_size,
+        'max_lon': spot[0] + half_size, 'max_lat': spot[1] + half_size,
+    }
+
+
+def polygon_around(spot, sides=8):
+    """热点周围的正多边形（GeoJSON），外接圆半径与 rect_around 的半边长相同"""
+    ring = [[spot[0] + QUERY_HALF_SIZE * math.cos(2 * math.pi * i / sides),
+             spot[1] + QUERY_HALF_SIZE * math.sin(2 * math.pi * i / sides)] for i in range(sides)]
+    return {'type': 'Polygon', 'coordinates': [ring]}
+
+
+def tile_url(spot, dx=0):
+    """热点所在（向东平移 dx 个瓦片）的 TILE_ZOOM 级密度瓦片，时间窗为首日上午"""
+    scale = 1 << TILE_ZOOM
+    x = int((spot[0] + 180) / 360 * scale) + dx
+    lat = math.radians(spot[1])
+    y = int((1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2 * scale)
+    return (f'/api/density/tiles/{TILE_ZOOM}/{x}/{y}'
+            '?start_time=2008-02-02%2008:00:00&end_time=2008-02-02%2012:00:00')
+
+
+def endpoint_cases(dataset):
+    """根据数据集的热点构造各接口的请求：A、B 为最热门的两个热点，时间窗为首日上午
+
+    第五项为可选的预热请求 (路径, 请求体)，不计时：*_extended 先请求缩短一小时的时间窗，
+    再计时完整时间窗，衡量时间桶缓存（api/bucket_cache.py）下只扫描新增部分的耗时；
+    F4_density_tile_pan 先请求相邻的瓦片，衡量平移地图时的耗时。
+    """
+    area_a = rect_around(dataset['hotspots'][0])
+    area_b = rect_around(dataset['hotspots'][1])
+    window = {'start_time': '2008-02-02T08:00', 'end_time': '2008-02-02T12:00'}
+    large = {**rect_around(dataset['hotspots'][0], LARGE_HALF_SIZE),
+             'start_time': '2008-02-02T00:00', 'end_time': '2008-02-03T00:00'}
+    return [
+        ('F1_taxi_routes', 'GET', '/api/taxi_routes/1', None),
+        ('F1_taxi_routes_zoom11', 'GET', '/api/taxi_routes/1?zoom=11', None),
+        ('F1_taxi_routes_batch', 'POST', '/api/taxi_routes/batch',
+         {'taxi_ids': list(range(1, BATCH_TAXIS + 1)), **window}),
+        ('F1_taxi_list', 'GET', '/api/taxi_routes?sort=points&order=desc&min_lon={}&min_lat={}&max_lon={}&max_lat={}'
+         .format(area_a['min_lon'], area_a['min_lat'], area_a['max_lon'], area_a['max_lat']), None),
+        ('F3_area_query', 'POST', '/api/area_query/rectangle', {**area_a, **window}),
+        ('F3_area_query_polygon', 'POST', '/api/area_query/polygon',
+         {'region': polygon_around(dataset['hotspots'][0]), **window}),
+        ('F3_area_query_extended', 'POST', '/api/area_query/rectangle', {**area_a, **window},
+         ('/api/area_query/rectangle', {**area_a, **window, 'end_time': '2008-02-02T11:00'})),
+        ('F3_area_query_large', 'POST', '/api/area_query/rectangle', large),
+        ('F3_area_query_large_exact', 'POST', '/api/area_query/rectangle', {**large, 'exact': True}),
+        ('F4_density', 'POST', '/api/density/analyze',
+         {'grid_size': 500, 'start_time': '2008-02-02 08:00:00', 'end_time': '2008-02-02 09:00:00'}),
+        ('F4_density_time_series', 'POST', '/api/density/analyze/time-series',
+         {'grid_size': 500, 'start_time': '2008-02-02 08:00:00', 'end_time': '2008-02-02 12:00:00', 'interval': 30}),
+        ('F4_density_extended', 'POST', '/api/density/analyze',
+         {'grid_size': 500, 'start_time': '2008-02-02 08:00:00', 'end_time': '2008-02-02 12:00:00'},
+         ('/api/density/analyze',
+          {'grid_size': 500, 'start_time': '2008-02-02 08:00:00', 'end_time': '2008-02-02 11:00:00'})),
+        ('F4_density_tile', 'GET', tile_url(dataset['hotspots'][0]), None),
+        ('F4_density_tile_pan', 'GET', tile_url(dataset['hotspots'][0]), None,
+         (tile_url(dataset['hotspots'][0], -1), None)),
+        ('F5_area_relation', 'POST', '/api/area_relation/analyze',
+         {'area_a': area_a, 'area_b': area_b, **window, 'interval': 30}),
+        ('F5_area_relation_trips', 'POST', '/api/area_relation/analyze',
+         {'area_a': area_a, 'area_b': area_b, **window, 'interval': 30, 'mode': 'trips'}),
+        ('F6_area_relation2', 'POST', '/api/area_relation2/analyze', {'inner_rect': area_a, **window}),
+        ('F7_frequent_paths', 'POST', '/api/frequent_paths/analyze', {'k': 10, 'min_distance': 500}),
+        ('F8_frequent_paths_ab', 'POST', '/api/frequent_paths_ab/analyze_ab', {
+            'k': 10,
+            'rect_a': [area_a['min_lon'], area_a['min_lat'], area_a['max_lon'], area_a['max_lat']],
+            'rect_b': [area_b['min_lon'], area_b['min_lat'], area_b['max_lon'], area_b['max_lat']],
+        }),
+        ('F9_travel_time', 'POST', '/api/travel_time/analyze', {'area_a': area_a, 'area_b': area_b, **window}),
+        ('F9_travel_time_trips', 'POST', '/api/travel_time/analyze',
+         {'area_a': area_a, 'area_b': area_b, **window, 'mode': 'trips'}),
+    ]
+
+
+def parse_server_timing(header):
+    timings = {}
+    for entry in (header or '').split(','):
+        name, _, params = entry.strip().partition(';')
+        if params.startswith('dur='):
+            timings[name] = float(params[4:])
+    return timings
+
+
+def bench_endpoints(work_dir, dataset, repeat, backend):
+    # 必须在导入 app 之前指定数据目录；预热改为在计时前同步执行，避免后台预热干扰计时
+    os.environ['TAXIFLOW_DATA_DIR'] = work_dir
+    os.environ['TAXIFLOW_WARMUP'] = 'off'
+    os.environ['TAXIFLOW_INDEX_BACKEND'] = backend
+    sys.path.insert(0, PROJECT_ROOT)
+    from app import app
+    from api.lazy import preload_modules
+    from api.warmup import warm_files, warm_queries
+    from api.bucket_cache import clear_cache
+    from api.density_tiles import clear_pyramids
+    # 模块导入耗时已计入冷启动，接口计时只统计查询本身
+    preload_modules()
+    start = time.perf_counter()
+    warm_files()
+    warm_queries()
+    warmup_seconds = time.perf_counter() - start
+    print(f"索引预热 {warmup_seconds * 1000:9.1f} ms")
+
+    client = app.test_client()
+    results = {}
+    for name, method, url, body, *prime in endpoint_cases(dataset):
+        durations = []
+        status = None
+        timing = {}
+        for _ in range(repeat):
+            for cache_dir in ('f7_query_cache', 'f8_query_cache', 'density_tiles'):
+                shutil.rmtree(os.path.join(work_dir, cache_dir), ignore_errors=True)
+            clear_cache()
+            clear_pyramids()
+            # 各接口会打印调试信息，计时期间丢弃
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                if prime:
+                    prime_url, prime_body = prime[0]
+                    client.open(prime_url, method=method, json=prime_body)
+                start = time.perf_counter()
+                response = client.open(url, method=method, json=body)
+                durations.append(time.perf_counter() - start)
+            status = response.status_code
+            timing = parse_server_timing(response.headers.get('Server-Timing'))
+        results[name] = {
+            'status': status,
+            'runs': durations,
+            'min': min(durations),
+            'median': statistics.median(durations),
+            'mean': statistics.mean(durations),
+            'server_timing_ms': timing,
+        }
+        print(f"{name:<26} {status}  中位数 {results[name]['median'] * 1000:9.1f} ms")
+    return results, warmup_seconds
+
+
+def compare(baseline_path, current):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\n对比基准 {baseline_path}（提交 {baseline.get('commit')}）:")
+    print(f"{'项目':<26} {'基准(ms)':>10} {'当前(ms)':>10} {'比值':>7}")
+    rows = [(f'build:{name}', baseline.get('builders', {}).get(name), seconds)
+            for name, seconds in current.get('builders', {}).items()]
+    if 'startup' in current:
+        rows.append(('startup', baseline.get('startup', {}).get('seconds'), current['startup']['seconds']))
+    rows += [(name, baseline.get('endpoints', {}).get(name, {}).get('median'), result['median'])
+             for name, result in current['endpoints'].items()]
+    for name, old, new in rows:
+        if old is None or new is None:
+            continue
+        ratio = new / old if old else float('inf')
+        print(f"{name:<26} {old * 1000:10.1f} {new * 1000:10.1f} {ratio:7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TaxiFlow 端到端性能基准')
+    parser.add_argument('--taxis', type=int, default=1000, help='合成出租车数量（建议 1000~100000）')
+    parser.add_argument('--days', type=int, default=1, help='合成数据天数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--workers', type=int, default=None, help='生成数据的进程数')
+    parser.add_argument('--repeat', type=int, default=3, help='每个接口的请求次数')
+    parser.add_argument('--work-dir', default=None, help='数据目录，默认 benchmarks/.work/<规模>')
+    parser.add_argument('--regenerate', action='store_true', help='忽略已有数据，重新生成')
+    parser.add_argument('--skip-build', action='store_true', help='复用已构建的索引与路径库')
+    parser.add_argument('--shard-hours', type=float, default=0, help='同时构建按时间分片的索引，分片时长（小时），0 表示不分片')
+    parser.add_argument('--backend', choices=('rtree', 'columnar'), default='rtree', help='F3~F6、F9 的查询后端')
+    parser.add_argument('--output', default=None, help='结果 JSON 路径')
+    parser.add_argument('--compare', default=None, help='与之前的结果 JSON 对比')
+    args = parser.parse_args()
+
+    work_dir = os.path.abspath(args.work_dir or os.path.join(
+        WORK_ROOT, f'taxis{args.taxis}_days{args.days}_seed{args.seed}'))
+
+    dataset, generate_seconds = prepare_dataset(work_dir, args.taxis, args.days, args.seed,
+                                                args.workers, args.regenerate)
+    print(f"数据集: {dataset['taxis']} 辆车, {dataset['points']} 个轨迹点 ({work_dir})")
+
+    builders = {}
+    if not args.skip_build or generate_seconds is not None:
+        builders = build_data(work_dir, args.shard_hours)
+        for name, seconds in builders.items():
+            print(f"构建 {name:<20} {seconds:9.2f} s")
+
+    print(f"查询后端: {args.backend}")
+    startup = measure_startup(work_dir, args.backend)
+    print(f"冷启动至首次响应 {startup['seconds'] * 1000:9.1f} ms（应用初始化 {startup['startup_ms']} ms）")
+
+    endpoints, warmup_seconds = bench_endpoints(work_dir, dataset, args.repeat, args.backend)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'dataset': {key: dataset[key] for key in ('taxis', 'days', 'seed', 'points')},
+        'generate_seconds': generate_seconds,
+        'builders': builders,
+        'shard_hours': args.shard_hours,
+        'backend': args.backend,
+        'startup': startup,
+        'warmup_seconds': warmup_seconds,
+        'repeat': args.repeat,
+        'endpoints': endpoints,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+    if args.compare:
+        compare(args.compare, report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+北京出租车轨迹合成数据生成器
+
+按 taxi_log_2008_by_id 的格式（每辆车一个 <id>.txt，每行 "id,YYYY-MM-DD HH:MM:SS,经度,纬度"）
+生成可复现的合成轨迹：车辆在若干热点之间沿约200米的网格道路行驶，热点按热度加权选择，
+使热门线路上形成频繁路径；到达后原地停留若干采样（带GPS噪声），偶尔出现超过30分钟的
+收车间隔。同一 seed 下每辆车的轨迹与进程数无关。
+
+用法:
+    python benchmarks/synthetic_data.py --taxis 1000 --days 1 --output benchmarks/.work/demo
+"""
+import os
+import json
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+START_TIME = np.datetime64('2008-02-02T00:00:00')
+BEIJING_CENTER = (116.397428, 39.90923)
+BEIJING_BOUNDS = (116.0, 39.6, 116.8, 40.2)  # min_lon, min_lat, max_lon, max_lat
+STEP = 0.002           # 道路网格间距（度），与路径挖掘的网格一致
+N_HOTSPOTS = 24        # 热点数量
+GPS_NOISE = 0.0001     # GPS 噪声标准差（度）
+DRIVE_INTERVAL = (60, 300)    # 行驶中的采样间隔（秒），与 T-Drive 平均约177秒接近
+STAY_INTERVAL = (60, 300)     # 停留时的采样间隔（秒）
+STAY_SAMPLES = (2, 10)        # 每次停留的采样数
+OFF_SHIFT_PROB = 0.05         # 每次到达后收车的概率
+OFF_SHIFT_GAP = (1800, 4 * 3600)  # 收车间隔（秒）
+TAXIS_PER_TASK = 200   # 每个进程任务生成的车辆数
+
+
+def hotspots(seed=0, count=N_HOTSPOTS):
+    """按 seed 生成热点坐标（对齐到道路网格）与选择概率"""
+    rng = np.random.default_rng(seed)
+    spots = np.array(BEIJING_CENTER) + rng.normal(0, [0.08, 0.06], size=(count, 2))
+    spots[:, 0] = np.clip(spots[:, 0], BEIJING_BOUNDS[0] + STEP, BEIJING_BOUNDS[2] - STEP)
+    spots[:, 1] = np.clip(spots[:, 1], BEIJING_BOUNDS[1] + STEP, BEIJING_BOUNDS[3] - STEP)
+    spots = np.round(spots / STEP) * STEP
+    # 热度按排名的倒数分布，少数热点承担大部分出行
+    weights = 1.0 / np.arange(1, count + 1)
+    return spots, weights / weights.sum()
+
+
+def route(origin, dest):
+    """两点间的网格道路路线：先沿经度方向，再沿纬度方向，包含起终点"""
+    n_lon = int(round((dest[0] - origin[0]) / STEP))
+    n_lat = int(round((dest[1] - origin[1]) / STEP))
+    lon_steps = np.arange(1, abs(n_lon) + 1) * np.sign(n_lon) * STEP
+    lat_steps = np.arange(1, abs(n_lat) + 1) * np.sign(n_lat) * STEP
+    leg1 = np.column_stack([origin[0] + lon_steps, np.full(len(lon_steps), origin[1])])
+    corner_lon = origin[0] + n_lon * STEP
+    leg2 = np.column_stack([np.full(len(lat_steps), corner_lon), origin[1] + lat_steps])
+    return np.vstack([[origin], leg1, leg2])
+
+
+def generate_taxi(taxi_id, seed, days, spots, weights):
+    """生成单辆车的轨迹，返回 (相对 START_TIME 的秒数, 经度, 纬度)"""
+    rng = np.random.default_rng([seed, taxi_id])
+    end = days * 86400
+    t = rng.uniform(0, 3600)
+    current = rng.choice(len(spots), p=weights)
+    times, coords = [], []
+    while t < end:
+        dest = rng.choice(len(spots), p=weights)
+        if dest == current:
+            continue
+        drive = route(spots[current], spots[dest])
+        stay = np.repeat(spots[dest][None, :], rng.integers(*STAY_SAMPLES), axis=0)
+        intervals = np.concatenate([
+            rng.uniform(*DRIVE_INTERVAL, size=len(drive)),
+            rng.uniform(*STAY_INTERVAL, size=len(stay)),
+        ])
+        times.append(t + np.cumsum(intervals) - intervals[0])
+        coords.append(np.vstack([drive, stay]))
+        t = times[-1][-1] + rng.uniform(*DRIVE_INTERVAL)
+        if rng.random() < OFF_SHIFT_PROB:
+            t += rng.uniform(*OFF_SHIFT_GAP)
+        current = dest
+
+    times = np.concatenate(times)
+    coords = np.vstack(coords) + rng.normal(0, GPS_NOISE, size=(len(times), 2))
+    keep = times < end
+    return times[keep], coords[keep, 0], coords[keep, 1]
+
+
+def write_taxi(path, taxi_id, times, lons, lats):
+    time_strs = np.datetime_as_string(START_TIME + times.astype('timedelta64[s]'), unit='s')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(''.join(f"{taxi_id},{ts.replace('T', ' ')},{lon:.5f},{lat:.5f}\n"
+                        for ts, lon, lat in zip(time_strs, lons, lats)))
+
+
+def _generate_range(first_id, last_id, seed, days, log_dir):
+    spots, weights = hotspots(seed)
+    points = 0
+    for taxi_id in range(first_id, last_id + 1):
+        times, lons, lats = generate_taxi(taxi_id, seed, days, spots, weights)
+        write_taxi(os.path.join(log_dir, f'{taxi_id}.txt'), taxi_id, times, lons, lats)
+        points += len(times)
+    return points
+
+
+def generate_dataset(output_dir, taxis=1000, days=1, seed=0, workers=None):
+    """在 output_dir/taxi_log_2008_by_id 下生成 taxis 辆车的轨迹，返回数据集描述"""
+    log_dir = os.path.join(output_dir, 'taxi_log_2008_by_id')
+    os.makedirs(log_dir, exist_ok=True)
+    ranges = [(first, min(first + TAXIS_PER_TASK - 1, taxis))
+              for first in range(1, taxis + 1, TAXIS_PER_TASK)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_generate_range, first, last, seed, days, log_dir)
+                   for first, last in ranges]
+        points = sum(future.result() for future in futures)
+
+    spots, _ = hotspots(seed)
+    dataset = {
+        'taxis': taxis,
+        'days': days,
+        'seed': seed,
+        'points': points,
+        'start_time': str(START_TIME).replace('T', ' '),
+        'hotspots': spots.tolist(),
+    }
+    with open(os.path.join(output_dir, 'synthetic.json'), 'w', encoding='utf-8') as f:
+        json.dump(dataset, f, indent=2)
+    return dataset
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成出租车轨迹数据')
+    parser.add_argument('--taxis', type=int, default=1000, help='出租车数量')
+    parser.add_argument('--days', type=int, default=1, help='生成的天数（从 2008-02-02 开始）')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--workers', type=int, default=None, help='生成数据的进程数')
+    parser.add_argument('--output', required=True, help='输出目录，轨迹写入其下的 taxi_log_2008_by_id')
+    args = parser.parse_args()
+
+    dataset = generate_dataset(args.output, args.taxis, args.days, args.seed, args.workers)
+    print(f"已生成 {dataset['taxis']} 辆车、{dataset['points']} 个轨迹点: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
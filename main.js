@@ -4,7 +4,9 @@
 
 const { app, BrowserWindow, Menu } = require('electron');
 const path = require('path');
+const os = require('os');
 const { spawn } = require('child_process');
+const http = require('http');
 
 // 保持对窗口对象的全局引用，避免JavaScript对象被垃圾回收时窗口关闭
 let mainWindow;
@@ -155,9 +157,15 @@ function showAboutDialog() {
   });
 }
 
-function startPythonServer() {
+function startPythonServer(isDev) {
   const pythonExecutable = process.platform === 'win32' ? 'python' : 'python3';
-  pythonProcess = spawn(pythonExecutable, [path.join(__dirname, 'app.py')]);
+  const args = [path.join(__dirname, 'app.py')];
+  // 非开发模式使用多进程生产服务器，避免重查询相互阻塞
+  if (!isDev) {
+    const workers = Math.max(2, Math.min(os.cpus().length, 8));
+    args.push('--workers', String(workers));
+  }
+  pythonProcess = spawn(pythonExecutable, args);
 
   pythonProcess.stdout.on('data', (data) => {
     console.log(`Flask服务输出: ${data}`);
@@ -168,9 +176,45 @@ function startPythonServer() {
   });
 }
 
+/**
+ * 轮询后端健康检查接口，直到服务可以响应或超时
+ * @param {number} timeoutMs - 最长等待时间(毫秒)，超时后仍然打开窗口
+ */
+function waitForServer(timeoutMs = 20000) {
+  const deadline = Date.now() + timeoutMs;
+  return new Promise((resolve) => {
+    const poll = () => {
+      const req = http.get('http://localhost:5000/api/health', (res) => {
+        res.resume();
+        if (res.statusCode === 200) {
+          resolve(true);
+        } else {
+          retry();
+        }
+      });
+      req.on('error', retry);
+      req.setTimeout(1000, () => req.destroy());
+    };
+    const retry = () => {
+      if (Date.now() >= deadline) {
+        console.error('等待Flask服务启动超时');
+        resolve(false);
+      } else {
+        setTimeout(poll, 100);
+      }
+    };
+    poll();
+  });
+}
+
 // 当Electron完成初始化并准备创建浏览器窗口时调用此方法
-app.whenReady().then(() => {
-  startPythonServer();
+app.whenReady().then(async () => {
+  const startedAt = Date.now();
+  startPythonServer(process.argv.includes('--inspect'));
+  // 等待后端可以响应后再加载页面，避免页面初始化请求早于服务启动
+  if (await waitForServer()) {
+    console.log(`Flask服务已就绪，用时 ${Date.now() - startedAt} ms`);
+  }
   createWindow();
 });
 
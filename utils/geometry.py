@@ -0,0 +1,79 @@
+"""
+经纬度几何工具（API 与 DataProcess 共用）
+
+所有函数都直接接受 NumPy 数组，避免在 Python 循环中逐点调用。
+"""
+import numpy as np
+
+# 地球平均半径（米）
+EARTH_RADIUS = 6371000
+
+
+def haversine_distance(lon1, lat1, lon2, lat2):
+    """Haversine 距离（米），参数可以是标量或等长数组"""
+    lon1 = np.radians(lon1)
+    lat1 = np.radians(lat1)
+    lon2 = np.radians(lon2)
+    lat2 = np.radians(lat2)
+    a = np.sin((lat2 - lat1) / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+def equirectangular_distance(lon1, lat1, lon2, lat2):
+    """等距圆柱近似距离（米）
+
+    只需一次 cos，适合几公里以内的短线段（网格化路径的相邻点），
+    在北京纬度下 200 米线段的相对误差远小于 0.1%。
+    """
+    lon1 = np.radians(lon1)
+    lat1 = np.radians(lat1)
+    lon2 = np.radians(lon2)
+    lat2 = np.radians(lat2)
+    x = (lon2 - lon1) * np.cos((lat1 + lat2) / 2.0)
+    y = lat2 - lat1
+    return EARTH_RADIUS * np.sqrt(x * x + y * y)
+
+
+def path_length(points, approximate=False):
+    """单条路径长度（米），points 为 [[lon, lat], ...]"""
+    coords = np.asarray(points, dtype=np.float64)
+    if len(coords) < 2:
+        return 0.0
+    distance = equirectangular_distance if approximate else haversine_distance
+    return float(np.sum(distance(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])))
+
+
+def ragged_path_lengths(coords, offsets, approximate=False):
+    """不等长路径批量求长度
+
+    Args:
+        coords: 所有路径点首尾拼接后的 (N, 2) 数组
+        offsets: 每条路径在 coords 中的起始下标（长度为路径数，单调不减）
+    Returns:
+        np.ndarray: 每条路径的长度（米）
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.zeros(len(offsets))
+    if len(coords) < 2 or len(offsets) == 0:
+        return lengths
+    distance = equirectangular_distance if approximate else haversine_distance
+    seg = distance(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])
+    # 线段 i 连接点 i 与 i+1；补一个 0 使线段数与点数相同，再把跨路径线段置零
+    seg = np.append(seg, 0.0)
+    ends = np.append(offsets[1:], len(coords)) - 1
+    counts = ends - offsets + 1
+    nonempty = counts > 0
+    seg[ends[nonempty]] = 0.0
+    lengths[nonempty] = np.add.reduceat(seg, offsets[nonempty])
+    return lengths
+
+
+def batch_path_lengths(paths, approximate=False):
+    """批量计算多条路径的长度，paths 为 List[List[[lon, lat], ...]]"""
+    counts = np.fromiter((len(p) for p in paths), dtype=np.int64, count=len(paths))
+    if counts.sum() == 0:
+        return np.zeros(len(paths))
+    coords = np.array([pt for p in paths for pt in p], dtype=np.float64)
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return ragged_path_lengths(coords, offsets, approximate)
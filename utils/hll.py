@@ -0,0 +1,59 @@
+"""
+HyperLogLog 基数估计（出租车ID去重计数，API 与 DataProcess 共用）
+
+草图为 m = 2^precision 个 uint8 寄存器，估计值的相对标准误差约 1.04/sqrt(m)。
+出租车ID用 splitmix64 哈希，构建与查询时同一ID总落在同一寄存器，
+多个草图逐位取最大值即为它们并集的草图，因此可以跨网格、跨时间桶合并。
+"""
+import math
+import numpy as np
+
+DEFAULT_PRECISION = 12
+
+
+def hash_ids(ids):
+    """splitmix64，返回 uint64 数组"""
+    x = np.asarray(ids, dtype=np.int64).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _bit_length(values):
+    """uint64 数组各元素的二进制位数；分高低 32 位转为浮点数，避免超过 53 位时的舍入"""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, np.frexp(high)[1] + 32, np.frexp(low)[1])
+
+
+def empty_sketch(precision=DEFAULT_PRECISION):
+    return np.zeros(1 << precision, dtype=np.uint8)
+
+
+def add_ids(registers, ids, precision=DEFAULT_PRECISION):
+    """把出租车ID加入草图（原地修改 registers）"""
+    hashes = hash_ids(ids)
+    if len(hashes) == 0:
+        return registers
+    rest_bits = 64 - precision
+    index = (hashes >> np.uint64(rest_bits)).astype(np.int64)
+    rest = hashes & np.uint64((1 << rest_bits) - 1)
+    ranks = (rest_bits + 1 - _bit_length(rest)).astype(np.uint8)
+    np.maximum.at(registers, index, ranks)
+    return registers
+
+
+def estimate(registers):
+    """草图的基数估计；基数较小时用线性计数修正"""
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / float(np.sum(np.exp2(-registers.astype(np.float64))))
+    zeros = int(np.count_nonzero(registers == 0))
+    if raw <= 2.5 * m and zeros:
+        return m * math.log(m / zeros)
+    return raw
+
+
+def relative_error(precision=DEFAULT_PRECISION):
+    """估计值的相对标准误差"""
+    return 1.04 / math.sqrt(1 << precision)
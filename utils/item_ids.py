@@ -0,0 +1,71 @@
+"""
+R 树条目ID的编码（API 与 DataProcess 共用）
+
+原先每个点以递增序号为ID、用 obj=taxi_id 保存出租车ID，rtree 会为每个点 pickle 一个整数，
+查询时 objects=True 又要逐个反序列化。现在把出租车ID与时间戳直接编码进 64 位条目ID：
+
+    位 43~62  出租车ID（20 位，最大 1048575）
+    位 11~42  时间戳（32 位无符号整数秒）
+    位 0~10   该车轨迹中的点序号（取低 11 位，同一秒内的多个点ID不同）
+
+只需 (出租车ID, 时间戳) 的查询用 objects=False 取ID后解码即可，.dat 中也不再存放 pickle 数据。
+ID 按 出租车、时间 排序；同一辆车的重复记录可能得到相同的ID，查询不依赖ID唯一。
+"""
+import numpy as np
+
+TAXI_BITS = 20
+TIME_BITS = 32
+SEQ_BITS = 11
+
+TIME_SHIFT = SEQ_BITS
+TAXI_SHIFT = SEQ_BITS + TIME_BITS
+MAX_TAXI_ID = (1 << TAXI_BITS) - 1
+MAX_TIMESTAMP = (1 << TIME_BITS) - 1
+SEQ_MASK = (1 << SEQ_BITS) - 1
+TIME_MASK = MAX_TIMESTAMP
+
+
+def encode_item_id(taxi_id, timestamp, seq=0):
+    """编码单个条目ID；时间戳取整到秒"""
+    timestamp = int(round(timestamp))
+    if not 0 <= taxi_id <= MAX_TAXI_ID:
+        raise ValueError(f'出租车ID {taxi_id} 超出条目ID可编码的范围 0~{MAX_TAXI_ID}')
+    if not 0 <= timestamp <= MAX_TIMESTAMP:
+        raise ValueError(f'时间戳 {timestamp} 超出条目ID可编码的范围')
+    return (taxi_id << TAXI_SHIFT) | (timestamp << TIME_SHIFT) | (seq & SEQ_MASK)
+
+
+def encode_item_ids(taxi_ids, timestamps, seqs):
+    """批量编码条目ID，参数为等长数组，返回 int64 数组"""
+    taxi_ids = np.asarray(taxi_ids, dtype=np.int64)
+    timestamps = np.rint(np.asarray(timestamps, dtype=np.float64)).astype(np.int64)
+    if len(taxi_ids) and (taxi_ids.min() < 0 or taxi_ids.max() > MAX_TAXI_ID):
+        raise ValueError(f'出租车ID超出条目ID可编码的范围 0~{MAX_TAXI_ID}')
+    if len(timestamps) and (timestamps.min() < 0 or timestamps.max() > MAX_TIMESTAMP):
+        raise ValueError('时间戳超出条目ID可编码的范围')
+    seqs = np.asarray(seqs, dtype=np.int64) & SEQ_MASK
+    return (taxi_ids << TAXI_SHIFT) | (timestamps << TIME_SHIFT) | seqs
+
+
+def decode_taxi_ids(item_ids):
+    """条目ID数组 -> 出租车ID数组"""
+    return np.asarray(item_ids, dtype=np.int64) >> TAXI_SHIFT
+
+
+def decode_timestamps(item_ids):
+    """条目ID数组 -> 时间戳数组（浮点秒，与索引边界框中的时间一致）"""
+    return ((np.asarray(item_ids, dtype=np.int64) >> TIME_SHIFT) & TIME_MASK).astype(np.float64)
+
+
+def track_sequence(taxi_ids):
+    """按点在数组中的顺序给出每个点在本车中的序号（同一辆车的点依次为 0, 1, 2, ...）"""
+    taxi_ids = np.asarray(taxi_ids, dtype=np.int64)
+    if len(taxi_ids) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.argsort(taxi_ids, kind='stable')
+    sorted_ids = taxi_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    counts = np.diff(np.r_[starts, len(sorted_ids)])
+    seqs = np.empty(len(taxi_ids), dtype=np.int64)
+    seqs[order] = np.arange(len(taxi_ids)) - np.repeat(starts, counts)
+    return seqs
@@ -0,0 +1,73 @@
+"""
+轨迹折线的 Douglas-Peucker 简化（API 与 DataProcess 共用）
+
+一次计算出每个点的“重要度”（米）：点在 Douglas-Peucker 递归中被选为分割点时到当前线段的距离，
+并且不超过其上层分割点的重要度。于是对任意容差 tolerance，保留重要度大于 tolerance 的点
+正好等于以该容差运行 Douglas-Peucker 的结果，任意简化程度都只是一次阈值过滤。
+首末两点的重要度为无穷大，总会保留。
+
+递归按层向量化：同一层的所有线段一起计算点到线段的距离并取各段最大值，层数约为 log(点数)。
+"""
+import numpy as np
+from utils.geometry import EARTH_RADIUS
+
+
+def _ranges(starts, ends):
+    """若干 [start, end) 区间内的全部下标"""
+    lengths = ends - starts
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(int(lengths.sum()))
+
+
+def segment_distance(px, py, ax, ay, bx, by):
+    """点 (px, py) 到线段 (ax, ay)-(bx, by) 的距离，参数为等长数组"""
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    t = np.where(length2 > 0, ((px - ax) * dx + (py - ay) * dy) / np.where(length2 > 0, length2, 1), 0)
+    t = np.clip(t, 0, 1)
+    return np.hypot(px - ax - t * dx, py - ay - t * dy)
+
+
+def significance(lons, lats):
+    """每个点的 Douglas-Peucker 重要度（米），返回 float64 数组"""
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    n = len(lons)
+    result = np.full(n, np.inf)
+    if n <= 2:
+        return result
+    # 单条轨迹范围不大，用等距圆柱投影换算为米
+    lat0 = np.radians(lats.mean())
+    x = np.radians(lons) * np.cos(lat0) * EARTH_RADIUS
+    y = np.radians(lats) * EARTH_RADIUS
+
+    starts, ends, parents = np.array([0]), np.array([n - 1]), np.array([np.inf])
+    while len(starts):
+        lengths = ends - starts - 1
+        keep = lengths > 0
+        starts, ends, parents, lengths = starts[keep], ends[keep], parents[keep], lengths[keep]
+        if not len(starts):
+            break
+        segment = np.repeat(np.arange(len(starts)), lengths)
+        inner = _ranges(starts + 1, ends)
+        a, b = starts[segment], ends[segment]
+        distance = segment_distance(x[inner], y[inner], x[a], y[a], x[b], y[b])
+        offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+        farthest = np.maximum.reduceat(distance, offsets)
+        # 各段距离最大的第一个点为分割点
+        candidates = np.flatnonzero(distance == farthest[segment])
+        _, first = np.unique(segment[candidates], return_index=True)
+        splits = inner[candidates[first]]
+        scores = np.minimum(farthest, parents)
+        result[splits] = scores
+        # 所有内部点都在线段上（如停车时的重复点）时不再细分，重要度均为0
+        flat = farthest == 0
+        result[inner[flat[segment]]] = 0
+        split = ~flat
+        starts, ends, parents = (np.r_[starts[split], splits[split]], np.r_[splits[split], ends[split]],
+                                 np.r_[scores[split], scores[split]])
+    return result
+
+
+def zoom_tolerance(zoom, lat, pixels=1.0):
+    """地图第 zoom 级（256 像素瓦片）在纬度 lat 处 pixels 个像素对应的米数"""
+    return pixels * 2 * np.pi * EARTH_RADIUS * np.cos(np.radians(lat)) / (256 * 2 ** zoom)
@@ -0,0 +1,27 @@
+"""
+去重草图的网格与格子键（API 与 DataProcess 共用）
+
+网格边界为 cell_size 的整数倍，点按左闭右开归属网格；cell_index 的结果与边界坐标 k * cell_size
+（按浮点数计算）严格一致，查询时可以用这些边界坐标拼出与内部网格互不相交的查询框。
+格子键把时间桶号与两个方向的网格号编码为一个 int64，按键排序即按 时间桶、经度、纬度 排序。
+"""
+import numpy as np
+
+CELL_BITS = 21  # 每个方向的网格号（加上偏移 2^20 后）占用的位数
+CELL_OFFSET = 1 << (CELL_BITS - 1)
+
+
+def cell_index(values, cell_size):
+    """坐标 -> 网格号 k，满足 k * cell_size <= 坐标 < (k + 1) * cell_size（两端均按浮点数计算）"""
+    values = np.asarray(values, dtype=np.float64)
+    k = np.floor(values / cell_size)
+    k -= values < k * cell_size
+    k += values >= (k + 1) * cell_size
+    return k.astype(np.int64)
+
+
+def encode_keys(buckets, cols, rows):
+    """时间桶号、经度方向网格号、纬度方向网格号 -> 格子键"""
+    return (np.asarray(buckets, dtype=np.int64) << (2 * CELL_BITS)) | \
+        ((np.asarray(cols, dtype=np.int64) + CELL_OFFSET) << CELL_BITS) | \
+        (np.asarray(rows, dtype=np.int64) + CELL_OFFSET)
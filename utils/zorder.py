@@ -0,0 +1,75 @@
+"""
+Z 序（Morton）空间填充曲线（API 与 DataProcess 共用）
+
+把经纬度范围划分为 2^GRID_BITS × 2^GRID_BITS 的网格，网格坐标按位交织得到 Z 序编码：
+相邻的编码区间对应空间上的方块，查询矩形可以分解为少量编码区间，在按编码排序的数组上二分查找。
+超出网格范围的点归入边缘的格子，查询时同样处理，因此不会漏掉点（只多出需要精确过滤的候选）。
+"""
+import numpy as np
+
+GRID_BITS = 16
+GRID_CELLS = 1 << GRID_BITS
+MAX_RANGES = 128  # 查询矩形分解出的编码区间数上限，超过后以较大的方块近似
+
+
+def _spread_bits(v):
+    # 把 16 位整数的各位分散到偶数位上
+    v = np.asarray(v, dtype=np.uint64) & np.uint64(0xFFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x33333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x55555555)
+    return v
+
+
+def morton_encode(cx, cy):
+    """网格坐标 -> Z 序编码（x 在偶数位，y 在奇数位），返回 int64 数组"""
+    return (_spread_bits(cx) | (_spread_bits(cy) << np.uint64(1))).astype(np.int64)
+
+
+def grid_cells(lons, lats, extent):
+    """经纬度 -> 网格坐标；extent 为 (min_lon, min_lat, max_lon, max_lat)，范围外的点归入边缘格子"""
+    min_lon, min_lat, max_lon, max_lat = extent
+    scale_x = GRID_CELLS / max(max_lon - min_lon, 1e-12)
+    scale_y = GRID_CELLS / max(max_lat - min_lat, 1e-12)
+    cx = np.clip(np.floor((np.asarray(lons, dtype=np.float64) - min_lon) * scale_x), 0, GRID_CELLS - 1)
+    cy = np.clip(np.floor((np.asarray(lats, dtype=np.float64) - min_lat) * scale_y), 0, GRID_CELLS - 1)
+    return cx.astype(np.int64), cy.astype(np.int64)
+
+
+def zorder_ranges(x0, y0, x1, y1, max_ranges=MAX_RANGES):
+    """把网格矩形 [x0, x1] × [y0, y1]（含端点）分解为 Z 序编码区间，返回 (起点数组, 终点数组)，终点含在内
+
+    从整个网格开始逐层四分：完全落在矩形内的方块直接输出，部分相交的继续细分；
+    待细分的方块数超过 max_ranges 时停止细分，把它们整体输出（多出的点由调用方精确过滤）。
+    """
+    ranges = []
+    quads = [(0, 0, GRID_CELLS, 0)]  # (x, y, 边长, 起始编码)
+    while quads:
+        partial = []
+        for x, y, size, z in quads:
+            if x > x1 or y > y1 or x + size - 1 < x0 or y + size - 1 < y0:
+                continue
+            if (x >= x0 and y >= y0 and x + size - 1 <= x1 and y + size - 1 <= y1) or size == 1:
+                ranges.append((z, z + size * size - 1))
+            else:
+                partial.append((x, y, size, z))
+        if len(ranges) + 4 * len(partial) > max_ranges:
+            ranges.extend((z, z + size * size - 1) for x, y, size, z in partial)
+            break
+        half_quads = []
+        for x, y, size, z in partial:
+            half = size // 2
+            for q in range(4):
+                half_quads.append((x + (q & 1) * half, y + (q >> 1) * half, half, z + q * half * half))
+        quads = half_quads
+
+    ranges.sort()
+    merged = []
+    for lo, hi in ranges:
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], hi)
+        else:
+            merged.append([lo, hi])
+    bounds = np.array(merged, dtype=np.int64).reshape(-1, 2)
+    return bounds[:, 0], bounds[:, 1]
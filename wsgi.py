@@ -0,0 +1,16 @@
+"""
+生产环境 WSGI 入口
+
+gunicorn:  gunicorn -w 4 --preload -b 127.0.0.1:5000 --timeout 300 wsgi:application
+waitress:  waitress-serve --port=5000 --threads=8 wsgi:application
+
+使用 --preload 时本模块在 master 进程中导入，数据文件与功能模块预加载后再 fork 工作进程。
+"""
+from api.resources import preload
+from api.lazy import preload_modules
+from app import app
+
+preload()
+preload_modules()
+
+application = app